@@ -52,6 +52,8 @@ from copy import deepcopy
 import logging, logging.handlers
 from datetime import datetime
 
+from TracX.instrumentation import span
+
 
 ## AUTHORSHIP INFORMATION
 __author__ = "David Pagnon"
@@ -171,11 +173,12 @@ def calibration(config=None):
 
     level, config_dicts = read_config_files(config)
     config_dict = config_dicts[0]
+    config_dir = os.getcwd() if config is None or type(config)==dict else config
     try:
-        session_dir = os.path.realpath([os.getcwd() if level==2 else os.path.join(os.getcwd(), '..')][0])
+        session_dir = os.path.realpath([config_dir if level==2 else os.path.join(config_dir, '..')][0])
         [os.path.join(session_dir, c) for c in os.listdir(session_dir) if 'calib' in c.lower() and not c.lower().endswith('.py')][0]
     except:
-        session_dir = os.path.realpath(os.getcwd())
+        session_dir = os.path.realpath(config_dir)
     config_dict.get("project").update({"project_dir":session_dir})
 
     # Set up logging
@@ -191,7 +194,8 @@ def calibration(config=None):
     logging.info("---------------------------------------------------------------------\n")
     start = time.time()
 
-    calibrate_cams_all(config_dict)
+    with span('calibration'):
+        calibrate_cams_all(config_dict)
 
     end = time.time()
     logging.info(f'\nCalibration took {end-start:.2f} s.\n')
@@ -235,7 +239,8 @@ def poseEstimation(config=None):
         logging.info(f"Project directory: {project_dir}")
         logging.info("---------------------------------------------------------------------\n")
 
-        rtm_estimator(config_dict)
+        with span('poseEstimation', trial=seq_name):
+            rtm_estimator(config_dict)
         
         end = time.time()
         elapsed = end - start
@@ -279,7 +284,8 @@ def synchronization(config=None):
         logging.info(f"Project directory: {project_dir}")
         logging.info("---------------------------------------------------------------------\n")
 
-        synchronize_cams_all(config_dict)
+        with span('synchronization'):
+            synchronize_cams_all(config_dict)
         
         end = time.time()
         elapsed = end-start
@@ -326,7 +332,8 @@ def personAssociation(config=None):
         logging.info(f"Project directory: {project_dir}")
         logging.info("---------------------------------------------------------------------\n")
 
-        associate_all(config_dict)
+        with span('personAssociation', trial=seq_name):
+            associate_all(config_dict)
         
         end = time.time()
         elapsed = end-start
@@ -372,7 +379,8 @@ def triangulation(config=None):
         logging.info(f"Project directory: {project_dir}")
         logging.info("---------------------------------------------------------------------\n")
 
-        triangulate_all(config_dict)
+        with span('triangulation', trial=seq_name):
+            triangulate_all(config_dict)
         
         end = time.time()
         elapsed = end-start
@@ -417,7 +425,8 @@ def filtering(config=None):
         logging.info(f"Project directory: {project_dir}\n")
         logging.info("---------------------------------------------------------------------\n")
 
-        filter_all(config_dict)
+        with span('filtering', trial=seq_name):
+            filter_all(config_dict)
         
         logging.info('\n')
 
@@ -458,7 +467,8 @@ def markerAugmentation(config=None):
         logging.info(f"Project directory: {project_dir}")
         logging.info("---------------------------------------------------------------------\n")
 
-        augmentTRC(config_dict)
+        with span('markerAugmentation', trial=seq_name):
+            augmentTRC(config_dict)
         
         end = time.time()
         elapsed = end-start
@@ -502,7 +512,8 @@ def kinematics(config=None):
         logging.info(f"Project directory: {project_dir}")
         logging.info("---------------------------------------------------------------------\n")
 
-        kinematics(config_dict)
+        with span('kinematics', trial=seq_name):
+            kinematics(config_dict)
         
         end = time.time()
         elapsed = end - start
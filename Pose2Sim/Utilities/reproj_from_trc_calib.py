@@ -192,22 +192,35 @@ def retrieve_calib_params(calib_file):
 
 def reprojection(P_all, Q):
     '''
-    Reprojects 3D point on all cameras.
+    Reprojects 3D points on all cameras.
+    All points are projected at once with a single batched matrix product.
     
     INPUTS:
-    - P_all: list of arrays. Projection matrix for all cameras
-    - Q: array of triangulated point (x,y,z,1.)
+    - P_all: list of arrays. Projection matrix for all cameras, 
+             or array of shape (n_cams, n_frames, 3, 4) for zooming or moving cameras
+    - Q: array of triangulated point (x,y,z,1.), 
+         or array of points of shape (n_frames, n_points, 4)
 
     OUTPUTS:
-    - x_calc, y_calc: list of coordinates of point reprojected on all cameras
+    - x_calc, y_calc: list of coordinates of point reprojected on all cameras,
+                      or arrays of shape (n_cams, n_frames, n_points)
     '''
     
-    x_calc, y_calc = [], []
-    for c in range(len(P_all)):  
-        P_cam = P_all[c]
-        x_calc.append(P_cam[0] @ Q / (P_cam[2] @ Q))
-        y_calc.append(P_cam[1] @ Q / (P_cam[2] @ Q))
-        
+    P_all = np.asarray(P_all, dtype=float)
+    P_all = P_all.reshape((-1,) + P_all.shape[-3:] if P_all.ndim == 4 else (-1, 3, 4))
+    Q = np.asarray(Q, dtype=float)
+    if Q.ndim == 1:
+        proj = np.einsum('cij,j->ci', P_all, Q)
+    elif P_all.ndim == 4:
+        proj = np.einsum('cfij,fpj->cfpi', P_all, Q)
+    else:
+        proj = np.einsum('cij,fpj->cfpi', P_all, Q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_calc = proj[...,0] / proj[...,2]
+        y_calc = proj[...,1] / proj[...,2]
+
+    if Q.ndim == 1:
+        return x_calc.tolist(), y_calc.tolist()
     return x_calc, y_calc
     
 
@@ -322,23 +335,20 @@ def reproj_from_trc_calib_func(**args):
     # Reproject 3D points on all cameras
     data_proj = [deepcopy(data_h5) for cam in range(len(P_all))] # copy data_h5 as many times as there are cameras
     Q = data_trc_zup.iloc[:,2:]
-    for frame in range(num_frames):
-        coords = [[] for cam in range(len(P_all))]
-        P_all_frame = [P_all[cam][0] if P_all.shape[1]==1 else P_all[cam][frame] for cam in range(len(P_all))]
-        for keypoint in range(num_bodyparts):
-            q = np.append(Q.iloc[frame,3*keypoint:3*keypoint+3], 1)
-            if undistort_points:
-                coords_2D_all = [cv2.projectPoints(np.array(q[:-1]), calib_params_R_filt[i], calib_params_T_filt[i], calib_params_K_filt[i], calib_params_dist_filt[i])[0] for i in range(len(P_all))]
-                x_all = [coords_2D_all[i][0,0,0] for i in range(len(P_all_frame))]
-                y_all = [coords_2D_all[i][0,0,1] for i in range(len(P_all_frame))]
-            else:
-                x_all, y_all = reprojection(P_all_frame, q)
-            [coords[cam].extend([x_all[cam], y_all[cam]]) for cam in range(len(P_all_frame))]
-        for cam in range(len(P_all_frame)):
-            data_proj[cam].iloc[frame,:] = coords[cam]
+    Q_all = Q.to_numpy(dtype=float)[:num_frames].reshape(num_frames, num_bodyparts, 3)
+    if undistort_points:
+        coords_2D_all = np.array([cv2.projectPoints(Q_all.reshape(-1,3), calib_params_R_filt[i], calib_params_T_filt[i], calib_params_K_filt[i], calib_params_dist_filt[i])[0].reshape(num_frames, num_bodyparts, 2) 
+                                  for i in range(len(P_all))])
+    else:
+        Q_all = np.concatenate([Q_all, np.ones((num_frames, num_bodyparts, 1))], axis=-1)
+        P_all_frames = P_all[:,0] if P_all.shape[1]==1 else P_all[:,:num_frames]
+        x_all, y_all = reprojection(P_all_frames, Q_all)
+        coords_2D_all = np.stack([x_all, y_all], axis=-1)
+    for cam in range(len(P_all)):
+        data_proj[cam].iloc[:num_frames,:] = coords_2D_all[cam].reshape(num_frames, -1)
     
     # Replace by nan when reprojection out of image
-    for cam in range(len(P_all_frame)):
+    for cam in range(len(P_all)):
         x_above_size = data_proj[cam].iloc[:,::2] < calib_params_size[cam][0]
         data_proj[cam].iloc[:, ::2] = data_proj[cam].iloc[:, ::2].where(x_above_size, np.nan)
         y_above_size = data_proj[cam].iloc[:,1::2] < calib_params_size[cam][1]
@@ -25,6 +25,9 @@ import numpy as np
 import opensim as osim
 import argparse
 
+from TracX.motion_io import trc_header, write_trc
+from TracX.osim_poses import evaluate_poses
+
 
 ## AUTHORSHIP INFORMATION
 __author__ = "David Pagnon"
@@ -62,28 +65,18 @@ def get_marker_positions(motion_data, model, in_degrees=True, marker_list=[]):
             print(f'The following markers were not found in the model: {absent_markers}')
     marker_set_names_xyz = np.array([[m+'_x', m+'_y', m+'_z'] for m in marker_set_names]).flatten()
 
-    # Data
+    # Data, converted to radians at once
     times = motion_data.getIndependentColumn()
     joint_angle_set_names = motion_data.getColumnLabels() # or [c.getName() for c in model.getCoordinateSet()]
     joint_angle_set_names = [j for j in joint_angle_set_names if not j.endswith('activation')]
-    motion_data_pd = pd.DataFrame(motion_data.getMatrix().to_numpy()[:,:len(joint_angle_set_names)], columns=joint_angle_set_names)
+    joint_angles = motion_data.getMatrix().to_numpy()[:,:len(joint_angle_set_names)].copy()
+    if in_degrees:
+        rotational = [not coord.endswith(('_tx', '_ty', '_tz')) for coord in joint_angle_set_names]
+        joint_angles[:,rotational] *= np.pi/180
 
-    # Get marker positions at each state
-    state = model.initSystem()
-    marker_positions = []
-    print('Time frame:')
-    for n,t in enumerate(times):
-        print('t = ', t, 's')
-        # put the model in the right position
-        for coord in joint_angle_set_names:
-            if in_degrees and not coord.endswith('_tx') and not coord.endswith('_ty') and not coord.endswith('_tz'):
-                value = motion_data_pd.loc[n,coord]*np.pi/180
-            else:
-                value = motion_data_pd.loc[n,coord]
-            model.getCoordinateSet().get(coord).setValue(state,value, enforceContraints=False)
-        model.assemble(state)
-        # get marker positions
-        marker_positions += [np.array([marker_set.get(mk_name).findLocationInFrame(state, model.getGround()).to_numpy() for mk_name in marker_set_names]).flatten()]
+    # Get marker positions at each state, walking the trajectory once
+    _, marker_positions = evaluate_poses(model, joint_angle_set_names, joint_angles, [], marker_set_names)
+    marker_positions = marker_positions.reshape(len(times), -1)
     marker_positions_pd = pd.DataFrame(marker_positions, columns=marker_set_names_xyz)
     marker_positions_pd.insert(0, 'time', times)
     marker_positions_pd.insert(0, 'frame', np.arange(len(times))+1)
@@ -132,31 +125,10 @@ def trc_from_mot_osim_func(**args):
     # Trc header
     times = motion_data.getIndependentColumn()
     fps = str( int(1/ ((times[-1]-times[0]) / (len(times)-1))))
-    nb_frames = str(len(times))
-    nb_markers = str(len(marker_set_names))
-    header0_str = 'PathFileType\t4\t(X/Y/Z)\t' + os.path.basename(trc_path)
-
-    header1 = {}
-    header1['DataRate'] = fps
-    header1['CameraRate'] = fps
-    header1['NumFrames'] = nb_frames
-    header1['NumMarkers'] = nb_markers
-    header1['Units'] = 'm'
-    header1['OrigDataRate'] = fps
-    header1['OrigDataStartFrame'] = '0'
-    header1['OrigNumFrames'] = nb_frames
-    header1_str1 = '\t'.join(header1.keys())
-    header1_str2 = '\t'.join(header1.values())
-
-    header2_str1 = 'Frame#\tTime\t' + '\t\t\t'.join([mk.strip() for mk in marker_set_names]) + '\t\t'
-    header2_str2 = '\t\t'+'\t'.join(['X{i}\tY{i}\tZ{i}'.format(i=i+1) for i in range(int(header1['NumMarkers']))])
-
-    header_trc = '\n'.join([header0_str, header1_str1, header1_str2, header2_str1, header2_str2])
+    header_trc = trc_header(os.path.basename(trc_path), [mk.strip() for mk in marker_set_names], fps, len(times))
     
     # write data
-    with open(trc_path, 'w') as trc_o:
-        trc_o.write(header_trc+'\n')
-    marker_positions_pd.to_csv(trc_path, header=False, sep = '\t', mode='a', index=False)
+    write_trc(trc_path, marker_positions_pd.to_numpy(), header_trc, float_format='%.18g')
     print(f'trc file successfully saved as {trc_path}')
     
     
@@ -30,6 +30,7 @@ OUTPUTS:
 
 ## INIT
 from Pose2Sim.common import world_to_camera_persp, rotate_cam, quat2mat, euclidean_distance, natural_sort_key, zup2yup
+from TracX.video_reader import VideoReader
 
 import os
 import logging
@@ -47,6 +48,7 @@ import matplotlib.pyplot as plt
 from mpl_interactions import zoom_factory, panhandler
 from PIL import Image
 from contextlib import contextmanager,redirect_stderr,redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
 from os import devnull
 
 
@@ -61,6 +63,13 @@ __email__ = "contact@david-pagnon.com"
 __status__ = "Development"
 
 
+## CONSTANTS
+DETECTION_MAX_WIDTH = 640 # width at which the presence of the board is checked
+DETECTION_MIN_SQUARE = 8 # px. If the squares of a board filling the downscaled image are smaller, the board is also searched for at full resolution
+SEEK_MIN_GAP = 30 # seek rather than decode when the next sampled frame is further away than this
+CORNERS_CACHE_NAME = 'corners_cache.pickle'
+
+
 ## FUNCTIONS
 def calib_qca_fun(file_to_convert_path, binning_factor=1):
     '''
@@ -564,54 +573,82 @@ def calibrate_intrinsics(calib_dir, intrinsics_config_dict):
     intrinsics_square_size = intrinsics_config_dict.get('intrinsics_square_size') / 1000 # convert to meters
     ret, C, S, D, K, R, T = [], [], [], [], [], [], []
 
-    for i,cam in enumerate(intrinsics_cam_listdirs_names):
-        # Prepare object points
-        objp = np.zeros((intrinsics_corners_nb[0]*intrinsics_corners_nb[1],3), np.float32) 
-        objp[:,:2] = np.mgrid[0:intrinsics_corners_nb[0],0:intrinsics_corners_nb[1]].T.reshape(-1,2)
-        objp[:,:2] = objp[:,0:2]*intrinsics_square_size
-        objpoints = [] # 3d points in world space
-        imgpoints = [] # 2d points in image plane
-
-        logging.info(f'\nCamera {cam}:')
+    # list image or video files
+    img_vid_files_all, is_video_all = [], []
+    for cam in intrinsics_cam_listdirs_names:
         img_vid_files = glob.glob(os.path.join(calib_dir, 'intrinsics', cam, f'*.{intrinsics_extension}'))
         if len(img_vid_files) == 0:
             logging.exception(f'The folder {os.path.join(calib_dir, "intrinsics", cam)} does not exist or does not contain any files with extension .{intrinsics_extension}.')
             raise ValueError(f'The folder {os.path.join(calib_dir, "intrinsics", cam)} does not exist or does not contain any files with extension .{intrinsics_extension}.')
         img_vid_files = sorted(img_vid_files, key=lambda c: [int(n) for n in re.findall(r'\d+', c)]) #sorting paths with numbers
         
-        # extract frames from video if video
+        # check whether the files are images or a video
         try:
             cap = cv2.VideoCapture(img_vid_files[0])
             cap.read()
-            if cap.read()[0] == False:
-                raise
-            extract_frames(img_vid_files[0], extract_every_N_sec, overwrite_extraction)
-            img_vid_files = glob.glob(os.path.join(calib_dir, 'intrinsics', cam, f'*.png'))
-            img_vid_files = sorted(img_vid_files, key=lambda c: [int(n) for n in re.findall(r'\d+', c)])
+            is_video = cap.read()[0]
+            cap.release()
         except:
-            pass
+            is_video = False
+        img_vid_files_all.append(img_vid_files)
+        is_video_all.append(is_video)
+
+    # find corners of all cameras in memory and in parallel, and reuse previous detections
+    if not show_detection_intrinsics:
+        sources = {}
+        for img_vid_files, is_video in zip(img_vid_files_all, is_video_all):
+            if is_video:
+                sources[img_vid_files[0]] = sample_video_frames(img_vid_files[0], extract_every_N_sec)
+            else:
+                sources.update(dict.fromkeys(img_vid_files))
+        detections, img_sizes = detect_corners_cached(sources, intrinsics_corners_nb)
+
+    for i,cam in enumerate(intrinsics_cam_listdirs_names):
+        # Prepare object points
+        objp = np.zeros((intrinsics_corners_nb[0]*intrinsics_corners_nb[1],3), np.float32) 
+        objp[:,:2] = np.mgrid[0:intrinsics_corners_nb[0],0:intrinsics_corners_nb[1]].T.reshape(-1,2)
+        objp[:,:2] = objp[:,0:2]*intrinsics_square_size
+        objpoints = [] # 3d points in world space
+        imgpoints = [] # 2d points in image plane
+
+        logging.info(f'\nCamera {cam}:')
+        img_vid_files, is_video = img_vid_files_all[i], is_video_all[i]
+
+        if show_detection_intrinsics == True:
+            # extract frames from video if video
+            if is_video:
+                extract_frames(img_vid_files[0], extract_every_N_sec, overwrite_extraction)
+                img_vid_files = glob.glob(os.path.join(calib_dir, 'intrinsics', cam, f'*.png'))
+                img_vid_files = sorted(img_vid_files, key=lambda c: [int(n) for n in re.findall(r'\d+', c)])
 
-        # find corners
-        for img_path in img_vid_files:
-            if show_detection_intrinsics == True:
+            # find corners, and confirm or click them by hand
+            for img_path in img_vid_files:
                 imgp_confirmed, objp_confirmed = findCorners(img_path, intrinsics_corners_nb, objp=objp, show=show_detection_intrinsics)
                 if isinstance(imgp_confirmed, np.ndarray):
                     imgpoints.append(imgp_confirmed)
                     objpoints.append(objp_confirmed)
-            else:
-                imgp_confirmed = findCorners(img_path, intrinsics_corners_nb, objp=objp, show=show_detection_intrinsics)
-                if isinstance(imgp_confirmed, np.ndarray):
-                    imgpoints.append(imgp_confirmed)
-                    objpoints.append(objp)
+            img_size = cv2.imread(str(img_path)).shape[1::-1]
+
+        else:
+            img_size = None
+            for img_path in (img_vid_files[:1] if is_video else img_vid_files):
+                for frame_id, imgp in sorted(detections[img_path].items()):
+                    name = f'{os.path.splitext(os.path.basename(img_path))[0]}_{frame_id:05d}' if is_video else os.path.basename(img_path)
+                    if imgp is None:
+                        logging.info(f'{name}: Corners not found. To label them by hand, set "show_detection_intrinsics" to true in the Config.toml file.')
+                    else:
+                        logging.info(f'{name}: Corners found.')
+                        imgpoints.append(imgp)
+                        objpoints.append(objp)
+                img_size = img_sizes[img_path] or img_size
         if len(imgpoints) < 10:
             logging.info(f'Corners were detected only on {len(imgpoints)} images for camera {cam}. Calibration of intrinsic parameters may not be accurate with fewer than 10 good images of the board.')
 
         # calculate intrinsics
-        img = cv2.imread(str(img_path))
         objpoints = np.array(objpoints)
-        ret_cam, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, img.shape[1::-1], 
+        ret_cam, mtx, dist, rvecs, tvecs = cv2.calibrateCamera(objpoints, imgpoints, tuple(img_size), 
                                     None, None, flags=(cv2.CALIB_FIX_K3 + cv2.CALIB_FIX_PRINCIPAL_POINT))
-        h, w = [np.float32(i) for i in img.shape[:-1]]
+        w, h = [np.float32(i) for i in img_size]
         ret.append(ret_cam)
         C.append(cam)
         S.append([w, h])
@@ -763,6 +800,216 @@ def calibrate_extrinsics(calib_dir, extrinsics_config_dict, C, S, K, D):
     return ret, C, S, D, K, R, T
 
 
+def sample_video_frames(video_path, extract_every_N_sec=1):
+    '''
+    Indices of the frames sampled from a video for calibration:
+    the same frames as those written by extract_frames.
+
+    INPUTS:
+    - video_path: path to the video
+    - extract_every_N_sec: one frame every N seconds (can be <1)
+
+    OUTPUT:
+    - frame_ids: list of int
+    '''
+
+    cap = cv2.VideoCapture(str(video_path))
+    fps = round(cap.get(cv2.CAP_PROP_FPS))
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    step = fps*extract_every_N_sec
+    if step <= 0:
+        return [0]
+    return [n for n in range(frame_count) if n % step == 0]
+
+
+def read_video_frames(video_path, frame_ids):
+    '''
+    Decode selected frames of a video in memory.
+    Seeks to the next frame if it is far, otherwise skips the frames in between 
+    without converting them.
+
+    INPUTS:
+    - video_path: path to the video
+    - frame_ids: sorted list of int
+
+    OUTPUT:
+    - yields (frame_id, frame) tuples
+    '''
+
+    cap = cv2.VideoCapture(str(video_path))
+    next_frame = 0
+    try:
+        for frame_id in frame_ids:
+            if frame_id - next_frame > SEEK_MIN_GAP:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
+            else:
+                for _ in range(frame_id - next_frame):
+                    cap.grab()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            next_frame = frame_id + 1
+            yield frame_id, frame
+    finally:
+        cap.release()
+
+
+def detect_board(img, corner_nb, max_width=DETECTION_MAX_WIDTH):
+    '''
+    Detect the corners of a checkerboard.
+    The presence of the board is first checked on a downscaled image, 
+    and the corners are then refined at full resolution. The board is only 
+    searched for at full resolution if the image is not downscaled, or if 
+    its squares could be too small to be detected in the downscaled image.
+
+    INPUTS:
+    - img: BGR or grayscale image
+    - corner_nb: [H, W] internal corners in checkerboard: list of two integers [4,7]
+    - max_width: width of the downscaled image
+
+    OUTPUT:
+    - imgp: array of [[2d corner coordinates]], or None if the board is not found
+    '''
+
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001) # stop refining after 30 iterations or if error less than 0.001px
+    flags_check = cv2.CALIB_CB_ADAPTIVE_THRESH + cv2.CALIB_CB_NORMALIZE_IMAGE + cv2.CALIB_CB_FAST_CHECK
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    corner_nb = tuple(corner_nb)
+
+    scale = max_width / gray.shape[1]
+    if scale < 1:
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        ret, corners = cv2.findChessboardCorners(small, corner_nb, flags=flags_check)
+        if ret:
+            corners = ((corners + 0.5) / scale - 0.5).astype(np.float32)
+        elif max_width / (max(corner_nb) + 1) < DETECTION_MIN_SQUARE:
+            # the squares may be too small to be found in the downscaled image
+            ret, corners = cv2.findChessboardCorners(gray, corner_nb, flags=flags_check)
+    else:
+        # same default flags as findCorners
+        ret, corners = cv2.findChessboardCorners(gray, corner_nb, None)
+    if not ret:
+        return None
+
+    return cv2.cornerSubPix(gray, corners, (11,11), (-1,-1), criteria)
+
+
+def detect_corners_task(source, frame_ids, corner_nb):
+    '''
+    Detect checkerboard corners on some frames of a video, or on an image.
+    Run in a worker process.
+
+    INPUTS:
+    - source: path to a video or an image
+    - frame_ids: list of int. Frames to read from the video, or None for an image
+    - corner_nb: [H, W] internal corners in checkerboard
+
+    OUTPUTS:
+    - source: path to the video or image
+    - detections: dict {frame_id: array of corners, or None}. Frame 0 for an image
+    - img_size: (width, height) of the frames
+    '''
+
+    cv2.setNumThreads(1)
+    if frame_ids is None:
+        img = cv2.imread(source)
+        frames = [(0, img)] if img is not None else []
+    else:
+        frames = read_video_frames(source, frame_ids)
+
+    detections, img_size = {}, None
+    for frame_id, frame in frames:
+        img_size = frame.shape[1::-1]
+        detections[frame_id] = detect_board(frame, corner_nb)
+
+    return source, detections, img_size
+
+
+def detect_corners_cached(sources, corner_nb, max_workers=None):
+    '''
+    Detect checkerboard corners on frames of videos or on images, in a process pool.
+    Detections are cached per frame in a file next to the sources, so that they 
+    are not computed again as long as the files and the number of corners are unchanged.
+
+    INPUTS:
+    - sources: dict {path to video: list of frame ids, or path to image: None}
+    - corner_nb: [H, W] internal corners in checkerboard
+    - max_workers: number of worker processes. Defaults to the number of CPUs
+
+    OUTPUTS:
+    - detections: dict {path: {frame_id: array of corners, or None}}. Frame 0 for an image
+    - img_sizes: dict {path: (width, height) of the frames, or None if none could be read}
+    '''
+
+    # Load cached detections that are still valid, one cache per folder
+    caches = {}
+    for cache_path in {os.path.join(os.path.dirname(source), CORNERS_CACHE_NAME) for source in sources}:
+        cache = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    cache = pickle.load(f)
+            except Exception:
+                cache = {}
+        if cache.get('corner_nb') != list(corner_nb):
+            cache = {'corner_nb': list(corner_nb), 'files': {}}
+        caches[cache_path] = cache
+
+    def cache_entry(source):
+        return caches[os.path.join(os.path.dirname(source), CORNERS_CACHE_NAME)]['files'][os.path.basename(source)]
+
+    tasks = []
+    for source, frame_ids in sources.items():
+        cache = caches[os.path.join(os.path.dirname(source), CORNERS_CACHE_NAME)]
+        stat = os.stat(source)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        entry = cache['files'].get(os.path.basename(source))
+        if entry is None or entry['stamp'] != stamp:
+            cache['files'][os.path.basename(source)] = {'stamp': stamp, 'img_size': None, 'frames': {}}
+        frames = cache_entry(source)['frames']
+        if frame_ids is None:
+            if 0 not in frames:
+                tasks.append((source, None))
+        else:
+            missing = [frame_id for frame_id in frame_ids if frame_id not in frames]
+            if len(missing) > 0:
+                tasks.append((source, missing))
+
+    # Detect corners on missing frames, splitting videos into chunks
+    if len(tasks) > 0:
+        max_workers = max_workers or os.cpu_count() or 1
+        nb_frames = sum(1 if frame_ids is None else len(frame_ids) for _, frame_ids in tasks)
+        chunk_size = max(1, int(np.ceil(nb_frames / (4*max_workers))))
+        chunks = [(source, frame_ids) for source, frame_ids in tasks if frame_ids is None] \
+               + [(source, frame_ids[i:i+chunk_size]) for source, frame_ids in tasks if frame_ids is not None for i in range(0, len(frame_ids), chunk_size)]
+        logging.info(f'Detecting corners on {nb_frames} frames...')
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            futures = [executor.submit(detect_corners_task, source, frame_ids, corner_nb) for source, frame_ids in chunks]
+            for future in futures:
+                source, detections, img_size = future.result()
+                entry = cache_entry(source)
+                entry['frames'].update(detections)
+                entry['img_size'] = img_size or entry['img_size']
+
+        for cache_path, cache in caches.items():
+            try:
+                with open(cache_path, 'wb') as f:
+                    pickle.dump(cache, f)
+            except OSError:
+                logging.warning(f'Could not write the corner detection cache {cache_path}.')
+
+    detections, img_sizes = {}, {}
+    for source, frame_ids in sources.items():
+        frames = cache_entry(source)['frames']
+        frame_ids = [0] if frame_ids is None else frame_ids
+        detections[source] = {frame_id: frames[frame_id] for frame_id in frame_ids if frame_id in frames}
+        img_sizes[source] = cache_entry(source)['img_size']
+
+    return detections, img_sizes
+
+
 def findCorners(img_path, corner_nb, objp=[], show=True):
     '''
     Find corners in the photo of a checkerboard.
@@ -1146,20 +1393,15 @@ def extract_frames(video_path, extract_every_N_sec=1, overwrite_extraction=False
     '''
     
     if not os.path.exists(os.path.splitext(video_path)[0] + '_00000.png') or overwrite_extraction:
-        cap = cv2.VideoCapture(str(video_path))
-        if cap.isOpened():
-            fps = round(cap.get(cv2.CAP_PROP_FPS))
-            frame_nb = 0
-            logging.info(f'Extracting frames...')
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if ret == True:
-                    if frame_nb % (fps*extract_every_N_sec) == 0:
-                        img_path = (os.path.splitext(video_path)[0] + '_' +str(frame_nb).zfill(5)+'.png')
-                        cv2.imwrite(str(img_path), frame)
-                    frame_nb+=1
-                else:
-                    break
+        with VideoReader(video_path) as reader:
+            if reader.isOpened():
+                fps = round(reader.fps)
+                logging.info(f'Extracting frames...')
+                # Frames in between are only grabbed (or seeked over), not decoded
+                step = max(1, round(fps*extract_every_N_sec))
+                for frame_nb, frame in reader.frames(step=step):
+                    img_path = (os.path.splitext(video_path)[0] + '_' +str(frame_nb).zfill(5)+'.png')
+                    cv2.imwrite(str(img_path), frame)
 
 
 def trc_write(object_coords_3d, trc_path):
@@ -11,21 +11,27 @@ Functions shared between modules, and other utilities
 '''
 
 ## INIT
-import toml
 import json
-import numpy as np
+import os
 import re
-import cv2
-import c3d
 import sys
+import warnings
 
+import c3d
+import cv2
 import matplotlib as mpl
+import numpy as np
+import toml
+
+from TracX.instrumentation import count
+from TracX.motion_io import read_trc_data
+
 mpl.use('qt5agg')
 mpl.rc('figure', max_open_warning=0)
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from PyQt6.QtWidgets import QMainWindow, QApplication, QWidget, QTabWidget, QVBoxLayout
-import warnings
+from PyQt6.QtWidgets import QApplication, QMainWindow, QTabWidget, QVBoxLayout, QWidget
+
 warnings.filterwarnings("ignore", category=UserWarning, module="c3d")
 
 
@@ -214,6 +220,7 @@ def weighted_triangulation(P_all,x_all,y_all,likelihood_all):
         
     if np.shape(A)[0] >= 4:
         S, U, Vt = cv2.SVDecomp(A)
+        count('svd')
         V = Vt.T
         Q = np.array([V[0][3]/V[3][3], V[1][3]/V[3][3], V[2][3]/V[3][3], 1])
     else: 
@@ -224,25 +231,185 @@ def weighted_triangulation(P_all,x_all,y_all,likelihood_all):
 
 def reprojection(P_all, Q):
     '''
-    Reprojects 3D point on all cameras.
+    Reprojects 3D points on all cameras.
+    All points are projected at once with a single batched matrix product.
     
     INPUTS:
     - P_all: list of arrays. Projection matrix for all cameras
-    - Q: array of triangulated point (x,y,z,1.)
+    - Q: array of triangulated point (x,y,z,1.), 
+         or array of points of shape (..., 3) or (..., 4)
 
     OUTPUTS:
-    - x_calc, y_calc: list of coordinates of point reprojected on all cameras
+    - x_calc, y_calc: list of coordinates of point reprojected on all cameras,
+                      or arrays of shape (n_cams, ...) if several points are given
     '''
     
-    x_calc, y_calc = [], []
-    for c in range(len(P_all)):  
-        P_cam = P_all[c]
-        x_calc.append(P_cam[0] @ Q / (P_cam[2] @ Q))
-        y_calc.append(P_cam[1] @ Q / (P_cam[2] @ Q))
-        
+    P_all = np.asarray(P_all, dtype=float).reshape(-1, 3, 4)
+    Q = np.asarray(Q, dtype=float)
+    if Q.shape[-1] == 3:
+        Q = np.concatenate([Q, np.ones(Q.shape[:-1]+(1,))], axis=-1)
+
+    proj = np.einsum('cij,...j->c...i', P_all, Q)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_calc = proj[...,0] / proj[...,2]
+        y_calc = proj[...,1] / proj[...,2]
+
+    if Q.ndim == 1:
+        return x_calc.tolist(), y_calc.tolist()
     return x_calc, y_calc
 
 
+def reprojection_errors(P_all, Q, coords_2D):
+    '''
+    Reprojection errors of a whole trial, for all cameras, frames, and keypoints at once.
+    
+    INPUTS:
+    - P_all: list of arrays. Projection matrix for all cameras
+    - Q: array of shape (n_frames, n_keypoints, 3). Triangulated points
+    - coords_2D: array of shape (n_cams, n_frames, n_keypoints, 2). 
+                 Detected 2D points, NaN where missing
+
+    OUTPUTS:
+    - errors: array of shape (n_cams, n_frames, n_keypoints). 
+              Reprojection errors in pixels, NaN where either point is missing
+    '''
+    
+    x_calc, y_calc = reprojection(P_all, Q)
+    coords_2D = np.asarray(coords_2D, dtype=float)
+    return np.hypot(x_calc - coords_2D[...,0], y_calc - coords_2D[...,1])
+
+
+def reprojection_quality(errors, cam_names=None, keypoints_names=None, hist_bins=np.arange(0, 52.5, 2.5), outlier_factor=2.):
+    '''
+    Summarize a reprojection error tensor into per-camera, per-keypoint, and 
+    per-frame statistics and residual histograms, and flag outlier cameras.
+
+    A camera is flagged as an outlier if its median error is more than 
+    outlier_factor times the median of the median errors of the other cameras.
+    
+    INPUTS:
+    - errors: array of shape (n_cams, n_frames, n_keypoints), as from reprojection_errors
+    - cam_names: list of camera names. Defaults to cam01, cam02, ...
+    - keypoints_names: list of keypoint names. Defaults to their indices
+    - hist_bins: histogram bin edges in pixels. Larger errors fall in the last bin
+    - outlier_factor: float. Threshold for flagging outlier cameras
+
+    OUTPUTS:
+    - quality: dict of JSON-serializable statistics
+    '''
+    
+    errors = np.asarray(errors, dtype=float)
+    n_cams, n_frames, n_keypoints = errors.shape
+    if cam_names is None:
+        cam_names = [f'cam{c+1:02d}' for c in range(n_cams)]
+    if keypoints_names is None:
+        keypoints_names = [str(k) for k in range(n_keypoints)]
+    hist_bins = np.asarray(hist_bins, dtype=float)
+    valid = np.isfinite(errors)
+
+    def to_list(arr):
+        return [None if not np.isfinite(a) else round(float(a), 3) for a in np.ravel(arr)]
+
+    def histogram(err):
+        err = np.clip(err[np.isfinite(err)], hist_bins[0], hist_bins[-1])
+        return np.histogram(err, bins=hist_bins)[0].tolist()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        errors_per_cam = errors.reshape(n_cams, -1)
+        median_per_cam = np.nanmedian(errors_per_cam, axis=1)
+        per_camera = {
+            'mean': to_list(np.nanmean(errors_per_cam, axis=1)),
+            'median': to_list(median_per_cam),
+            'rms': to_list(np.sqrt(np.nanmean(errors_per_cam**2, axis=1))),
+            'valid_ratio': to_list(valid.reshape(n_cams, -1).mean(axis=1)),
+            }
+        per_keypoint = {
+            'mean': to_list(np.nanmean(errors, axis=(0,1))),
+            'median': to_list(np.nanmedian(errors.transpose(2,0,1).reshape(n_keypoints, -1), axis=1)),
+            }
+        per_frame = {'mean': to_list(np.nanmean(errors, axis=(0,2)))}
+        overall = {
+            'mean': to_list(np.nanmean(errors))[0],
+            'median': to_list(np.nanmedian(errors))[0],
+            'rms': to_list(np.sqrt(np.nanmean(errors**2)))[0],
+            'p95': to_list(np.nanpercentile(errors, 95))[0] if valid.any() else None,
+            }
+
+        # Outlier cameras
+        outlier_cams = []
+        for c in range(n_cams):
+            others = np.delete(median_per_cam, c)
+            reference = np.nanmedian(others) if len(others) > 0 else np.nan
+            if np.isfinite(median_per_cam[c]) and np.isfinite(reference) and median_per_cam[c] > outlier_factor * reference:
+                outlier_cams.append(cam_names[c])
+
+    return {
+        'cam_names': list(cam_names),
+        'keypoints_names': list(keypoints_names),
+        'n_frames': n_frames,
+        'overall': overall,
+        'per_camera': per_camera,
+        'per_keypoint': per_keypoint,
+        'per_frame': per_frame,
+        'histogram': {
+            'bin_edges': hist_bins.tolist(),
+            'all': histogram(errors),
+            'per_camera': [histogram(errors[c]) for c in range(n_cams)],
+            },
+        'outlier_factor': outlier_factor,
+        'outlier_cameras': outlier_cams,
+        }
+
+
+def quality_report_path(trc_path):
+    '''
+    Path of the reprojection quality report associated with a trc file.
+    '''
+    
+    return os.path.splitext(trc_path)[0] + '_quality.json'
+
+
+def write_quality_report(report_path, quality, errors=None):
+    '''
+    Save a quality report as compact json. 
+    The full error tensor is optionally stored next to it as a .npz file.
+    
+    INPUTS:
+    - report_path: path of the json report
+    - quality: dict, as from reprojection_quality
+    - errors: optional array of shape (n_cams, n_frames, n_keypoints)
+    '''
+    
+    with open(report_path, 'w') as f:
+        json.dump(quality, f, separators=(',', ':'))
+    if errors is not None:
+        np.savez_compressed(os.path.splitext(report_path)[0] + '.npz', errors=np.asarray(errors, dtype=np.float32))
+
+
+def read_quality_report(report_path, load_errors=False):
+    '''
+    Read a quality report written by write_quality_report.
+    
+    INPUTS:
+    - report_path: path of the json report
+    - load_errors: bool. Also load the full error tensor if it was saved
+
+    OUTPUTS:
+    - quality: dict
+    - errors (if load_errors): array of shape (n_cams, n_frames, n_keypoints), or None
+    '''
+    
+    with open(report_path, 'r') as f:
+        quality = json.load(f)
+    if not load_errors:
+        return quality
+
+    errors_path = os.path.splitext(report_path)[0] + '.npz'
+    errors = np.load(errors_path)['errors'] if os.path.exists(errors_path) else None
+    return quality, errors
+
+
 def min_with_single_indices(L, T):
     '''
     Let L be a list (size s) with T associated tuple indices (size s).
@@ -504,14 +671,11 @@ def extract_trc_data(trc_path):
     - marker_coords: Array of marker coordinates (n_frames, t+3*n_markers)
     '''
 
-    # marker names
-    with open(trc_path, 'r') as file:
-        lines = file.readlines()
-        marker_names_line = lines[3]
-        marker_names = marker_names_line.strip().split('\t')[2::3]
+    header, trc_data = read_trc_data(trc_path)
+    marker_names = header['marker_names']
 
     # time and marker coordinates
-    trc_data_np = np.genfromtxt(trc_path, skip_header=5, delimiter = '\t')[:,1:] 
+    trc_data_np = trc_data[:,1:]
 
     return marker_names, trc_data_np
 
@@ -39,6 +39,7 @@ from filterpy.common import Q_discrete_white_noise
 
 from Pose2Sim.common import plotWindow
 from Pose2Sim.common import convert_to_c3d
+from TracX.motion_io import read_trc_data, write_trc
 
 ## AUTHORSHIP INFORMATION
 __author__ = "David Pagnon"
@@ -474,31 +475,21 @@ def filter_all(config_dict):
     trc_path_out = [os.path.join(pose3d_dir, t) for t in trc_f_out]
     
     for person_id, (t_in, t_out) in enumerate(zip(trc_path_in, trc_path_out)):
-        # Read trc header
-        with open(t_in, 'r') as trc_file:
-            header = [next(trc_file) for line in range(5)]
-
-        # Read trc coordinates values
-        trc_df = pd.read_csv(t_in, sep="\t", skiprows=4)
-        frames_col, time_col = trc_df.iloc[:,0], trc_df.iloc[:,1]
-        Q_coord = trc_df.drop(trc_df.columns[[0, 1]], axis=1)
+        # Read trc header and coordinates values
+        header, trc_data = read_trc_data(t_in)
+        keypoints_names = np.array(header['marker_names'])
+        frames_col, time_col = pd.Series(trc_data[:,0]), pd.Series(trc_data[:,1])
+        Q_coord = pd.DataFrame(trc_data[:,2:], columns=[f'{c}{i+1}' for i in range(len(keypoints_names)) for c in 'XYZ'])
 
         # Filter coordinates
         Q_filt = Q_coord.apply(filter1d, axis=0, args = [config_dict, filter_type, frame_rate])
 
         # Display figures
         if display_figures:
-            # Retrieve keypoints
-            keypoints_names = pd.read_csv(t_in, sep="\t", skiprows=3, nrows=0).columns[2::3].to_numpy()
             display_figures_fun(Q_coord, Q_filt, time_col, keypoints_names, person_id)
 
         # Reconstruct trc file with filtered coordinates
-        with open(t_out, 'w') as trc_o:
-            [trc_o.write(line) for line in header]
-            Q_filt.insert(0, 'Frame#', frames_col)
-            Q_filt.insert(1, 'Time', time_col)
-            # Q_filt = Q_filt.fillna(' ')
-            Q_filt.to_csv(trc_o, sep='\t', index=False, header=None, lineterminator='\n')
+        write_trc(t_out, np.column_stack([frames_col, time_col, Q_filt]), header['lines'])
 
         # Save c3d
         if make_c3d:
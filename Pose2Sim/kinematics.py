@@ -45,6 +45,8 @@ from anytree import PreOrderIter
 import opensim
 
 from Pose2Sim.common import natural_sort_key, euclidean_distance, trimmed_mean
+from TracX.ik_runner import run_chunked_ik
+from TracX.motion_io import read_trc_data
 from TracX.skeletons import *
 
 
@@ -73,13 +75,15 @@ def read_trc(trc_path):
     '''
 
     try:
-        with open(trc_path, 'r') as trc_file:
-            header = [next(trc_file) for _ in range(5)]
+        trc_header, trc_data = read_trc_data(trc_path)
+        header = [line + '\n' for line in trc_header['lines']]
         markers = header[3].split('\t')[2::3][:-1]
-        
-        trc_df = pd.read_csv(trc_path, sep="\t", skiprows=4, encoding='utf-8')
-        frames_col, time_col = trc_df.iloc[:, 0], trc_df.iloc[:, 1]
-        Q_coords = trc_df.drop(trc_df.columns[[0, 1, -1]], axis=1)
+
+        # Coordinates columns, without the last one
+        coords_cols = header[4].rstrip('\n').split('\t')[2:-1]
+        frames_col = pd.Series(trc_data[:, 0].astype(int), name='Frame#')
+        time_col = pd.Series(trc_data[:, 1], name='Time')
+        Q_coords = pd.DataFrame(trc_data[:, 2:2+len(coords_cols)], columns=coords_cols)
 
         return Q_coords, frames_col, time_col, markers, header
     
@@ -484,11 +488,12 @@ def perform_scaling(trc_file, kinematics_dir, osim_setup_dir, model_name, right_
         raise
 
 
-def perform_IK(trc_file, kinematics_dir, osim_setup_dir, model_name, remove_IK_setup=True):
+def perform_IK(trc_file, kinematics_dir, osim_setup_dir, model_name, remove_IK_setup=True, chunk_duration=0, chunk_overlap=1, max_workers=None):
     '''
     Perform inverse kinematics based on a TRC file and a scaled OpenSim model:
     - Model markers follow the triangulated markers while respecting the model kinematic constraints
     - Joint angles are computed
+    - Optionally, the trial is split into overlapping time windows solved in parallel, then stitched back
 
     INPUTS:
     - trc_file (Path): The path to the TRC file.
@@ -496,14 +501,26 @@ def perform_IK(trc_file, kinematics_dir, osim_setup_dir, model_name, remove_IK_s
     - osim_setup_dir (Path): The directory where the OpenSim setup and model files are stored.
     - model_name (str): The name of the model.
     - remove_IK_setup (bool): Whether to remove the IK setup file after running IK.
+    - chunk_duration (float): Duration of the time windows in seconds. 0 to run IK on the whole trial at once.
+    - chunk_overlap (float): Overlap between consecutive windows in seconds.
+    - max_workers (int): Number of IK processes. None for the number of CPUs.
 
     OUTPUTS:
     - A joint angle data file (.mot).
+    - If chunked, the per-window timing and marker errors.
     '''
 
     try:
         # Retrieve data
         ik_path = get_IK_Setup(model_name, osim_setup_dir)
+        if chunk_duration and chunk_duration > 0:
+            if not trc_file.exists():
+                raise FileNotFoundError(f"TRC file does not exist: {trc_file}")
+            job = dict(trc_file=trc_file,
+                       model_file=(kinematics_dir / (trc_file.stem + '.osim')).resolve(),
+                       output_file=Path(kinematics_dir, trc_file.stem + '.mot').resolve())
+            return run_chunked_ik([job], ik_path, chunk_duration=chunk_duration, overlap=chunk_overlap, max_workers=max_workers)
+
         ik_path_temp =  str(kinematics_dir / (trc_file.stem + '_ik_setup.xml'))
         scaled_model_path = (kinematics_dir / (trc_file.stem + '.osim')).resolve()
         output_motion_file = Path(kinematics_dir, trc_file.stem + '.mot').resolve()
@@ -564,13 +581,16 @@ def kinematics(config_dict):
     # if batch
     session_dir = Path(project_dir) / '..'
     # if single trial
-    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.getcwd()
+    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.path.realpath(project_dir)
     use_augmentation = config_dict.get('kinematics').get('use_augmentation')
     if use_augmentation: model_name = 'LSTM'
     else: model_name = config_dict.get('pose').get('pose_model').upper()
     right_left_symmetry = config_dict.get('kinematics').get('right_left_symmetry')
     remove_scaling_setup = config_dict.get('kinematics').get('remove_individual_scaling_setup')
     remove_IK_setup = config_dict.get('kinematics').get('remove_individual_IK_setup')
+    ik_chunk_duration = config_dict.get('kinematics').get('ik_chunk_duration', 0)
+    ik_chunk_overlap = config_dict.get('kinematics').get('ik_chunk_overlap', 1)
+    ik_max_workers = config_dict.get('kinematics').get('ik_max_workers', 0) or None
     subject_height = config_dict.get('project').get('participant_height')
     subject_mass = config_dict.get('project').get('participant_mass')
 
@@ -619,6 +639,25 @@ def kinematics(config_dict):
         logging.warning("Number of subject masses does not match number of TRC files. Missing masses are set to 70kg.\n")
         subject_mass += [70] * (len(trc_files) - len(subject_mass))
 
+    # Chunked IK: scale each person, then solve all persons and time windows in one process pool
+    if ik_chunk_duration and ik_chunk_duration > 0:
+        for p, trc_file in enumerate(trc_files):
+            logging.info(f"Processing TRC file: {trc_file.resolve()}")
+            logging.info("Scaling...")
+            perform_scaling(trc_file, kinematics_dir, osim_setup_dir, model_name, right_left_symmetry=right_left_symmetry, subject_height=subject_height[p], subject_mass=subject_mass[p], remove_scaling_setup=remove_scaling_setup)
+            logging.info(f"\tScaled model saved to {(kinematics_dir / (trc_file.stem + '.osim')).resolve()}")
+
+        logging.info(f"Inverse Kinematics in windows of {ik_chunk_duration} s...")
+        jobs = [dict(trc_file=trc_file,
+                     model_file=(kinematics_dir / (trc_file.stem + '.osim')).resolve(),
+                     output_file=Path(kinematics_dir, trc_file.stem + '.mot').resolve())
+                for trc_file in trc_files]
+        run_chunked_ik(jobs, get_IK_Setup(model_name, osim_setup_dir), chunk_duration=ik_chunk_duration, overlap=ik_chunk_overlap, max_workers=ik_max_workers)
+        logging.info(f"\tDone. OpenSim logs saved to {opensim_logs_file.resolve()}.")
+        for job in jobs:
+            logging.info(f"\tJoint angle data saved to {job['output_file']}")
+        return
+
     # Perform scaling and IK for each trc file
     for p, trc_file in enumerate(trc_files):
         logging.info(f"Processing TRC file: {trc_file.resolve()}")
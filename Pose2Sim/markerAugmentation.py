@@ -22,9 +22,8 @@ OUTPUT:
 
 ## INIT
 import os
+import importlib.util
 import numpy as np
-import copy
-import tensorflow as tf
 import glob
 import logging
 
@@ -44,7 +43,125 @@ __email__ = "contact@david-pagnon.com"
 __status__ = "Development"
 
 
+## CONSTANTS
+# Augmenter models loaded in this process, by model directory and backend
+_AUGMENTER_CACHE = {}
+
+
+## CLASSES
+class Augmenter:
+    '''
+    LSTM marker augmenter, loaded once per process and reused for all trials.
+
+    Runs either with TensorFlow (model.json + weights.h5) or, when a model.onnx
+    export is available, with ONNX Runtime which imports and predicts faster on CPU.
+    The normalization mean and std are loaded once as well.
+
+    INPUTS:
+    - model_dir: directory of the augmenter model
+    - backend: 'tensorflow', 'onnx', or 'auto' (onnx if model.onnx exists and onnxruntime is installed)
+    '''
+
+    def __init__(self, model_dir, backend='auto'):
+        self.model_dir = model_dir
+        onnx_path = os.path.join(model_dir, 'model.onnx')
+
+        if backend == 'auto':
+            backend = 'tensorflow'
+            if os.path.isfile(onnx_path) and importlib.util.find_spec('onnxruntime') is not None:
+                backend = 'onnx'
+        if backend == 'onnx' and not os.path.isfile(onnx_path):
+            raise FileNotFoundError(f'No ONNX augmenter model found at {onnx_path}. Export it with export_augmenter_onnx().')
+        self.backend = backend
+
+        path_mean = os.path.join(model_dir, 'mean.npy')
+        path_std = os.path.join(model_dir, 'std.npy')
+        self.mean = np.load(path_mean, allow_pickle=True) if os.path.isfile(path_mean) else 0
+        self.std = np.load(path_std, allow_pickle=True) if os.path.isfile(path_std) else 1
+
+        if backend == 'onnx':
+            import onnxruntime as ort
+            self.session = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            self.model = load_keras_augmenter(model_dir)
+
+    def predict(self, inputs):
+        '''
+        Predict response markers for a batch of trials of the same length.
+
+        INPUTS:
+        - inputs: (trials, frames, features) array of normalized features
+
+        OUTPUTS:
+        - outputs: (trials, frames, 3*response_markers) array
+        '''
+
+        inputs = (inputs - self.mean) / self.std
+        if self.backend == 'onnx':
+            return self.session.run(None, {self.input_name: inputs.astype(np.float32)})[0]
+        return self.model.predict(inputs, verbose=0)
+
+
 ## FUNCTIONS
+def load_keras_augmenter(model_dir):
+    '''
+    Build the Keras augmenter model from model.json and load its weights.
+    TensorFlow is only imported when this is called.
+    '''
+
+    import tensorflow as tf
+
+    with open(os.path.join(model_dir, 'model.json'), 'r') as json_file:
+        pretrainedModel_json = json_file.read()
+    model = tf.keras.models.model_from_json(pretrainedModel_json, custom_objects={
+                            'Sequential': tf.keras.models.Sequential,
+                            'Dense': tf.keras.layers.Dense
+                            })
+    model.load_weights(os.path.join(model_dir, 'weights.h5'))
+    return model
+
+
+def get_augmenter(model_dir, backend='auto'):
+    '''
+    Return the augmenter of a model directory, loading it on first use only.
+    '''
+
+    key = (os.path.realpath(model_dir), backend)
+    if key not in _AUGMENTER_CACHE:
+        _AUGMENTER_CACHE[key] = Augmenter(model_dir, backend=backend)
+        logging.info(f'Loaded {os.path.basename(model_dir)} augmenter with {_AUGMENTER_CACHE[key].backend}.')
+    return _AUGMENTER_CACHE[key]
+
+
+def export_augmenter_onnx(model_dir, opset=13):
+    '''
+    Export a Keras augmenter model to model.onnx in the same directory,
+    so that it can be run with ONNX Runtime instead of TensorFlow.
+    Requires tf2onnx.
+
+    INPUTS:
+    - model_dir: directory of the augmenter model
+    - opset: ONNX opset version
+
+    OUTPUT:
+    - path to the exported model.onnx
+    '''
+
+    import tensorflow as tf
+    try:
+        import tf2onnx
+    except ImportError:
+        raise ImportError('Exporting the augmenter to ONNX requires tf2onnx: pip install tf2onnx')
+
+    model = load_keras_augmenter(model_dir)
+    nb_features = model.inputs[0].shape[-1]
+    input_signature = [tf.TensorSpec((None, None, nb_features), tf.float32, name='inputs')]
+    onnx_path = os.path.join(model_dir, 'model.onnx')
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=opset, output_path=onnx_path)
+    return onnx_path
+
+
 # subject_height must be in meters
 def check_midhip_data(trc_file):
     try:
@@ -84,6 +201,7 @@ def augmentTRC(config_dict):
     pathInputTRCFile = os.path.realpath(os.path.join(project_dir, 'pose-3d'))
     pathOutputTRCFile = os.path.realpath(os.path.join(project_dir, 'pose-3d'))
     make_c3d = config_dict.get('markerAugmentation').get('make_c3d')
+    backend = config_dict.get('markerAugmentation').get('backend', 'auto')
     subject_height = config_dict.get('project').get('participant_height')
     subject_mass = config_dict.get('project').get('participant_mass')
     
@@ -104,53 +222,53 @@ def augmentTRC(config_dict):
         trc_files = trc_filtering
     else:
         trc_files = trc_no_filtering
-    sorted(trc_files, key=natural_sort_key)
+    trc_files = sorted(trc_files, key=natural_sort_key)
 
     # Get subject heights and masses
     if subject_height is None or subject_height == 0:
         subject_height = [1.75] * len(trc_files)
         logging.warning("No subject height found in Config.toml. Using default height of 1.75m.")
-    elif not type(subject_height) == list: # int or float
-        subject_height = [subject_height]
+    elif not type(subject_height) == list: # int or float: same height for all trc files
+        subject_height = [subject_height] * len(trc_files)
     elif len(subject_height) < len(trc_files):
         logging.warning("Number of subject heights does not match number of TRC files. Missing heights are set to 1.75m.")
-        subject_height += [1.75] * (len(trc_files) - len(subject_height))
+        subject_height = subject_height + [1.75] * (len(trc_files) - len(subject_height))
 
     if subject_mass is None or subject_mass == 0:
         subject_mass = [70] * len(trc_files)
         logging.warning("No subject mass found in Config.toml. Using default mass of 70kg.")
     elif not type(subject_mass) == list:
-        subject_mass = [subject_mass]
+        subject_mass = [subject_mass] * len(trc_files)
     elif len(subject_mass) < len(trc_files):
         logging.warning("Number of subject masses does not match number of TRC files. Missing masses are set to 70kg.")
-        subject_mass += [70] * (len(trc_files) - len(subject_mass))
+        subject_mass = subject_mass + [70] * (len(trc_files) - len(subject_mass))
 
-    for p in range(len(subject_mass)):
-        pathInputTRCFile = trc_files[p]
-        pathOutputTRCFile = os.path.splitext(pathInputTRCFile)[0] + '_LSTM.trc'
+    # This is by default - might need to be adjusted in the future.
+    featureHeight = True
+    featureWeight = True
     
-        # This is by default - might need to be adjusted in the future.
-        featureHeight = True
-        featureWeight = True
-        
-        # Augmenter types
-        if augmenter_model == 'v0.3':
-            # Lower body           
-            augmenterModelType_lower = '{}_lower'.format(augmenter_model)
-            from Pose2Sim.MarkerAugmenter.utils import getOpenPoseMarkers_lowerExtremity2
-            feature_markers_lower, response_markers_lower = getOpenPoseMarkers_lowerExtremity2()
-            # Upper body
-            augmenterModelType_upper = '{}_upper'.format(augmenter_model)
-            from Pose2Sim.MarkerAugmenter.utils import getMarkers_upperExtremity_noPelvis2
-            feature_markers_upper, response_markers_upper = getMarkers_upperExtremity_noPelvis2()        
-            augmenterModelType_all = [augmenterModelType_lower, augmenterModelType_upper]
-            feature_markers_all = [feature_markers_lower, feature_markers_upper]
-            response_markers_all = [response_markers_lower, response_markers_upper]
-        else:
-            raise ValueError('Augmenter models other than 0.3 are not supported.')
-        logging.info('Using Stanford augmenter model: {}'.format(augmenter_model))
+    # Augmenter types
+    if augmenter_model == 'v0.3':
+        # Lower body           
+        augmenterModelType_lower = '{}_lower'.format(augmenter_model)
+        from Pose2Sim.MarkerAugmenter.utils import getOpenPoseMarkers_lowerExtremity2
+        feature_markers_lower, response_markers_lower = getOpenPoseMarkers_lowerExtremity2()
+        # Upper body
+        augmenterModelType_upper = '{}_upper'.format(augmenter_model)
+        from Pose2Sim.MarkerAugmenter.utils import getMarkers_upperExtremity_noPelvis2
+        feature_markers_upper, response_markers_upper = getMarkers_upperExtremity_noPelvis2()        
+        augmenterModelType_all = [augmenterModelType_lower, augmenterModelType_upper]
+        feature_markers_all = [feature_markers_lower, feature_markers_upper]
+        response_markers_all = [response_markers_lower, response_markers_upper]
+    else:
+        raise ValueError('Augmenter models other than 0.3 are not supported.')
+    logging.info('Using Stanford augmenter model: {}'.format(augmenter_model))
+
+    # %% Pre-process data of all trc files.
+    trials = []
+    for p in range(len(trc_files)):
+        pathInputTRCFile = trc_files[p]
         
-        # %% Process data.
         # Import TRC file
         try:
             trc_file = utilsDataman.TRCFile(pathInputTRCFile)
@@ -169,117 +287,66 @@ def augmentTRC(config_dict):
         if len(missing_markers) > 0:
             raise ValueError(f'Marker augmentation requires {missing_markers} markers and they are not present in the TRC file.')
 
-        # Loop over augmenter types to handle separate augmenters for lower and
-        # upper bodies.
-        outputs_all = {}
-        n_response_markers_all = 0
-        for idx_augm, augmenterModelType in enumerate(augmenterModelType_all):
-            outputs_all[idx_augm] = {}
-            feature_markers = feature_markers_all[idx_augm]
-            response_markers = response_markers_all[idx_augm]
-            
-            augmenterModelDir = os.path.join(augmenterDir, augmenterModelName, 
-                                             augmenterModelType)
-            
-            # %% Pre-process inputs.
-            # Step 1: import .trc file with OpenPose marker trajectories.  
-            trc_data = TRC2numpy(pathInputTRCFile, feature_markers)
-            trc_data_data = trc_data[:,1:]
-
-            # Step 2: Normalize with reference marker position.
-            referenceMarker_data = trc_file.marker("Hip")  # instead of trc_file.marker(referenceMarker) # change by HunMin
-            norm_trc_data_data = np.zeros((trc_data_data.shape[0],
-                                        trc_data_data.shape[1]))
-            for i in range(0,trc_data_data.shape[1],3):
-                norm_trc_data_data[:,i:i+3] = (trc_data_data[:,i:i+3] - 
-                                            referenceMarker_data)
-                
-                
-            # Step 3: Normalize with subject's height.
-            norm2_trc_data_data = copy.deepcopy(norm_trc_data_data)
-            norm2_trc_data_data = norm2_trc_data_data / subject_height[p]
-            
-            # Step 4: Add remaining features.
-            inputs = copy.deepcopy(norm2_trc_data_data)
-            if featureHeight:    
-                inputs = np.concatenate(
-                    (inputs, subject_height[p]*np.ones((inputs.shape[0],1))), axis=1)
-            if featureWeight:    
-                inputs = np.concatenate(
-                    (inputs, subject_mass[p]*np.ones((inputs.shape[0],1))), axis=1)
-                
-            # Step 5: Pre-process data
-            pathMean = os.path.join(augmenterModelDir, "mean.npy")
-            pathSTD = os.path.join(augmenterModelDir, "std.npy")
-            if os.path.isfile(pathMean):
-                trainFeatures_mean = np.load(pathMean, allow_pickle=True)
-                inputs -= trainFeatures_mean
-            if os.path.isfile(pathSTD):
-                trainFeatures_std = np.load(pathSTD, allow_pickle=True)
-                inputs /= trainFeatures_std 
-                
-            # Step 6: Reshape inputs if necessary (eg, LSTM)
-            if augmenterModelName == "LSTM":
-                inputs = np.reshape(inputs, (1, inputs.shape[0], inputs.shape[1]))
-                
-            # %% Load model and weights, and predict outputs.
-            json_file = open(os.path.join(augmenterModelDir, "model.json"), 'r')
-            pretrainedModel_json = json_file.read()
-            json_file.close()
-            model = tf.keras.models.model_from_json(pretrainedModel_json, custom_objects={
-                                    'Sequential': tf.keras.models.Sequential,
-                                    'Dense': tf.keras.layers.Dense
-                                    })
-            model.load_weights(os.path.join(augmenterModelDir, "weights.h5"))  
-            outputs = model.predict(inputs)
-            tf.keras.backend.clear_session()
-
-            # %% Post-process outputs.
-            # Step 1: Reshape if necessary (eg, LSTM)
-            if augmenterModelName == "LSTM":
-                outputs = np.reshape(outputs, (outputs.shape[1], outputs.shape[2]))
-                
-            # Step 2: Un-normalize with subject's height.
-            unnorm_outputs = outputs * subject_height[p]
-            
-            # Step 2: Un-normalize with reference marker position.
-            unnorm2_outputs = np.zeros((unnorm_outputs.shape[0],
-                                        unnorm_outputs.shape[1]))
-            for i in range(0,unnorm_outputs.shape[1],3):
-                unnorm2_outputs[:,i:i+3] = (unnorm_outputs[:,i:i+3] + 
-                                            referenceMarker_data)
+        # Normalize with reference marker position and subject's height, and add remaining features.
+        referenceMarker_data = trc_file.marker("Hip")  # instead of trc_file.marker(referenceMarker) # change by HunMin
+        inputs_all = []
+        for feature_markers in feature_markers_all:
+            trc_data_data = TRC2numpy(pathInputTRCFile, feature_markers)[:,1:]
+            nb_frames = trc_data_data.shape[0]
+            inputs = (trc_data_data.reshape(nb_frames, -1, 3) - referenceMarker_data[:,None,:]).reshape(nb_frames, -1)
+            inputs = inputs / subject_height[p]
+            if featureHeight:
+                inputs = np.column_stack((inputs, np.full(nb_frames, subject_height[p])))
+            if featureWeight:
+                inputs = np.column_stack((inputs, np.full(nb_frames, subject_mass[p])))
+            inputs_all.append(inputs)
+
+        trials.append(dict(trc_file=trc_file, 
+                           path=pathInputTRCFile, 
+                           height=subject_height[p], 
+                           reference=referenceMarker_data, 
+                           inputs=inputs_all, 
+                           outputs=[None]*len(augmenterModelType_all)))
+
+    # %% Predict outputs, with one model load per augmenter type,
+    # and one predict call per group of trials of the same length.
+    for idx_augm, augmenterModelType in enumerate(augmenterModelType_all):
+        augmenterModelDir = os.path.join(augmenterDir, augmenterModelName, augmenterModelType)
+        augmenter = get_augmenter(augmenterModelDir, backend=backend)
+        
+        lengths = sorted({len(trial['inputs'][idx_augm]) for trial in trials})
+        for length in lengths:
+            group = [trial for trial in trials if len(trial['inputs'][idx_augm]) == length]
+            outputs = augmenter.predict(np.stack([trial['inputs'][idx_augm] for trial in group]))
+            for trial, output in zip(group, outputs):
+                trial['outputs'][idx_augm] = output
+
+    # %% Post-process outputs and write augmented trc files.
+    for trial in trials:
+        trc_file = trial['trc_file']
+        pathOutputTRCFile = os.path.splitext(trial['path'])[0] + '_LSTM.trc'
+        
+        responses_all = []
+        for idx_augm, response_markers in enumerate(response_markers_all):
+            # Un-normalize with subject's height and reference marker position.
+            outputs = trial['outputs'][idx_augm]
+            nb_frames = outputs.shape[0]
+            unnorm_outputs = (outputs.reshape(nb_frames, -1, 3) * trial['height'] + trial['reference'][:,None,:]).reshape(nb_frames, -1)
                 
-            # %% Add markers to .trc file.
+            # Add markers to .trc file.
             for c, marker in enumerate(response_markers):
-                x = unnorm2_outputs[:,c*3]
-                y = unnorm2_outputs[:,c*3+1]
-                z = unnorm2_outputs[:,c*3+2]
-                trc_file.add_marker(marker, x, y, z)
-                
-            # %% Gather data for computing minimum y-position.
-            outputs_all[idx_augm]['response_markers'] = response_markers   
-            outputs_all[idx_augm]['response_data'] = unnorm2_outputs
-            n_response_markers_all += len(response_markers)
+                trc_file.add_marker(marker, *unnorm_outputs[:,c*3:c*3+3].T)
+            responses_all.append(unnorm_outputs)
             
-        # %% Extract minimum y-position across response markers. This is used
+        # Extract minimum y-position across response markers. This is used
         # to align feet and floor when visualizing.
-        responses_all_conc = np.zeros((unnorm2_outputs.shape[0],
-                                       n_response_markers_all*3))
-        idx_acc_res = 0
-        for idx_augm in outputs_all:
-            idx_acc_res_end = (idx_acc_res + 
-                               (len(outputs_all[idx_augm]['response_markers']))*3)
-            responses_all_conc[:,idx_acc_res:idx_acc_res_end] = (
-                outputs_all[idx_augm]['response_data'])
-            idx_acc_res = idx_acc_res_end
-        # Minimum y-position across response markers.
-        min_y_pos = np.min(responses_all_conc[:,1::3])
+        min_y_pos = np.min(np.concatenate(responses_all, axis=1)[:,1::3])
             
-        # %% If offset
+        # If offset
         if offset:
             trc_file.offset('y', -(min_y_pos-0.01))
             
-        # %% Return augmented .trc file   
+        # Return augmented .trc file   
         trc_file.write(pathOutputTRCFile)
 
         logging.info(f'Augmented marker coordinates are stored at {pathOutputTRCFile}.')
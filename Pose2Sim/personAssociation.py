@@ -44,9 +44,12 @@ import cv2
 from anytree import RenderTree
 from anytree.importer import DictImporter
 import logging
+import warnings
 
-from Pose2Sim.common import retrieve_calib_params, computeP, weighted_triangulation, \
+from Pose2Sim.common import retrieve_calib_params, computeP, \
     reprojection, euclidean_distance, sort_stringlist_by_last_number
+from TracX.instrumentation import count
+from TracX.keypoint_sink import KeypointSink
 from TracX.skeletons import *
 
 
@@ -85,6 +88,25 @@ def persons_combinations(json_files_framef):
         except:
             nb_persons_per_cam += [0]
     
+    return persons_combinations_from_counts(nb_persons_per_cam)
+
+
+def persons_combinations_from_counts(nb_persons_per_cam):
+    '''
+    Find all possible combinations of detected persons' ids, 
+    from the number of persons detected by each camera.
+    Person's id when no person detected is set to nan.
+    Combinations are listed in the order of itertools.product.
+    
+    INPUT:
+    - nb_persons_per_cam: list of int
+
+    OUTPUT:
+    - personsIDs_comb: array, list of lists of int
+    '''
+    
+    n_cams = len(nb_persons_per_cam)
+
     # persons combinations
     id_no_detect = [i for i, x in enumerate(nb_persons_per_cam) if x == 0]  # ids of cameras that have not detected any person
     nb_persons_per_cam = [x if x != 0 else 1 for x in nb_persons_per_cam] # temporarily replace persons count by 1 when no detection
@@ -95,80 +117,191 @@ def persons_combinations(json_files_framef):
     return personsIDs_comb
 
 
-def triangulate_comb(comb, coords, P_all, calib_params, config_dict):
+def read_keypoint_all_cams(json_files_framef, keypoint_id):
     '''
-    Triangulate 2D points and compute reprojection error for a combination of cameras.
+    Read the coordinates of one keypoint for all persons detected in each camera.
+    Each json file is parsed only once.
+
     INPUTS:
-    - comb: list of ints: combination of persons' ids for each camera
-    - coords: array: x, y, likelihood for each camera
-    - P_all: list of arrays: projection matrices for each camera
-    - calib_params: dict: calibration parameters
-    - config_dict: dictionary from Config.toml file
+    - json_files_framef: list of strings
+    - keypoint_id: int
+
     OUTPUTS:
-    - error_comb: float: reprojection error
-    - comb: list of ints: combination of persons' ids for each camera
-    - Q_comb: array: 3D coordinates of the triangulated point
-    ''' 
+    - nb_persons_per_cam: list of int. Number of persons in each json file
+    - coords: array (n_cams, max_nb_persons, 3). x, y, likelihood of the keypoint for 
+              each person, in the order of read_json. NaN when missing
+    '''
 
-    undistort_points = config_dict.get('triangulation').get('undistort_points')
-    likelihood_threshold = config_dict.get('personAssociation').get('likelihood_threshold_association')
+    nb_persons_per_cam, coords_per_cam = [], []
+    for js_file in json_files_framef:
+        try:
+            with open(js_file, 'r') as json_f:
+                people = json.load(json_f)['people']
+        except:
+            people = []
+        nb_persons_per_cam.append(len(people))
 
-    # Replace likelihood by 0. if under likelihood_threshold
-    coords[:,2][coords[:,2] < likelihood_threshold] = 0.
-    comb[coords[:,2] == 0.] = np.nan
+        coords_cam = []
+        try:
+            for person in people:
+                keypoints = person['pose_keypoints_2d']
+                if len(keypoints) < 3: continue
+                coord = keypoints[keypoint_id*3:keypoint_id*3+3]
+                coords_cam.append(coord if len(coord) == 3 else [np.nan]*3)
+        except:
+            coords_cam = []
+        coords_per_cam.append(coords_cam)
 
-    # Filter coords and projection_matrices containing nans
-    coords_filt = [coords[i] for i in range(len(comb)) if not np.isnan(comb[i])]
-    projection_matrices_filt = [P_all[i] for i in range(len(comb)) if not np.isnan(comb[i])]
-    if undistort_points:
-        calib_params_R_filt = [calib_params['R'][i] for i in range(len(comb)) if not np.isnan(comb[i])]
-        calib_params_T_filt = [calib_params['T'][i] for i in range(len(comb)) if not np.isnan(comb[i])]
-        calib_params_K_filt = [calib_params['K'][i] for i in range(len(comb)) if not np.isnan(comb[i])]
-        calib_params_dist_filt = [calib_params['dist'][i] for i in range(len(comb)) if not np.isnan(comb[i])]
+    max_nb_persons = max([1] + [len(c) for c in coords_per_cam])
+    coords = np.full((len(json_files_framef), max_nb_persons, 3), np.nan)
+    for c, coords_cam in enumerate(coords_per_cam):
+        if len(coords_cam) > 0:
+            coords[c, :len(coords_cam)] = np.array(coords_cam, dtype=float)
 
-    # Triangulate 2D points
-    try:
-        x_files_filt, y_files_filt, likelihood_files_filt = np.array(coords_filt).T
-        Q_comb = weighted_triangulation(projection_matrices_filt, x_files_filt, y_files_filt, likelihood_files_filt)
-    except:
-        Q_comb = [np.nan, np.nan, np.nan, 1.]
+    return nb_persons_per_cam, coords
+
+
+def fundamental_matrices(P_all):
+    '''
+    Fundamental matrices between all pairs of cameras.
+    F[i][j] maps a point of camera i to its epipolar line in camera j.
+
+    INPUTS:
+    - P_all: list of arrays. Projection matrices of all cameras
+
+    OUTPUT:
+    - F: array (n_cams, n_cams, 3, 3). Zeros on the diagonal
+    '''
+
+    n_cams = len(P_all)
+    F = np.zeros((n_cams, n_cams, 3, 3))
+    for i, j in it.permutations(range(n_cams), 2):
+        P_i, P_j = np.asarray(P_all[i], float), np.asarray(P_all[j], float)
+        center_i = np.linalg.svd(P_i)[2][-1]
+        e_j = P_j @ center_i
+        e_j_cross = np.array([[0, -e_j[2], e_j[1]], [e_j[2], 0, -e_j[0]], [-e_j[1], e_j[0], 0]])
+        F[i,j] = e_j_cross @ P_j @ np.linalg.pinv(P_i)
+
+    return F
+
+
+def epipolar_distances(coords, F):
+    '''
+    Symmetric epipolar distance between all persons of all pairs of cameras.
+
+    INPUTS:
+    - coords: array (n_cams, n_persons, 3+). x, y coordinates of a keypoint
+    - F: array (n_cams, n_cams, 3, 3), as from fundamental_matrices
+
+    OUTPUT:
+    - dist: array (n_cams, n_cams, n_persons, n_persons) in pixels. 
+            NaN when a point is missing, zeros on the diagonal
+    '''
+
+    n_cams, n_persons = coords.shape[:2]
+    q = np.concatenate([coords[...,:2], np.ones((n_cams, n_persons, 1))], axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # epipolar lines in camera j of persons from camera i: (i, j, p_i, 3)
+        lines = np.einsum('ijab,ipb->ijpa', F, q)
+        dist = np.abs(np.einsum('ijpa,jqa->ijpq', lines, q)) / np.hypot(lines[...,0], lines[...,1])[...,None]
+        dist = (dist + dist.transpose(1,0,3,2)) / 2
+    dist[np.arange(n_cams), np.arange(n_cams)] = 0
+
+    return dist
+
+
+def triangulate_combs(combs, coords, P_all, calib_params, undistort_points):
+    '''
+    Triangulate 2D points and compute reprojection errors for many 
+    combinations of persons and cameras at once.
+
+    INPUTS:
+    - combs: array (n_combs, n_cams): persons' ids for each camera, NaN if the camera is excluded
+    - coords: array (n_cams, n_persons, 3): x, y, likelihood of each person for each camera. 
+              Likelihoods under threshold must already be set to 0
+    - P_all: list of arrays: projection matrices for each camera
+    - calib_params: dict: calibration parameters
+    - undistort_points: bool
+
+    OUTPUTS:
+    - error_combs: array (n_combs): mean reprojection errors
+    - combs: array (n_combs, n_cams): combinations, with cameras of null likelihood excluded
+    - Q_combs: array (n_combs, 4): 3D coordinates of the triangulated points
+    '''
+
+    n_combs, n_cams = combs.shape
+    P_all = np.asarray(P_all, dtype=float)
+    persons = np.where(np.isnan(combs), 0, combs).astype(int)
+    points = coords[np.arange(n_cams), persons] # (n_combs, n_cams, 3)
+
+    # Exclude cameras with null likelihood
+    combs = combs.copy()
+    combs[points[...,2] == 0.] = np.nan
+    active = ~np.isnan(combs)
+    nb_active = active.sum(axis=1)
+
+    # Weighted triangulation with direct linear transform
+    x, y, likelihood = [np.where(active, points[...,i], 0.) for i in range(3)]
+    A = np.stack([P_all[None,:,0] - x[...,None]*P_all[None,:,2], 
+                  P_all[None,:,1] - y[...,None]*P_all[None,:,2]], axis=2) * likelihood[...,None,None]
+    A = A.reshape(n_combs, 2*n_cams, 4)
+    solvable = (nb_active >= 2) & np.isfinite(A).all(axis=(1,2))
+    Q_combs = np.full((n_combs, 4), np.nan)
+    Q_combs[:,3] = 1.
+    if solvable.any():
+        V = np.linalg.svd(A[solvable])[2][:,-1]
+        count('svd', int(solvable.sum()))
+        Q_combs[solvable,:3] = V[:,:3] / V[:,3:]
 
     # Reprojection
     if undistort_points:
-        coords_2D_kpt_calc_filt = [cv2.projectPoints(np.array(Q_comb[:-1]), calib_params_R_filt[i], calib_params_T_filt[i], calib_params_K_filt[i], calib_params_dist_filt[i])[0] for i in range(len(Q_comb))]
-        x_calc = [coords_2D_kpt_calc_filt[i][0,0,0] for i in range(len(Q_comb))]
-        y_calc = [coords_2D_kpt_calc_filt[i][0,0,1] for i in range(len(Q_comb))]
+        x_calc, y_calc = np.full((2, n_combs, n_cams), np.nan)
+        finite = np.isfinite(Q_combs).all(axis=1)
+        if finite.any():
+            for c in range(n_cams):
+                proj = cv2.projectPoints(Q_combs[finite,:3].reshape(-1,1,3), calib_params['R'][c], calib_params['T'][c], calib_params['K'][c], calib_params['dist'][c])[0]
+                x_calc[finite,c], y_calc[finite,c] = proj[:,0,0], proj[:,0,1]
     else:
-        x_calc, y_calc = reprojection(projection_matrices_filt, Q_comb)
+        x_calc, y_calc = reprojection(P_all, Q_combs)
+        x_calc, y_calc = x_calc.T, y_calc.T
 
-    # Reprojection error
-    error_comb_per_cam = []
-    for cam in range(len(x_calc)):
-        q_file = (x_files_filt[cam], y_files_filt[cam])
-        q_calc = (x_calc[cam], y_calc[cam])
-        error_comb_per_cam.append( euclidean_distance(q_file, q_calc) )
-    error_comb = np.mean(error_comb_per_cam)
+    # Reprojection error, same conventions as euclidean_distance
+    dx, dy = x_calc - x, y_calc - y
+    both_nan = np.isnan(dx) & np.isnan(dy)
+    error_per_cam = np.where(both_nan, np.inf, np.sqrt(np.nan_to_num(dx**2) + np.nan_to_num(dy**2)))
+    with np.errstate(invalid='ignore'):
+        error_combs = np.where(active, error_per_cam, 0.).sum(axis=1) / nb_active
 
-    return error_comb, comb, Q_comb
+    return error_combs, combs, Q_combs
 
 
-def best_persons_and_cameras_combination(config_dict, json_files_framef, personsIDs_combinations, projection_matrices, tracked_keypoint_id, calib_params):
+def best_persons_and_cameras_combination(config_dict, coords, personsIDs_combinations, projection_matrices, calib_params, fundamental_mat=None, previous_comb=None):
     '''
     Chooses the right person among the multiple ones found by
     OpenPose & excludes cameras with wrong 2d-pose estimation.
     
     1. triangulate the tracked keypoint for all possible combinations of people,
     2. compute difference between reprojection & original openpose detection,
-    3. take combination with smallest error OR all those below the error threshold
+    3. take the first combination (in the order of personsIDs_combinations) 
+       with an error below the threshold
     If error is too big, take off one or several of the cameras until err is 
     lower than "max_err_px".
+
+    Combinations are triangulated in batches, and the combination chosen on the 
+    previous frame is tried first to bound the search. If epipolar_gate_factor is set, 
+    candidates for which the epipolar distance between two cameras is much larger than 
+    the error threshold are skipped. This is faster, but may skip the combination that 
+    an exhaustive search would choose, since the error is averaged over all cameras.
     
     INPUTS:
     - a Config.toml file
-    - json_files_framef: list of strings
+    - coords: array (n_cams, n_persons, 3), as from read_keypoint_all_cams
     - personsIDs_combinations: array, list of lists of int
     - projection_matrices: list of arrays
-    - tracked_keypoint_id: int
+    - calib_params: dict: calibration parameters
+    - fundamental_mat: array (n_cams, n_cams, 3, 3), as from fundamental_matrices. No gating if None or if epipolar_gate_factor is 0
+    - previous_comb: array of persons' ids chosen on the previous frame, or None
 
     OUTPUTS:
     - errors_below_thresh: list of float
@@ -176,52 +309,103 @@ def best_persons_and_cameras_combination(config_dict, json_files_framef, persons
     '''
     
     error_threshold_tracking = config_dict.get('personAssociation').get('single_person').get('reproj_error_threshold_association')
+    epipolar_gate_factor = config_dict.get('personAssociation').get('single_person').get('epipolar_gate_factor', 0)
+    likelihood_threshold = config_dict.get('personAssociation').get('likelihood_threshold_association')
     min_cameras_for_triangulation = config_dict.get('triangulation').get('min_cameras_for_triangulation')
     undistort_points = config_dict.get('triangulation').get('undistort_points')
 
-    n_cams = len(json_files_framef)
+    n_cams = len(coords)
+    coords = coords.copy()
+
+    # undistort points
+    if undistort_points:
+        for c in range(n_cams):
+            undistorted_points = cv2.undistortPoints(np.ascontiguousarray(coords[c,:,None,:2]), calib_params['K'][c], calib_params['dist'][c], None, calib_params['optim_K'][c])
+            coords[c,:,:2] = undistorted_points[:,0]
+
+    # Replace likelihood by 0. if under likelihood_threshold
+    with np.errstate(invalid='ignore'):
+        coords[...,2][coords[...,2] < likelihood_threshold] = 0.
+
+    # Epipolar gating
+    if fundamental_mat is not None and epipolar_gate_factor:
+        too_far = epipolar_distances(coords, fundamental_mat) > epipolar_gate_factor * error_threshold_tracking
+    else:
+        too_far = None
+
+    # Index of the combination chosen on the previous frame
+    nb_persons_per_cam = [1 if np.isnan(personsIDs_combinations[:,c]).all() else int(np.nanmax(personsIDs_combinations[:,c]))+1 for c in range(n_cams)]
+    previous_id = None
+    if previous_comb is not None:
+        previous_persons = [int(p) if not np.isnan(p) and p < nb_persons_per_cam[c] else 0 for c, p in enumerate(previous_comb)]
+        previous_id = int(np.ravel_multi_index(previous_persons, nb_persons_per_cam))
+
+    def best_subsets(comb_ids, cams_off, gate=True):
+        # Best subset of cameras for each combination.
+        # Without gating, the first subset with a NaN error is kept if any, as np.argmin does
+        combs = np.repeat(personsIDs_combinations[comb_ids], len(cams_off), axis=0)
+        combs[np.tile(cams_off, (len(comb_ids), 1))] = np.nan
+        error_combs = np.full(len(combs), np.inf)
+        Q_combs = np.full((len(combs), 4), np.nan)
+
+        candidates = np.ones(len(combs), bool)
+        if gate and too_far is not None:
+            cams = np.arange(n_cams)
+            persons = np.where(np.isnan(combs), 0, combs).astype(int)
+            active = ~np.isnan(combs) & (coords[cams, persons, 2] != 0.)
+            pairs_too_far = too_far[cams[:,None], cams[None,:], persons[:,:,None], persons[:,None,:]]
+            candidates = ~(pairs_too_far & active[:,:,None] & active[:,None,:]).any(axis=(1,2))
+        if candidates.any():
+            error_combs[candidates], combs[candidates], Q_combs[candidates] = triangulate_combs(combs[candidates], coords, projection_matrices, calib_params, undistort_points)
+
+        error_combs = error_combs.reshape(len(comb_ids), len(cams_off))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            error_min = np.nanmin(error_combs, axis=1)
+        if gate:
+            all_nan = np.isnan(error_combs).all(axis=1)
+            best = np.where(all_nan, 0, np.nanargmin(np.where(np.isnan(error_combs), np.inf, error_combs), axis=1))
+        else:
+            best = np.argmin(error_combs, axis=1)
+        best = np.arange(len(comb_ids)) * len(cams_off) + best
+        return error_min, combs[best], Q_combs[best]
+
+    def first_below_threshold(comb_ids, cams_off):
+        # First combination with an error below threshold, evaluated in batches
+        batch_size = max(1, 4096 // len(cams_off))
+        for start in range(0, len(comb_ids), batch_size):
+            error_min, combs, Q_combs = best_subsets(comb_ids[start:start+batch_size], cams_off)
+            below = np.flatnonzero(error_min < error_threshold_tracking)
+            if len(below) > 0:
+                return error_min[below[0]], combs[below[0]], Q_combs[below[0]]
+        return None
+
     error_min = np.inf 
+    comb_error_min, Q_kpt = [np.full(n_cams, np.nan)], [np.array([np.nan, np.nan, np.nan, 1.])]
     nb_cams_off = 0 # cameras will be taken-off until the reprojection error is under threshold
-    Q_kpt = []
+    all_ids = np.arange(len(personsIDs_combinations))
     while error_min > error_threshold_tracking and n_cams - nb_cams_off >= min_cameras_for_triangulation:
-        # Try all persons combinations
-        for combination in personsIDs_combinations:
-            #  Get coords from files
-            coords = []
-            for index_cam, person_nb in enumerate(combination):
-                try:
-                    js = read_json(json_files_framef[index_cam])
-                    coords.append(js[int(person_nb)][tracked_keypoint_id*3:tracked_keypoint_id*3+3])
-                except:
-                    coords.append([np.nan, np.nan, np.nan])
-            coords = np.array(coords)
-            
-            # undistort points
-            if undistort_points:
-                points = np.array(coords)[:,None,:2]
-                undistorted_points = [cv2.undistortPoints(points[i], calib_params['K'][i], calib_params['dist'][i], None, calib_params['optim_K'][i]) for i in range(n_cams)]
-                coords[:,0] = np.array([[u[i][0][0] for i in range(len(u))] for u in undistorted_points]).squeeze()
-                coords[:,1] = np.array([[u[i][0][1] for i in range(len(u))] for u in undistorted_points]).squeeze()
-
-            # For each persons combination, create subsets with "nb_cams_off" cameras excluded
-            id_cams_off = list(it.combinations(range(len(combination)), nb_cams_off))
-            combinations_with_cams_off = np.array([combination.copy()]*len(id_cams_off))
-            for i, id in enumerate(id_cams_off):
-                combinations_with_cams_off[i,id] = np.nan
-
-            # Try all subsets
-            error_comb_all, comb_all, Q_comb_all = [], [], []
-            for comb in combinations_with_cams_off:
-                error_comb, comb, Q_comb = triangulate_comb(comb, coords, projection_matrices, calib_params, config_dict)
-                error_comb_all.append(error_comb)
-                comb_all.append(comb)
-                Q_comb_all.append(Q_comb)
-
-            error_min = np.nanmin(error_comb_all)
-            comb_error_min = [comb_all[np.argmin(error_comb_all)]]
-            Q_kpt = [Q_comb_all[np.argmin(error_comb_all)]]
-            if error_min < error_threshold_tracking:
-                break 
+        # For each persons combination, create subsets with "nb_cams_off" cameras excluded
+        id_cams_off = list(it.combinations(range(n_cams), nb_cams_off))
+        cams_off = np.zeros((len(id_cams_off), n_cams), bool)
+        for i, id in enumerate(id_cams_off):
+            cams_off[i, list(id)] = True
+
+        # Try the previous combination first: no later one can be chosen if it is below threshold
+        search_ids = all_ids
+        result = None
+        if previous_id is not None:
+            result = first_below_threshold(all_ids[previous_id:previous_id+1], cams_off)
+            if result is not None:
+                search_ids = all_ids[:previous_id]
+        result = first_below_threshold(search_ids, cams_off) or result
+        
+        if result is not None:
+            error_min, comb, Q = result
+        else:
+            # No combination below threshold: keep the last one
+            error_min, comb, Q = [r[0] for r in best_subsets(all_ids[-1:], cams_off, gate=False)]
+        comb_error_min, Q_kpt = [comb], [Q]
 
         nb_cams_off += 1
     
@@ -520,7 +704,7 @@ def person_index_per_cam(affinity, cum_persons_per_view, min_cameras_for_triangu
     return proposals
 
 
-def rewrite_json_files(json_tracked_files_f, json_files_f, proposals, n_cams):
+def rewrite_json_files(json_tracked_files_f, json_files_f, proposals, n_cams, sink=None):
     '''
     Write new json files with correct association of people across cameras.
 
@@ -529,6 +713,7 @@ def rewrite_json_files(json_tracked_files_f, json_files_f, proposals, n_cams):
     - json_files_f: list of strings: json files to read
     - proposals: 2D array: n_persons * n_cams
     - n_cams: int: number of cameras
+    - sink: optional KeypointSink writing the files in the background
 
     OUTPUT:
     - json files with correct association of people across cameras
@@ -536,19 +721,26 @@ def rewrite_json_files(json_tracked_files_f, json_files_f, proposals, n_cams):
 
     for cam in range(n_cams):
         try:
-            with open(json_tracked_files_f[cam], 'w') as json_tracked_f:
-                with open(json_files_f[cam], 'r') as json_f:
-                    js = json.load(json_f)
-                    js_new = js.copy()
-                    js_new['people'] = []
-                    for new_comb in proposals:
-                        if not np.isnan(new_comb[cam]):
-                            js_new['people'] += [js['people'][int(new_comb[cam])]]
-                        else:
-                            js_new['people'] += [{}]
-                json_tracked_f.write(json.dumps(js_new))
+            with open(json_files_f[cam], 'r') as json_f:
+                js = json.load(json_f)
+                js_new = js.copy()
+                js_new['people'] = []
+                for new_comb in proposals:
+                    if not np.isnan(new_comb[cam]):
+                        js_new['people'] += [js['people'][int(new_comb[cam])]]
+                    else:
+                        js_new['people'] += [{}]
         except:
-            os.remove(json_tracked_files_f[cam])
+            if os.path.isfile(json_tracked_files_f[cam]): os.remove(json_tracked_files_f[cam])
+            continue
+
+        if sink is not None:
+            sink.write(json_tracked_files_f[cam], js_new)
+        else:
+            with open(json_tracked_files_f[cam], 'w') as json_tracked_f:
+                json_string = json.dumps(js_new)
+                json_tracked_f.write(json_string)
+                count('json_bytes', len(json_string))
 
 
 def recap_tracking(config_dict, error=0, nb_cams_excluded=0):
@@ -571,7 +763,7 @@ def recap_tracking(config_dict, error=0, nb_cams_excluded=0):
     # if batch
     session_dir = os.path.realpath(os.path.join(project_dir, '..'))
     # if single trial
-    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.getcwd()
+    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.path.realpath(project_dir)
     multi_person = config_dict.get('project').get('multi_person')
     likelihood_threshold_association = config_dict.get('personAssociation').get('likelihood_threshold_association')
     tracked_keypoint = config_dict.get('personAssociation').get('single_person').get('tracked_keypoint')
@@ -633,7 +825,7 @@ def associate_all(config_dict):
     # if batch
     session_dir = os.path.realpath(os.path.join(project_dir, '..'))
     # if single trial
-    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.getcwd()
+    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.path.realpath(project_dir)
     multi_person = config_dict.get('project').get('multi_person')
     pose_model = config_dict.get('pose').get('pose_model')
     tracked_keypoint = config_dict.get('personAssociation').get('single_person').get('tracked_keypoint')
@@ -703,49 +895,55 @@ def associate_all(config_dict):
                     Found {len(P_all)} cameras in the calibration file,\
                     and {n_cams} cameras based on the number of pose folders.')
     
-    for f in tqdm(range(*f_range)):
-        # print(f'\nFrame {f}:')
-        json_files_names_f = [[j for j in json_files_names[c] if int(re.split(r'(\d+)',j)[-2])==f] for c in range(n_cams)]
-        json_files_names_f = [j for j_list in json_files_names_f for j in (j_list or ['none'])]
-        try:
-            json_files_f = [os.path.join(poseSync_dir, json_dirs_names[c], json_files_names_f[c]) for c in range(n_cams)]
-            with open(os.path.exist(json_files_f[0])) as json_exist_test: pass
-        except:
-            json_files_f = [os.path.join(pose_dir, json_dirs_names[c], json_files_names_f[c]) for c in range(n_cams)]
-        json_tracked_files_f = [os.path.join(poseTracked_dir, json_dirs_names[c], json_files_names_f[c]) for c in range(n_cams)]
-
-        if not multi_person:
-            # all possible combinations of persons
-            personsIDs_comb = persons_combinations(json_files_f) 
+    F_all = fundamental_matrices(P_all)
+    previous_comb = None
+    with KeypointSink() as sink: # json files are written in the background
+        for f in tqdm(range(*f_range)):
+            # print(f'\nFrame {f}:')
+            count('frames')
+            json_files_names_f = [[j for j in json_files_names[c] if int(re.split(r'(\d+)',j)[-2])==f] for c in range(n_cams)]
+            json_files_names_f = [j for j_list in json_files_names_f for j in (j_list or ['none'])]
+            try:
+                json_files_f = [os.path.join(poseSync_dir, json_dirs_names[c], json_files_names_f[c]) for c in range(n_cams)]
+                with open(os.path.exist(json_files_f[0])) as json_exist_test: pass
+            except:
+                json_files_f = [os.path.join(pose_dir, json_dirs_names[c], json_files_names_f[c]) for c in range(n_cams)]
+            json_tracked_files_f = [os.path.join(poseTracked_dir, json_dirs_names[c], json_files_names_f[c]) for c in range(n_cams)]
+
+            if not multi_person:
+                # tracked keypoint of all persons, and all possible combinations of persons
+                nb_persons_per_cam, coords_f = read_keypoint_all_cams(json_files_f, tracked_keypoint_id)
+                personsIDs_comb = persons_combinations_from_counts(nb_persons_per_cam) 
             
-            # choose persons of interest and exclude cameras with bad pose estimation
-            error_proposals, proposals, Q_kpt = best_persons_and_cameras_combination(config_dict, json_files_f, personsIDs_comb, P_all, tracked_keypoint_id, calib_params)
-
-            if not np.isinf(error_proposals):
-                error_min_tot.append(np.nanmean(error_proposals))
-            cameras_off_count = np.count_nonzero([np.isnan(comb) for comb in proposals]) / len(proposals)
-            cameras_off_tot.append(cameras_off_count)            
-
-        else:
-            # read data
-            all_json_data_f = []
-            for js_file in json_files_f:
-                all_json_data_f.append(read_json(js_file))
-            #TODO: remove people with average likelihood < 0.3, no full torso, less than 12 joints... (cf filter2d in dataset/base.py L498)
+                # choose persons of interest and exclude cameras with bad pose estimation
+                error_proposals, proposals, Q_kpt = best_persons_and_cameras_combination(config_dict, coords_f, personsIDs_comb, P_all, calib_params, F_all, previous_comb)
+                previous_comb = proposals[0]
+
+                if not np.isinf(error_proposals):
+                    error_min_tot.append(np.nanmean(error_proposals))
+                cameras_off_count = np.count_nonzero([np.isnan(comb) for comb in proposals]) / len(proposals)
+                cameras_off_tot.append(cameras_off_count)            
+
+            else:
+                # read data
+                all_json_data_f = []
+                for js_file in json_files_f:
+                    all_json_data_f.append(read_json(js_file))
+                #TODO: remove people with average likelihood < 0.3, no full torso, less than 12 joints... (cf filter2d in dataset/base.py L498)
             
-            # obtain proposals after computing affinity between all the people in the different views
-            persons_per_view = [0] + [len(j) for j in all_json_data_f]
-            cum_persons_per_view = np.cumsum(persons_per_view)
-            affinity = compute_affinity(all_json_data_f, calib_params, cum_persons_per_view, reconstruction_error_threshold=reconstruction_error_threshold)
-            circ_constraint = circular_constraint(cum_persons_per_view)
-            affinity = affinity * circ_constraint
-            #TODO: affinity without hand, face, feet (cf ray.py L31)
-            affinity = matchSVT(affinity, cum_persons_per_view, circ_constraint, max_iter = 20, w_rank = 50, tol = 1e-4, w_sparse=0.1)
-            affinity[affinity<min_affinity] = 0
-            proposals = person_index_per_cam(affinity, cum_persons_per_view, min_cameras_for_triangulation)
+                # obtain proposals after computing affinity between all the people in the different views
+                persons_per_view = [0] + [len(j) for j in all_json_data_f]
+                cum_persons_per_view = np.cumsum(persons_per_view)
+                affinity = compute_affinity(all_json_data_f, calib_params, cum_persons_per_view, reconstruction_error_threshold=reconstruction_error_threshold)
+                circ_constraint = circular_constraint(cum_persons_per_view)
+                affinity = affinity * circ_constraint
+                #TODO: affinity without hand, face, feet (cf ray.py L31)
+                affinity = matchSVT(affinity, cum_persons_per_view, circ_constraint, max_iter = 20, w_rank = 50, tol = 1e-4, w_sparse=0.1)
+                affinity[affinity<min_affinity] = 0
+                proposals = person_index_per_cam(affinity, cum_persons_per_view, min_cameras_for_triangulation)
         
-        # rewrite json files with a single or multiple persons of interest
-        rewrite_json_files(json_tracked_files_f, json_files_f, proposals, n_cams)
+            # rewrite json files with a single or multiple persons of interest
+            rewrite_json_files(json_tracked_files_f, json_files_f, proposals, n_cams, sink=sink)
 
 
     # recap message
@@ -37,12 +37,16 @@ import glob
 import json
 import logging
 import itertools as it
+from collections import deque
 from tqdm import tqdm
 import numpy as np
 import cv2
 
 from Pose2Sim.common import natural_sort_key, min_with_single_indices, euclidean_distance
-from TracX_rtmlib import Body, BodyWithFeet, BodyWithSpine, Face, Hand, PoseTracker, Wholebody, draw_skeleton
+from TracX.instrumentation import count, span
+from TracX.keypoint_sink import KeypointSink
+from TracX.video_reader import VideoReader
+from TracX_rtmlib import BatchPoseTracker, Body, BodyWithFeet, BodyWithSpine, Face, Hand, PoseTracker, Wholebody, draw_skeleton, pooled_solution
 
 
 ## AUTHORSHIP INFORMATION
@@ -57,7 +61,7 @@ __status__ = "Development"
 
 
 ## FUNCTIONS
-def save_to_openpose(json_file_path, keypoints, scores):
+def save_to_openpose(json_file_path, keypoints, scores, sink=None):
     '''
     Save the keypoints and scores to a JSON file in the OpenPose format
 
@@ -65,6 +69,7 @@ def save_to_openpose(json_file_path, keypoints, scores):
     - json_file_path: Path to save the JSON file
     - keypoints: Detected keypoints
     - scores: Confidence scores for each keypoint
+    - sink: Optional KeypointSink writing the file in the background
 
     OUTPUTS:
     - JSON file with the detected keypoints and confidence scores in the OpenPose format
@@ -94,10 +99,15 @@ def save_to_openpose(json_file_path, keypoints, scores):
     json_output = {"version": 1.3, "people": detections}
     
     # Save JSON output for each frame
+    if sink is not None:
+        sink.write(json_file_path, json_output)
+        return
     json_output_dir = os.path.abspath(os.path.join(json_file_path, '..'))
     if not os.path.isdir(json_output_dir): os.makedirs(json_output_dir)
+    json_string = json.dumps(json_output)
     with open(json_file_path, 'w') as json_file:
-        json.dump(json_output, json_file)
+        json_file.write(json_string)
+    count('json_bytes', len(json_string))
 
    
 def sort_people_sports2d(keyptpre, keypt, scores):
@@ -162,7 +172,7 @@ def process_video(video_path, pose_tracker, output_format, save_video, save_imag
     
     INPUTS:
     - video_path: str. Path to the input video file
-    - pose_tracker: PoseTracker. Initialized pose tracker object from RTMLib
+    - pose_tracker: PoseTracker or BatchPoseTracker. Initialized pose tracker object from RTMLib
     - output_format: str. Output format for the pose estimation results ('openpose', 'mmpose', 'deeplabcut')
     - save_video: bool. Whether to save the output video
     - save_images: bool. Whether to save the output images
@@ -175,54 +185,110 @@ def process_video(video_path, pose_tracker, output_format, save_video, save_imag
     - if save_images: Image files with the detected keypoints and confidence scores drawn on the frames
     '''
 
-    try:
-        cap = cv2.VideoCapture(video_path)
-        cap.read()
-        if cap.read()[0] == False:
-            raise
-    except:
-        raise NameError(f"{video_path} is not a video. Images must be put in one subdirectory per camera.")
+    process_videos([video_path], pose_tracker, output_format, save_video, save_images, display_detection, frame_range, multi_person)
+
+
+def process_videos(video_paths, pose_tracker, output_format, save_video, save_images, display_detection, frame_range, multi_person):
+    '''
+    Estimate pose from synchronized video files, one timestamp at a time.
+
+    With a BatchPoseTracker, the frames of all cameras, and of several timestamps, 
+    are gathered in the same detection and pose inference calls. 
+    With a PoseTracker, only one video can be processed at a time.
     
-    pose_dir = os.path.abspath(os.path.join(video_path, '..', '..', 'pose'))
-    if not os.path.isdir(pose_dir): os.makedirs(pose_dir)
-    video_name_wo_ext = os.path.splitext(os.path.basename(video_path))[0]
-    json_output_dir = os.path.join(pose_dir, f'{video_name_wo_ext}_json')
-    output_video_path = os.path.join(pose_dir, f'{video_name_wo_ext}_pose.mp4')
-    img_output_dir = os.path.join(pose_dir, f'{video_name_wo_ext}_img')
+    INPUTS:
+    - video_paths: list of str. Paths to the input video files
+    - pose_tracker: BatchPoseTracker, or PoseTracker if there is only one video
+    - output_format, save_video, save_images, display_detection, frame_range, multi_person: see process_video
+
+    OUTPUTS:
+    - For each video, JSON files with the detected keypoints and confidence scores in the OpenPose format
+    - if save_video: Video files with the detected keypoints and confidence scores drawn on the frames
+    - if save_images: Image files with the detected keypoints and confidence scores drawn on the frames
+    '''
+
+    if len(video_paths) > 1 and not hasattr(pose_tracker, 'run'):
+        raise ValueError('Several videos can only be processed together with a BatchPoseTracker.')
+
+    cams = []
+    for video_path in video_paths:
+        reader = VideoReader(video_path)
+        if not (reader.isOpened() and reader.grab()):
+            for cam in cams: cam['reader'].release()
+            reader.release()
+            raise NameError(f"{video_path} is not a video. Images must be put in one subdirectory per camera.")
     
-    if save_video: # Set up video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v') # Codec for the output video
-        fps = cap.get(cv2.CAP_PROP_FPS) # Get the frame rate from the raw video
-        W, H = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) # Get the width and height from the raw video
-        out = cv2.VideoWriter(output_video_path, fourcc, fps, (W, H)) # Create the output video file
-        
-    if display_detection:
-        cv2.namedWindow(f"Pose Estimation {os.path.basename(video_path)}", cv2.WINDOW_NORMAL + cv2.WINDOW_KEEPRATIO)
+        pose_dir = os.path.abspath(os.path.join(video_path, '..', '..', 'pose'))
+        if not os.path.isdir(pose_dir): os.makedirs(pose_dir)
+        video_name_wo_ext = os.path.splitext(os.path.basename(video_path))[0]
+        cam = {'reader': reader,
+               'video_name_wo_ext': video_name_wo_ext,
+               'json_output_dir': os.path.join(pose_dir, f'{video_name_wo_ext}_json'),
+               'output_video_path': os.path.join(pose_dir, f'{video_name_wo_ext}_pose.mp4'),
+               'img_output_dir': os.path.join(pose_dir, f'{video_name_wo_ext}_img'),
+               'window_name': f"Pose Estimation {os.path.basename(video_path)}",
+               'prev_keypoints': None}
+    
+        if save_video: # Set up video writer
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v') # Codec for the output video
+            fps = reader.fps # Get the frame rate from the raw video
+            W, H = reader.width, reader.height # Get the width and height from the raw video
+            cam['out'] = cv2.VideoWriter(cam['output_video_path'], fourcc, fps, (W, H)) # Create the output video file
+            
+        if display_detection:
+            cv2.namedWindow(cam['window_name'], cv2.WINDOW_NORMAL + cv2.WINDOW_KEEPRATIO)
+        cams.append(cam)
 
-    frame_idx = 0
-    cap = cv2.VideoCapture(video_path)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    # Only decode the frames in range: seek to the first one, stop after the last one
+    total_frames = max(cam['reader'].frame_count for cam in cams)
     f_range = [[total_frames] if frame_range==[] else frame_range][0]
-    with tqdm(total=total_frames, desc=f'Processing {os.path.basename(video_path)}') as pbar:
-        while cap.isOpened():
-            # print('\nFrame ', frame_idx)
-            success, frame = cap.read()
-            if not success:
+    frame_indices = range(*f_range)
+    for cam in cams:
+        cam['frames'] = cam['reader'].frames(frame_indices.start, frame_indices.stop, frame_indices.step)
+
+    # Frames of each timestamp, by camera. Cameras whose video has ended are left out
+    decoded = deque()
+    def frame_sets():
+        while True:
+            with span('decode'):
+                frames = {c: next(cam['frames'], (None, None)) for c, cam in enumerate(cams)}
+                frames = {c: f for c, f in frames.items() if f[1] is not None}
+            if not frames:
+                return
+            decoded.append(frames)
+            yield {c: frame for c, (_, frame) in frames.items()}
+
+    if hasattr(pose_tracker, 'run'):
+        poses = pose_tracker.run(frame_sets())
+    else:
+        poses = ({0: pose_tracker(frames[0])} for frames in frame_sets())
+
+    desc = f'Processing {os.path.basename(video_paths[0])}' if len(video_paths)==1 else f'Processing {len(video_paths)} videos'
+    # JSON files are written in the background, in order, while the next frames are processed
+    with KeypointSink() as sink, tqdm(total=len(frame_indices[:total_frames]), desc=desc) as pbar:
+        quit = False
+        while not quit:
+            with span('pose'):
+                frame_poses = next(poses, None)
+            if frame_poses is None:
                 break
-            
-            if frame_idx in range(*f_range):
-                # Perform pose estimation on the frame
-                keypoints, scores = pose_tracker(frame)
+            frames = decoded.popleft()
+
+            for c, (keypoints, scores) in frame_poses.items():
+                cam = cams[c]
+                frame_idx, frame = frames[c]
+                count('frames')
+                count('persons', len(keypoints))
 
                 # Tracking people IDs across frames
                 if multi_person:
-                    if 'prev_keypoints' not in locals(): prev_keypoints = keypoints
-                    prev_keypoints, keypoints, scores = sort_people_sports2d(prev_keypoints, keypoints, scores)
+                    if cam['prev_keypoints'] is None: cam['prev_keypoints'] = keypoints
+                    cam['prev_keypoints'], keypoints, scores = sort_people_sports2d(cam['prev_keypoints'], keypoints, scores)
            
                 # Save to json
                 if 'openpose' in output_format:
-                    json_file_path = os.path.join(json_output_dir, f'{video_name_wo_ext}_{frame_idx:06d}.json')
-                    save_to_openpose(json_file_path, keypoints, scores)
+                    json_file_path = os.path.join(cam['json_output_dir'], f"{cam['video_name_wo_ext']}_{frame_idx:06d}.json")
+                    save_to_openpose(json_file_path, keypoints, scores, sink=sink)
 
                 # Draw skeleton on the frame
                 if display_detection or save_video or save_images:
@@ -230,26 +296,26 @@ def process_video(video_path, pose_tracker, output_format, save_video, save_imag
                     img_show = draw_skeleton(img_show, keypoints, scores, kpt_thr=0.1) # maybe change this value if 0.1 is too low
                 
                 if display_detection:
-                    cv2.imshow(f"Pose Estimation {os.path.basename(video_path)}", img_show)
+                    cv2.imshow(cam['window_name'], img_show)
                     if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
+                        quit = True
 
                 if save_video:
-                    out.write(img_show)
+                    cam['out'].write(img_show)
 
                 if save_images:
-                    if not os.path.isdir(img_output_dir): os.makedirs(img_output_dir)
-                    cv2.imwrite(os.path.join(img_output_dir, f'{video_name_wo_ext}_{frame_idx:06d}.png'), img_show)
+                    if not os.path.isdir(cam['img_output_dir']): os.makedirs(cam['img_output_dir'])
+                    cv2.imwrite(os.path.join(cam['img_output_dir'], f"{cam['video_name_wo_ext']}_{frame_idx:06d}.png"), img_show)
 
-            frame_idx += 1
             pbar.update(1)
 
-    cap.release()
-    if save_video:
-        out.release()
-        logging.info(f"--> Output video saved to {output_video_path}.")
-    if save_images:
-        logging.info(f"--> Output images saved to {img_output_dir}.")
+    for cam in cams:
+        cam['reader'].release()
+        if save_video:
+            cam['out'].release()
+            logging.info(f"--> Output video saved to {cam['output_video_path']}.")
+        if save_images:
+            logging.info(f"--> Output images saved to {cam['img_output_dir']}.")
     if display_detection:
         cv2.destroyAllWindows()
 
@@ -293,43 +359,48 @@ def process_images(image_folder_path, vid_img_extension, pose_tracker, output_fo
         cv2.namedWindow(f"Pose Estimation {os.path.basename(image_folder_path)}", cv2.WINDOW_NORMAL)
     
     f_range = [[len(image_files)] if frame_range==[] else frame_range][0]
-    for frame_idx, image_file in enumerate(tqdm(image_files, desc=f'\nProcessing {os.path.basename(img_output_dir)}')):
-        if frame_idx in range(*f_range):
+    with KeypointSink() as sink: # JSON files are written in the background
+        for frame_idx, image_file in enumerate(tqdm(image_files, desc=f'\nProcessing {os.path.basename(img_output_dir)}')):
+            if frame_idx in range(*f_range):
 
-            try:
-                frame = cv2.imread(image_file)
-            except:
-                raise NameError(f"{image_file} is not an image. Videos must be put in the video directory, not in subdirectories.")
+                try:
+                    with span('decode'):
+                        frame = cv2.imread(image_file)
+                except:
+                    raise NameError(f"{image_file} is not an image. Videos must be put in the video directory, not in subdirectories.")
             
-            # Perform pose estimation on the image
-            keypoints, scores = pose_tracker(frame)
+                # Perform pose estimation on the image
+                with span('pose', frame=frame_idx):
+                    keypoints, scores = pose_tracker(frame)
+                count('frames')
+                count('persons', len(keypoints))
 
-            # Tracking people IDs across frames
-            if multi_person:
-                if 'prev_keypoints' not in locals(): prev_keypoints = keypoints
-                prev_keypoints, keypoints, scores = sort_people_sports2d(prev_keypoints, keypoints, scores)
+                # Tracking people IDs across frames
+                if multi_person:
+                    if 'prev_keypoints' not in locals(): prev_keypoints = keypoints
+                    prev_keypoints, keypoints, scores = sort_people_sports2d(prev_keypoints, keypoints, scores)
             
-            # Extract frame number from the filename
-            if 'openpose' in output_format:
-                json_file_path = os.path.join(json_output_dir, f"{os.path.splitext(os.path.basename(image_file))[0]}_{frame_idx:06d}.json")
-                save_to_openpose(json_file_path, keypoints, scores)
+                # Extract frame number from the filename
+                if 'openpose' in output_format:
+                    json_file_path = os.path.join(json_output_dir, f"{os.path.splitext(os.path.basename(image_file))[0]}_{frame_idx:06d}.json")
+                    save_to_openpose(json_file_path, keypoints, scores, sink=sink)
 
-            # Draw skeleton on the image
-            if display_detection or save_video or save_images:
-                img_show = frame.copy()
-                img_show = draw_skeleton(img_show, keypoints, scores, kpt_thr=0.1) # maybe change this value if 0.1 is too low
+                # Draw skeleton on the image
+                if display_detection or save_video or save_images:
+                    img_show = frame.copy()
+                    img_show = draw_skeleton(img_show, keypoints, scores, kpt_thr=0.1) # maybe change this value if 0.1 is too low
 
-            if display_detection:
-                cv2.imshow(f"Pose Estimation {os.path.basename(image_folder_path)}", img_show)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+                if display_detection:
+                    cv2.imshow(f"Pose Estimation {os.path.basename(image_folder_path)}", img_show)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
 
-            if save_video:
-                out.write(img_show)
+                if save_video:
+                    out.write(img_show)
 
-            if save_images:
-                if not os.path.isdir(img_output_dir): os.makedirs(img_output_dir)
-                cv2.imwrite(os.path.join(img_output_dir, f'{os.path.splitext(os.path.basename(image_file))[0]}_{frame_idx:06d}.png'), img_show)
+                if save_images:
+                    if not os.path.isdir(img_output_dir): os.makedirs(img_output_dir)
+                    cv2.imwrite(os.path.join(img_output_dir, f'{os.path.splitext(os.path.basename(image_file))[0]}_{frame_idx:06d}.png'), img_show)
 
     if save_video:
         logging.info(f"--> Output video saved to {output_video_path}.")
@@ -369,7 +440,7 @@ def rtm_estimator(config_dict):
     # if batch
     session_dir = os.path.realpath(os.path.join(project_dir, '..'))
     # if single trial
-    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.getcwd()
+    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.path.realpath(project_dir)
     frame_range = config_dict.get('project').get('frame_range')
     multi_person = config_dict.get('project').get('multi_person')
     video_dir = os.path.join(project_dir, 'videos')
@@ -385,6 +456,8 @@ def rtm_estimator(config_dict):
     display_detection = config_dict['pose']['display_detection']
     overwrite_pose = config_dict['pose']['overwrite_pose']
     det_frequency = config_dict['pose']['det_frequency']
+    precision = config_dict['pose'].get('precision', 'fp32')
+    batch_size = config_dict['pose'].get('batch_size', 'auto')
 
     # Determine frame rate
     video_files = glob.glob(os.path.join(video_dir, '*'+vid_img_extension))
@@ -450,18 +523,34 @@ def rtm_estimator(config_dict):
         logging.info(f"Using BODY_43 model (body and spine) for pose estimation.")
     else:
         raise ValueError(f"Invalid model_type: {pose_model}. Must be 'HALPE_26', 'COCO_133', 'COCO_17', 'HAND_21', 'FACE_106' or 'BODY_43'. Use another network (MMPose, DeepLabCut, OpenPose, AlphaPose, BlazePose...) and convert the output files if you need another model. See documentation.")
-    logging.info(f'Mode: {mode}.\n')
+    # Reduced precision models are only used for CPU inference, and INT8 ones are calibrated on the videos
+    if device != 'cpu' or (precision == 'int8' and not video_files):
+        precision = 'fp32'
+    logging.info(f'Mode: {mode}. Precision: {precision}.\n')
 
 
     # Initialize the pose tracker
-    pose_tracker = PoseTracker(
-        ModelClass,
-        det_frequency=det_frequency,
-        mode=mode,
-        backend=backend,
-        device=device,
-        tracking=False,
-        to_openpose=False)
+    # With batching, the synchronized frames of all cameras are gathered in the same inference calls
+    if batch_size == 1:
+        pose_tracker = PoseTracker(
+            pooled_solution(ModelClass, precision=precision, videos=video_files),
+            det_frequency=det_frequency,
+            mode=mode,
+            backend=backend,
+            device=device,
+            tracking=False,
+            to_openpose=False)
+    else:
+        pose_tracker = BatchPoseTracker(
+            pooled_solution(ModelClass, precision=precision, videos=video_files),
+            det_frequency=det_frequency,
+            mode=mode,
+            backend=backend,
+            device=device,
+            tracking=False,
+            to_openpose=False,
+            batch_size=None if batch_size == 'auto' else int(batch_size))
+        logging.info(f'Batched inference: up to {pose_tracker.batch_size} frames per detection call.')
 
 
     logging.info('\nEstimating pose...')
@@ -479,9 +568,13 @@ def rtm_estimator(config_dict):
         if not len(video_files) == 0: 
             # Process video files
             logging.info(f'Found video files with extension {vid_img_extension}.')
-            for video_path in video_files:
+            if isinstance(pose_tracker, BatchPoseTracker):
                 pose_tracker.reset()
-                process_video(video_path, pose_tracker, output_format, save_video, save_images, display_detection, frame_range, multi_person)
+                process_videos(video_files, pose_tracker, output_format, save_video, save_images, display_detection, frame_range, multi_person)
+            else:
+                for video_path in video_files:
+                    pose_tracker.reset()
+                    process_video(video_path, pose_tracker, output_format, save_video, save_images, display_detection, frame_range, multi_person)
 
         else:
             # Process image folders
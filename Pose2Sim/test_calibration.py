@@ -0,0 +1,86 @@
+"""
+detect_board finds checkerboards from a downscaled presence check, and only
+searches at full resolution when the downscaled image cannot show the board.
+"""
+
+
+import cv2
+import numpy as np
+import pytest
+
+try:
+    from Pose2Sim import calibration
+except ModuleNotFoundError as e:
+    # c3d, lxml, mpl_interactions, Qt bindings...
+    pytest.skip(f"{e.name} is not installed", allow_module_level=True)
+
+CORNER_NB = [4, 7]
+
+
+def board_image(width=1920, height=1080, square=60, origin=(500, 300)):
+    """Gray image of a checkerboard of (4+1) x (7+1) squares, and its internal corners."""
+    img = np.full((height, width), 160, dtype=np.uint8)
+    x0, y0 = origin
+    img[y0 - square : y0 + 6 * square, x0 - square : x0 + 9 * square] = 255
+    for i in range(CORNER_NB[0] + 1):
+        for j in range(CORNER_NB[1] + 1):
+            if (i + j) % 2 == 0:
+                img[y0 + i * square : y0 + (i + 1) * square, x0 + j * square : x0 + (j + 1) * square] = 0
+    corners = np.array(
+        [[x0 + j * square - 0.5, y0 + i * square - 0.5] for i in range(1, CORNER_NB[0] + 1) for j in range(1, CORNER_NB[1] + 1)]
+    )
+    return img, corners
+
+
+@pytest.fixture
+def searched_widths(monkeypatch):
+    """Widths of the images in which a board is searched."""
+    widths = []
+    find_chessboard_corners = cv2.findChessboardCorners
+
+    def recording_find_chessboard_corners(image, *args, **kwargs):
+        widths.append(image.shape[1])
+        return find_chessboard_corners(image, *args, **kwargs)
+
+    monkeypatch.setattr(calibration.cv2, "findChessboardCorners", recording_find_chessboard_corners)
+    return widths
+
+
+def assert_same_corners(found, expected):
+    # The corner order depends on the orientation OpenCV picks
+    distances = np.linalg.norm(found.reshape(-1, 1, 2) - expected[None], axis=-1)
+    assert len(found) == len(expected)
+    assert distances.min(axis=0).max() < 0.5
+
+
+def test_board_found_from_downscaled_image(searched_widths):
+    img, corners = board_image()
+
+    found = calibration.detect_board(cv2.cvtColor(img, cv2.COLOR_GRAY2BGR), CORNER_NB)
+
+    assert_same_corners(found, corners)
+    assert searched_widths == [calibration.DETECTION_MAX_WIDTH]
+
+
+def test_no_full_resolution_search_without_board(searched_widths):
+    img = np.random.default_rng(0).integers(100, 200, (1080, 1920), dtype=np.uint8)
+
+    assert calibration.detect_board(img, CORNER_NB) is None
+    assert searched_widths == [calibration.DETECTION_MAX_WIDTH]
+
+
+def test_small_image_searched_at_full_resolution(searched_widths):
+    img, corners = board_image(width=600, height=400, square=30, origin=(100, 80))
+
+    assert_same_corners(calibration.detect_board(img, CORNER_NB), corners)
+    assert searched_widths == [600]
+
+
+def test_full_resolution_search_when_squares_too_small(searched_widths):
+    img, corners = board_image(width=1920, height=1080, square=20, origin=(500, 300))
+    max_width = 60  # squares of at most 60 / 8 = 7.5 px
+
+    found = calibration.detect_board(img, CORNER_NB, max_width=max_width)
+
+    assert_same_corners(found, corners)
+    assert searched_widths == [max_width, 1920]
@@ -0,0 +1,95 @@
+"""
+augmentTRC normalizes the markers of every TRC file with its subject height,
+with a scalar or missing height and mass applied to all files.
+"""
+
+
+import os
+
+import numpy as np
+import pytest
+
+try:
+    from Pose2Sim import markerAugmentation
+    from Pose2Sim.MarkerAugmenter.utils import (
+        getMarkers_upperExtremity_noPelvis2,
+        getOpenPoseMarkers_lowerExtremity2,
+    )
+except ModuleNotFoundError as e:
+    pytest.skip(f"{e.name} is not installed", allow_module_level=True)
+from TracX.motion_io import trc_header, write_trc  # noqa: E402
+
+FEATURES = {"lower": getOpenPoseMarkers_lowerExtremity2(), "upper": getMarkers_upperExtremity_noPelvis2()}
+MARKERS = ["Hip", *dict.fromkeys(FEATURES["lower"][0] + FEATURES["upper"][0])]
+
+
+class StubAugmenter:
+    """Records the inputs of the augmenter, and predicts all response markers at the origin."""
+
+    def __init__(self, nb_responses):
+        self.nb_responses = nb_responses
+        self.inputs = []
+
+    def predict(self, inputs):
+        self.inputs.extend(inputs)
+        return np.zeros((len(inputs), inputs.shape[1], 3 * self.nb_responses))
+
+
+@pytest.fixture
+def augmenters(monkeypatch):
+    augmenters = {}
+
+    def get_augmenter(model_dir, backend="auto"):
+        part = os.path.basename(model_dir).split("_")[-1]
+        return augmenters.setdefault(part, StubAugmenter(len(FEATURES[part][1])))
+
+    monkeypatch.setattr(markerAugmentation, "get_augmenter", get_augmenter)
+    return augmenters
+
+
+def write_trial(path, nb_frames, seed):
+    coords = np.random.default_rng(seed).uniform(-1, 1, (nb_frames, len(MARKERS), 3))
+    data = np.column_stack([np.arange(nb_frames), np.arange(nb_frames) / 30, coords.reshape(nb_frames, -1)])
+    write_trc(path, data, trc_header(os.path.basename(path), MARKERS, 30, nb_frames))
+    return coords
+
+
+def config(project_dir, height, mass):
+    return {
+        "project": {"project_dir": str(project_dir), "participant_height": height, "participant_mass": mass},
+        "markerAugmentation": {"make_c3d": False},
+    }
+
+
+@pytest.mark.parametrize(
+    ("height", "mass", "heights", "masses"),
+    [
+        (1.72, 65.0, [1.72] * 3, [65.0] * 3),
+        (None, None, [1.75] * 3, [70] * 3),
+        ([1.6], [60], [1.6, 1.75, 1.75], [60, 70, 70]),
+    ],
+)
+def test_all_trials_are_normalized(tmp_path, augmenters, height, mass, heights, masses):
+    os.makedirs(tmp_path / "pose-3d")
+    lengths = {"trial1": 20, "trial2": 30, "trial3": 20}
+    trials = {
+        name: write_trial(str(tmp_path / "pose-3d" / f"{name}.trc"), nb_frames, seed)
+        for seed, (name, nb_frames) in enumerate(lengths.items())
+    }
+
+    markerAugmentation.augmentTRC(config(tmp_path, height, mass))
+
+    for name in trials:
+        assert os.path.exists(tmp_path / "pose-3d" / f"{name}_LSTM.trc")
+    # Trials of the same length are predicted together
+    order = sorted(trials, key=lambda name: lengths[name])
+    for part, augmenter in augmenters.items():
+        feature_ids = [MARKERS.index(marker) for marker in FEATURES[part][0]]
+        assert len(augmenter.inputs) == len(trials)
+        for name, inputs in zip(order, augmenter.inputs):
+            p = list(trials).index(name)
+            coords = trials[name]
+            expected = (coords[:, feature_ids] - coords[:, [0]]).reshape(len(coords), -1) / heights[p]
+            np.testing.assert_allclose(inputs[:, :-2], expected, atol=1e-5)
+            np.testing.assert_array_equal(inputs[:, -2], heights[p])
+            np.testing.assert_array_equal(inputs[:, -1], masses[p])
@@ -0,0 +1,156 @@
+"""
+The batched single-person association search chooses the same persons, cameras
+and errors as trying every combination and camera subset one by one.
+"""
+
+
+import itertools as it
+import json
+
+import numpy as np
+import pytest
+
+try:
+    from Pose2Sim.common import euclidean_distance, reprojection, weighted_triangulation
+    from Pose2Sim.personAssociation import (
+        best_persons_and_cameras_combination,
+        fundamental_matrices,
+        persons_combinations_from_counts,
+        read_keypoint_all_cams,
+    )
+except ModuleNotFoundError as e:
+    # c3d, anytree, Qt bindings...
+    pytest.skip(f"{e.name} is not installed", allow_module_level=True)
+
+CONFIG = {
+    "personAssociation": {
+        "likelihood_threshold_association": 0.3,
+        "single_person": {"reproj_error_threshold_association": 20},
+    },
+    "triangulation": {"min_cameras_for_triangulation": 2, "undistort_points": False},
+}
+
+
+def projection_matrix(angle, height):
+    """Camera on a circle of radius 4 m around the origin, looking at it."""
+    center = np.array([4 * np.cos(angle), 4 * np.sin(angle), height])
+    forward = -center / np.linalg.norm(center)
+    right = np.cross(forward, [0, 0, 1])
+    right /= np.linalg.norm(right)
+    down = np.cross(forward, right)
+    R = np.array([right, down, forward])
+    K = np.array([[1000, 0, 640], [0, 1000, 480], [0, 0, 1]])
+    return K @ np.column_stack([R, -R @ center])
+
+
+def make_scene(rng, min_cams=3, max_cams=6, max_other_persons=2):
+    """Projections of a tracked keypoint and of other persons, with noise and bad detections."""
+    n_cams = rng.integers(min_cams, max_cams + 1)
+    P_all = [projection_matrix(angle, rng.uniform(0.5, 2)) for angle in np.sort(rng.uniform(0, 2 * np.pi, n_cams))]
+    points = rng.uniform(-1.5, 1.5, (max_other_persons + 1, 3))
+
+    coords = []
+    for P in P_all:
+        persons = [reprojection([P], np.append(point, 1)) for point in points[:rng.integers(1, max_other_persons + 2)]]
+        persons = np.array(persons)[..., 0] + rng.normal(scale=2, size=(len(persons), 2))
+        persons = np.column_stack([persons, rng.uniform(0.2, 1, len(persons))])
+        if rng.uniform() < 0.2:
+            # Wrong detection
+            persons[0, :2] = rng.uniform(0, 1000, 2)
+        coords.append(persons[rng.permutation(len(persons))])
+    return P_all, coords
+
+
+def reference_search(config_dict, coords, personsIDs_combinations, P_all):
+    """Try all persons combinations and camera subsets, one at a time."""
+    error_threshold = config_dict["personAssociation"]["single_person"]["reproj_error_threshold_association"]
+    likelihood_threshold = config_dict["personAssociation"]["likelihood_threshold_association"]
+    min_cameras = config_dict["triangulation"]["min_cameras_for_triangulation"]
+
+    n_cams = len(coords)
+    error_min = np.inf
+    nb_cams_off = 0
+    while error_min > error_threshold and n_cams - nb_cams_off >= min_cameras:
+        for combination in personsIDs_combinations:
+            points = np.array([coords[c][int(p)] if not np.isnan(p) else [np.nan] * 3 for c, p in enumerate(combination)])
+            points[:, 2][points[:, 2] < likelihood_threshold] = 0.0
+
+            errors, combs, Qs = [], [], []
+            for cams_off in it.combinations(range(n_cams), nb_cams_off):
+                comb = combination.copy()
+                comb[list(cams_off)] = np.nan
+                comb[points[:, 2] == 0.0] = np.nan
+                active = ~np.isnan(comb)
+                try:
+                    x, y, likelihood = points[active].T
+                    Q = weighted_triangulation([P_all[c] for c in np.flatnonzero(active)], x, y, likelihood)
+                except Exception:
+                    Q = [np.nan, np.nan, np.nan, 1.0]
+                    x, y = [], []
+                x_calc, y_calc = reprojection([P_all[c] for c in np.flatnonzero(active)], Q)
+                errors.append(np.mean([euclidean_distance((x[c], y[c]), (x_calc[c], y_calc[c])) for c in range(len(x_calc))]))
+                combs.append(comb)
+                Qs.append(Q)
+
+            error_min = np.nanmin(errors)
+            best = np.argmin(errors)
+            comb_error_min, Q_kpt = combs[best], Qs[best]
+            if error_min < error_threshold:
+                break
+        nb_cams_off += 1
+
+    return error_min, comb_error_min, Q_kpt
+
+
+def padded(coords):
+    array = np.full((len(coords), max(len(c) for c in coords), 3), np.nan)
+    for c, persons in enumerate(coords):
+        array[c, :len(persons)] = persons
+    return array
+
+
+def assert_matches_exhaustive_search(P_all, coords, config_dict=CONFIG, rng=None):
+    combinations = persons_combinations_from_counts([len(c) for c in coords])
+    F = fundamental_matrices(P_all)
+
+    error, comb, Q = reference_search(config_dict, coords, combinations, P_all)
+
+    previous_combs = [None, comb, combinations[rng.integers(len(combinations))]]
+    for fundamental_mat, previous_comb in it.product([None, F], previous_combs):
+        result = best_persons_and_cameras_combination(
+            config_dict, padded(coords), combinations, P_all, {}, fundamental_mat, previous_comb
+        )
+        assert result[0] == pytest.approx(error, rel=1e-6)
+        np.testing.assert_array_equal(result[1][0], comb)
+        np.testing.assert_allclose(result[2][0], Q, rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_matches_exhaustive_search(seed):
+    rng = np.random.default_rng(seed)
+    assert_matches_exhaustive_search(*make_scene(rng), rng=rng)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_matches_exhaustive_search_with_many_cameras(seed):
+    rng = np.random.default_rng(seed)
+    assert_matches_exhaustive_search(*make_scene(rng, min_cams=6, max_cams=9, max_other_persons=1), rng=rng)
+
+
+def test_read_keypoint_all_cams(tmp_path):
+    people = [
+        [{"pose_keypoints_2d": [1, 2, 0.5, 3, 4, 0.6]}, {"pose_keypoints_2d": [5, 6, 0.7, 7, 8, 0.8]}],
+        [],
+        [{"pose_keypoints_2d": [9, 10, 0.9]}],
+    ]
+    json_files = []
+    for c, persons in enumerate(people):
+        (tmp_path / f"cam{c}.json").write_text(json.dumps({"people": persons}))
+        json_files.append(str(tmp_path / f"cam{c}.json"))
+    json_files.append(str(tmp_path / "missing.json"))
+
+    nb_persons_per_cam, coords = read_keypoint_all_cams(json_files, 1)
+
+    assert nb_persons_per_cam == [2, 0, 1, 0]
+    np.testing.assert_array_equal(coords[0], [[3, 4, 0.6], [7, 8, 0.8]])
+    assert np.isnan(coords[1:]).all()
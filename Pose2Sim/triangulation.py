@@ -49,10 +49,14 @@ from collections import Counter
 from anytree import RenderTree
 from anytree.importer import DictImporter
 import logging
+import warnings
 
 from Pose2Sim.common import retrieve_calib_params, computeP, weighted_triangulation, \
     reprojection, euclidean_distance, sort_stringlist_by_last_number, \
-    min_with_single_indices, zup2yup, convert_to_c3d
+    min_with_single_indices, zup2yup, convert_to_c3d, reprojection_errors, \
+    reprojection_quality, quality_report_path, write_quality_report
+from TracX.instrumentation import count
+from TracX.motion_io import trc_header, write_trc
 from TracX.skeletons import *
 
 
@@ -208,14 +212,7 @@ def make_trc(config_dict, Q, keypoints_names, f_range, id_person=-1):
     trc_f = f'{seq_name}_{f_range[0]}-{f_range[1]}.trc'
 
     #Header
-    DataRate = CameraRate = OrigDataRate = frame_rate
-    NumFrames = len(Q)
-    NumMarkers = len(keypoints_names)
-    header_trc = ['PathFileType\t4\t(X/Y/Z)\t' + trc_f, 
-            'DataRate\tCameraRate\tNumFrames\tNumMarkers\tUnits\tOrigDataRate\tOrigDataStartFrame\tOrigNumFrames', 
-            '\t'.join(map(str,[DataRate, CameraRate, NumFrames, NumMarkers, 'm', OrigDataRate, f_range[0], f_range[1]])),
-            'Frame#\tTime\t' + '\t\t\t'.join(keypoints_names) + '\t\t',
-            '\t\t'+'\t'.join([f'X{i+1}\tY{i+1}\tZ{i+1}' for i in range(len(keypoints_names))])]
+    header_trc = trc_header(trc_f, keypoints_names, frame_rate, len(Q), orig_start_frame=f_range[0], orig_nb_frames=f_range[1])
     
     # Zup to Yup coordinate system
     Q = zup2yup(Q)
@@ -228,9 +225,7 @@ def make_trc(config_dict, Q, keypoints_names, f_range, id_person=-1):
     #Write file
     if not os.path.exists(pose3d_dir): os.mkdir(pose3d_dir)
     trc_path = os.path.realpath(os.path.join(pose3d_dir, trc_f))
-    with open(trc_path, 'w') as trc_o:
-        [trc_o.write(line+'\n') for line in header_trc]
-        Q.to_csv(trc_o, sep='\t', index=True, header=None, lineterminator='\n')
+    write_trc(trc_path, np.column_stack([Q.index, Q]), header_trc)
 
     return trc_path
 
@@ -272,7 +267,7 @@ def retrieve_right_trc_order(trc_paths):
     return trc_id
 
 
-def recap_triangulate(config_dict, error, nb_cams_excluded, keypoints_names, cam_excluded_count, interp_frames, non_interp_frames, trc_path):
+def recap_triangulate(config_dict, error, nb_cams_excluded, keypoints_names, cam_excluded_count, interp_frames, non_interp_frames, trc_path, quality=None):
     '''
     Print a message giving statistics on reprojection errors (in pixel and in m)
     as well as the number of cameras that had to be excluded to reach threshold 
@@ -283,6 +278,7 @@ def recap_triangulate(config_dict, error, nb_cams_excluded, keypoints_names, cam
     - error: dataframe 
     - nb_cams_excluded: dataframe
     - keypoints_names: list of strings
+    - quality: list of reprojection quality dicts (see common.reprojection_quality)
 
     OUTPUT:
     - Message in console
@@ -293,7 +289,7 @@ def recap_triangulate(config_dict, error, nb_cams_excluded, keypoints_names, cam
     # if batch
     session_dir = os.path.realpath(os.path.join(project_dir, '..'))
     # if single trial
-    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.getcwd()
+    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.path.realpath(project_dir)
     calib_dir = [os.path.join(session_dir, c) for c in os.listdir(session_dir) if os.path.isdir(os.path.join(session_dir, c)) and  'calib' in c.lower()][0]
     calib_file = glob.glob(os.path.join(calib_dir, '*.toml'))[0] # lastly created calibration file
     calib = toml.load(calib_file)
@@ -320,10 +316,14 @@ def recap_triangulate(config_dict, error, nb_cams_excluded, keypoints_names, cam
         if nb_persons_to_detect > 1:
             logging.info(f'\n\nPARTICIPANT {n+1}\n')
         
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            mean_error_keypoints_px = np.around(np.nanmean(error[n].to_numpy(dtype=float)[:,:len(keypoints_names)], axis=0), decimals=1) # RMS à la place?
+            mean_cam_excluded_keypoints = np.around(np.nanmean(nb_cams_excluded[n].to_numpy(dtype=float)[:,:len(keypoints_names)], axis=0), decimals=2)
         for idx, name in enumerate(keypoints_names):
-            mean_error_keypoint_px = np.around(error[n].iloc[:,idx].mean(), decimals=1) # RMS à la place?
+            mean_error_keypoint_px = mean_error_keypoints_px[idx]
             mean_error_keypoint_m = np.around(mean_error_keypoint_px * Dm / fm, decimals=3)
-            mean_cam_excluded_keypoint = np.around(nb_cams_excluded[n].iloc[:,idx].mean(), decimals=2)
+            mean_cam_excluded_keypoint = mean_cam_excluded_keypoints[idx]
             logging.info(f'Mean reprojection error for {name} is {mean_error_keypoint_px} px (~ {mean_error_keypoint_m} m), reached with {mean_cam_excluded_keypoint} excluded cameras. ')
             if show_interp_indices:
                 if interpolation_kind != 'none':
@@ -359,6 +359,12 @@ def recap_triangulate(config_dict, error, nb_cams_excluded, keypoints_names, cam
             else:
                 str_cam_excluded_count += f'Camera {k}: {int(np.round(v*100))}%, '
         logging.info(str_cam_excluded_count)
+        if quality is not None:
+            cam_errors = ', '.join([f'{c}: {e} px' for c, e in zip(quality[n]['cam_names'], quality[n]['per_camera']['median'])])
+            logging.info(f'Median reprojection error of the final 3D points on each camera: {cam_errors}.')
+            if quality[n]['outlier_cameras']:
+                logging.warning(f'Camera(s) {", ".join(quality[n]["outlier_cameras"])} had a median reprojection error more than {quality[n]["outlier_factor"]} times that of the other cameras. Check their calibration or 2D pose estimation.')
+            logging.info(f'Reprojection quality report stored at {quality_report_path(trc_path[n])}.')
         logging.info(f'\n3D coordinates are stored at {trc_path[n]}.')
         
     logging.info('\n\n')
@@ -687,7 +693,7 @@ def triangulate_all(config_dict):
     # if batch
     session_dir = os.path.realpath(os.path.join(project_dir, '..'))
     # if single trial
-    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.getcwd()
+    session_dir = session_dir if 'Config.toml' in os.listdir(session_dir) else os.path.realpath(project_dir)
     multi_person = config_dict.get('project').get('multi_person')
     pose_model = config_dict.get('pose').get('pose_model')
     frame_range = config_dict.get('project').get('frame_range')
@@ -787,8 +793,10 @@ def triangulate_all(config_dict):
     nb_cams_excluded = [[] for n in range(nb_persons_to_detect)]
     id_excluded_cams = [[] for n in range(nb_persons_to_detect)]
     Q_tot, error_tot, nb_cams_excluded_tot,id_excluded_cams_tot = [], [], [], []
+    coords_2D_tot = []
     for f in tqdm(range(*f_range)):
         # print(f'\nFrame {f}:')        
+        count('frames')
         # Get x,y,likelihood values from files
         json_files_names_f = [[j for j in json_files_names[c] if int(re.split(r'(\d+)',j)[-2])==f] for c in range(n_cams)]
         json_files_names_f = [j for j_list in json_files_names_f for j in (j_list or ['none'])]
@@ -821,6 +829,7 @@ def triangulate_all(config_dict):
         error = [[] for n in range(nb_persons_to_detect)]
         nb_cams_excluded = [[] for n in range(nb_persons_to_detect)]
         id_excluded_cams = [[] for n in range(nb_persons_to_detect)]
+        coords_2D = [np.stack([x_files[n], y_files[n]], axis=-1) for n in range(nb_persons_to_detect)]
         
         for n in range(nb_persons_to_detect):
             for keypoint_idx in keypoints_idx:
@@ -845,7 +854,7 @@ def triangulate_all(config_dict):
                 Q, personsIDs_sorted, associated_tuples = sort_people(Q_old, Q)
                 # print('Q after ordering ', personsIDs_sorted, associated_tuples, np.array(Q)[:,:2])
                 
-                error_sorted, nb_cams_excluded_sorted, id_excluded_cams_sorted = [], [], []
+                error_sorted, nb_cams_excluded_sorted, id_excluded_cams_sorted, coords_2D_sorted = [], [], [], []
                 for i in range(len(Q)):
                     id_in_old =  associated_tuples[:,1][associated_tuples[:,0] == i].tolist()
                     if len(id_in_old) > 0:
@@ -853,12 +862,14 @@ def triangulate_all(config_dict):
                         error_sorted += [error[id_in_old[0]]]
                         nb_cams_excluded_sorted += [nb_cams_excluded[id_in_old[0]]]
                         id_excluded_cams_sorted += [id_excluded_cams[id_in_old[0]]]
+                        coords_2D_sorted += [coords_2D[id_in_old[0]]]
                     else:
                         personsIDs_sorted += [-1]
                         error_sorted += [error[i]]
                         nb_cams_excluded_sorted += [nb_cams_excluded[i]]
                         id_excluded_cams_sorted += [id_excluded_cams[i]]
-                error, nb_cams_excluded, id_excluded_cams = error_sorted, nb_cams_excluded_sorted, id_excluded_cams_sorted
+                        coords_2D_sorted += [coords_2D[i]]
+                error, nb_cams_excluded, id_excluded_cams, coords_2D = error_sorted, nb_cams_excluded_sorted, id_excluded_cams_sorted, coords_2D_sorted
         
         # TODO: if distance > threshold, new person
         
@@ -868,18 +879,21 @@ def triangulate_all(config_dict):
         nb_cams_excluded_tot.append([nb_cams_excluded[n] for n in range(nb_persons_to_detect)])
         id_excluded_cams = [[id_excluded_cams[n][k] for k in range(keypoints_nb)] for n in range(nb_persons_to_detect)]
         id_excluded_cams_tot.append(id_excluded_cams)
+        coords_2D_tot.append([coords_2D[n] for n in range(nb_persons_to_detect)])
             
     # fill values for if a person that was not initially detected has entered the frame 
     Q_tot = [list(tpl) for tpl in zip(*it.zip_longest(*Q_tot, fillvalue=[np.nan]*keypoints_nb*3))]
     error_tot = [list(tpl) for tpl in zip(*it.zip_longest(*error_tot, fillvalue=[np.nan]*keypoints_nb*3))]
     nb_cams_excluded_tot = [list(tpl) for tpl in zip(*it.zip_longest(*nb_cams_excluded_tot, fillvalue=[np.nan]*keypoints_nb*3))]
     id_excluded_cams_tot = [list(tpl) for tpl in zip(*it.zip_longest(*id_excluded_cams_tot, fillvalue=[np.nan]*keypoints_nb*3))]
+    coords_2D_tot = [list(tpl) for tpl in zip(*it.zip_longest(*coords_2D_tot, fillvalue=np.full((n_cams, keypoints_nb, 2), np.nan)))]
 
     # dataframes for each person
     Q_tot = [pd.DataFrame([Q_tot_f[n] for Q_tot_f in Q_tot]) for n in range(nb_persons_to_detect)]
     error_tot = [pd.DataFrame([error_tot_f[n] for error_tot_f in error_tot]) for n in range(nb_persons_to_detect)]
     nb_cams_excluded_tot = [pd.DataFrame([nb_cams_excluded_tot_f[n] for nb_cams_excluded_tot_f in nb_cams_excluded_tot]) for n in range(nb_persons_to_detect)]
     id_excluded_cams_tot = [pd.DataFrame([id_excluded_cams_tot_f[n] for id_excluded_cams_tot_f in id_excluded_cams_tot]) for n in range(nb_persons_to_detect)]
+    coords_2D_tot = [np.stack([coords_2D_tot_f[n] for coords_2D_tot_f in coords_2D_tot], axis=1) for n in range(nb_persons_to_detect)] # (n_cams, n_frames, n_keypoints, 2)
     
     for n in range(nb_persons_to_detect):
         error_tot[n]['mean'] = error_tot[n].mean(axis = 1)
@@ -896,11 +910,17 @@ def triangulate_all(config_dict):
     error_tot = [error_tot[n] for n in range(len(error_tot)) if n not in deleted_person_id]
     nb_cams_excluded_tot = [nb_cams_excluded_tot[n] for n in range(len(nb_cams_excluded_tot)) if n not in deleted_person_id]
     id_excluded_cams_tot = [id_excluded_cams_tot[n] for n in range(len(id_excluded_cams_tot)) if n not in deleted_person_id]
+    coords_2D_tot = [coords_2D_tot[n] for n in range(len(coords_2D_tot)) if n not in deleted_person_id]
     nb_persons_to_detect = len(Q_tot)
 
     if nb_persons_to_detect ==0:
         raise Exception('No persons have been triangulated. Please check your calibration and your synchronization, or the triangulation parameters in Config.toml.')
 
+    # Reprojection errors of all cameras, frames, and keypoints, before interpolation
+    cam_names = [os.path.basename(j).split('_')[0] for j in json_dirs_names]
+    errors_reproj = [reprojection_errors(P, Q_tot[n].to_numpy().reshape(-1, keypoints_nb, 3), coords_2D_tot[n]) for n in range(nb_persons_to_detect)]
+    quality = [reprojection_quality(errors_reproj[n], cam_names=cam_names, keypoints_names=keypoints_names) for n in range(nb_persons_to_detect)]
+
     # IDs of excluded cameras
     # id_excluded_cams_tot = [np.concatenate([id_excluded_cams_tot[f][k] for f in range(frames_nb)]) for k in range(keypoints_nb)]
     id_excluded_cams_tot = [np.hstack(np.hstack(np.array(id_excluded_cams_tot[n]))) for n in range(nb_persons_to_detect)]
@@ -934,6 +954,7 @@ def triangulate_all(config_dict):
     
     # Create TRC file
     trc_paths = [make_trc(config_dict, Q_tot[n], keypoints_names, f_range, id_person=n) for n in range(len(Q_tot))]
+    [write_quality_report(quality_report_path(trc_paths[n]), quality[n], errors_reproj[n]) for n in range(len(Q_tot))]
     if make_c3d:
         c3d_paths = [convert_to_c3d(t) for t in trc_paths]
         
@@ -955,4 +976,4 @@ def triangulate_all(config_dict):
 
 
     # Recap message
-    recap_triangulate(config_dict, error_tot, nb_cams_excluded_tot, keypoints_names, cam_excluded_count, interp_frames, non_interp_frames, trc_paths)
+    recap_triangulate(config_dict, error_tot, nb_cams_excluded_tot, keypoints_names, cam_excluded_count, interp_frames, non_interp_frames, trc_paths, quality)
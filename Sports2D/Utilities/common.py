@@ -10,17 +10,22 @@
     - A class for displaying several matplotlib figures in tabs.
     - A function for interpolating sequences with missing data. 
     It does not interpolate sequences of more than N contiguous missing data.
+    - A growable array accumulating per-frame, per-person values.
 
 '''
 
 
 ## INIT
+import contextlib
+import os
 import re
 import sys
 import subprocess
+import tempfile
 from pathlib import Path
 
 import numpy as np
+import pandas as pd
 from scipy import interpolate
 import imageio_ffmpeg as ffmpeg
 
@@ -139,6 +144,77 @@ def interpolate_zeros_nans(col, *args):
     return col_interp
 
 
+def interpolate_zeros_nans_2d(data, N=np.inf, kind='linear'):
+    '''
+    Interpolate missing points (of value zero or nan) of all columns at once,
+    unless more than N contiguous values are missing.
+    Same output as applying interpolate_zeros_nans to each column, with extrapolation.
+
+    Gaps are found by run-length encoding of the whole matrix. Linear interpolation
+    is fully vectorized, other kinds are batched over the columns sharing the same
+    missing frames (typically the X and Y coordinates of each keypoint).
+
+    INPUTS:
+    - data: 2D numpy array or pandas DataFrame of shape (frames, columns)
+    - N: max number of contiguous bad values, above which they won't be interpolated
+    - kind: 'linear', 'slinear', 'quadratic', 'cubic'. Default: 'linear'
+
+    OUTPUT:
+    - data_interp: interpolated array, or DataFrame if data is a DataFrame
+    '''
+
+    is_df = hasattr(data, 'columns')
+    values = np.array(data, dtype=float)
+    data_interp = values.copy()
+    nb_frames = len(values)
+
+    # Columns with too few good values are left untouched
+    mask = ~(np.isnan(values) | (values == 0)) # true where good values
+    cols = np.where(mask.sum(axis=0) > 4)[0]
+    if cols.size > 0:
+        sub, mask_sub = values[:, cols], mask[:, cols]
+        frames = np.arange(nb_frames)[:, np.newaxis]
+
+        # Previous and next good frame of each missing point
+        prev_good = np.maximum.accumulate(np.where(mask_sub, frames, -1), axis=0)
+        next_good = np.minimum.accumulate(np.where(mask_sub, frames, nb_frames)[::-1], axis=0)[::-1]
+        rows, cs = np.nonzero(~mask_sub)
+        prev_bad, next_bad = prev_good[rows, cs], next_good[rows, cs]
+
+        if kind == 'linear':
+            # Extrapolate with the first and last two good values
+            first = np.argmax(mask_sub, axis=0)
+            last = nb_frames - 1 - np.argmax(mask_sub[::-1], axis=0)
+            second = next_good[first + 1, np.arange(len(cols))]
+            before_last = prev_good[last - 1, np.arange(len(cols))]
+            lead, trail = prev_bad < 0, next_bad >= nb_frames
+            x_lo = np.where(lead, first[cs], np.where(trail, before_last[cs], prev_bad))
+            x_hi = np.where(lead, second[cs], np.where(trail, last[cs], next_bad))
+            y_lo, y_hi = sub[x_lo, cs], sub[x_hi, cs]
+            slope = (y_hi - y_lo) / (x_hi - x_lo)
+            sub_interp = sub.copy()
+            sub_interp[rows, cs] = slope * (rows - x_lo) + y_lo
+        else:
+            # One interpolator per group of columns with the same missing frames
+            sub_interp = sub.copy()
+            _, groups = np.unique(np.packbits(mask_sub, axis=0).T, axis=0, return_inverse=True)
+            for group in np.unique(groups):
+                group_cols = np.where(groups.ravel() == group)[0]
+                idx_good = np.where(mask_sub[:, group_cols[0]])[0]
+                f_interp = interpolate.interp1d(idx_good, sub[idx_good][:, group_cols], kind=kind, axis=0, fill_value='extrapolate', bounds_error=False)
+                sub_interp[:, group_cols] = np.where(mask_sub[:, group_cols], sub[:, group_cols], f_interp(np.arange(nb_frames)))
+
+        # Reintroduce nans if length of sequence > N
+        gap_lengths = np.minimum(next_bad, nb_frames) - np.maximum(prev_bad, -1) - 1
+        too_long = gap_lengths > N
+        sub_interp[rows[too_long], cs[too_long]] = np.nan
+        data_interp[:, cols] = sub_interp
+
+    if is_df:
+        return pd.DataFrame(data_interp, index=data.index, columns=data.columns)
+    return data_interp
+
+
 def natural_sort_key(s):
     return [int(c) if c.isdigit() else c.lower() for c in re.split(r'(\d+)', s)]
 
@@ -189,6 +265,159 @@ def make_homogeneous(list_of_arrays):
     return np.array(list_of_arrays)
 
 
+class FrameAccumulator():
+    '''
+    Accumulate per-frame, per-person values into a (frames, persons, values) array,
+    padded with nans. This replaces lists of ragged per-frame arrays padded
+    afterwards with make_homogeneous.
+
+    Frames are stored in fixed-size chunks, so that appending a frame never copies
+    the previous ones. The person dimension of the current chunk grows in amortized
+    steps when more persons are detected than it can hold. Chunks can optionally be
+    spilled to memory-mapped files for very long videos.
+
+    USAGE:
+    acc = FrameAccumulator()
+    for frame in frames:
+        acc.append(valid_X) # list of per-person arrays, or [] if no detection
+    all_frames_X = acc.to_array() # or np.asarray(acc)
+
+    INPUTS:
+    - nb_values: int. Number of values per person (e.g. keypoints). Inferred from the first non-empty frame if None
+    - chunk_size: int. Number of frames per chunk
+    - person_step: int. Minimum number of persons added when the person dimension grows
+    - dtype: data type of the stored values. Default: float32
+    - spill_dir: str or None. If set, chunks are memory-mapped files in this directory
+    '''
+
+    def __init__(self, nb_values=None, chunk_size=1024, person_step=4, dtype=np.float32, spill_dir=None):
+        self.nb_values = nb_values
+        self.chunk_size = chunk_size
+        self.person_step = person_step
+        self.dtype = dtype
+        self.spill_dir = spill_dir
+
+        self.nb_frames = 0
+        self.nb_persons = 0
+        self._chunks = []
+        self._files = []
+        self._array = None
+
+    def _allocate(self, shape):
+        '''
+        Allocate a nan-filled array, memory-mapped if spill_dir is set.
+        '''
+
+        if self.spill_dir is None or 0 in shape:
+            return np.full(shape, np.nan, dtype=self.dtype)
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.dat', prefix='frames_', dir=self.spill_dir)
+        os.close(fd)
+        self._files.append(path)
+        array = np.memmap(path, dtype=self.dtype, mode='w+', shape=shape)
+        array[:] = np.nan
+        return array
+
+    def append(self, frame_values):
+        '''
+        Append the values of one frame.
+
+        INPUTS:
+        - frame_values: list of per-person arrays or lists of length nb_values, or an
+          array of shape (persons, nb_values). An empty list marks a frame without detection.
+        '''
+
+        values = np.asarray(frame_values, dtype=self.dtype)
+        frame_idx = self.nb_frames
+        self.nb_frames += 1
+        self._array = None
+
+        if values.size == 0:
+            return
+        values = values.reshape(len(values), -1)
+        if self.nb_values is None:
+            self.nb_values = values.shape[1]
+
+        # Allocate the chunk holding this frame, or grow its person dimension
+        nb_persons = len(values)
+        chunk_idx, row = divmod(frame_idx, self.chunk_size)
+        self._chunks.extend([None] * (chunk_idx + 1 - len(self._chunks)))
+        chunk = self._chunks[chunk_idx]
+        if chunk is None or chunk.shape[1] < nb_persons:
+            capacity = 0 if chunk is None else chunk.shape[1]
+            capacity = max(nb_persons, 2 * capacity, capacity + self.person_step)
+            new_chunk = self._allocate((self.chunk_size, capacity, self.nb_values))
+            if chunk is not None:
+                new_chunk[:, :chunk.shape[1]] = chunk
+            self._chunks[chunk_idx] = chunk = new_chunk
+
+        chunk[row, :nb_persons] = values
+        self.nb_persons = max(self.nb_persons, nb_persons)
+
+    @property
+    def shape(self):
+        return (self.nb_frames, self.nb_persons, self.nb_values or 0)
+
+    def __len__(self):
+        return self.nb_frames
+
+    def to_array(self):
+        '''
+        Return all values as one (frames, persons, values) array, padded with nans.
+        The array is cached until the next append. It is held in memory even if the
+        chunks are memory-mapped, so that it remains valid after close().
+        '''
+
+        if self._array is not None:
+            return self._array
+
+        array = np.full(self.shape, np.nan, dtype=self.dtype)
+        for chunk_idx, chunk in enumerate(self._chunks):
+            if chunk is None:
+                continue
+            start = chunk_idx * self.chunk_size
+            stop = min(start + self.chunk_size, self.nb_frames)
+            nb_persons = min(chunk.shape[1], self.nb_persons)
+            array[start:stop, :nb_persons] = chunk[:stop - start, :nb_persons]
+
+        self._array = array
+        return array
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.to_array()
+        return array if dtype is None else array.astype(dtype)
+
+    def close(self):
+        '''
+        Release the stored values and delete the memory-mapped files, if any.
+        '''
+
+        # Unmap the chunks before deleting their files, which fails on Windows while they are mapped
+        del self._chunks[:]
+        self._array = None
+        for path in self._files:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        self._files = []
+
+
+def frames_to_array(all_frames):
+    '''
+    Convert per-frame values to a (frames, persons, values) array padded with nans.
+
+    INPUTS:
+    - all_frames: FrameAccumulator, or list of per-frame arrays or lists
+
+    OUTPUT:
+    - np.array of padded values
+    '''
+
+    if isinstance(all_frames, FrameAccumulator):
+        return all_frames.to_array()
+    return make_homogeneous(all_frames)
+
+
 def resample_video(vid_output_path, fps, desired_framerate):
     '''
     Resample video to the desired fps using ffmpeg.
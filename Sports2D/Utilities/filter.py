@@ -12,6 +12,7 @@
     
     Usage: 
     col_filtered = filter1d(col, *filter_options)
+    data_filtered = filter2d(data, *filter_options) # all columns at once
     filter_options = (do_filter, filter_type, butterworth_filter_order, butterworth_filter_cutoff, frame_rate, gaussian_filter_kernel, loess_filter_kernel, median_filter_kernel)
                         bool        str             int                         int                    int         int                     int                 int
     
@@ -173,3 +174,93 @@ def filter1d(col, *filter_options):
     col_filtered = filter_fun(col, args)
 
     return col_filtered
+
+
+def valid_sequences_2d(valid):
+    '''
+    Run-length encoding of the valid values of each column
+
+    INPUT:
+    - valid: 2D boolean numpy array (frames, columns)
+
+    OUTPUT
+    - starts, stops, cols: numpy arrays. Column cols[i] is valid from starts[i] to stops[i] (excluded)
+    '''
+
+    padded = np.zeros((valid.shape[0] + 2, valid.shape[1]), dtype=np.int8)
+    padded[1:-1] = valid
+    edges = np.diff(padded, axis=0).T # transposed to sort edges by column, then by frame
+    cols, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+
+    return starts, stops, cols
+
+
+def butterworth_filter_2d(data, args):
+    '''
+    Zero-phase Butterworth filter (dual pass) of all columns at once
+    Same output as butterworth_filter_1d on each column.
+    Columns sharing the same valid sequences are filtered in a single call.
+
+    INPUT:
+    - data: 2D numpy array (frames, columns)
+    - order: int
+    - cutoff: int
+    - framerate: int
+
+    OUTPUT
+    - data_filtered: Filtered numpy array
+    '''
+
+    order, cutoff, framerate = args
+
+    # Filter
+    b, a = signal.butter(order/2, cutoff/(framerate/2), 'low', analog = False)
+    padlen = 3 * max(len(a), len(b))
+
+    # split into sequences of not nans, and group columns by sequence
+    data_filtered = data.copy()
+    starts, stops, cols = valid_sequences_2d(~(np.isnan(data) | (data == 0)))
+    long_enough = stops - starts > padlen
+    sequences = {}
+    for start, stop, col in zip(starts[long_enough], stops[long_enough], cols[long_enough]):
+        sequences.setdefault((start, stop), []).append(col)
+
+    # Filter each of the selected sequences
+    for (start, stop), seq_cols in sequences.items():
+        data_filtered[start:stop, seq_cols] = signal.filtfilt(b, a, data[start:stop, seq_cols], axis=0)
+
+    return data_filtered
+
+
+def filter2d(data, *filter_options):
+    '''
+    Choose filter type and filter all columns of a 2D array at once
+
+    INPUT:
+    - data: 2D numpy array or pandas DataFrame (frames, columns)
+    - filter_options = (do_filter, filter_type, butterworth_filter_order, butterworth_filter_cutoff, frame_rate, gaussian_filter_kernel, loess_filter_kernel, median_filter_kernel)
+
+    OUTPUT
+    - data_filtered: Filtered numpy array, or DataFrame if data is a DataFrame
+    '''
+
+    is_df = hasattr(data, 'columns')
+    values = np.array(data, dtype=float)
+
+    filter_type = filter_options[1]
+    if filter_type == 'butterworth':
+        data_filtered = butterworth_filter_2d(values, (filter_options[2], filter_options[3], filter_options[4]))
+    elif filter_type == 'gaussian':
+        data_filtered = gaussian_filter1d(values, filter_options[5], axis=0)
+    elif filter_type == 'median':
+        # medfilt of the 2D array differs from the 1D one near NaN values: filter each column
+        data_filtered = np.column_stack([median_filter_1d(col, filter_options[7]) for col in values.T]) if values.shape[1] > 0 else values
+    elif filter_type == 'loess':
+        data_filtered = np.column_stack([loess_filter_1d(col, filter_options[6]) for col in values.T]) if values.shape[1] > 0 else values
+    else:
+        raise ValueError(f'Unknown filter type: {filter_type}')
+
+    if is_df:
+        return data.__class__(data_filtered, index=data.index, columns=data.columns)
+    return data_filtered
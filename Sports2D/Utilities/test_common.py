@@ -0,0 +1,130 @@
+"""
+FrameAccumulator gives the same array as make_homogeneous on the per-frame arrays,
+and its memory-mapped files are deleted on close. interpolate_zeros_nans_2d gives
+the same output as interpolate_zeros_nans on each column.
+"""
+
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+try:
+    from Sports2D.Utilities.common import (
+        FrameAccumulator,
+        frames_to_array,
+        interpolate_zeros_nans,
+        interpolate_zeros_nans_2d,
+        make_homogeneous,
+    )
+except ModuleNotFoundError as e:
+    # imageio_ffmpeg, Qt bindings...
+    pytest.skip(f"{e.name} is not installed", allow_module_level=True)
+
+
+def make_frames(nb_frames=30, nb_values=5):
+    """Per-frame lists of per-person arrays, with a varying number of persons."""
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(nb_frames):
+        nb_persons = 1 + (i * 7) % 6
+        frames.append([rng.normal(size=nb_values) for _ in range(nb_persons)])
+        frames[-1][0][i % nb_values] = np.nan
+    return frames
+
+
+@pytest.mark.parametrize("spill", [False, True])
+@pytest.mark.parametrize("chunk_size", [4, 1024])
+def test_matches_make_homogeneous(tmp_path, spill, chunk_size):
+    frames = make_frames()
+    accumulator = FrameAccumulator(chunk_size=chunk_size, person_step=1, dtype=np.float64,
+                                   spill_dir=tmp_path if spill else None)
+    for frame in frames:
+        accumulator.append(frame)
+
+    expected = make_homogeneous([np.array(frame) for frame in frames])
+    np.testing.assert_array_equal(frames_to_array(accumulator), expected)
+    accumulator.close()
+
+
+def test_frames_without_detection_are_nan(tmp_path):
+    frames = make_frames(nb_frames=10)
+    accumulator = FrameAccumulator(chunk_size=4, spill_dir=tmp_path)
+    for i in (0, 5, 9):
+        frames[i] = []
+    for frame in frames:
+        accumulator.append(frame)
+
+    array = accumulator.to_array()
+
+    assert array.shape == (10, max(map(len, frames)), 5)
+    assert np.isnan(array[[0, 5, 9]]).all()
+    np.testing.assert_array_equal(array[1, :len(frames[1])], np.array(frames[1], dtype=np.float32))
+    accumulator.close()
+
+
+def test_close_deletes_spilled_files(tmp_path):
+    accumulator = FrameAccumulator(chunk_size=4, spill_dir=tmp_path)
+    for frame in make_frames():
+        accumulator.append(frame)
+    assert os.listdir(tmp_path)
+    array = accumulator.to_array()
+
+    accumulator.close()
+
+    assert os.listdir(tmp_path) == []
+    # The returned array does not depend on the deleted files
+    assert not isinstance(array, np.memmap)
+    assert array.shape == (30, 6, 5)
+
+
+def make_coordinates():
+    """Columns of coordinates with gaps of missing values (nans or zeros)."""
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 2, 80)[:, None]
+    data = np.sin(2 * np.pi * t * rng.uniform(0.5, 2, 12)) * 100 + rng.normal(size=(80, 12))
+    data[:, 1] = np.nan             # all missing
+    data[:76, 2] = 0                # too few good values
+    data[:5, 3] = np.nan            # leading gap
+    data[-7:, 4] = np.nan           # trailing gap
+    data[20:23, 5] = 0              # zeros count as missing
+    data[40:48, 5] = np.nan         # gap longer than N
+    data[30, 6] = np.nan            # single missing value
+    data[[0, 10, 11, 50, 79], 7] = np.nan
+    data[10:30, 8] = np.nan         # X and Y of a keypoint share their gaps
+    data[10:30, 9] = np.nan
+    data[:3, 10] = 0
+    data[-3:, 10] = np.nan
+    return data
+
+
+@pytest.mark.parametrize("N", [np.inf, 5])
+@pytest.mark.parametrize("kind", ["linear", "slinear", "quadratic", "cubic"])
+def test_interpolation_matches_columns(N, kind):
+    data = pd.DataFrame(make_coordinates())
+
+    data_interp = interpolate_zeros_nans_2d(data, N, kind)
+
+    expected = data.apply(interpolate_zeros_nans, axis=0, args=[N, kind])
+    assert isinstance(data_interp, pd.DataFrame)
+    np.testing.assert_allclose(data_interp.to_numpy(), expected.to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_interpolation_of_arrays():
+    data = make_coordinates()
+
+    data_interp = interpolate_zeros_nans_2d(data, 5, "linear")
+
+    assert isinstance(data_interp, np.ndarray)
+    assert np.isnan(data_interp[:, 1]).all()
+    np.testing.assert_array_equal(data_interp[:, 2], data[:, 2])
+    # Gaps longer than N stay missing
+    assert np.isnan(data_interp[-7:, 4]).all()
+    assert np.isnan(data_interp[40:48, 5]).all()
+    assert np.isnan(data_interp[10:30, 8:10]).all()
+    assert not np.isnan(np.delete(data_interp, [1, 2, 4, 5, 8, 9], axis=1)).any()
+    assert (data_interp[20:23, 5] != 0).all()
+    # The input is not modified
+    assert np.isnan(data[:5, 3]).all()
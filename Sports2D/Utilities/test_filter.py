@@ -0,0 +1,53 @@
+"""
+filter2d gives the same output as filter1d on each column, including around
+gaps of missing values.
+"""
+
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Sports2D.Utilities import filter
+
+
+def make_data():
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 4, 120)[:, None]
+    data = np.sin(2 * np.pi * t * rng.uniform(0.5, 2, 6)) + rng.normal(scale=0.1, size=(120, 6))
+    data[10:14, 1] = np.nan   # gap
+    data[30, 2] = np.nan      # single missing value
+    data[:3, 3] = np.nan      # leading gap
+    data[-5:, 4] = np.nan     # trailing gap
+    data[50:60, 5] = 0        # zeros count as missing for the Butterworth filter
+    data[60:62, 0] = np.nan
+    return data
+
+
+FILTER_OPTIONS = {
+    "butterworth": (True, "butterworth", 4, 6, 30, 1, 10, 5),
+    "gaussian": (True, "gaussian", 4, 6, 30, 1, 10, 5),
+    "loess": (True, "loess", 4, 6, 30, 1, 10, 5),
+    "median": (True, "median", 4, 6, 30, 1, 10, 5),
+}
+
+
+@pytest.mark.parametrize("filter_type", FILTER_OPTIONS)
+def test_filter2d_matches_filter1d(filter_type):
+    data = make_data()
+    options = FILTER_OPTIONS[filter_type]
+
+    expected = np.column_stack([filter.filter1d(pd.Series(col), *options) for col in data.T])
+    filtered = filter.filter2d(data, *options)
+
+    np.testing.assert_allclose(filtered, expected, rtol=1e-10, atol=1e-12, equal_nan=True)
+
+
+def test_filter2d_keeps_dataframe_labels():
+    data = pd.DataFrame(make_data(), index=np.arange(100, 220), columns=list("abcdef"))
+
+    filtered = filter.filter2d(data, *FILTER_OPTIONS["median"])
+
+    assert isinstance(filtered, pd.DataFrame)
+    assert filtered.index.equals(data.index)
+    assert filtered.columns.equals(data.columns)
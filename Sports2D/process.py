@@ -67,7 +67,7 @@ from tqdm import tqdm
 from Sports2D.Utilities import filter
 from Sports2D.Utilities.common import *
 from TracX.skeletons import *
-from TracX_rtmlib import BodyWithFeet, PoseTracker
+from TracX_rtmlib import BodyWithFeet, PoseTracker, pooled_solution
 
 ## CONSTANTS
 angle_dict = {  # lowercase!
@@ -307,7 +307,7 @@ def setup_pose_tracker(det_frequency, mode, tracking):
 
     # Initialize the pose tracker with Halpe26 model
     pose_tracker = PoseTracker(
-        BodyWithFeet,
+        pooled_solution(BodyWithFeet),
         det_frequency=det_frequency,
         mode=mode,
         backend=backend,
@@ -1575,7 +1575,14 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
     # Process video or webcam feed
     logging.info("\nProcessing video stream...")
     # logging.info(f"{'Video, ' if save_vid else ''}{'Images, ' if save_img else ''}{'Pose, ' if save_pose else ''}{'Angles ' if save_angles else ''}{'and ' if save_angles or save_img or save_pose or save_vid else ''}Logs will be saved in {result_dir}.")
-    all_frames_X, all_frames_Y, all_frames_scores, all_frames_angles = [], [], [], []
+    # Accumulate per-frame values in growable arrays, optionally memory-mapped
+    spill_to_disk = config_dict.get("process").get("spill_to_disk", False)
+    spill_dir = output_dir if spill_to_disk else None
+    all_frames_X = FrameAccumulator(spill_dir=spill_dir)
+    all_frames_Y = FrameAccumulator(spill_dir=spill_dir)
+    all_frames_scores = FrameAccumulator(spill_dir=spill_dir)
+    all_frames_angles = FrameAccumulator(spill_dir=spill_dir)
+    accumulators = [all_frames_X, all_frames_Y, all_frames_scores, all_frames_angles]
     frame_processing_times = []
     frame_count = 0
     while cap.isOpened():
@@ -1746,11 +1753,11 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
                     )
 
             if save_pose:
-                all_frames_X.append(np.array(valid_X))
-                all_frames_Y.append(np.array(valid_Y))
-                all_frames_scores.append(np.array(valid_scores))
+                all_frames_X.append(valid_X)
+                all_frames_Y.append(valid_Y)
+                all_frames_scores.append(valid_scores)
             if save_angles:
-                all_frames_angles.append(np.array(valid_angles))
+                all_frames_angles.append(valid_angles)
             if (
                 video_file == "webcam" and save_vid
             ):  # To adjust framerate of output video
@@ -1787,9 +1794,9 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
     if save_pose:
         logging.info("\nPost-processing pose:")
         # Select only the keypoints that are in the model from skeletons.py, invert Y axis, divide pixel values by 1000
-        all_frames_X = make_homogeneous(all_frames_X)
+        all_frames_X = frames_to_array(all_frames_X)
         all_frames_X = all_frames_X[..., keypoints_ids] / 1000
-        all_frames_Y = make_homogeneous(all_frames_Y)
+        all_frames_Y = frames_to_array(all_frames_Y)
         all_frames_Y = -all_frames_Y[..., keypoints_ids] / 1000
         all_frames_Z_person = pd.DataFrame(
             np.zeros_like(all_frames_X)[:, 0, :], columns=keypoints_names
@@ -1912,7 +1919,7 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
     # Angles post-processing
     if save_angles:
         logging.info("\nPost-processing angles:")
-        all_frames_angles = make_homogeneous(all_frames_angles)
+        all_frames_angles = frames_to_array(all_frames_angles)
 
         # Process angles for each person
         for i in range(all_frames_angles.shape[1]):
@@ -2003,3 +2010,7 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
                     angle_plots(
                         all_frames_angles_person, angle_data, i
                     )  # i = current person
+
+    # Release the accumulated arrays and their memory-mapped files
+    for accumulator in accumulators:
+        accumulator.close()
@@ -4,15 +4,15 @@ import shutil
 from datetime import datetime
 
 import cv2
-from Pose2Sim.Utilities import bodykin_from_mot_osim
 
+from TracX import instrumentation
 from TracX.core import Experiment
-from TracX.core.analyze2d import process as process2d
-from TracX.core.analyze3d import lift_2d_to_3d
-from TracX.kinematics import run_kinematics
+from TracX.instrumentation import span
 
 
 def process_mono2d(experiment: Experiment):
+    from TracX.core.analyze2d import process as process2d
+
     if len(experiment.videos) == 0:
         raise ValueError("No videos found for experiment")
 
@@ -27,7 +27,8 @@ def process_mono2d(experiment: Experiment):
     config_dict["project"]["video_input"] = video_path
     config_dict["process"]["result_dir"] = experiment.path
     config_dict["post-processing"]["show_graphs"] = False
-    process2d(config_dict)
+    with span("pose2d", experiment=experiment.name):
+        process2d(config_dict)
 
     # Post-process paths
     logging.info("Cleaning up temporary files")
@@ -52,6 +53,11 @@ def process_mono2d(experiment: Experiment):
 
 def process_mono3d(experiment: Experiment):
     process_mono2d(experiment)
+    lift_mono3d(experiment)
+
+
+def lift_mono3d(experiment: Experiment):
+    from TracX.core.analyze3d import lift_2d_to_3d
 
     logging.info("Lifting 2D poses to 3D")
     pose2d_files = [
@@ -78,7 +84,8 @@ def process_mono3d(experiment: Experiment):
         )
         pose3d_file = pose3d_file.replace(".trc", "_filt_butterworth.trc")
         logging.info(f"Lifting {pose2d_file} to {pose3d_file}")
-        lift_2d_to_3d(pose2d_file, pose3d_file, res_w, res_h)
+        with span("lifting", experiment=experiment.name):
+            lift_2d_to_3d(pose2d_file, pose3d_file, res_w, res_h)
 
         # Remove original 2D pose file
         os.remove(pose2d_file)
@@ -125,10 +132,16 @@ def process(name: str):
     )
 
     # Run the processing function
-    process_fun(experiment)
+    instrumentation.reset()
+    with span("process", experiment=experiment.name):
+        process_fun(experiment)
+    instrumentation.export_experiment(experiment.path)
 
 
 def kinematics(name: str, overwrite: bool = False):
+    # OpenSim is slow to import, only load it when kinematics are computed
+    from TracX.kinematics import run_kinematics
+
     try:
         experiment = Experiment.open(name)
         pose_model = experiment.cfg["pose"]["pose_model"]
@@ -166,15 +179,22 @@ def kinematics(name: str, overwrite: bool = False):
     )
 
     # TODO: Read time range from the config file
-    output, mot, scaled_model = run_kinematics(
-        motion_file=motion_file,
-        output_dir=experiment.output_dir,
-        pose_model=pose_model,
-        time_range=None,  # Use the entire motion file
-    )
+    kinematics_cfg = experiment.cfg.get("kinematics", {})
+    with span("kinematics", experiment=experiment.name):
+        output, mot, scaled_model = run_kinematics(
+            motion_file=motion_file,
+            output_dir=experiment.output_dir,
+            pose_model=pose_model,
+            time_range=None,  # Use the entire motion file
+            chunk_duration=kinematics_cfg.get("ik_chunk_duration", 0),
+            chunk_overlap=kinematics_cfg.get("ik_chunk_overlap", 1.0),
+            max_workers=kinematics_cfg.get("ik_max_workers") or None,
+        )
 
     with_blender = False  # TODO: Implement Blender integration
     if with_blender:
+        from Pose2Sim.Utilities import bodykin_from_mot_osim
+
         bodykin_from_mot_osim.bodykin_from_mot_osim_func(
             mot,
             scaled_model,
@@ -0,0 +1,318 @@
+"""Headless batch processing of many experiments.
+
+Experiments are processed from a queue by a pool of worker processes, stage by
+stage. The state of each stage is saved in the experiment directory as soon as
+it changes, so an interrupted batch resumes from the first stage that did not
+complete. Processing never changes the working directory, so several
+experiments can safely be processed at the same time. With `--profile`, the
+spans and counters of each experiment are saved in its `profile` directory.
+
+Usage:
+    python -m TracX.batch experiment_1 experiment_2 --workers 2 --kinematics
+    python -m TracX.batch --all --profile
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import cv2
+
+from TracX import instrumentation
+from TracX.constants import APP_CACHE
+from TracX.core import Experiment
+
+STATE_FILE_NAME = "batch_state.json"
+BATCH_REPORTS_DIR = os.path.join(APP_CACHE, "batch")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _pose2d_mono(experiment, context):
+    from TracX.TracX import process_mono2d
+
+    process_mono2d(experiment)
+
+
+def _lifting_mono(experiment, context):
+    from TracX.TracX import lift_mono3d
+
+    lift_mono3d(experiment)
+
+
+def _pose2d_multi(experiment, context):
+    context["res_w"], context["res_h"] = experiment.estimate_pose2d()
+
+
+def _association(experiment, context):
+    experiment.associate_persons()
+
+
+def _triangulation(experiment, context):
+    experiment.reconstruct_3d(context.get("res_w", 0), context.get("res_h", 0))
+
+
+def _filtering(experiment, context):
+    experiment.filter_poses()
+
+
+def _kinematics(experiment, context):
+    from TracX.TracX import kinematics
+
+    if kinematics(experiment.name, overwrite=True) is None:
+        raise RuntimeError("Kinematics could not be computed")
+
+
+def experiment_stages(experiment, with_kinematics=False):
+    """Ordered (name, function) processing stages of an experiment."""
+    if experiment.monocular and experiment.is_2d:
+        stages = [("pose2d", _pose2d_mono)]
+    elif experiment.monocular:
+        stages = [("pose2d", _pose2d_mono), ("lifting", _lifting_mono)]
+    else:
+        stages = [
+            ("pose2d", _pose2d_multi),
+            ("association", _association),
+            ("triangulation", _triangulation),
+            ("filtering", _filtering),
+        ]
+    if with_kinematics and not experiment.is_2d:
+        stages.append(("kinematics", _kinematics))
+    return stages
+
+
+def count_frames(experiment):
+    """Total number of frames of the videos of an experiment."""
+    frames = 0
+    for video in experiment.videos:
+        cap = cv2.VideoCapture(video)
+        frames += max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        cap.release()
+    return frames
+
+
+def load_state(experiment):
+    """Read the batch state of an experiment, or an empty state."""
+    state_file = os.path.join(experiment.path, STATE_FILE_NAME)
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            return json.load(f)
+    return {"stages": {}, "context": {}}
+
+
+def save_state(experiment, state):
+    """Write the batch state of an experiment atomically."""
+    state_file = os.path.join(experiment.path, STATE_FILE_NAME)
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(state_file + ".tmp", state_file)
+
+
+def process_experiment(name, with_kinematics=False, force=False):
+    """Process the stages of an experiment that have not completed yet.
+
+    Args:
+        name: Name of the experiment.
+        with_kinematics: Whether to compute the kinematics after the 3D poses.
+        force: Whether to run all stages again, even those that completed.
+
+    Returns:
+        dict: The `name`, the `status`, the `wall_time` in seconds, the number
+            of video `frames`, and the `stages` of the experiment with their
+            status, wall time and error if any.
+    """
+    start = time.perf_counter()
+    summary = {"name": name, "status": DONE, "frames": 0, "stages": {}, "ran": []}
+    try:
+        experiment = Experiment.open(name)
+    except FileNotFoundError:
+        summary.update(status=FAILED, error=f"Experiment {name} not found", wall_time=0.0)
+        return summary
+
+    # Log to the experiment log file while it is processed
+    log_handler = logging.FileHandler(experiment.log_file)
+    log_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    logging.getLogger().addHandler(log_handler)
+
+    instrumentation.reset()
+    try:
+        state = {"stages": {}, "context": {}} if force else load_state(experiment)
+        frames = state["context"].get("frames")
+        if frames is None:
+            frames = state["context"]["frames"] = count_frames(experiment)
+        summary["frames"] = frames
+
+        for stage, fun in experiment_stages(experiment, with_kinematics):
+            stage_state = state["stages"].setdefault(stage, {"status": PENDING})
+            if stage_state["status"] == DONE:
+                logging.info(f"[{name}] Stage '{stage}' already done, skipping")
+                continue
+
+            logging.info(f"[{name}] Running stage '{stage}'")
+            stage_state.update(status=RUNNING, started=datetime.now().isoformat(timespec="seconds"))
+            stage_state.pop("error", None)
+            save_state(experiment, state)
+
+            stage_start = time.perf_counter()
+            summary["ran"].append(stage)
+            try:
+                with instrumentation.span(stage, experiment=name):
+                    fun(experiment, state["context"])
+            except Exception as e:
+                logging.exception(f"[{name}] Stage '{stage}' failed")
+                stage_state.update(status=FAILED, error=str(e), wall_time=time.perf_counter() - stage_start)
+                summary.update(status=FAILED, error=f"{stage}: {e}")
+                break
+            finally:
+                save_state(experiment, state)
+
+            stage_state.update(status=DONE, wall_time=time.perf_counter() - stage_start, frames=frames)
+            save_state(experiment, state)
+
+        summary["stages"] = state["stages"]
+        instrumentation.export_experiment(experiment.path)
+    finally:
+        logging.getLogger().removeHandler(log_handler)
+        log_handler.close()
+
+    summary["wall_time"] = time.perf_counter() - start
+    return summary
+
+
+def throughput_report(summaries, wall_time):
+    """Aggregate the summaries of processed experiments.
+
+    Stages skipped because they were already done are not counted in the
+    throughput of this run.
+
+    Returns:
+        dict: The per-stage frames, time and frames per second, the
+            per-experiment wall time and status, and the totals.
+    """
+    stages = {}
+    for summary in summaries:
+        for stage, stage_state in summary.get("stages", {}).items():
+            if stage not in summary.get("ran", []) or stage_state.get("status") != DONE:
+                continue
+            totals = stages.setdefault(stage, {"frames": 0, "time": 0.0})
+            totals["frames"] += stage_state.get("frames", 0)
+            totals["time"] += stage_state["wall_time"]
+    for totals in stages.values():
+        totals["fps"] = totals["frames"] / totals["time"] if totals["time"] > 0 else None
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "wall_time": wall_time,
+        "experiments": {
+            s["name"]: {
+                "status": s["status"],
+                "wall_time": s.get("wall_time", 0.0),
+                "frames": s.get("frames", 0),
+                **({"error": s["error"]} if "error" in s else {}),
+            }
+            for s in summaries
+        },
+        "stages": stages,
+        "succeeded": sum(s["status"] == DONE for s in summaries),
+        "failed": sum(s["status"] == FAILED for s in summaries),
+    }
+
+
+def run_batch(names, max_workers=1, with_kinematics=False, force=False, report_file=None):
+    """Process a queue of experiments with a pool of worker processes.
+
+    Args:
+        names: Names of the experiments, in processing order.
+        max_workers: Number of experiments processed at the same time.
+        with_kinematics: Whether to compute the kinematics of 3D experiments.
+        force: Whether to run all stages again, even those that completed.
+        report_file: Path of the JSON throughput report. Defaults to a dated
+            file in the batch reports directory.
+
+    Returns:
+        dict: The throughput report (see `throughput_report`).
+    """
+    start = time.perf_counter()
+    summaries = []
+
+    if max_workers <= 1:
+        for name in names:
+            summaries.append(process_experiment(name, with_kinematics, force))
+            _log_summary(summaries[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(process_experiment, name, with_kinematics, force): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    summary = {"name": futures[future], "status": FAILED, "error": str(e)}
+                summaries.append(summary)
+                _log_summary(summary)
+
+    report = throughput_report(summaries, time.perf_counter() - start)
+
+    if report_file is None:
+        os.makedirs(BATCH_REPORTS_DIR, exist_ok=True)
+        report_file = os.path.join(
+            BATCH_REPORTS_DIR, f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        )
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for stage, totals in report["stages"].items():
+        fps = "-" if totals["fps"] is None else f"{totals['fps']:.1f}"
+        logging.info(f"Stage '{stage}': {totals['frames']} frames in {totals['time']:.1f} s ({fps} frames/s)")
+    logging.info(
+        f"Batch done in {report['wall_time']:.1f} s: {report['succeeded']} succeeded, "
+        f"{report['failed']} failed. Report saved to {report_file}"
+    )
+    return report
+
+
+def _log_summary(summary):
+    if summary["status"] == DONE:
+        logging.info(f"Experiment '{summary['name']}' processed in {summary.get('wall_time', 0.0):.1f} s")
+    else:
+        logging.error(f"Experiment '{summary['name']}' failed: {summary.get('error')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process a queue of experiments without the GUI.")
+    parser.add_argument("experiments", nargs="*", help="Names of the experiments to process")
+    parser.add_argument("--all", action="store_true", help="Process all experiments")
+    parser.add_argument("--workers", type=int, default=1, help="Number of experiments processed at the same time")
+    parser.add_argument("--kinematics", action="store_true", help="Also compute the kinematics")
+    parser.add_argument("--force", action="store_true", help="Run all stages again, even those that completed")
+    parser.add_argument("--report", default=None, help="Path of the JSON throughput report")
+    parser.add_argument("--profile", action="store_true", help="Save a profile of each experiment")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.profile:
+        # Also enables profiling in worker processes started with spawn
+        os.environ["FEATURE_PROFILING_ENABLED"] = "1"
+        instrumentation.enable()
+
+    names = list(args.experiments)
+    if args.all:
+        names += [e["name"] for e in Experiment.list() if e["name"] not in names]
+    if not names:
+        parser.error("No experiment to process")
+
+    report = run_batch(names, args.workers, args.kinematics, args.force, args.report)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,501 @@
+"""Performance benchmark of the processing stages on synthetic sessions.
+
+A synthetic multi-camera session is a random walking motion of HALPE_26
+skeletons, seen by a ring of calibrated cameras. The 3D keypoints are
+projected with `Pose2Sim.common.reprojection`, with pixel noise, occluded
+keypoints, and extra people who are only seen by some of the cameras, and are
+written as OpenPose JSON files with a calibration file and a configuration
+file, like a processed experiment.
+
+The person association, triangulation, filtering and streaming stages are
+timed on sessions of several scales (cameras, persons, frames). Results are
+compared with a stored baseline, so that regressions in speed or in
+triangulation accuracy are caught.
+
+Usage:
+    python -m TracX.benchmark --cameras 4 8 --persons 1 --frames 200 1000
+    python -m TracX.benchmark --quick --save-baseline
+"""
+
+import argparse
+import itertools as it
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+import toml
+
+from TracX import instrumentation
+from TracX.constants import APP_ASSETS, APP_CACHE
+
+BENCHMARK_BASELINE = os.path.join(APP_CACHE, "benchmark_baseline.json")
+
+DEFAULT_SCALES = {"cameras": (4, 8), "persons": (1, 3), "frames": (200, 1000)}
+QUICK_SCALES = {"cameras": (4,), "persons": (1,), "frames": (100,)}
+
+STAGES = ("projection", "write_json", "association", "triangulation", "filtering", "streaming")
+
+# HALPE_26 keypoints of a standing person facing +X, in meters, Z-up
+HALPE_26_REST_POSE = np.array(
+    [
+        [0.10, 0.00, 1.65],  # Nose
+        [0.08, 0.03, 1.68],  # LEye
+        [0.08, -0.03, 1.68],  # REye
+        [0.00, 0.07, 1.66],  # LEar
+        [0.00, -0.07, 1.66],  # REar
+        [0.00, 0.18, 1.45],  # LShoulder
+        [0.00, -0.18, 1.45],  # RShoulder
+        [0.00, 0.20, 1.17],  # LElbow
+        [0.00, -0.20, 1.17],  # RElbow
+        [0.05, 0.20, 0.92],  # LWrist
+        [0.05, -0.20, 0.92],  # RWrist
+        [0.00, 0.10, 0.95],  # LHip
+        [0.00, -0.10, 0.95],  # RHip
+        [0.02, 0.10, 0.52],  # LKnee
+        [0.02, -0.10, 0.52],  # RKnee
+        [0.00, 0.10, 0.08],  # LAnkle
+        [0.00, -0.10, 0.08],  # RAnkle
+        [0.00, 0.00, 1.75],  # Head
+        [0.00, 0.00, 1.50],  # Neck
+        [0.00, 0.00, 0.95],  # Hip
+        [0.18, 0.12, 0.02],  # LBigToe
+        [0.18, -0.12, 0.02],  # RBigToe
+        [0.16, 0.16, 0.02],  # LSmallToe
+        [0.16, -0.16, 0.02],  # RSmallToe
+        [-0.05, 0.10, 0.02],  # LHeel
+        [-0.05, -0.10, 0.02],  # RHeel
+    ]
+)
+
+# Swinging limbs: (pivot keypoint, moving keypoints, phase sign)
+HALPE_26_LIMBS = (
+    (11, (13, 15, 20, 22, 24), 1),  # Left leg
+    (12, (14, 16, 21, 23, 25), -1),  # Right leg
+    (5, (7, 9), -1),  # Left arm
+    (6, (8, 10), 1),  # Right arm
+)
+
+
+def _rotation_y(angles):
+    c, s = np.cos(angles), np.sin(angles)
+    R = np.zeros(angles.shape + (3, 3))
+    R[..., 0, 0], R[..., 0, 2], R[..., 1, 1] = c, s, 1
+    R[..., 2, 0], R[..., 2, 2] = -s, c
+    return R
+
+
+def _rotation_z(angles):
+    c, s = np.cos(angles), np.sin(angles)
+    R = np.zeros(angles.shape + (3, 3))
+    R[..., 0, 0], R[..., 0, 1], R[..., 1, 0] = c, -s, s
+    R[..., 1, 1], R[..., 2, 2] = c, 1
+    return R
+
+
+def synthetic_motion(nb_frames, nb_persons, frame_rate=60, radius=(0.5, 2.0), rng=None):
+    """Random walking motions of HALPE_26 skeletons.
+
+    Each person walks along a circle around the origin, at their own radius,
+    speed, direction and phase, swinging arms and legs.
+
+    Returns:
+        np.ndarray: Keypoints of shape (frames, persons, 26, 3), in meters,
+            Z-up.
+    """
+    rng = np.random.default_rng(rng)
+    t = np.arange(nb_frames) / frame_rate
+    motion = np.empty((nb_frames, nb_persons, len(HALPE_26_REST_POSE), 3))
+    for p in range(nb_persons):
+        r = rng.uniform(*radius)
+        speed = rng.uniform(0.8, 1.4) * rng.choice([-1, 1])
+        phase = rng.uniform(0, 2 * np.pi)
+        stride = rng.uniform(0.8, 1.2)  # Hz
+
+        # Limb swing around the lateral axis
+        pose = np.repeat(HALPE_26_REST_POSE[None], nb_frames, axis=0)
+        swing = 0.4 * np.sin(2 * np.pi * stride * t + phase)
+        for pivot, moving, sign in HALPE_26_LIMBS:
+            R = _rotation_y(sign * swing)
+            offset = pose[:, moving] - pose[:, pivot, None]
+            pose[:, moving] = pose[:, pivot, None] + np.einsum("fij,fkj->fki", R, offset)
+
+        # Heading along the circle, then position on the circle
+        angle = phase + speed * t / r
+        heading = angle + np.sign(speed) * np.pi / 2
+        pose = np.einsum("fij,fkj->fki", _rotation_z(heading), pose)
+        pose[..., 0] += (r * np.cos(angle))[:, None]
+        pose[..., 1] += (r * np.sin(angle))[:, None]
+        motion[:, p] = pose
+    return motion
+
+
+def ring_cameras(nb_cameras, radius=5.0, height=2.0, target=(0, 0, 1.0), size=(1920, 1080), focal=1400.0):
+    """Calibration of cameras evenly placed on a ring, all looking at a target.
+
+    Returns:
+        dict: The camera `names`, image `S`izes, intrinsic matrices `K`,
+            `dist`ortions, Rodrigues rotations `R`, translations `T`, and
+            projection matrices `P`, in the conventions of the Pose2Sim
+            calibration files.
+    """
+    import cv2
+
+    calib = {"names": [], "S": [], "K": [], "dist": [], "R": [], "T": [], "P": []}
+    K = np.array([[focal, 0, size[0] / 2], [0, focal, size[1] / 2], [0, 0, 1]])
+    for c in range(nb_cameras):
+        angle = 2 * np.pi * c / nb_cameras
+        center = np.array([radius * np.cos(angle), radius * np.sin(angle), height])
+        z = np.asarray(target, float) - center
+        z /= np.linalg.norm(z)
+        x = np.cross(z, [0, 0, 1])
+        x /= np.linalg.norm(x)
+        y = np.cross(z, x)
+        R_mat = np.stack([x, y, z])
+        T = -R_mat @ center
+
+        calib["names"].append(f"cam{c + 1:02d}")
+        calib["S"].append([float(size[0]), float(size[1])])
+        calib["K"].append(K)
+        calib["dist"].append(np.zeros(4))
+        calib["R"].append(cv2.Rodrigues(R_mat)[0].ravel())
+        calib["T"].append(T)
+        calib["P"].append(K @ np.column_stack([R_mat, T]))
+    return calib
+
+
+def project_session(motion, calib, noise=1.0, occlusion=0.05, extra_people=0, rng=None):
+    """Project 3D keypoints to all cameras, as a 2D pose estimator would see them.
+
+    Args:
+        motion: Keypoints of shape (frames, persons, keypoints, 3).
+        calib: Calibration (see `ring_cameras`).
+        noise: Standard deviation of the pixel noise.
+        occlusion: Probability that a keypoint is not detected.
+        extra_people: Number of people walking around the scene who are each
+            seen by a random half of the cameras.
+
+    Returns:
+        tuple: The x, y and likelihood of shape (cameras, frames, people,
+            keypoints, 3), with extra people after the persons of `motion`
+            and undetected keypoints set to zero, and the 3D keypoints of all
+            people, of shape (frames, people, keypoints, 3).
+    """
+    from Pose2Sim.common import reprojection
+
+    rng = np.random.default_rng(rng)
+    nb_frames, nb_persons = motion.shape[:2]
+    if extra_people:
+        extra = synthetic_motion(nb_frames, extra_people, radius=(2.5, 3.5), rng=rng)
+        motion = np.concatenate([motion, extra], axis=1)
+    P = np.asarray(calib["P"])
+
+    x, y = reprojection(P, motion)  # (cameras, frames, people, keypoints)
+    depth = np.einsum("cj,fpkj->cfpk", P[:, 2, :3], motion) + P[:, 2, None, None, None, 3]
+    width, height = np.asarray(calib["S"]).T
+    visible = (
+        (depth > 0.1)
+        & (x >= 0) & (x < width[:, None, None, None])
+        & (y >= 0) & (y < height[:, None, None, None])
+        & (rng.random(x.shape) >= occlusion)
+    )
+    if extra_people:
+        seen = rng.random((len(P), extra_people)) < 0.5
+        visible[:, :, nb_persons:] &= seen[:, None, :, None]
+
+    coords = np.stack(
+        [
+            x + rng.normal(0, noise, x.shape),
+            y + rng.normal(0, noise, y.shape),
+            rng.uniform(0.6, 0.95, x.shape),
+        ],
+        axis=-1,
+    )
+    coords[~visible] = 0
+    return coords, motion
+
+
+def write_session(session_dir, coords, calib, config):
+    """Write a synthetic session as a processed experiment.
+
+    The 2D keypoints are written as one OpenPose JSON file per camera and
+    frame, with the detected people in random order. People with no detected
+    keypoint in a view are left out of it.
+    """
+    from Pose2Sim.calibration import toml_write
+
+    calibration_dir = os.path.join(session_dir, "calibration")
+    os.makedirs(calibration_dir, exist_ok=True)
+    toml_write(
+        os.path.join(calibration_dir, "Calib_board.toml"),
+        calib["names"], calib["S"], calib["dist"], calib["K"], calib["R"], calib["T"],
+    )
+    with open(os.path.join(session_dir, "Config.toml"), "w") as f:
+        toml.dump(config, f)
+
+    rng = np.random.default_rng(0)
+    for c, name in enumerate(calib["names"]):
+        json_dir = os.path.join(session_dir, "pose", f"{name}_json")
+        os.makedirs(json_dir, exist_ok=True)
+        for f, people in enumerate(coords[c]):
+            detected = [p for p in rng.permutation(len(people)) if people[p, :, 2].any()]
+            json_output = {
+                "version": 1.3,
+                "people": [
+                    {"person_id": [-1], "pose_keypoints_2d": people[p].ravel().tolist()}
+                    for p in detected
+                ],
+            }
+            with open(os.path.join(json_dir, f"{name}_{f:06d}.json"), "w") as json_file:
+                json.dump(json_output, json_file)
+
+
+def session_config(session_dir, nb_persons, frame_rate=60):
+    """Default multi-camera configuration of a synthetic session."""
+    config = toml.load(os.path.join(APP_ASSETS, "defaults", "Config_Multi3d.toml"))
+    config["project"].update(
+        project_dir=session_dir,
+        multi_person=nb_persons > 1,
+        frame_rate=frame_rate,
+        frame_range=[],
+    )
+    config["pose"]["pose_model"] = "HALPE_26"
+    config["filtering"]["display_figures"] = False
+    return config
+
+
+def triangulation_error(session_dir, motion):
+    """Mean distance between triangulated keypoints and the nearest true person, in mm.
+
+    `motion` must hold all the people seen by the cameras, including the extra
+    people, since they are triangulated too.
+    """
+    from TracX.motion_io import read_trc_data
+
+    pose3d_dir = os.path.join(session_dir, "pose-3d")
+    trc_files = [f for f in os.listdir(pose3d_dir) if f.endswith(".trc") and "_filt" not in f]
+    errors = []
+    for trc_file in trc_files:
+        header, data = read_trc_data(os.path.join(pose3d_dir, trc_file))
+        frames = data[:, 0].astype(int)
+        # Y-up to Z-up: (X, Y, Z) were written as (Y, Z, X)
+        Q = data[:, 2:].reshape(len(data), -1, 3)[..., [2, 0, 1]]
+        ids = [_HALPE_26_IDS[name] for name in header["marker_names"]]
+        truth = motion[frames][:, :, ids]  # (frames, persons, markers, 3)
+        dist = np.linalg.norm(truth - Q[:, None], axis=-1)
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            person_error = np.nanmean(dist, axis=2)
+        nearest = np.argmin(np.nan_to_num(person_error, nan=np.inf), axis=1)
+        errors.append(dist[np.arange(len(frames)), nearest])
+    if not errors:
+        return None
+    return float(np.nanmean(np.concatenate(errors)) * 1000)
+
+
+_HALPE_26_IDS = {
+    name: i
+    for i, name in enumerate(
+        [
+            "Nose", "LEye", "REye", "LEar", "REar", "LShoulder", "RShoulder", "LElbow",
+            "RElbow", "LWrist", "RWrist", "LHip", "RHip", "LKnee", "RKnee", "LAnkle",
+            "RAnkle", "Head", "Neck", "Hip", "LBigToe", "RBigToe", "LSmallToe",
+            "RSmallToe", "LHeel", "RHeel",
+        ]
+    )
+}
+
+
+def run_scale(cameras, persons, frames, repeats=1, noise=1.0, occlusion=0.05, extra_people=1, seed=0, work_dir=None):
+    """Generate a synthetic session and time each processing stage on it.
+
+    Returns:
+        dict: The best `times` of each stage in seconds, the triangulation
+            `error` in mm, and the instrumentation `counters` of the last run.
+    """
+    from Pose2Sim import Pose2Sim
+    from Pose2Sim.common import reprojection
+    from TracX.streaming import encode_frame
+
+    rng = np.random.default_rng(seed)
+    motion = synthetic_motion(frames, persons, rng=rng)
+    calib = ring_cameras(cameras)
+
+    session_dir = tempfile.mkdtemp(prefix="tracx_benchmark_", dir=work_dir)
+    times = {stage: [] for stage in STAGES}
+    try:
+        config = session_config(session_dir, persons)
+        for _ in range(repeats):
+            instrumentation.reset()
+            start = time.perf_counter()
+            reprojection(calib["P"], motion)
+            times["projection"].append(time.perf_counter() - start)
+
+            coords, truth = project_session(motion, calib, noise, occlusion, extra_people, rng=seed)
+            for d in ("pose", "pose-associated", "pose-3d"):
+                shutil.rmtree(os.path.join(session_dir, d), ignore_errors=True)
+            start = time.perf_counter()
+            write_session(session_dir, coords, calib, config)
+            times["write_json"].append(time.perf_counter() - start)
+
+            for stage, fun in [
+                ("association", Pose2Sim.personAssociation),
+                ("triangulation", Pose2Sim.triangulation),
+                ("filtering", Pose2Sim.filtering),
+            ]:
+                start = time.perf_counter()
+                fun(config)
+                times[stage].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for f in range(frames):
+                encode_frame({"frame": f, "keypoints": motion[f]})
+            times["streaming"].append(time.perf_counter() - start)
+
+        return {
+            "times": {stage: min(t) for stage, t in times.items()},
+            "error": triangulation_error(session_dir, truth),
+            "counters": instrumentation.summary()["counters"],
+        }
+    finally:
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+
+def scale_key(cameras, persons, frames):
+    return f"{cameras}cams_{persons}persons_{frames}frames"
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Stages slower, or triangulations less accurate, than baseline.
+
+    Returns:
+        list: (scale, stage, value, baseline value) of each regression.
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        for stage, t in result["times"].items():
+            base_t = base["times"].get(stage)
+            if base_t is not None and t > base_t * (1 + tolerance):
+                regressions.append((key, stage, t, base_t))
+        # Accuracy is deterministic for a given seed, allow 1 mm of slack
+        if (
+            result["error"] is not None
+            and base.get("error") is not None
+            and result["error"] > base["error"] * (1 + tolerance) + 1
+        ):
+            regressions.append((key, "error", result["error"], base["error"]))
+    return regressions
+
+
+def run_benchmark(scales=DEFAULT_SCALES, repeats=3, baseline_file=BENCHMARK_BASELINE, save_baseline=False, tolerance=0.2, **session_args):
+    """Time the processing stages at all combinations of scales.
+
+    Args:
+        scales: Lists of the numbers of `cameras`, `persons` and `frames`.
+        repeats: Number of runs of each scale. The best time is kept.
+        baseline_file: JSON file of the baseline results.
+        save_baseline: Whether to save the results as the new baseline.
+        tolerance: Allowed slowdown ratio.
+        **session_args: `noise`, `occlusion`, `extra_people` and `seed` of the
+            synthetic sessions (see `run_scale`).
+
+    Returns:
+        tuple: The results by scale, and the list of regressions (see `compare`).
+    """
+    was_enabled = instrumentation.is_enabled()
+    instrumentation.enable()
+    results = {}
+    try:
+        for cameras, persons, frames in it.product(scales["cameras"], scales["persons"], scales["frames"]):
+            key = scale_key(cameras, persons, frames)
+            logging.warning(f"Benchmarking {key}...")
+            results[key] = dict(
+                cameras=cameras,
+                persons=persons,
+                frames=frames,
+                **run_scale(cameras, persons, frames, repeats=repeats, **session_args),
+            )
+    finally:
+        if not was_enabled:
+            instrumentation.disable()
+
+    baseline = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, tolerance)
+
+    if save_baseline:
+        baseline = {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "results": {**baseline.get("results", {}), **results},
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_file)), exist_ok=True)
+        with open(baseline_file, "w") as f:
+            json.dump(baseline, f, indent=2)
+
+    return results, regressions
+
+
+def format_results(results):
+    """Format benchmark results as a text table."""
+    lines = [f"{'scale':<28}" + "".join(f"{stage:>14}" for stage in STAGES) + f"{'error':>10}"]
+    for key, result in results.items():
+        error = "-" if result["error"] is None else f"{result['error']:.1f}mm"
+        lines.append(
+            f"{key:<28}"
+            + "".join(f"{result['times'][stage]:>13.3f}s" for stage in STAGES)
+            + f"{error:>10}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=DEFAULT_SCALES["cameras"])
+    parser.add_argument("--persons", type=int, nargs="+", default=DEFAULT_SCALES["persons"])
+    parser.add_argument("--frames", type=int, nargs="+", default=DEFAULT_SCALES["frames"])
+    parser.add_argument("--quick", action="store_true", help="Run a single small scale")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=1.0, help="Pixel noise standard deviation")
+    parser.add_argument("--occlusion", type=float, default=0.05, help="Probability of a missed keypoint")
+    parser.add_argument("--extra-people", type=int, default=1, help="People seen by some cameras only")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE, help="JSON baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown ratio")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    scales = QUICK_SCALES if args.quick else {"cameras": args.cameras, "persons": args.persons, "frames": args.frames}
+    results, regressions = run_benchmark(
+        scales,
+        repeats=args.repeats,
+        baseline_file=args.baseline,
+        save_baseline=args.save_baseline,
+        tolerance=args.tolerance,
+        noise=args.noise,
+        occlusion=args.occlusion,
+        extra_people=args.extra_people,
+        seed=args.seed,
+    )
+    print(format_results(results))
+    for key, stage, value, base in regressions:
+        print(f"REGRESSION {key} {stage}: {value:.3f} (baseline {base:.3f})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -63,4 +63,5 @@ def create_directories():
 FEATURE_RECORDING_ENABLED = os.getenv("FEATURE_RECORDING_ENABLED", "0") == "1"
 FEATURE_MONOCULAR_2D_ANALYSIS_ENABLED = os.getenv("FEATURE_MONOCULAR_2D_ANALYSIS_ENABLED", "0") == "1"
 FEATURE_MONOCULAR_3D_ANALYSIS_ENABLED = os.getenv("FEATURE_MONOCULAR_3D_ANALYSIS_ENABLED", "0") == "1"
-FEATURE_STREAMING_ENABLED = os.getenv("FEATURE_STREAMING_ENABLED", "0") == "1"
\ No newline at end of file
+FEATURE_STREAMING_ENABLED = os.getenv("FEATURE_STREAMING_ENABLED", "0") == "1"
+FEATURE_PROFILING_ENABLED = os.getenv("FEATURE_PROFILING_ENABLED", "0") == "1"
@@ -20,7 +20,10 @@ from tqdm import tqdm
 from Sports2D.process import setup_video, sort_people_rtmlib, sort_people_sports2d
 from Sports2D.Utilities import filter
 from Sports2D.Utilities.common import *
+from TracX.instrumentation import count, span
+from TracX.motion_io import trc_header, write_mot, write_trc
 from TracX.skeletons import *
+from TracX.video_reader import VideoReader
 from TracX_rtmlib import (
     Body,
     BodyWithFeet,
@@ -29,9 +32,11 @@ from TracX_rtmlib import (
     Face,
     Hand,
     PoseTracker,
+    RegionOfInterestTracker,
     Wholebody,
     WholebodyWithSpine,
     draw_skeleton,
+    pooled_solution,
 )
 
 ## CONSTANTS
@@ -114,7 +119,7 @@ __status__ = "Development"
 
 
 # FUNCTIONS
-def setup_pose_tracker(config_dict):
+def setup_pose_tracker(config_dict, videos=None, live=False):
     """
     Set up the RTMLib pose tracker with the appropriate model and backend.
     If CUDA is available, use it with ONNXRuntime backend; else use CPU with openvino
@@ -123,6 +128,9 @@ def setup_pose_tracker(config_dict):
     - det_frequency: int. The frequency of pose detection (every N frames)
     - mode: str. The mode of the pose tracker ('lightweight', 'balanced', 'performance')
     - tracking: bool. Whether to track persons across frames with RTMlib tracker
+    - precision: str. Precision of the models on CPU ('fp32', 'int8', 'fp16')
+    - videos: list. Videos whose frames calibrate the INT8 models
+    - live: bool. Whether frames come from a webcam, where roi_tracking applies
 
     OUTPUTS:
     - pose_tracker: PoseTracker. The initialized pose tracker object
@@ -133,6 +141,8 @@ def setup_pose_tracker(config_dict):
     tracking_mode = config_dict.get("pose").get("tracking_mode")
     multiperson = config_dict.get("process").get("multiperson")
     tracking = tracking_mode == "rtmlib" and multiperson
+    precision = config_dict.get("pose").get("precision", "fp32")
+    roi_tracking = live and config_dict.get("pose").get("roi_tracking", True)
 
     # If CUDA is available, use it with ONNXRuntime backend; else use CPU with openvino
     try:
@@ -218,11 +228,26 @@ def setup_pose_tracker(config_dict):
         raise ValueError(
             f"Invalid model_type: {pose_model}. Must be 'HALPE_26', 'COCO_133', 'COCO_17', 'HAND_21', 'FACE_106', 'WHOLEBODY_150', 'BODY_43' or 'BODY_53'. Use another network (MMPose, DeepLabCut, OpenPose, AlphaPose, BlazePose...) and convert the output files if you need another model. See documentation."
         )
-    logging.info(f"Pose tracking set up for {ModelClass} model in {mode} mode. \n")
+    # Reduced precision models are only used for CPU inference
+    if device != "cpu" or (precision == "int8" and not videos):
+        precision = "fp32"
+    logging.info(f"Pose tracking set up for {ModelClass} model in {mode} mode with {precision} precision. \n")
+
+    # Live streams: only detect around the persons already tracked, see RegionOfInterestTracker
+    if roi_tracking:
+        logging.info("Region of interest tracking: persons are detected on the full frame only periodically.")
+        return RegionOfInterestTracker(
+            pooled_solution(ModelClass, precision=precision, videos=videos),
+            mode=mode,
+            backend=backend,
+            device=device,
+            tracking=tracking,
+            to_openpose=False,
+        )
 
-    # Initialize the pose tracker with Halpe26 model
+    # Initialize the pose tracker, reusing warm sessions of previous videos
     return PoseTracker(
-        ModelClass,
+        pooled_solution(ModelClass, precision=precision, videos=videos),
         det_frequency=det_frequency,
         mode=mode,
         backend=backend,
@@ -979,32 +1004,7 @@ def make_trc_with_XYZ(X, Y, Z, time, trc_path):
 
     # Header
     frame_rate = (len(X) - 1) / (time.iloc[-1] - time.iloc[0])
-    DataRate = CameraRate = OrigDataRate = frame_rate
-    NumFrames = len(X)
-    NumMarkers = len(X.columns)
-    keypoint_names = X.columns
-    header_trc = [
-        "PathFileType\t4\t(X/Y/Z)\t" + trc_path,
-        "DataRate\tCameraRate\tNumFrames\tNumMarkers\tUnits\tOrigDataRate\tOrigDataStartFrame\tOrigNumFrames",
-        "\t".join(
-            map(
-                str,
-                [
-                    DataRate,
-                    CameraRate,
-                    NumFrames,
-                    NumMarkers,
-                    "m",
-                    OrigDataRate,
-                    0,
-                    NumFrames,
-                ],
-            )
-        ),
-        "Frame#\tTime\t" + "\t\t\t".join(keypoint_names) + "\t\t",
-        "\t\t"
-        + "\t".join([f"X{i+1}\tY{i+1}\tZ{i+1}" for i in range(len(keypoint_names))]),
-    ]
+    header_trc = trc_header(trc_path, list(X.columns), frame_rate, len(X))
 
     # Data
     trc_data = pd.concat(
@@ -1017,9 +1017,11 @@ def make_trc_with_XYZ(X, Y, Z, time, trc_path):
     trc_data.insert(0, "t", time)
 
     # Write file
-    with open(trc_path, "w") as trc_o:
-        [trc_o.write(line + "\n") for line in header_trc]
-        trc_data.to_csv(trc_o, sep="\t", index=True, header=None, lineterminator="\n")
+    write_trc(
+        trc_path,
+        np.column_stack([trc_data.index.to_numpy(), trc_data.to_numpy()]),
+        header_trc,
+    )
 
     return trc_data
 
@@ -1037,28 +1039,9 @@ def make_mot_with_angles(angles, time, mot_path):
     - angles: pd.DataFrame. The data that has been written to the MOT file
     """
 
-    # Header
-    nRows, nColumns = angles.shape
-    angle_names = angles.columns
-    header_mot = [
-        "Coordinates",
-        "version=1",
-        f"{nRows=}",
-        f"{nColumns=}",
-        "inDegrees=yes",
-        "",
-        "Units are S.I. units (second, meters, Newtons, ...)",
-        "If the header above contains a line with 'inDegrees', this indicates whether rotational values are in degrees (yes) or radians (no).",
-        "",
-        "endheader",
-        "time\t" + "\t".join(angle_names),
-    ]
-
     # Write file
     angles.insert(0, "time", time)
-    with open(mot_path, "w") as mot_o:
-        [mot_o.write(line + "\n") for line in header_mot]
-        angles.to_csv(mot_o, sep="\t", index=False, header=None, lineterminator="\n")
+    write_mot(mot_path, angles.to_numpy(), list(angles.columns))
 
     return angles
 
@@ -1216,7 +1199,9 @@ def process_frame(config_dict, pose_tracker, frame):
     tracking_rtmlib = tracking_mode == "rtmlib" and tracking
 
     # Detect poses
-    keypoints, scores = pose_tracker(frame)
+    with span("pose"):
+        keypoints, scores = pose_tracker(frame)
+    count("persons", len(keypoints))
 
     # Track persons
     if tracking:  # multi-person
@@ -1343,6 +1328,67 @@ def process_frame(config_dict, pose_tracker, frame):
     return img, (valid_X, valid_Y, valid_scores, valid_angles, metadata)
 
 
+def interpolate_and_filter(
+    data,
+    persons,
+    interpolate,
+    interp_gap_smaller_than,
+    fill_large_gaps_with,
+    filter_options,
+    fps,
+):
+    """
+    Interpolate and filter the columns of all persons at once.
+
+    INPUTS:
+    - data: np.array (frames, columns). The coordinates or angles of all persons
+    - persons: list of int. The person ids, for logging
+    - interpolate: bool. Whether to interpolate missing sequences
+    - interp_gap_smaller_than: int. Only interpolate gaps smaller than this number of frames
+    - fill_large_gaps_with: str. 'last_value', 'nan', or 'zeros'
+    - filter_options: list. Filter options, as expected by filter.filter2d
+    - fps: float. The frame rate, used by the Butterworth filter
+
+    OUTPUT:
+    - data_filt: np.array (frames, columns). The interpolated and filtered data
+    """
+    if not persons:
+        return np.asarray(data, dtype=float)
+
+    # Interpolate
+    if not interpolate:
+        logging.info(f"- Persons {persons}: No interpolation.")
+        data_interp = np.asarray(data, dtype=float)
+    else:
+        logging.info(
+            f"- Persons {persons}: Interpolating missing sequences if they are smaller than {interp_gap_smaller_than} frames. Large gaps filled with {fill_large_gaps_with}."
+        )
+        data_interp = interpolate_zeros_nans_2d(data, interp_gap_smaller_than, "linear")
+        if fill_large_gaps_with == "last_value":
+            data_interp = pd.DataFrame(data_interp).ffill(axis=0).bfill(axis=0)
+            data_interp = data_interp.to_numpy()
+        elif fill_large_gaps_with == "zeros":
+            data_interp = np.where(np.isnan(data_interp), 0, data_interp)
+
+    # Filter
+    if not filter_options[0]:
+        logging.info("No filtering.")
+        return data_interp
+
+    filter_type = filter_options[1]
+    if filter_type == "butterworth":
+        args = f"Butterworth filter, {filter_options[2]}th order, {filter_options[3]} Hz."
+        filter_options[4] = fps
+    if filter_type == "gaussian":
+        args = f"Gaussian filter, Sigma kernel {filter_options[5]}."
+    if filter_type == "loess":
+        args = f"LOESS filter, window size of {filter_options[6]} frames."
+    if filter_type == "median":
+        args = f"Median filter, kernel of {filter_options[7]}."
+    logging.info(f"Filtering with {args}")
+    return filter.filter2d(data_interp, *filter_options)
+
+
 def postprocess(
     config_dict,
     all_frames_X,
@@ -1416,204 +1462,148 @@ def postprocess(
     if save_pose:
         logging.info("\nPost-processing pose:")
         # Select only the keypoints that are in the model from skeletons.py, invert Y axis, divide pixel values by 1000
-        all_frames_X = make_homogeneous(all_frames_X)
+        all_frames_X = frames_to_array(all_frames_X)
         all_frames_X = all_frames_X[..., keypoints_ids] / 1000
-        all_frames_Y = make_homogeneous(all_frames_Y)
+        all_frames_Y = frames_to_array(all_frames_Y)
         all_frames_Y = -all_frames_Y[..., keypoints_ids] / 1000
         all_frames_Z_person = pd.DataFrame(
             np.zeros_like(all_frames_X)[:, 0, :], columns=keypoints_names
         )
 
-        # Process pose for each person
+        # Delete persons with less than 4 valid frames
+        pose_nan_count = (np.nansum(all_frames_X, axis=2) == 0).sum(axis=0)
+        persons = []
         for i in range(all_frames_X.shape[1]):
+            if frame_count - pose_nan_count[i] <= 4:
+                logging.info(
+                    f"- Person {i}: Less than 4 valid frames. Deleting person."
+                )
+            else:
+                persons.append(i)
+
+        # Interpolate and filter all persons at once, as (frames, persons x keypoints)
+        nb_frames, nb_keypoints = all_frames_X.shape[0], all_frames_X.shape[2]
+        all_frames_XY = np.concatenate(
+            [
+                all_frames_X[:, persons].reshape(nb_frames, -1),
+                all_frames_Y[:, persons].reshape(nb_frames, -1),
+            ],
+            axis=1,
+        )
+        all_frames_XY_filt = interpolate_and_filter(
+            all_frames_XY,
+            persons,
+            interpolate,
+            interp_gap_smaller_than,
+            fill_large_gaps_with,
+            filter_options,
+            fps,
+        )
+        all_frames_X_filt, all_frames_Y_filt = np.split(all_frames_XY_filt, 2, axis=1)
+
+        # Save pose for each person
+        for j, i in enumerate(persons):
             pose_path_person = pose_output_path.parent / (
                 pose_output_path.stem + f"_person{i:02d}.trc"
             )
-            all_frames_X_person = pd.DataFrame(
-                all_frames_X[:, i, :], columns=keypoints_names
+            person_cols = slice(j * nb_keypoints, (j + 1) * nb_keypoints)
+            all_frames_X_person_filt = pd.DataFrame(
+                all_frames_X_filt[:, person_cols], columns=keypoints_names
             )
-            all_frames_Y_person = pd.DataFrame(
-                all_frames_Y[:, i, :], columns=keypoints_names
+            all_frames_Y_person_filt = pd.DataFrame(
+                all_frames_Y_filt[:, person_cols], columns=keypoints_names
             )
 
-            # Delete person if less than 4 valid frames
-            pose_nan_count = len(np.where(all_frames_X_person.sum(axis=1) == 0)[0])
-            if frame_count - pose_nan_count <= 4:
-                logging.info(
-                    f"- Person {i}: Less than 4 valid frames. Deleting person."
-                )
+            # Build TRC file
+            trc_data = make_trc_with_XYZ(
+                all_frames_X_person_filt,
+                all_frames_Y_person_filt,
+                all_frames_Z_person,
+                all_frames_time,
+                str(pose_path_person),
+            )
+            logging.info(f"Pose saved to {pose_path_person.resolve()}.")
 
-            else:
-                # Interpolate
-                if not interpolate:
-                    logging.info(f"- Person {i}: No interpolation.")
-                    all_frames_X_person_interp = all_frames_X_person
-                    all_frames_Y_person_interp = all_frames_Y_person
-                else:
-                    logging.info(
-                        f"- Person {i}: Interpolating missing sequences if they are smaller than {interp_gap_smaller_than} frames. Large gaps filled with {fill_large_gaps_with}."
-                    )
-                    all_frames_X_person_interp = all_frames_X_person.apply(
-                        interpolate_zeros_nans,
-                        axis=0,
-                        args=[interp_gap_smaller_than, "linear"],
-                    )
-                    all_frames_Y_person_interp = all_frames_Y_person.apply(
-                        interpolate_zeros_nans,
-                        axis=0,
-                        args=[interp_gap_smaller_than, "linear"],
-                    )
-                    if fill_large_gaps_with == "last_value":
-                        all_frames_X_person_interp = all_frames_X_person_interp.ffill(
-                            axis=0
-                        ).bfill(axis=0)
-                        all_frames_Y_person_interp = all_frames_Y_person_interp.ffill(
-                            axis=0
-                        ).bfill(axis=0)
-                    elif fill_large_gaps_with == "zeros":
-                        all_frames_X_person_interp.replace(np.nan, 0, inplace=True)
-                        all_frames_Y_person_interp.replace(np.nan, 0, inplace=True)
-
-                # Filter
-                if not filter_options[0]:
-                    logging.info("No filtering.")
-                    all_frames_X_person_filt = all_frames_X_person_interp
-                    all_frames_Y_person_filt = all_frames_Y_person_interp
-                else:
-                    filter_type = filter_options[1]
-                    if filter_type == "butterworth":
-                        args = f"Butterworth filter, {filter_options[2]}th order, {filter_options[3]} Hz."
-                        filter_options[4] = fps
-                    if filter_type == "gaussian":
-                        args = f"Gaussian filter, Sigma kernel {filter_options[5]}."
-                    if filter_type == "loess":
-                        args = (
-                            f"LOESS filter, window size of {filter_options[6]} frames."
+            # Plotting coordinates before and after interpolation and filtering
+            if show_plots:
+                all_frames_X_person = pd.DataFrame(
+                    all_frames_X[:, i, :], columns=keypoints_names
+                )
+                all_frames_Y_person = pd.DataFrame(
+                    all_frames_Y[:, i, :], columns=keypoints_names
+                )
+                trc_data_unfiltered = pd.concat(
+                    [
+                        pd.concat(
+                            [
+                                all_frames_X_person.iloc[:, kpt],
+                                all_frames_Y_person.iloc[:, kpt],
+                                all_frames_Z_person.iloc[:, kpt],
+                            ],
+                            axis=1,
                         )
-                    if filter_type == "median":
-                        args = f"Median filter, kernel of {filter_options[7]}."
-                    logging.info(f"Filtering with {args}")
-                    all_frames_X_person_filt = all_frames_X_person_interp.apply(
-                        filter.filter1d, axis=0, args=filter_options
-                    )
-                    all_frames_Y_person_filt = all_frames_Y_person_interp.apply(
-                        filter.filter1d, axis=0, args=filter_options
-                    )
-
-                # Build TRC file
-                trc_data = make_trc_with_XYZ(
-                    all_frames_X_person_filt,
-                    all_frames_Y_person_filt,
-                    all_frames_Z_person,
-                    all_frames_time,
-                    str(pose_path_person),
+                        for kpt in range(len(all_frames_X_person.columns))
+                    ],
+                    axis=1,
                 )
-                logging.info(f"Pose saved to {pose_path_person.resolve()}.")
-
-                # Plotting coordinates before and after interpolation and filtering
-                if show_plots:
-                    trc_data_unfiltered = pd.concat(
-                        [
-                            pd.concat(
-                                [
-                                    all_frames_X_person.iloc[:, kpt],
-                                    all_frames_Y_person.iloc[:, kpt],
-                                    all_frames_Z_person.iloc[:, kpt],
-                                ],
-                                axis=1,
-                            )
-                            for kpt in range(len(all_frames_X_person.columns))
-                        ],
-                        axis=1,
-                    )
-                    trc_data_unfiltered.insert(0, "t", all_frames_time)
-                    pose_plots(trc_data_unfiltered, trc_data, i)  # i = current person
+                trc_data_unfiltered.insert(0, "t", all_frames_time)
+                pose_plots(trc_data_unfiltered, trc_data, i)  # i = current person
 
     # Angles post-processing
     if save_angles:
         logging.info("\nPost-processing angles:")
-        all_frames_angles = make_homogeneous(all_frames_angles)
+        all_frames_angles = frames_to_array(all_frames_angles)
 
-        # Process angles for each person
+        # Delete persons with less than 4 valid frames
+        angle_nan_count = (np.nansum(all_frames_angles, axis=2) == 0).sum(axis=0)
+        persons = []
         for i in range(all_frames_angles.shape[1]):
+            if frame_count - angle_nan_count[i] <= 4:
+                logging.info(
+                    f"- Person {i}: Less than 4 valid frames. Deleting person."
+                )
+            else:
+                persons.append(i)
+
+        # Interpolate and filter all persons at once, as (frames, persons x angles)
+        nb_frames, nb_angles = all_frames_angles.shape[0], all_frames_angles.shape[2]
+        all_frames_angles_filt = interpolate_and_filter(
+            all_frames_angles[:, persons].reshape(nb_frames, -1),
+            persons,
+            interpolate,
+            interp_gap_smaller_than,
+            fill_large_gaps_with,
+            filter_options,
+            fps,
+        )
+
+        # Save angles for each person
+        for j, i in enumerate(persons):
             angles_path_person = angles_output_path.parent / (
                 angles_output_path.stem + f"_person{i:02d}.mot"
             )
-            all_frames_angles_person = pd.DataFrame(
-                all_frames_angles[:, i, :], columns=angle_names
+            all_frames_angles_person_filt = pd.DataFrame(
+                all_frames_angles_filt[:, j * nb_angles : (j + 1) * nb_angles],
+                columns=angle_names,
             )
 
-            # Delete person if less than 4 valid frames
-            angle_nan_count = len(
-                np.where(all_frames_angles_person.sum(axis=1) == 0)[0]
+            # Build mot file
+            angle_data = make_mot_with_angles(
+                all_frames_angles_person_filt,
+                all_frames_time,
+                str(angles_path_person),
             )
-            if frame_count - angle_nan_count <= 4:
-                logging.info(
-                    f"- Person {i}: Less than 4 valid frames. Deleting person."
-                )
+            logging.info(f"Angles saved to {angles_path_person.resolve()}.")
 
-            else:
-                # Interpolate
-                if not interpolate:
-                    logging.info(f"- Person {i}: No interpolation.")
-                    all_frames_angles_person_interp = all_frames_angles_person
-                else:
-                    logging.info(
-                        f"- Person {i}: Interpolating missing sequences if they are smaller than {interp_gap_smaller_than} frames. Large gaps filled with {fill_large_gaps_with}."
-                    )
-                    all_frames_angles_person_interp = all_frames_angles_person.apply(
-                        interpolate_zeros_nans,
-                        axis=0,
-                        args=[interp_gap_smaller_than, "linear"],
-                    )
-                    if fill_large_gaps_with == "last_value":
-                        all_frames_angles_person_interp = (
-                            all_frames_angles_person_interp.ffill(axis=0).bfill(axis=0)
-                        )
-                    elif fill_large_gaps_with == "zeros":
-                        all_frames_angles_person_interp.replace(np.nan, 0, inplace=True)
-
-                # Filter
-                if not filter_options[0]:
-                    logging.info("No filtering.")
-                    all_frames_angles_person_filt = all_frames_angles_person_interp
-                else:
-                    filter_type = filter_options[1]
-                    if filter_type == "butterworth":
-                        args = (
-                            f"Butterworth filter, {filter_options[2]}th order, {filter_options[3]} Hz. "
-                            + args
-                        )
-                        filter_options[4] = fps
-                    if filter_type == "gaussian":
-                        args = f"Gaussian filter, Sigma kernel {filter_options[5]}."
-                    if filter_type == "loess":
-                        args = (
-                            f"LOESS filter, window size of {filter_options[6]} frames."
-                        )
-                    if filter_type == "median":
-                        args = f"Median filter, kernel of {filter_options[7]}."
-                    logging.info(f"Filtering with {args}")
-                    all_frames_angles_person_filt = (
-                        all_frames_angles_person_interp.apply(
-                            filter.filter1d, axis=0, args=filter_options
-                        )
-                    )
-
-                # Build mot file
-                angle_data = make_mot_with_angles(
-                    all_frames_angles_person_filt,
-                    all_frames_time,
-                    str(angles_path_person),
+            # Plotting angles before and after interpolation and filtering
+            if show_plots:
+                all_frames_angles_person = pd.DataFrame(
+                    all_frames_angles[:, i, :], columns=angle_names
                 )
-                logging.info(f"Angles saved to {angles_path_person.resolve()}.")
-
-                # Plotting angles before and after interpolation and filtering
-                if show_plots:
-                    all_frames_angles_person.insert(0, "t", all_frames_time)
-                    angle_plots(
-                        all_frames_angles_person, angle_data, i
-                    )  # i = current person
+                all_frames_angles_person.insert(0, "t", all_frames_time)
+                angle_plots(
+                    all_frames_angles_person, angle_data, i
+                )  # i = current person
 
     # TODO: Export final video with processed data
     # export_final_video(
@@ -1703,20 +1693,26 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
     )
 
     # Set up pose tracker
-    pose_tracker = setup_pose_tracker(config_dict)
+    pose_tracker = setup_pose_tracker(config_dict, videos=[str(video_file_path)])
 
     # Process video feed
     logging.info("\nProcessing video stream...")
-    all_frames_X, all_frames_Y, all_frames_scores, all_frames_angles = [], [], [], []
-    frame_count = 0
-    while cap.isOpened():
-        if frame_count < frame_range[0]:
-            cap.read()
-            frame_count += 1
-            continue
-
+    # Accumulate per-frame values in growable arrays, optionally memory-mapped
+    spill_to_disk = config_dict.get("process").get("spill_to_disk", False)
+    spill_dir = output_dir if spill_to_disk else None
+    all_frames_X = FrameAccumulator(spill_dir=spill_dir)
+    all_frames_Y = FrameAccumulator(spill_dir=spill_dir)
+    all_frames_scores = FrameAccumulator(spill_dir=spill_dir)
+    all_frames_angles = FrameAccumulator(spill_dir=spill_dir)
+    accumulators = [all_frames_X, all_frames_Y, all_frames_scores, all_frames_angles]
+    # Seek to the first frame of the range instead of decoding all frames before it
+    reader = VideoReader(video_file_path, cap=cap)
+    reader.seek(frame_range[0])
+    frame_count = frame_range[0]
+    while reader.isOpened():
         for frame_nb in tqdm(range(*frame_range), desc="Processing frames"):
-            success, frame = cap.read()
+            with span("decode"):
+                success, frame = reader.read()
 
             # If frame not grabbed
             if not success:
@@ -1753,14 +1749,15 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
                     )
 
             if save_pose:
-                all_frames_X.append(np.array(valid_X))
-                all_frames_Y.append(np.array(valid_Y))
-                all_frames_scores.append(np.array(valid_scores))
+                all_frames_X.append(valid_X)
+                all_frames_Y.append(valid_Y)
+                all_frames_scores.append(valid_scores)
             if save_angles:
-                all_frames_angles.append(np.array(valid_angles))
+                all_frames_angles.append(valid_angles)
             frame_count += 1
+            count("frames")
 
-        cap.release()
+        reader.release()
         logging.info("Video processing completed.")
         if save_vid:
             out_vid.release()
@@ -1783,6 +1780,10 @@ def process_fun(config_dict, video_file, time_range, frame_rate, result_dir):
         angles_output_path,
     )
 
+    # Release the accumulated arrays and their memory-mapped files
+    for accumulator in accumulators:
+        accumulator.close()
+
 
 def process(config_dict):
     """
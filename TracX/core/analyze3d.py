@@ -2,9 +2,9 @@ import os
 
 import numpy as np
 import onnxruntime as ort
-import pandas as pd
 
 from TracX.constants import APP_ASSETS
+from TracX.motion_io import read_trc_data, write_trc
 from TracX.utils import read_trc
 
 
@@ -58,16 +58,8 @@ def update_trc(input_path, output_path, updated_keypoints):
                                   and 3 corresponds to X, Y, Z coordinates.
     """
     # Read the original TRC file
-    with open(input_path, "r") as f:
-        lines = f.readlines()
-
-    # Extract header and data
-    header = lines[:5]  # First 5 lines are header
-
-    # Parse header to get the column structure
-    col_names = pd.read_csv(input_path, sep="\t", skiprows=3, nrows=0).columns
-    num_columns = len(col_names)
-    num_keypoints = (num_columns - 2) // 3  # Exclude Frame# and Time columns
+    header, data = read_trc_data(input_path)
+    num_keypoints = len(header["marker_names"])
 
     # Validate updated_keypoints shape
     if updated_keypoints.shape[1] != num_keypoints:
@@ -76,39 +68,18 @@ def update_trc(input_path, output_path, updated_keypoints):
             f"but the TRC file has {num_keypoints} keypoints."
         )
 
-    # Parse data lines into a DataFrame
-    data_df = pd.read_csv(input_path, sep="\t", skiprows=4)
-    frame_col = data_df.iloc[:, 0]
-    time_col = data_df.iloc[:, 1]
-
     # Update keypoint columns with new values
-    updated_data = np.zeros((updated_keypoints.shape[0], num_columns))
-    updated_data[:, 0] = frame_col  # Frame column
-    updated_data[:, 1] = time_col  # Time column
+    updated_data = np.zeros((updated_keypoints.shape[0], 2 + 3 * num_keypoints))
+    updated_data[:, 0] = data[:, 0]  # Frame column
+    updated_data[:, 1] = data[:, 1]  # Time column
 
-    # Flatten keypoints and update DataFrame
-    updated_keypoints_flat = updated_keypoints.reshape(
+    # Flatten keypoints
+    updated_data[:, 2:] = updated_keypoints.reshape(
         updated_keypoints.shape[0], -1
     )  # (N, V*3)
-    updated_data[:, 2:] = updated_keypoints_flat
-
-    # Create updated DataFrame
-    updated_df = pd.DataFrame(updated_data, columns=col_names)
-
-    # Make Frame# column integer
-    updated_df["Frame#"] = updated_df["Frame#"].astype(int)
 
     # Save updated TRC file
-    with open(output_path, "w") as f:
-        # Write header
-        f.writelines(header)
-
-        # Write updated data
-        updated_df.to_csv(f, sep="\t", index=False, header=False)
-
-    # Print the LBigToe and two following columns for the first row
-    lbigtoe_index = col_names.get_loc("LBigToe")
-    print(updated_df.iloc[0, lbigtoe_index : lbigtoe_index + 3].tolist())
+    write_trc(output_path, updated_data, header["lines"])
 
 
 def lift_2d_to_3d(input_path, output_path, res_w, res_h):
@@ -1,7 +1,5 @@
 import cv2 as cv
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib import cm
 from numpy import linspace
 
 from .camera_system import CameraSystem
@@ -205,6 +203,8 @@ class CameraVisualizer:
 
         # Color mapping for multiple cameras
         num_cams = len(extrinsics)
+        from matplotlib import cm
+
         cm_subsection = linspace(0.0, 1.0, num_cams)
         colors = [cm.jet(x) for x in cm_subsection]
 
@@ -282,6 +282,9 @@ class CameraVisualizer:
         OUTPUT:
         - fig: Matplotlib figure object containing the 3D visualization.
         """
+        # Imported here so that importing the camera tools does not load matplotlib
+        import matplotlib.pyplot as plt
+
         fig = plt.figure()
         ax = fig.add_subplot(111, projection="3d")
         ax.set_aspect("auto")
@@ -336,6 +339,8 @@ class CameraVisualizer:
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
     cameras = CameraSystem("./data/Calib_board.toml")
 
     # Create a CameraSystemVisualizer instance
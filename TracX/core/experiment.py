@@ -6,7 +6,6 @@ from typing import Optional
 import toml
 from easydict import EasyDict as edict
 
-from Pose2Sim import Pose2Sim
 from TracX.constants import (
     APP_ASSETS,
     APP_PROJECTS,
@@ -15,8 +14,9 @@ from TracX.constants import (
     FEATURE_MONOCULAR_3D_ANALYSIS_ENABLED,
 )
 
-from .pose import PoseTracker2D, lift_to_3d
-from .rotation import rotate_videos, unrotate_pose2d
+from .experiment_index import ExperimentIndex
+
+_index = None
 
 
 class Experiment:
@@ -73,30 +73,32 @@ class Experiment:
             self._makedirs(exist_ok=True)
 
     @staticmethod
-    def list():
-        experiments = []
-        for f in sorted(os.listdir(APP_PROJECTS)):
-            if not os.path.isdir(os.path.join(APP_PROJECTS, f)):
-                continue
+    def list(query=None):
+        """List the experiments from the experiment index.
+
+        Only the experiments that changed since the last listing are read again.
 
-            # Open the experiment and read the metadata
-            e = Experiment.open(f)
+        Args:
+            query: Optional text to search in the name, mode, pose model,
+                processing state and video names of the experiments.
 
+        Returns:
+            list: Index entries of the enabled experiments, sorted by name.
+        """
+        global _index
+        if _index is None:
+            _index = ExperimentIndex(APP_PROJECTS)
+
+        experiments = []
+        for e in _index.list(query):
             # Skip experiments that are not enabled
-            if e.is_2d and not FEATURE_MONOCULAR_2D_ANALYSIS_ENABLED:
+            if e["is_2d"] and not FEATURE_MONOCULAR_2D_ANALYSIS_ENABLED:
                 continue
 
-            if e.monocular and not FEATURE_MONOCULAR_3D_ANALYSIS_ENABLED:
+            if e["monocular"] and not FEATURE_MONOCULAR_3D_ANALYSIS_ENABLED:
                 continue
 
-            experiments.append(
-                {
-                    "name": f,
-                    "monocular": e.monocular,
-                    "is_2d": e.is_2d,
-                    "path": os.path.join(APP_PROJECTS, f),
-                }
-            )
+            experiments.append(e)
 
         return experiments
 
@@ -139,7 +141,8 @@ class Experiment:
 
     @property
     def videos(self) -> list:
-        os.makedirs(self.videos_dir, exist_ok=True)
+        if not os.path.isdir(self.videos_dir):
+            os.makedirs(self.videos_dir)
         return [
             os.path.join(self.videos_dir, name)
             for name in sorted(os.listdir(self.videos_dir))
@@ -203,17 +206,15 @@ class Experiment:
         self.update_config(cfg)
 
         # Execute the calibration
-        cwd = os.getcwd()
-        os.chdir(self.path)
+        from Pose2Sim import Pose2Sim
+
         try:
-            Pose2Sim.calibration()
+            Pose2Sim.calibration(self.path)
         except Exception as e:
             logging.error(f"Failed to calibrate cameras: {e}")
 
             import traceback
             logging.debug(traceback.format_exc())
-        finally:
-            os.chdir(cwd)
 
     def calibrate_extrinsics(
         self,
@@ -290,9 +291,23 @@ class Experiment:
             toml.dump(cfg, f)
 
     def process(self):
-        # Change the working directory to the project directory.
-        cwd = os.getcwd()
-        os.chdir(self.path)
+        """Run all processing stages of the experiment."""
+        res_w, res_h = self.estimate_pose2d()
+        self.associate_persons()
+        self.reconstruct_3d(res_w, res_h)
+        self.filter_poses()
+
+    def estimate_pose2d(self):
+        """Estimate the 2D poses in all videos.
+
+        Returns:
+            tuple: The video resolution for models that report it, else (0, 0).
+        """
+        # Heavy processing backends are only imported when processing
+        from Pose2Sim import Pose2Sim
+
+        from .pose import PoseTracker2D
+        from .rotation import rotate_videos, unrotate_pose2d
 
         # Update the configuration file with selected settings
         if not self.has_videos():
@@ -306,7 +321,9 @@ class Experiment:
             )
             rotated_dir = os.path.join(self.path, self.videos_dir + "_rotated")
             if not os.path.exists(rotated_dir):
-                rotate_videos(self.videos, rotated_dir, calibration_file)
+                # Only the display rotation is changed if OpenCV reads it back
+                metadata_only = cfg.get("pose").get("rotation_metadata_only", False)
+                rotate_videos(self.videos, rotated_dir, calibration_file, metadata_only=metadata_only)
             else:
                 logging.info("Rotated videos already exist. Skipping rotation...")
 
@@ -325,13 +342,14 @@ class Experiment:
         res_w, res_h = 0, 0
         # TODO: Do not hardcode the model names here
         if cfg.pose.pose_model in ["COCO_17", "COCO_133", "HALPE_26", "BODY_43", "WHOLEBODY_150"]:
-            Pose2Sim.poseEstimation()
+            Pose2Sim.poseEstimation(self.path)
         elif cfg.pose.pose_model == "BODY_43":
             res_w, res_h, _ = PoseTracker2D.estimateBodyWithSpine(
                 videos=self.videos_dir,
                 save_dir=self.pose2d_dir,
                 video_format=videos_format,
                 overwrite=overwrite,
+                precision=cfg.pose.get("precision", "fp32"),
             )
         else:
             raise ValueError(f"Unsupported custom pose model '{cfg.pose.pose_model}'")
@@ -345,9 +363,22 @@ class Experiment:
             logging.info("Rotating 2D poses back...")
             unrotate_pose2d(self.pose2d_dir, calibration_file)
 
-        # Person association
+        return res_w, res_h
+
+    def associate_persons(self):
+        """Find the most prominent person across views."""
+        from Pose2Sim import Pose2Sim
+
         logging.info("Finding the most prominent person...")
-        Pose2Sim.personAssociation()
+        Pose2Sim.personAssociation(self.path)
+
+    def reconstruct_3d(self, res_w=0, res_h=0):
+        """Lift the 2D poses to 3D in monocular mode, triangulate them otherwise."""
+        from Pose2Sim import Pose2Sim
+
+        from .pose import lift_to_3d
+
+        cfg = self.cfg
 
         # 2D-to-3D Lifting in Monocular Mode
         if self.monocular:
@@ -375,14 +406,14 @@ class Experiment:
         else:
             # TODO: Wrap triangulation in a try-except block and throw a nice error message
             logging.info("Triangulating 3D poses...")
-            Pose2Sim.triangulation()
+            Pose2Sim.triangulation(self.path)
 
-        # Filtering
-        logging.info("Smoothing triangulated poses...")
-        Pose2Sim.filtering()
+    def filter_poses(self):
+        """Smooth the 3D poses."""
+        from Pose2Sim import Pose2Sim
 
-        # Restore the working directory
-        os.chdir(cwd)
+        logging.info("Smoothing triangulated poses...")
+        Pose2Sim.filtering(self.path)
 
     def get_motion_file(self) -> Optional[str]:
         if self.is_2d:
@@ -410,6 +441,20 @@ class Experiment:
             return None
         return os.path.join(self.pose3d_dir, trc_files[0])
 
+    def get_quality_report(self) -> Optional[dict]:
+        """Reprojection quality report written by the multiview triangulation."""
+        if self.is_2d or self.monocular or not os.path.exists(self.pose3d_dir):
+            return None
+
+        reports = sorted(
+            f for f in os.listdir(self.pose3d_dir) if f.endswith("_quality.json")
+        )
+        if len(reports) == 0:
+            return None
+        from Pose2Sim.common import read_quality_report
+
+        return read_quality_report(os.path.join(self.pose3d_dir, reports[0]))
+
     @property
     def log_file(self):
         return os.path.join(self.path, "logs.log")
@@ -0,0 +1,258 @@
+"""Persistent index of the experiments of a projects directory.
+
+Listing experiments used to open each of them: parse its configuration, create
+its directories and list its videos. The index stores the metadata of each
+experiment in a JSON catalog, and only reads again the experiments whose
+directory, configuration, videos, outputs or batch state changed since, based
+on the modification times of their entries. Listing and searching then take a
+directory scan per experiment, even with hundreds of them on a network share.
+
+Entries are dictionaries with the keys `name`, `path`, `mode`, `monocular`,
+`is_2d`, `pose_model`, `videos` (name, size, fps, frames and duration of each
+video), `duration`, `state`, `stages` (batch processing state) and `outputs`.
+
+Usage:
+    index = ExperimentIndex()
+    for entry in index.list(query="walking"):
+        ...
+"""
+
+import json
+import logging
+import os
+import stat as st
+import threading
+
+import cv2
+import toml
+
+from TracX.constants import APP_FILES, APP_PROJECTS, SUPPORTED_VIDEO_FORMATS
+
+EXPERIMENT_INDEX = os.path.join(APP_FILES, "experiments_index.json")
+INDEX_VERSION = 1
+
+# Entries of an experiment directory whose modification invalidates its index entry.
+# The batch state file is written by TracX.batch
+WATCHED_ENTRIES = ("Config.toml", "videos", "pose", "pose-associated", "pose-3d", "output", "batch_state.json")
+
+# Processing states
+EMPTY = "empty"
+READY = "ready"
+POSE2D = "pose2d"
+PROCESSED = "processed"
+RUNNING = "running"
+FAILED = "failed"
+
+
+def _scan(path):
+    """Stat results of the entries of a directory, by name, or {} if it does not exist."""
+    try:
+        with os.scandir(path) as entries:
+            return {entry.name: entry.stat() for entry in entries}
+    except (FileNotFoundError, NotADirectoryError):
+        return {}
+
+
+def _video_metadata(path, stat, previous):
+    """Metadata of a video, reused from its previous entry if the file did not change."""
+    if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime_ns:
+        return previous
+
+    cap = cv2.VideoCapture(path)
+    frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    return {
+        "name": os.path.basename(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "frames": frames,
+        "fps": fps,
+        "duration": frames / fps if fps > 0 else 0.0,
+    }
+
+
+def _processing_state(entry):
+    stages = entry["stages"].values()
+    if "running" in stages:
+        return RUNNING
+    if "failed" in stages:
+        return FAILED
+    if not entry["videos"]:
+        return EMPTY
+    outputs = entry["outputs"]
+    if outputs["pose3d"] or (entry["is_2d"] and outputs["pose2d"]):
+        return PROCESSED
+    if outputs["pose2d"]:
+        return POSE2D
+    return READY
+
+
+def read_entry(path, signature, previous=None):
+    """Read the index entry of an experiment directory.
+
+    Args:
+        path: Path of the experiment directory.
+        signature: Modification times of the watched entries of the directory.
+        previous: Previous index entry of the experiment, whose video metadata is reused.
+
+    Returns:
+        dict: The index entry.
+    """
+    cfg = toml.load(os.path.join(path, "Config.toml"))
+    project_type = cfg.get("project", {}).get("type", "").lower()
+
+    videos_dir = os.path.join(path, "videos")
+    previous_videos = {v["name"]: v for v in (previous or {}).get("videos", [])}
+    videos = [
+        _video_metadata(os.path.join(videos_dir, name), stat, previous_videos.get(name))
+        for name, stat in sorted(_scan(videos_dir).items())
+        if st.S_ISREG(stat.st_mode) and os.path.splitext(name)[-1].lower() in SUPPORTED_VIDEO_FORMATS
+    ]
+
+    stages = {}
+    state_file = os.path.join(path, "batch_state.json")
+    if "batch_state.json" in signature:
+        try:
+            with open(state_file) as f:
+                stages = json.load(f).get("stages", {})
+        except (OSError, ValueError) as e:
+            logging.debug(f"Could not read {state_file}: {e}")
+
+    def outputs(directory, keep=lambda name: True):
+        directory = os.path.join(path, directory)
+        return [os.path.join(directory, name) for name in sorted(_scan(directory)) if keep(name)]
+
+    entry = {
+        "name": os.path.basename(path),
+        "path": path,
+        "mode": project_type,
+        "monocular": "mono" in project_type,
+        "is_2d": "2d" in project_type,
+        "pose_model": cfg.get("pose", {}).get("pose_model", ""),
+        "videos": videos,
+        "duration": sum(v["duration"] for v in videos),
+        "stages": stages,
+        "outputs": {
+            "pose2d": outputs("pose", lambda name: name.endswith("_json")),
+            "pose3d": outputs("pose-3d"),
+            "output": outputs("output"),
+        },
+        "signature": signature,
+    }
+    entry["state"] = _processing_state(entry)
+    return entry
+
+
+class ExperimentIndex:
+    """Index of the experiments of a projects directory, saved as a JSON catalog.
+
+    Args:
+        base_dir: Projects directory.
+        index_file: Path of the JSON catalog.
+    """
+
+    def __init__(self, base_dir=APP_PROJECTS, index_file=EXPERIMENT_INDEX):
+        self.base_dir = os.path.abspath(base_dir)
+        self.index_file = index_file
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == INDEX_VERSION:
+            self.entries = index.get("experiments", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        with open(self.index_file + ".tmp", "w") as f:
+            json.dump({"version": INDEX_VERSION, "experiments": self.entries}, f)
+        os.replace(self.index_file + ".tmp", self.index_file)
+
+    def refresh(self):
+        """Update the entries of the experiments that changed since the last refresh.
+
+        Returns:
+            bool: Whether any entry was added, updated or removed.
+        """
+        with self._lock:
+            changed = False
+            found = set()
+            try:
+                with os.scandir(self.base_dir) as entries:
+                    projects = sorted(entries, key=lambda e: e.name)
+            except FileNotFoundError:
+                projects = []
+
+            for project in projects:
+                if not project.is_dir():
+                    continue
+                # One directory listing per experiment, which also holds the stat results on Windows
+                entries = _scan(project.path)
+                if "Config.toml" not in entries:
+                    continue
+                path = os.path.abspath(project.path)
+                found.add(path)
+                signature = {"": project.stat().st_mtime_ns}
+                signature.update({name: entries[name].st_mtime_ns for name in WATCHED_ENTRIES if name in entries})
+
+                previous = self.entries.get(path)
+                if previous is not None and previous["signature"] == signature:
+                    continue
+                try:
+                    self.entries[path] = read_entry(path, signature, previous)
+                except Exception as e:
+                    logging.warning(f"Could not index experiment '{project.name}': {e}")
+                    self.entries.pop(path, None)
+                    continue
+                changed = True
+
+            # Experiments deleted from this projects directory
+            for path in list(self.entries):
+                if os.path.dirname(path) == self.base_dir and path not in found:
+                    del self.entries[path]
+                    changed = True
+
+            if changed:
+                try:
+                    self._save()
+                except OSError as e:
+                    logging.warning(f"Could not save the experiment index: {e}")
+            return changed
+
+    def list(self, query=None, refresh=True):
+        """Index entries of the experiments, sorted by name.
+
+        Args:
+            query: Case-insensitive text to search in the name, mode, pose model,
+                processing state and video names of the experiments.
+            refresh: Whether to update the entries that changed first.
+
+        Returns:
+            list: Matching index entries.
+        """
+        if refresh:
+            self.refresh()
+        entries = [e for path, e in self.entries.items() if os.path.dirname(path) == self.base_dir]
+        if query:
+            query = query.lower()
+            entries = [
+                e
+                for e in entries
+                if any(
+                    query in text.lower()
+                    for text in [e["name"], e["mode"], e["pose_model"], e["state"]] + [v["name"] for v in e["videos"]]
+                )
+            ]
+        return sorted(entries, key=lambda e: e["name"])
+
+    def get(self, name, refresh=True):
+        """Index entry of an experiment, or None if it does not exist."""
+        if refresh:
+            self.refresh()
+        return self.entries.get(os.path.join(self.base_dir, name))
@@ -7,7 +7,8 @@ import onnxruntime as ort
 from tqdm import tqdm
 
 from Pose2Sim import Pose2Sim
-from TracX_rtmlib import BodyWithFeet, BodyWithSpine, PoseTracker
+from TracX.keypoint_sink import KeypointSink
+from TracX_rtmlib import BodyWithFeet, BodyWithSpine, PoseTracker, pooled_solution
 
 from .utils import save_to_openpose
 
@@ -20,11 +21,13 @@ def process_video(
     overwrite: bool = False,
     backend: str = "onnxruntime",
     device: str = "cpu",
+    precision: str = "fp32",
+    calibration_videos: list = None,
 ):
-    # Load the model
+    # Load the model, reusing warm sessions of previous videos
     try:
         pose_tracker = PoseTracker(
-            model_class,
+            pooled_solution(model_class, precision=precision, videos=calibration_videos or [video_path]),
             mode=model_mode,
             det_frequency=1,
             tracking=False,
@@ -56,7 +59,8 @@ def process_video(
     # Process the video
     frame_idx = 0
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    with tqdm(
+    # Keypoint files are written in the background while the next frames are processed
+    with KeypointSink() as sink, tqdm(
         total=total_frames,
         desc=f"Processing {video_name}",
     ) as pbar:
@@ -80,7 +84,7 @@ def process_video(
             keypoints, scores = pose_tracker(frame)
 
             # Save keypoints in OpenPose format
-            save_to_openpose(save_path, keypoints, scores)
+            save_to_openpose(save_path, keypoints, scores, sink=sink)
 
             # Update progress bar
             frame_idx += 1
@@ -102,6 +106,7 @@ def process_folder(
     overwrite: bool = False,
     backend: str = "onnxruntime",
     device: str = "cpu",
+    precision: str = "fp32",
 ):
     # Get list of video files
     video_files = [
@@ -122,6 +127,8 @@ def process_folder(
             overwrite=overwrite,
             backend=backend,
             device=device,
+            precision=precision,
+            calibration_videos=video_files,
         )
 
     default_values = (1920, 1080, 30)
@@ -162,8 +169,12 @@ class PoseTracker2D:
         model_mode,
         video_format="mp4",
         overwrite=False,
+        precision="fp32",
     ):
         backend, device = PoseTracker2D._select_backend()
+        # Reduced precision models are only used for CPU inference
+        if device != "cpu":
+            precision = "fp32"
 
         # Check if videos is a directory
         if os.path.isdir(videos):
@@ -176,6 +187,7 @@ class PoseTracker2D:
                 overwrite=overwrite,
                 backend=backend,
                 device=device,
+                precision=precision,
             )
 
         # Check if videos is a file
@@ -188,6 +200,7 @@ class PoseTracker2D:
                 backend=backend,
                 device=device,
                 overwrite=overwrite,
+                precision=precision,
             )
 
         # Invalid input
@@ -199,6 +212,7 @@ class PoseTracker2D:
         save_dir,
         video_format="mp4",
         overwrite=False,
+        precision="fp32",
     ):
         return PoseTracker2D.estimateCustom(
             videos=videos,
@@ -207,6 +221,7 @@ class PoseTracker2D:
             model_mode="performance",
             video_format=video_format,
             overwrite=overwrite,
+            precision=precision,
         )
 
     @staticmethod
@@ -215,6 +230,7 @@ class PoseTracker2D:
         save_dir,
         video_format="mp4",
         overwrite=False,
+        precision="fp32",
     ):
         return PoseTracker2D.estimateCustom(
             videos=videos,
@@ -223,4 +239,5 @@ class PoseTracker2D:
             model_mode="lightweight",
             video_format=video_format,
             overwrite=overwrite,
+            precision=precision,
         )
@@ -2,13 +2,14 @@ import json
 import os
 
 
-def save_to_openpose(json_file_path, keypoints, scores):
+def save_to_openpose(json_file_path, keypoints, scores, sink=None):
     """Save the keypoints and scores to a JSON file in the OpenPose format
 
     INPUTS:
     - json_file_path: Path to save the JSON file
     - keypoints: Detected keypoints
     - scores: Confidence scores for each keypoint
+    - sink: Optional KeypointSink writing the file in the background
 
     OUTPUTS:
     - JSON file with the detected keypoints and confidence scores in the OpenPose format
@@ -40,6 +41,9 @@ def save_to_openpose(json_file_path, keypoints, scores):
     json_output = {"version": 1.3, "people": detections}
 
     # Save JSON output for each frame
+    if sink is not None:
+        sink.write(json_file_path, json_output)
+        return
     json_output_dir = os.path.abspath(os.path.join(json_file_path, ".."))
     if not os.path.isdir(json_output_dir):
         os.makedirs(json_output_dir)
@@ -2,11 +2,16 @@ import json
 import logging
 import os
 import shutil
+import subprocess
+import time
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
 
+from TracX.keypoint_sink import KeypointSink
+
 
 def get_rotation(videoName, rotation_dict):
     for key, value in rotation_dict.items():
@@ -15,149 +20,220 @@ def get_rotation(videoName, rotation_dict):
     return None
 
 
-def rotate_video(video_file, rot, save_dir=None):
+# OpenCV rotation codes by clockwise angle
+ROTATE_CODES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+SUPPORTED_FOURCC = {
+    "mp4": "mp4v",
+    "avi": "XVID",
+    "mov": "mp4v",
+}
+
+
+def _read_first_frame(video_file):
+    cap = cv2.VideoCapture(video_file)
+    ret, frame = cap.read()
+    cap.release()
+    return frame if ret else None
+
+
+def _rotate_metadata(video_file, rotated_file, clockwise):
+    """Copy the streams of a video and only set its display rotation.
+
+    OpenCV applies the display rotation when reading, so the rotated copy is
+    only kept if its first frame reads exactly as the rotated original frame.
+
+    Returns:
+        bool: Whether the rotated copy was written.
+    """
+    if not shutil.which("ffmpeg"):
+        logging.debug("ffmpeg not found, rotating the pixels instead of the metadata.")
+        return False
+
+    commands = [
+        # FFmpeg >= 6: display matrix, counterclockwise
+        [
+            "ffmpeg", "-y", "-v", "error", "-display_rotation:v:0", str((360 - clockwise) % 360),
+            "-i", video_file, "-map", "0", "-c", "copy", rotated_file,
+        ],
+        # Older versions: rotate tag, clockwise
+        [
+            "ffmpeg", "-y", "-v", "error", "-i", video_file, "-map", "0", "-c", "copy",
+            "-metadata:s:v:0", f"rotate={clockwise}", rotated_file,
+        ],
+    ]
+    original = _read_first_frame(video_file)
+    if original is None:
+        return False
+    expected = cv2.rotate(original, ROTATE_CODES[clockwise])
+    for command in commands:
+        if subprocess.run(command, capture_output=True).returncode != 0:
+            continue
+        rotated = _read_first_frame(rotated_file)
+        if rotated is not None and np.array_equal(rotated, expected):
+            return True
+
+    if os.path.exists(rotated_file):
+        os.remove(rotated_file)
+    return False
+
+
+def _rotate_pixels(video_file, rotated_file, clockwise, fourcc):
+    """Decode, rotate and encode the frames of a video. Returns the number of frames."""
+    cap = cv2.VideoCapture(video_file)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    out = None
+    frames = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = cv2.rotate(frame, ROTATE_CODES[clockwise])
+        if out is None:
+            # Output size from the rotated frame, with swapped dimensions for 90 and 270 degrees
+            out = cv2.VideoWriter(rotated_file, cv2.VideoWriter_fourcc(*fourcc), fps, frame.shape[1::-1])
+        out.write(frame)
+        frames += 1
+    cap.release()
+    if out is not None:
+        out.release()
+    return frames
+
+
+def transcode_rotated(video_file, rotated_file, clockwise, fourcc="mp4v", metadata_only=False):
+    """Write a copy of a video rotated clockwise.
+
+    Args:
+        video_file: Path of the video.
+        rotated_file: Path of the rotated copy.
+        clockwise: Clockwise rotation angle, 90, 180 or 270 degrees.
+        fourcc: Codec of the rotated copy when the frames are encoded again.
+        metadata_only: Whether to only change the display rotation of the video,
+            without decoding it, when ffmpeg is available and OpenCV reads the
+            rotated frames back. Otherwise the frames are rotated and encoded again.
+
+    Returns:
+        dict: Throughput of the rotation, with the keys `video`, `output`,
+            `method` ("metadata" or "pixels"), `frames`, `seconds`, `fps` and `mb_per_s`.
+    """
+    if clockwise not in ROTATE_CODES:
+        raise ValueError(f"Rotation angle {clockwise} not supported.")
+
+    os.makedirs(os.path.dirname(os.path.abspath(rotated_file)), exist_ok=True)
+    start = time.perf_counter()
+    if metadata_only and _rotate_metadata(video_file, rotated_file, clockwise):
+        method = "metadata"
+        cap = cv2.VideoCapture(rotated_file)
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+    else:
+        method = "pixels"
+        frames = _rotate_pixels(video_file, rotated_file, clockwise, fourcc)
+    seconds = time.perf_counter() - start
+
+    stats = {
+        "video": video_file,
+        "output": rotated_file,
+        "method": method,
+        "frames": frames,
+        "seconds": seconds,
+        "fps": frames / seconds if seconds > 0 else 0.0,
+        "mb_per_s": os.path.getsize(video_file) / 1e6 / seconds if seconds > 0 else 0.0,
+    }
+    logging.info(
+        f"Rotated '{os.path.basename(video_file)}' by {clockwise} degrees ({method}): "
+        f"{frames} frames in {seconds:.1f} s, {stats['fps']:.0f} fps, {stats['mb_per_s']:.1f} MB/s."
+    )
+    return stats
+
+
+def rotate_files(jobs, metadata_only=False, workers=None):
+    """Rotate videos in parallel.
+
+    OpenCV and ffmpeg release the GIL while decoding and encoding, so the videos
+    are processed by a pool of threads.
+
+    Args:
+        jobs: List of (video_file, rotated_file, clockwise) or
+            (video_file, rotated_file, clockwise, fourcc) tuples.
+        metadata_only: See `transcode_rotated`.
+        workers: Number of videos processed at the same time. Defaults to the number of CPUs.
+
+    Returns:
+        list: Throughput of each rotation, see `transcode_rotated`, in the order of the jobs.
+    """
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(transcode_rotated, *job, metadata_only=metadata_only)
+            for job in jobs
+        ]
+        return [future.result() for future in futures]
+
+
+def _rotate_video_job(video_file, rot, save_dir=None):
     rot = 270 if rot == -90 else rot
     if rot not in [90, 180, 270]:
         error = f"Rotation angle {rot} not supported. Skipping video."
         logging.error(error)
         raise ValueError(error)
 
-    def read_format(video_path):
-        return video_path.split(".")[-1].lower()
-
-    supported_formats = {
-        "mp4": cv2.VideoWriter_fourcc(*"mp4v"),
-        "avi": cv2.VideoWriter_fourcc(*"XVID"),
-        "mov": cv2.VideoWriter_fourcc(*"mp4v"),
-    }
-
-    video_format = read_format(video_file)
-    if video_format not in supported_formats:
+    video_format = video_file.split(".")[-1].lower()
+    if video_format not in SUPPORTED_FOURCC:
         logging.error(f"Video format '{video_format}' not supported. Skipping video.")
         return None
 
-    def rotate_frame(frame, rot):
-        if rot == 180:
-            return cv2.rotate(frame, cv2.ROTATE_180)
-        if rot == 90:
-            return cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        if rot == 270:
-            return cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-        return None
-
-    # Open the video file
-    logging.info(f"Rotating video '{video_file}' by {rot} degrees.")
-    cap = cv2.VideoCapture(video_file)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    # Create a VideoWriter object
     video_dir = os.path.dirname(video_file)
     video_name = os.path.basename(video_file)
-
     rotated_dir = save_dir if save_dir else video_dir
     rotated_file = os.path.join(
         rotated_dir, video_name.split(".")[0] + f"_rot.{video_format}"
     )
-    # Set output frame size based on rotation
-    if rot in [90, 270]:
-        out = cv2.VideoWriter(
-            rotated_file,
-            supported_formats[video_format],
-            cap.get(cv2.CAP_PROP_FPS),
-            (height, width),  # Swapped dimensions for 90 and 270 degrees
-        )
-    else:
-        out = cv2.VideoWriter(
-            rotated_file,
-            supported_formats[video_format],
-            cap.get(cv2.CAP_PROP_FPS),
-            (width, height),
-        )
-
-    # Process the video frame by frame
-    logging.info(f"Processing video '{video_name}'...")
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    # Positive angles rotate counterclockwise
+    return video_file, rotated_file, (360 - rot) % 360, SUPPORTED_FOURCC[video_format]
 
-        frame = rotate_frame(frame, rot)
-        if frame is None:
-            logging.error(f"Rotation angle {rot} not supported. Skipping video.")
-            break
 
-        out.write(frame)
+def rotate_video(video_file, rot, save_dir=None, metadata_only=False):
+    job = _rotate_video_job(video_file, rot, save_dir)
+    if job is None:
+        return None
 
-    cap.release()
-    logging.info(f"Rotated video '{rotated_file}' saved.")
-    return rotated_file
+    logging.info(f"Rotating video '{video_file}' by {rot} degrees.")
+    transcode_rotated(*job, metadata_only=metadata_only)
+    logging.info(f"Rotated video '{job[1]}' saved.")
+    return job[1]
 
 
-def rotate_videos(video_list, output_dir, camera_parameters):
+def rotate_videos(video_list, output_dir, camera_parameters, metadata_only=False, workers=None):
     tree = ET.parse(os.path.expanduser(camera_parameters))
     root = tree.getroot()
     rotation_dict = {
         camera.get("serial"): camera.get("viewrotation")
         for camera in root.find("cameras")
     }
+
+    # The view rotation of each camera is clockwise
+    jobs = []
     for video in video_list:
         video_name = os.path.basename(video)
         rot = get_rotation(video_name, rotation_dict)
-        cap = cv2.VideoCapture(video)
-        ret, frame = cap.read()
-        if not ret:
-            continue
-        # frame = Image.fromarray(frame)
-        # frame = frame.rotate(rot, expand=True)
-        # frame = np.array(frame)
-        if rot == 180:
-            frame = cv2.rotate(frame, cv2.ROTATE_180)
-        elif rot == 270:
-            frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        elif rot == 90:
-            frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-        else:
+        if rot not in ROTATE_CODES:
             logging.error(f"Rotation angle {rot} not supported")
             continue
-        frame_width = frame.shape[1]
-        frame_height = frame.shape[0]
-        # Get original video's width, height, and fps
-        fps = cap.get(cv2.CAP_PROP_FPS)
-
-        # Create a VideoWriter object
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        # Define VideoWriter object for MP4 file
-        out = cv2.VideoWriter(
-            os.path.join(output_dir, video_name.split(".")[0] + "_rot.mp4"),
-            cv2.VideoWriter_fourcc(*"mp4v"),
-            fps,
-            (frame_width, frame_height),
-        )
+        jobs.append((video, os.path.join(output_dir, video_name.split(".")[0] + "_rot.mp4"), rot))
 
-        out.write(frame)
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            if rot == 180:
-                frame = cv2.rotate(frame, cv2.ROTATE_180)
-            elif rot == 270:
-                frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            elif rot == 90:
-                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-            # Write the rotated frame to the new video file
-            out.write(frame)
-
-        # Release the VideoCapture and VideoWriter objects
-        cap.release()
+    os.makedirs(output_dir, exist_ok=True)
+    return rotate_files(jobs, metadata_only=metadata_only, workers=workers)
 
 
-def rotate_video_monocular(video_list, output_dir, rot):
+def rotate_video_monocular(video_list, output_dir, rot, metadata_only=False, workers=None):
     os.makedirs(output_dir, exist_ok=True)
-    for video in video_list:
-        rotate_video(video, rot, save_dir=output_dir)
+    jobs = [_rotate_video_job(video, rot, save_dir=output_dir) for video in video_list]
+    return rotate_files([job for job in jobs if job is not None], metadata_only=metadata_only, workers=workers)
 
 
 def unrotate_pose2d(pose_dir, camera_parameters):
@@ -182,65 +258,66 @@ def unrotate_pose2d(pose_dir, camera_parameters):
         if os.path.isdir(os.path.join(rotated_dir, f))
     ]
 
-    for rotated in rotated_poses:
-        name = os.path.basename(rotated)
-        unrotated = os.path.join(pose_dir, name)
-        os.makedirs(unrotated, exist_ok=True)
-
-        # Get a list of all JSON files in the directory
-        pose_files = [f for f in os.listdir(rotated) if f.endswith(".json")]
-
-        rotation_angle = get_rotation(name, rotation_dict)
-        for file in pose_files:
-            with open(os.path.join(rotated, file)) as f:
-                data = json.load(f)
-                for i in range(len(data["people"])):
-                    # Extract the 'pose_keypoints_2d' data for the first person
-                    keypoints = data["people"][i]["pose_keypoints_2d"]
-
-                    # Split the keypoints into x, y coordinates and confidence values
-                    x = keypoints[::3]
-                    y = keypoints[1::3]
-                    c = keypoints[2::3]
-
-                    # Check the directory name against the dictionary to determine the rotation angle
-                    if rotation_angle == 270:
-                        y2 = np.array(keypoints[::3])
-                        x2 = 1920 - np.array(keypoints[1::3])
-                    elif rotation_angle == 90:
-                        x2 = np.array(keypoints[1::3])
-                        y2 = 1088 - np.array(keypoints[::3])
-                    elif rotation_angle == 180:
-                        x2 = 1920 + np.array(keypoints[::3]) * -1
-                        y2 = 1088 - np.array(keypoints[1::3])
-                    else:
-                        logging.error(f"Rotation angle {rotation_angle} not supported")
-                        continue
-
-                    # Unrotate the points
-                    points = np.array(list(zip(x2, y2)))
-                    if (
-                        rotation_angle == 90
-                        or rotation_angle == 180
-                        or rotation_angle == 270
-                    ):
-                        rotated_keypoints = [
-                            coord
-                            for i in range(len(points))
-                            for coord in [
-                                points[i][0],
-                                points[i][1],
-                                c[i],
+    # Unrotated files are written in the background while the next ones are read
+    with KeypointSink() as sink:
+        for rotated in rotated_poses:
+            name = os.path.basename(rotated)
+            unrotated = os.path.join(pose_dir, name)
+            os.makedirs(unrotated, exist_ok=True)
+
+            # Get a list of all JSON files in the directory
+            pose_files = [f for f in os.listdir(rotated) if f.endswith(".json")]
+
+            rotation_angle = get_rotation(name, rotation_dict)
+            for file in pose_files:
+                with open(os.path.join(rotated, file)) as f:
+                    data = json.load(f)
+                    for i in range(len(data["people"])):
+                        # Extract the 'pose_keypoints_2d' data for the first person
+                        keypoints = data["people"][i]["pose_keypoints_2d"]
+
+                        # Split the keypoints into x, y coordinates and confidence values
+                        x = keypoints[::3]
+                        y = keypoints[1::3]
+                        c = keypoints[2::3]
+
+                        # Check the directory name against the dictionary to determine the rotation angle
+                        if rotation_angle == 270:
+                            y2 = np.array(keypoints[::3])
+                            x2 = 1920 - np.array(keypoints[1::3])
+                        elif rotation_angle == 90:
+                            x2 = np.array(keypoints[1::3])
+                            y2 = 1088 - np.array(keypoints[::3])
+                        elif rotation_angle == 180:
+                            x2 = 1920 + np.array(keypoints[::3]) * -1
+                            y2 = 1088 - np.array(keypoints[1::3])
+                        else:
+                            logging.error(f"Rotation angle {rotation_angle} not supported")
+                            continue
+
+                        # Unrotate the points
+                        points = np.array(list(zip(x2, y2)))
+                        if (
+                            rotation_angle == 90
+                            or rotation_angle == 180
+                            or rotation_angle == 270
+                        ):
+                            rotated_keypoints = [
+                                coord
+                                for i in range(len(points))
+                                for coord in [
+                                    points[i][0],
+                                    points[i][1],
+                                    c[i],
+                                ]
                             ]
-                        ]
 
-                    # Write the modified data back to the file
-                    data["people"][i]["pose_keypoints_2d"] = rotated_keypoints
+                        # Write the modified data back to the file
+                        data["people"][i]["pose_keypoints_2d"] = rotated_keypoints
 
-            # Write the modified data to the new file
-            unrotated_file = os.path.join(unrotated, file)
-            with open(unrotated_file, "w") as f:
-                json.dump(data, f)
+                # Write the modified data to the new file
+                unrotated_file = os.path.join(unrotated, file)
+                sink.write(unrotated_file, data)
 
     # Delete the rotated directory
     shutil.rmtree(rotated_dir)
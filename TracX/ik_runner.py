@@ -0,0 +1,281 @@
+"""Time-chunked, parallel OpenSim inverse kinematics.
+
+Inverse kinematics is solved independently at each frame, so a long trial can
+be split into overlapping time windows that are solved in parallel. Each
+window gets its own TRC file and IK setup, and all windows of all persons are
+run in one process pool. All windows of a person share the same scaled model.
+The resulting `.mot` files are then stitched back together, with a linear
+crossfade over the overlaps so that the solver has settled from its initial
+pose by the time a window takes over.
+"""
+
+import logging
+import os
+import shutil
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from TracX.motion_io import read_mot, read_trc_data, trc_header, write_mot, write_trc
+
+CHUNKS_DIR_SUFFIX = "_ik_chunks"
+MARKER_ERRORS_SUFFIX = "_ik_marker_errors.sto"
+
+
+def plan_chunks(times, chunk_duration, overlap):
+    """Split a time series into overlapping windows.
+
+    Args:
+        times: Increasing times of the frames.
+        chunk_duration: Duration of a window in seconds, overlap excluded.
+            The whole trial is a single window if not positive.
+        overlap: Duration shared by consecutive windows in seconds.
+
+    Returns:
+        list: (start, stop) frame index ranges, stop excluded.
+    """
+    nb_frames = len(times)
+    if nb_frames == 0:
+        return []
+    if not chunk_duration or chunk_duration <= 0 or nb_frames < 2:
+        return [(0, nb_frames)]
+
+    frame_time = float(np.median(np.diff(times)))
+    chunk_frames = max(1, int(round(chunk_duration / frame_time)))
+    overlap_frames = max(0, int(round(overlap / frame_time)))
+
+    # Do not leave a tail shorter than the overlap on its own
+    nb_chunks = max(1, int(np.ceil((nb_frames - overlap_frames) / chunk_frames)))
+    if nb_chunks > 1 and nb_frames - (nb_chunks - 1) * chunk_frames <= overlap_frames:
+        nb_chunks -= 1
+
+    chunks = []
+    for c in range(nb_chunks):
+        start = max(0, c * chunk_frames - overlap_frames // 2)
+        stop = (c + 1) * chunk_frames + (overlap_frames - overlap_frames // 2)
+        stop = nb_frames if c == nb_chunks - 1 else min(stop, nb_frames)
+        chunks.append((start, stop))
+    return chunks
+
+
+def write_ik_setup(ik_setup_file, setup_path, name, model_file, marker_file, output_motion_file, time_range):
+    """Save a copy of an IK setup file for a given model, marker file and time range."""
+    ik_parameters = dict(
+        results_directory=os.path.dirname(setup_path),
+        model_file=model_file,
+        marker_file=marker_file,
+        output_motion_file=output_motion_file,
+        time_range=f"{time_range[0]} {time_range[1]}",
+        report_errors="true",
+    )
+
+    tree = ET.parse(ik_setup_file)
+    root = tree.getroot()
+    for tool in root.iter("InverseKinematicsTool"):
+        # Marker errors are written to <results_directory>/<name>_ik_marker_errors.sto
+        tool.set("name", name)
+    for k, v in ik_parameters.items():
+        for item in root.iter(k):
+            item.text = str(v)
+    tree.write(setup_path)
+
+    return setup_path
+
+
+def _run_ik_chunk(task):
+    """Run the IK of a single window. Executed in a worker process."""
+    import opensim
+
+    start_time = time.perf_counter()
+    opensim.InverseKinematicsTool(task["setup_file"]).run()
+    duration = time.perf_counter() - start_time
+
+    result = dict(task, duration=duration, rms_error=np.nan, max_error=np.nan)
+    errors_file = os.path.join(os.path.dirname(task["setup_file"]), task["name"] + MARKER_ERRORS_SUFFIX)
+    if os.path.exists(errors_file):
+        _, columns, errors = read_mot(errors_file)
+        if len(errors):
+            result["rms_error"] = float(np.nanmean(errors[:, columns.index("marker_error_RMS")]))
+            result["max_error"] = float(np.nanmax(errors[:, columns.index("marker_error_max")]))
+    return result
+
+
+def crossfade_weights(chunks, nb_frames):
+    """Blending weights of each window over the full trial.
+
+    Inside a window the weight is one. Over the overlap with a neighbouring
+    window it ramps linearly so that the weights of both windows sum to one.
+    """
+    weights = np.zeros((len(chunks), nb_frames))
+    for c, (start, stop) in enumerate(chunks):
+        w = np.ones(stop - start)
+        if c > 0:
+            ramp = chunks[c - 1][1] - start
+            if ramp > 0:
+                w[:ramp] = np.minimum(w[:ramp], np.arange(1, ramp + 1) / (ramp + 1))
+        if c < len(chunks) - 1:
+            ramp = stop - chunks[c + 1][0]
+            if ramp > 0:
+                w[-ramp:] = np.minimum(w[-ramp:], np.arange(ramp, 0, -1) / (ramp + 1))
+        weights[c, start:stop] = w
+    return weights
+
+
+def stitch_mot_chunks(mot_files, chunks, times, output_file):
+    """Stitch the `.mot` outputs of overlapping windows into a single file.
+
+    Rows are matched to the trial frames by time, then blended with
+    `crossfade_weights`. Frames that no window solved are NaN.
+    """
+    weights = crossfade_weights(chunks, len(times))
+    header, column_names, blended, total = None, None, None, np.zeros(len(times))
+    for c, mot_file in enumerate(mot_files):
+        chunk_header, chunk_columns, data = read_mot(mot_file)
+        if blended is None:
+            header, column_names = chunk_header, chunk_columns
+            blended = np.zeros((len(times), len(column_names)))
+        elif chunk_columns != column_names:
+            raise ValueError(f"Columns of {mot_file} do not match those of the other chunks")
+
+        # Nearest trial frame (times are rounded in the .mot file)
+        frames = np.clip(np.searchsorted(times, data[:, 0]), 1, len(times) - 1)
+        frames -= data[:, 0] - times[frames - 1] < times[frames] - data[:, 0]
+        w = weights[c, frames]
+        blended[frames, 1:] += w[:, None] * data[:, 1:]
+        total[frames] += w
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        blended[:, 1:] /= total[:, None]
+    blended[total == 0, 1:] = np.nan
+    blended[:, 0] = times
+
+    header = [f"nRows={len(times)}" if line.startswith("nRows=") else line for line in header]
+    write_mot(output_file, blended, column_names, header=header)
+
+    return output_file
+
+
+def run_chunked_ik(
+    jobs,
+    ik_setup_file,
+    chunk_duration=0,
+    overlap=1.0,
+    max_workers=None,
+    keep_chunks=False,
+):
+    """Run OpenSim inverse kinematics in parallel over time windows and persons.
+
+    Args:
+        jobs: One dictionary per person with the `trc_file`, the scaled
+            `model_file`, and the `output_file` (.mot) to write. An optional
+            `time_range` (start, end) restricts the processed frames.
+        ik_setup_file: IK setup file (.xml) used as a template.
+        chunk_duration: Duration of a window in seconds. Each person is run as
+            a single window if not positive.
+        overlap: Duration shared by consecutive windows in seconds.
+        max_workers: Number of worker processes. Defaults to the CPU count.
+        keep_chunks: Whether to keep the per-window TRC, setup and motion files.
+
+    Returns:
+        list: Per-window reports with the person index, the time range, the
+            duration of the solve in seconds, and the mean RMS and max marker
+            errors in meters.
+    """
+    tasks, plans = [], []
+    for j, job in enumerate(jobs):
+        trc_file = os.path.abspath(job["trc_file"])
+        output_file = os.path.abspath(job["output_file"])
+        header, data = read_trc_data(trc_file)
+        if job.get("time_range") is not None:
+            t0, t1 = job["time_range"]
+            data = data[(data[:, 1] >= t0 - 1e-9) & (data[:, 1] <= t1 + 1e-9)]
+        times = data[:, 1]
+        chunks = plan_chunks(times, chunk_duration, overlap)
+
+        stem = os.path.splitext(os.path.basename(output_file))[0]
+        chunks_dir = os.path.join(os.path.dirname(output_file), stem + CHUNKS_DIR_SUFFIX)
+        os.makedirs(chunks_dir, exist_ok=True)
+
+        frame_rate = header["metadata"].get("DataRate", 0)
+        units = header["metadata"].get("Units", "m")
+        mot_files = []
+        for c, (start, stop) in enumerate(chunks):
+            name = f"{stem}_{c:03d}"
+            chunk_trc = os.path.join(chunks_dir, name + ".trc")
+            chunk_mot = os.path.join(chunks_dir, name + ".mot")
+            chunk_setup = os.path.join(chunks_dir, name + "_ik_setup.xml")
+            chunk_header = trc_header(
+                os.path.basename(chunk_trc),
+                header["marker_names"],
+                frame_rate,
+                stop - start,
+                units=units,
+                orig_start_frame=int(data[start, 0]),
+                orig_nb_frames=len(data),
+            )
+            write_trc(chunk_trc, data[start:stop], chunk_header)
+            write_ik_setup(
+                ik_setup_file,
+                chunk_setup,
+                name,
+                model_file=os.path.abspath(job["model_file"]),
+                marker_file=chunk_trc,
+                output_motion_file=chunk_mot,
+                time_range=(times[start], times[stop - 1]),
+            )
+            mot_files.append(chunk_mot)
+            tasks.append(
+                dict(
+                    person=j,
+                    chunk=c,
+                    name=name,
+                    setup_file=chunk_setup,
+                    time_range=(float(times[start]), float(times[stop - 1])),
+                )
+            )
+        plans.append(dict(times=times, chunks=chunks, mot_files=mot_files, chunks_dir=chunks_dir, output_file=output_file))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(tasks)))
+    logging.info(f"Running {len(tasks)} IK chunk(s) for {len(jobs)} person(s) on {max_workers} process(es)...")
+
+    reports = []
+    if max_workers == 1:
+        for task in tasks:
+            reports.append(_run_ik_chunk(task))
+            _log_chunk_report(reports[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_run_ik_chunk, task) for task in tasks]
+            for future in as_completed(futures):
+                reports.append(future.result())
+                _log_chunk_report(reports[-1])
+    reports.sort(key=lambda r: (r["person"], r["chunk"]))
+
+    for plan in plans:
+        if len(plan["chunks"]) == 1:
+            shutil.move(plan["mot_files"][0], plan["output_file"])
+        else:
+            stitch_mot_chunks(plan["mot_files"], plan["chunks"], plan["times"], plan["output_file"])
+        if not keep_chunks:
+            shutil.rmtree(plan["chunks_dir"], ignore_errors=True)
+
+    total = sum(r["duration"] for r in reports)
+    logging.info(f"IK chunks solved in {total:.1f} s of cumulated process time.")
+
+    return [
+        {k: r[k] for k in ("person", "chunk", "time_range", "duration", "rms_error", "max_error")}
+        for r in reports
+    ]
+
+
+def _log_chunk_report(report):
+    t0, t1 = report["time_range"]
+    logging.info(
+        f"\tIK chunk {report['chunk']} of person {report['person']} ({t0:.2f}-{t1:.2f} s): "
+        f"{report['duration']:.1f} s, marker error RMS {report['rms_error'] * 100:.1f} cm, "
+        f"max {report['max_error'] * 100:.1f} cm."
+    )
@@ -0,0 +1,263 @@
+"""Lightweight instrumentation of the processing stages.
+
+Named spans time a block of code and counters accumulate quantities such as
+frames processed, persons detected, JSON bytes written or SVDs solved. Both
+are disabled by default: a disabled span is a shared object that does nothing
+and a disabled counter returns at once, so they can be left in hot loops.
+Counters only keep their total: their values are sampled for the timeline
+when a span ends, not at each count.
+
+Enable instrumentation with the `FEATURE_PROFILING_ENABLED=1` environment
+variable or with `enable()`. The recorded timeline can be exported as JSON or
+in the Chrome trace event format (open it in chrome://tracing or Perfetto),
+and a summary can be logged, so it shows in the experiment logs.
+
+Usage:
+    from TracX.instrumentation import count, span
+
+    with span("triangulation"):
+        for frame in frames:
+            with span("pose", frame=frame_idx):
+                ...
+            count("frames")
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from TracX.constants import FEATURE_PROFILING_ENABLED
+
+PROFILE_DIR_NAME = "profile"
+
+
+class _Recorder:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.origin_ns = time.perf_counter_ns()
+        self.spans = []  # (name, start_ns, duration_ns, pid, tid, args)
+        self.counters = defaultdict(float)
+        self.changed = set()  # counters changed since they were last sampled
+        self.samples = []  # (name, time_ns, pid, value)
+
+    def sample_counters(self):
+        """Add the values of the counters changed since the last sample to the timeline."""
+        with self.lock:
+            now = time.perf_counter_ns()
+            pid = os.getpid()
+            for name in sorted(self.changed):
+                self.samples.append((name, now, pid, self.counters[name]))
+            self.changed.clear()
+
+
+_recorder = _Recorder(FEATURE_PROFILING_ENABLED)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        # list.append is atomic, no lock needed
+        _recorder.spans.append(
+            (self.name, self.start, duration, os.getpid(), threading.get_ident(), self.args)
+        )
+        if _recorder.changed:
+            _recorder.sample_counters()
+        return False
+
+
+def enable():
+    """Start recording spans and counters."""
+    _recorder.enabled = True
+
+
+def disable():
+    """Stop recording spans and counters. Recorded events are kept."""
+    _recorder.enabled = False
+
+
+def is_enabled():
+    return _recorder.enabled
+
+
+def reset():
+    """Discard all recorded spans and counters."""
+    with _recorder.lock:
+        _recorder.reset()
+
+
+def span(name, **args):
+    """Context manager timing a named block of code.
+
+    Args:
+        name: Name of the span. Spans with the same name are aggregated in
+            the summary.
+        **args: Values attached to the span in the exported timeline.
+    """
+    if not _recorder.enabled:
+        return _NO_SPAN
+    return _Span(name, args)
+
+
+def instrumented(name=None):
+    """Decorator timing each call of a function as a span.
+
+    The span is named after the function unless `name` is given.
+    """
+
+    def decorator(fun):
+        span_name = name or fun.__qualname__
+
+        @functools.wraps(fun)
+        def wrapper(*args, **kwargs):
+            if not _recorder.enabled:
+                return fun(*args, **kwargs)
+            with _Span(span_name, {}):
+                return fun(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, value=1):
+    """Add `value` to a named counter.
+
+    Only the total is kept, so counting in a loop over points does not grow
+    the recorded timeline.
+    """
+    if not _recorder.enabled:
+        return
+    with _recorder.lock:
+        _recorder.counters[name] += value
+        _recorder.changed.add(name)
+
+
+def summary():
+    """Aggregate the recorded spans and counters.
+
+    Returns:
+        dict: For each span name, the `count` of spans and their `total`,
+            `mean` and `max` durations in seconds, and the value of each
+            counter.
+    """
+    spans = {}
+    for name, _, duration, *_ in list(_recorder.spans):
+        stats = spans.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += duration / 1e9
+        stats["max"] = max(stats["max"], duration / 1e9)
+    for stats in spans.values():
+        stats["mean"] = stats["total"] / stats["count"]
+    return {"spans": spans, "counters": dict(_recorder.counters)}
+
+
+def format_summary(stats=None):
+    """Format a summary (see `summary`) as lines of text."""
+    stats = summary() if stats is None else stats
+    lines = []
+    for name, s in sorted(stats["spans"].items(), key=lambda item: item[1]["total"], reverse=True):
+        lines.append(
+            f"{name}: {s['count']} x {s['mean'] * 1000:.2f} ms = {s['total']:.2f} s (max {s['max'] * 1000:.2f} ms)"
+        )
+    for name, value in sorted(stats["counters"].items()):
+        lines.append(f"{name}: {value:g}")
+    return lines
+
+
+def log_summary():
+    """Log the summary of the recorded spans and counters."""
+    lines = format_summary()
+    if not lines:
+        return
+    logging.info("Profile summary:")
+    for line in lines:
+        logging.info(f"\t{line}")
+
+
+def export_json(path):
+    """Save the summary and the raw spans and counters as JSON."""
+    _recorder.sample_counters()
+    data = {
+        "summary": summary(),
+        "spans": [
+            {"name": name, "start": (start - _recorder.origin_ns) / 1e9, "duration": duration / 1e9,
+             "pid": pid, "tid": tid, "args": args}
+            for name, start, duration, pid, tid, args in list(_recorder.spans)
+        ],
+        "counters": [
+            {"name": name, "time": (t - _recorder.origin_ns) / 1e9, "pid": pid, "value": value}
+            for name, t, pid, value in list(_recorder.samples)
+        ],
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+    return path
+
+
+def export_chrome_trace(path):
+    """Save the timeline in the Chrome trace event format."""
+    _recorder.sample_counters()
+    events = [
+        {"name": name, "ph": "X", "ts": (start - _recorder.origin_ns) / 1e3, "dur": duration / 1e3,
+         "pid": pid, "tid": tid, "args": args}
+        for name, start, duration, pid, tid, args in list(_recorder.spans)
+    ]
+    events += [
+        {"name": name, "ph": "C", "ts": (t - _recorder.origin_ns) / 1e3, "pid": pid, "args": {name: value}}
+        for name, t, pid, value in list(_recorder.samples)
+    ]
+    events.sort(key=lambda e: e["ts"])
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+    return path
+
+
+def export_experiment(experiment_dir):
+    """Log the summary and save the JSON and Chrome trace files of an experiment.
+
+    Files are saved in the `profile` directory of the experiment. Nothing is
+    done if instrumentation is disabled.
+
+    Returns:
+        str: The directory of the saved files, or None.
+    """
+    if not _recorder.enabled:
+        return None
+    log_summary()
+    profile_dir = os.path.join(experiment_dir, PROFILE_DIR_NAME)
+    os.makedirs(profile_dir, exist_ok=True)
+    export_json(os.path.join(profile_dir, "profile.json"))
+    export_chrome_trace(os.path.join(profile_dir, "trace.json"))
+    logging.info(f"Profile saved to {profile_dir}")
+    return profile_dir
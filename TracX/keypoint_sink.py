@@ -0,0 +1,226 @@
+"""Asynchronous writing of per-frame keypoint JSON files.
+
+Pose estimation writes one OpenPose JSON file per frame and camera. Opening,
+serializing and closing each of them in the inference loop stalls it, all the
+more on network filesystems. A `KeypointSink` takes the JSON data of a file and
+returns at once: a background thread serializes and writes the queued files in
+batches, in the order they were submitted. When the same file is submitted
+several times before it is written, only its last content is written.
+
+Files are written as individual JSON files by default, which all readers of
+the pipeline expect. The files of each directory (one per camera) can instead
+be appended to a single container next to it, either newline-delimited JSON
+(`<dir>.ndjson`, one `{"file": name, "data": ...}` object per line) or a zip
+archive (`<dir>.zip`), and read back with `read_container`.
+
+Usage:
+    with KeypointSink() as sink:
+        for frame_idx, frame in frames:
+            ...
+            save_to_openpose(json_file_path, keypoints, scores, sink=sink)
+    # All files are written when the block exits
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import zipfile
+
+from TracX.instrumentation import count
+
+CONTAINERS = ("json", "ndjson", "zip")
+
+# Maximum number of files waiting to be written before `write` blocks
+MAX_PENDING = 1024
+# Maximum number of files written per batch
+BATCH_SIZE = 64
+
+_STOP = object()
+
+
+class KeypointSink:
+    """Background writer of JSON files, written in submission order.
+
+    Args:
+        container: "json" to write one file per frame, "ndjson" or "zip" to
+            append the files of each directory to a single container.
+        fsync: Whether to fsync the written files after each batch.
+        max_pending: Maximum number of queued files before `write` blocks.
+        batch_size: Maximum number of files written per batch.
+    """
+
+    def __init__(self, container="json", fsync=False, max_pending=MAX_PENDING, batch_size=BATCH_SIZE):
+        if container not in CONTAINERS:
+            raise ValueError(f"Unknown container '{container}'. Must be one of {CONTAINERS}")
+        self.container = container
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._containers = {}
+        self._directories = set()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="KeypointSink", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def write(self, path, data):
+        """Queue the JSON data of a file.
+
+        Args:
+            path: Path of the JSON file.
+            data: JSON-serializable data. It must not be modified afterwards.
+        """
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise RuntimeError("The keypoint sink is closed")
+        self._queue.put((os.path.abspath(path), data))
+
+    def flush(self):
+        """Wait until all queued files are written."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Write all queued files, close the containers and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        for handle in self._containers.values():
+            handle.close()
+        self._containers.clear()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing keypoint files failed") from error
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            items = [item for item in batch if item is not _STOP]
+            stop = len(items) < len(batch)
+            try:
+                if self._error is None and items:
+                    self._write_batch(items)
+            except Exception as e:
+                logging.error(f"Writing keypoint files failed: {e}")
+                self._error = e
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, items):
+        # Coalesce writes of the same file, keeping the order of their last submission
+        latest = {}
+        for path, data in items:
+            latest.pop(path, None)
+            latest[path] = data
+
+        written = []
+        nb_bytes = 0
+        for path, data in latest.items():
+            directory, name = os.path.split(path)
+            if directory not in self._directories:
+                os.makedirs(directory, exist_ok=True)
+                self._directories.add(directory)
+            json_string = json.dumps(data)
+            nb_bytes += len(json_string)
+
+            if self.container == "json":
+                with open(path, "w") as f:
+                    f.write(json_string)
+                    if self.fsync:
+                        f.flush()
+                        written.append(os.dup(f.fileno()))
+            elif self.container == "ndjson":
+                handle = self._container(directory)
+                handle.write(json.dumps({"file": name, "data": data}) + "\n")
+                written.append(handle)
+            else:
+                handle = self._container(directory)
+                handle.writestr(name, json_string)
+                written.append(handle)
+
+        # One flush and fsync per file or container per batch
+        for target in dict.fromkeys(written):
+            if isinstance(target, int):
+                os.fsync(target)
+                os.close(target)
+            elif self.container == "ndjson":
+                target.flush()
+                if self.fsync:
+                    os.fsync(target.fileno())
+            elif self.fsync:
+                target.fp.flush()
+                os.fsync(target.fp.fileno())
+        count("json_bytes", nb_bytes)
+
+    def _container(self, directory):
+        if directory not in self._containers:
+            path = f"{directory}.{self.container}"
+            if self.container == "ndjson":
+                # Kept open until the sink is closed, as the container gets appended to in every batch
+                self._containers[directory] = open(path, "a")  # noqa: SIM115
+            else:
+                self._containers[directory] = zipfile.ZipFile(path, "a", compression=zipfile.ZIP_DEFLATED)
+        return self._containers[directory]
+
+
+def read_container(path):
+    """Read the files of a ndjson or zip container written by a KeypointSink.
+
+    Files written several times are returned with their last content.
+
+    Args:
+        path: Path of the `.ndjson` or `.zip` container.
+
+    Returns:
+        dict: JSON data by file name, in writing order.
+    """
+    files = {}
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                files.pop(info.filename, None)
+                files[info.filename] = json.loads(archive.read(info))
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    files.pop(entry["file"], None)
+                    files[entry["file"]] = entry["data"]
+    return files
+
+
+def extract_container(path, directory=None):
+    """Write the files of a container as individual JSON files.
+
+    Args:
+        path: Path of the `.ndjson` or `.zip` container.
+        directory: Output directory. Defaults to the container path without its extension.
+
+    Returns:
+        str: The output directory.
+    """
+    directory = directory or os.path.splitext(path)[0]
+    with KeypointSink() as sink:
+        for name, data in read_container(path).items():
+            sink.write(os.path.join(directory, name), data)
+    return directory
@@ -8,6 +8,7 @@ import opensim
 from Pose2Sim.kinematics import read_trc
 
 from TracX.constants import OPENSIM_FILES, OPENSIM_GEOMETRY
+from TracX.ik_runner import run_chunked_ik
 
 
 def adapt_scaling_setup(
@@ -98,6 +99,9 @@ def run_kinematics(
     output_dir: str,
     pose_model="HALPE_26",
     time_range=None,
+    chunk_duration=0,
+    chunk_overlap=1.0,
+    max_workers=None,
 ):
     # Find OpenSim files
     logging.info("Finding OpenSim files...")
@@ -178,8 +182,25 @@ def run_kinematics(
             time_range=ik_time_range,
         )
 
-        logging.info("Running OpenSim Inverse Kinematics...")
-        opensim.InverseKinematicsTool(ik_file).run()
+        if chunk_duration and chunk_duration > 0:
+            logging.info(f"Running OpenSim Inverse Kinematics in chunks of {chunk_duration} s...")
+            run_chunked_ik(
+                [
+                    dict(
+                        trc_file=marker_file,
+                        model_file=os.path.join(output_dir, "scaled_model.osim"),
+                        output_file=os.path.join(output_dir, "ik.mot"),
+                        time_range=ik_time_range,
+                    )
+                ],
+                ik_setup_file=ik_file,
+                chunk_duration=chunk_duration,
+                overlap=chunk_overlap,
+                max_workers=max_workers,
+            )
+        else:
+            logging.info("Running OpenSim Inverse Kinematics...")
+            opensim.InverseKinematicsTool(ik_file).run()
         logging.info("Inverse Kinematics successfully completed")
     except Exception as e:
         logging.error("Inverse Kinematics failed, aborting...")
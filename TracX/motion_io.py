@@ -0,0 +1,293 @@
+"""Fast reading and writing of TRC (marker trajectories) and MOT (motion) files.
+
+All readers in the code base go through this module so that a file is parsed the
+same way everywhere. Data are parsed with NumPy into a single float array and
+written in large buffered blocks. A TRC file can optionally get a binary sidecar
+cache (``<file>.trc.npz``), which later reads use automatically while it is up
+to date.
+"""
+
+import io
+import itertools as it
+import os
+
+import numpy as np
+
+TRC_HEADER_LINES = 5
+TRC_CACHE_SUFFIX = ".npz"
+WRITE_CHUNK_SIZE = 10000
+
+
+def _parse_rows(text, nb_columns):
+    """Parse tab-separated numeric rows, treating empty fields as NaN."""
+    # Empty fields (missing values) are written by pandas as nothing between tabs
+    text = text.replace("\r\n", "\n").replace("\t\n", "\tnan\n")
+    text = text.replace("\t\t", "\tnan\t").replace("\t\t", "\tnan\t")
+    if text.endswith("\t"):
+        text += "nan"
+    if not text.strip():
+        return np.empty((0, nb_columns))
+    return np.loadtxt(
+        io.StringIO(text),
+        delimiter="\t",
+        usecols=range(nb_columns),
+        comments=None,
+        ndmin=2,
+    )
+
+
+def _parse_trc_header(lines):
+    """Build the header dictionary from the five TRC header lines."""
+    lines = [line.rstrip("\r\n") for line in lines]
+    keys = lines[1].split("\t")
+    values = lines[2].split("\t")
+    marker_names = [name.strip() for name in lines[3].split("\t")[2::3]]
+    return {
+        "lines": lines,
+        "metadata": dict(zip(keys, values)),
+        "marker_names": [name for name in marker_names if name],
+    }
+
+
+def trc_cache_path(trc_path):
+    """Path of the binary sidecar cache of a TRC file."""
+    return str(trc_path) + TRC_CACHE_SUFFIX
+
+
+def _load_trc_cache(trc_path):
+    cache_path = trc_cache_path(trc_path)
+    if not os.path.exists(cache_path):
+        return None
+
+    stat = os.stat(trc_path)
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            if (
+                int(cache["src_mtime_ns"]) != stat.st_mtime_ns
+                or int(cache["src_size"]) != stat.st_size
+            ):
+                return None
+            return _parse_trc_header(cache["header"].tolist()), cache["data"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_trc_cache(trc_path, header, data):
+    stat = os.stat(trc_path)
+    with open(trc_cache_path(trc_path), "wb") as f:
+        np.savez(
+            f,
+            header=np.array(header["lines"]),
+            data=data,
+            src_mtime_ns=np.int64(stat.st_mtime_ns),
+            src_size=np.int64(stat.st_size),
+        )
+
+
+def read_trc_header(trc_path):
+    """Read the header of a TRC file.
+
+    Args:
+        trc_path: Path to the TRC file.
+
+    Returns:
+        dict: The raw header `lines`, the `metadata` (DataRate, CameraRate,
+            NumFrames, ... as strings), and the `marker_names`.
+    """
+    with open(trc_path, encoding="utf-8") as f:
+        lines = [next(f) for _ in range(TRC_HEADER_LINES)]
+    return _parse_trc_header(lines)
+
+
+def read_trc_data(trc_path, cache=False):
+    """Read a TRC file into a NumPy array.
+
+    An up-to-date sidecar cache is always used if it exists.
+
+    Args:
+        trc_path: Path to the TRC file.
+        cache: Whether to write a sidecar cache for faster later reads.
+
+    Returns:
+        tuple: The header dictionary (see `read_trc_header`) and the data, an
+            array of shape (frames, 2 + 3 * markers) holding the frame numbers,
+            the times, and the X, Y, Z coordinates of each marker. Missing values
+            are NaN.
+    """
+    cached = _load_trc_cache(trc_path)
+    if cached is not None:
+        return cached
+
+    with open(trc_path, encoding="utf-8") as f:
+        header = _parse_trc_header([next(f) for _ in range(TRC_HEADER_LINES)])
+        nb_columns = 2 + 3 * len(header["marker_names"])
+        data = _parse_rows(f.read(), nb_columns)
+
+    if cache:
+        _save_trc_cache(trc_path, header, data)
+
+    return header, data
+
+
+def iter_trc_data(trc_path, chunk_size=WRITE_CHUNK_SIZE):
+    """Stream the data of a TRC file in chunks of rows.
+
+    Useful for very long files that should not be loaded at once.
+
+    Args:
+        trc_path: Path to the TRC file.
+        chunk_size: Number of rows per chunk.
+
+    Yields:
+        np.ndarray: Arrays of shape (<= chunk_size, 2 + 3 * markers).
+    """
+    with open(trc_path, encoding="utf-8") as f:
+        header = _parse_trc_header([next(f) for _ in range(TRC_HEADER_LINES)])
+        nb_columns = 2 + 3 * len(header["marker_names"])
+        while True:
+            lines = list(it.islice(f, chunk_size))
+            if not lines:
+                break
+            rows = _parse_rows("".join(lines), nb_columns)
+            if len(rows) > 0:
+                yield rows
+
+
+def trc_header(
+    file_name,
+    marker_names,
+    frame_rate,
+    nb_frames,
+    units="m",
+    orig_start_frame=0,
+    orig_nb_frames=None,
+):
+    """Build the five header lines of a TRC file (without line endings)."""
+    if orig_nb_frames is None:
+        orig_nb_frames = nb_frames
+    return [
+        "PathFileType\t4\t(X/Y/Z)\t" + str(file_name),
+        "DataRate\tCameraRate\tNumFrames\tNumMarkers\tUnits\tOrigDataRate\tOrigDataStartFrame\tOrigNumFrames",
+        "\t".join(
+            map(
+                str,
+                [
+                    frame_rate,
+                    frame_rate,
+                    nb_frames,
+                    len(marker_names),
+                    units,
+                    frame_rate,
+                    orig_start_frame,
+                    orig_nb_frames,
+                ],
+            )
+        ),
+        "Frame#\tTime\t" + "\t\t\t".join(marker_names) + "\t\t",
+        "\t\t"
+        + "\t".join([f"X{i+1}\tY{i+1}\tZ{i+1}" for i in range(len(marker_names))]),
+    ]
+
+
+def _write_rows(f, data, column_formats, chunk_size):
+    """Write rows in large blocks, with NaN written as empty fields."""
+    # Floats are written by default like pandas does: with the shortest repr that round-trips
+    row_format = "\t".join(fmt or "%r" for fmt in column_formats) + "\n"
+    for start in range(0, len(data), chunk_size):
+        rows = data[start : start + chunk_size].tolist()
+        text = "".join([row_format % tuple(row) for row in rows])
+        f.write(text.replace("nan", ""))
+
+
+def write_trc(
+    trc_path,
+    data,
+    header,
+    float_format=None,
+    chunk_size=WRITE_CHUNK_SIZE,
+):
+    """Write a TRC file.
+
+    Args:
+        trc_path: Path to the TRC file.
+        data: Array of shape (frames, 2 + 3 * markers) holding the frame
+            numbers, the times, and the marker coordinates.
+        header: The five header lines, as built by `trc_header` or read by
+            `read_trc_header` (the `lines` entry).
+        float_format: Format of times and coordinates. Defaults to the
+            shortest representation that reads back to the same value.
+        chunk_size: Number of rows formatted per write.
+    """
+    data = np.asarray(data, dtype=float)
+    column_formats = ["%d"] + [float_format] * (data.shape[1] - 1)
+    with open(trc_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.writelines(line.rstrip("\r\n") + "\n" for line in header)
+        _write_rows(f, data, column_formats, chunk_size)
+
+    # Drop the now stale binary cache
+    cache_path = trc_cache_path(trc_path)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+
+def read_mot(mot_path):
+    """Read a MOT (or STO) file.
+
+    Args:
+        mot_path: Path to the MOT file.
+
+    Returns:
+        tuple: The header lines (up to and including `endheader`), the column
+            names, and the data as an array of shape (frames, columns).
+    """
+    with open(mot_path, encoding="utf-8") as f:
+        header = []
+        for line in f:
+            header.append(line.rstrip("\r\n"))
+            if line.strip().lower() == "endheader":
+                break
+        column_names = next(f).rstrip("\r\n").split("\t")
+        data = _parse_rows(f.read(), len(column_names))
+    return header, column_names, data
+
+
+def write_mot(
+    mot_path,
+    data,
+    column_names,
+    header=None,
+    in_degrees=True,
+    float_format=None,
+    chunk_size=WRITE_CHUNK_SIZE,
+):
+    """Write a MOT file.
+
+    Args:
+        mot_path: Path to the MOT file.
+        data: Array of shape (frames, columns), the first column being the time.
+        column_names: Names of the columns, starting with "time".
+        header: Header lines up to `endheader`. Built from the data if None.
+        in_degrees: Whether rotational values are in degrees.
+        float_format: Format of the values. Defaults to the shortest
+            representation that reads back to the same value.
+        chunk_size: Number of rows formatted per write.
+    """
+    data = np.asarray(data, dtype=float)
+    if header is None:
+        header = [
+            "Coordinates",
+            "version=1",
+            f"nRows={data.shape[0]}",
+            f"nColumns={data.shape[1]}",
+            f"inDegrees={'yes' if in_degrees else 'no'}",
+            "",
+            "Units are S.I. units (second, meters, Newtons, ...)",
+            "If the header above contains a line with 'inDegrees', this indicates whether rotational values are in degrees (yes) or radians (no).",
+            "",
+            "endheader",
+        ]
+
+    with open(mot_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.writelines(line + "\n" for line in header)
+        f.write("\t".join(column_names) + "\n")
+        _write_rows(f, data, [float_format] * data.shape[1], chunk_size)
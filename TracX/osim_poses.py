@@ -0,0 +1,260 @@
+"""Bulk evaluation of OpenSim model poses along a motion.
+
+Body transforms and marker positions are computed by walking the state
+trajectory of a `.mot` file once. Coordinate, body and marker handles are
+fetched before the frame loop, all coordinate values are converted to radians
+at once, and results are written into preallocated arrays. Long motions can be
+split into blocks of frames evaluated in worker processes, and the results can
+be streamed to a CSV file or a binary `.npy` file block by block.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import opensim as osim
+
+from TracX.motion_io import read_mot
+
+BLOCK_SIZE = 500
+
+# OpenSim y-up to Blender z-up
+H_ZUP = np.array([[1, 0, 0, 0], [0, 0, -1, 0], [0, 1, 0, 0], [0, 0, 0, 1]], dtype=float)
+
+# Model and state of a worker process, loaded once by `_init_worker`
+_worker_model = None
+
+
+def read_motion(mot_path):
+    """Read a `.mot` file.
+
+    Returns:
+        tuple: The times, the coordinate names, the coordinate values of shape
+            (frames, coordinates), and whether rotations are in degrees.
+    """
+    header, column_names, data = read_mot(mot_path)
+    in_degrees = any(
+        line.replace(" ", "").lower() == "indegrees=yes" for line in header
+    )
+    return data[:, 0], column_names[1:], data[:, 1:], in_degrees
+
+
+def _select(names, available, kind):
+    if names is None:
+        return list(available)
+    missing = [n for n in names if n not in available]
+    if missing:
+        print(f"The following {kind} were not found in the model: {missing}")
+    return [n for n in names if n in available]
+
+
+def model_names(osim_path):
+    """Names of the bodies and markers of a model."""
+    return _model_names(osim.Model(str(osim_path)))
+
+
+def _model_names(model):
+    bodies = model.getBodySet()
+    markers = model.getMarkerSet()
+    return (
+        [bodies.get(i).getName() for i in range(bodies.getSize())],
+        [markers.get(i).getName() for i in range(markers.getSize())],
+    )
+
+
+def evaluate_poses(model, coordinate_names, values, body_names, marker_names, state=None):
+    """Evaluate body transforms and marker positions over frames of coordinates.
+
+    Args:
+        model: OpenSim model.
+        coordinate_names: Names of the model coordinates set at each frame.
+        values: Coordinate values of shape (frames, coordinates), in radians
+            for rotational coordinates.
+        body_names: Bodies to evaluate.
+        marker_names: Markers to evaluate.
+        state: State of the initialized model, to evaluate several blocks of
+            frames without initializing the model again. Initialized if None.
+
+    Returns:
+        tuple: The body transforms in ground (frames, bodies, 4, 4) and the
+            marker positions in ground (frames, markers, 3).
+    """
+    if state is None:
+        state = model.initSystem()
+
+    coordinate_set = model.getCoordinateSet()
+    coordinates = [coordinate_set.get(c) for c in coordinate_names]
+    body_set = model.getBodySet()
+    bodies = [body_set.get(b) for b in body_names]
+    marker_set = model.getMarkerSet()
+    markers = [marker_set.get(m) for m in marker_names]
+
+    nb_frames = len(values)
+    transforms = np.empty((nb_frames, len(bodies), 4, 4))
+    transforms[:, :, 3, :] = [0, 0, 0, 1]
+    positions = np.empty((nb_frames, len(markers), 3))
+    values = values.tolist()
+    for n in range(nb_frames):
+        for coordinate, value in zip(coordinates, values[n]):
+            coordinate.setValue(state, value, False)
+        model.assemble(state)
+
+        for b, body in enumerate(bodies):
+            H = body.getTransformInGround(state)
+            R = H.R()
+            transforms[n, b, :3, 3] = H.T().to_numpy()
+            for i in range(3):
+                for j in range(3):
+                    transforms[n, b, i, j] = R.get(i, j)
+        for m, marker in enumerate(markers):
+            positions[n, m] = marker.getLocationInGround(state).to_numpy()
+
+    return transforms, positions
+
+
+def _init_worker(osim_path):
+    """Load the model once in a worker process."""
+    global _worker_model
+    model = osim.Model(osim_path)
+    _worker_model = model, model.initSystem()
+
+
+def _evaluate_block(coordinate_names, values, body_names, marker_names):
+    """Evaluate a block of frames on the model of the worker process."""
+    model, state = _worker_model
+    return evaluate_poses(model, coordinate_names, values, body_names, marker_names, state=state)
+
+
+def iter_model_poses(
+    osim_path,
+    mot_path,
+    body_names=None,
+    marker_names=None,
+    block_size=BLOCK_SIZE,
+    max_workers=1,
+):
+    """Evaluate the poses of a model along a motion, block of frames by block.
+
+    Args:
+        osim_path: Path to the model (.osim).
+        mot_path: Path to the motion (.mot). Columns that are not coordinates
+            of the model are ignored.
+        body_names: Bodies to evaluate. All if None.
+        marker_names: Markers to evaluate. All if None.
+        block_size: Number of frames per block.
+        max_workers: Number of worker processes. Blocks are evaluated in the
+            current process if 1.
+
+    Yields:
+        tuple: For each block, in order, the times (frames,), the body
+            transforms in ground (frames, bodies, 4, 4) and the marker
+            positions in ground (frames, markers, 3).
+    """
+    times, column_names, data, in_degrees = read_motion(mot_path)
+
+    # Model coordinates present in the motion, converted to radians at once
+    model = osim.Model(str(osim_path))
+    coordinate_set = model.getCoordinateSet()
+    columns = [i for i, c in enumerate(column_names) if coordinate_set.contains(c)]
+    coordinate_names = [column_names[i] for i in columns]
+    values = data[:, columns]
+    if in_degrees:
+        rotational = [
+            coordinate_set.get(c).getMotionType() == 1  # 1: rotation, 2: translation, 3: coupled
+            for c in coordinate_names
+        ]
+        values[:, rotational] *= np.pi / 180
+
+    all_bodies, all_markers = _model_names(model)
+    body_names = _select(body_names, all_bodies, "bodies")
+    marker_names = _select(marker_names, all_markers, "markers")
+
+    # The model is loaded once per worker process, or once here
+    blocks = [(s, min(s + block_size, len(times))) for s in range(0, len(times), block_size)]
+    if max_workers is None or max_workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(str(osim_path),)
+        ) as executor:
+            futures = [
+                executor.submit(_evaluate_block, coordinate_names, values[s:e], body_names, marker_names)
+                for s, e in blocks
+            ]
+            for (s, e), future in zip(blocks, futures):
+                yield (times[s:e], *future.result())
+    else:
+        state = model.initSystem()
+        for s, e in blocks:
+            yield (
+                times[s:e],
+                *evaluate_poses(model, coordinate_names, values[s:e], body_names, marker_names, state=state),
+            )
+
+
+def evaluate_model_poses(osim_path, mot_path, body_names=None, marker_names=None, max_workers=1):
+    """Evaluate the poses of a model along a whole motion.
+
+    See `iter_model_poses` for the arguments.
+
+    Returns:
+        tuple: The times (frames,), the body transforms (frames, bodies, 4, 4)
+            and the marker positions (frames, markers, 3).
+    """
+    blocks = list(
+        iter_model_poses(osim_path, mot_path, body_names, marker_names, max_workers=max_workers)
+    )
+    if not blocks:
+        return np.empty(0), np.empty((0, 0, 4, 4)), np.empty((0, 0, 3))
+    return tuple(np.concatenate(arrays) for arrays in zip(*blocks))
+
+
+def euler_from_transforms(transforms):
+    """XYZ Euler angles of an array of homogeneous transforms (..., 4, 4)."""
+    R = transforms[..., :3, :3]
+    sy = np.sqrt(R[..., 1, 0] ** 2 + R[..., 0, 0] ** 2)
+    singular = sy <= 1e-6  # y angle is +/- pi/2
+    rot_x = np.where(
+        singular,
+        np.arctan2(-R[..., 1, 2], R[..., 1, 1]),
+        np.arctan2(R[..., 2, 1], R[..., 2, 2]),
+    )
+    rot_y = np.arctan2(-R[..., 2, 0], sy)
+    rot_z = np.where(singular, 0.0, np.arctan2(R[..., 1, 0], R[..., 0, 0]))
+    return np.stack([rot_x, rot_y, rot_z], axis=-1)
+
+
+@contextmanager
+def open_stream(output_path, nb_frames, columns, header=""):
+    """Open an output for rows of `columns` values, streamed block by block.
+
+    A `.npy` output is a preallocated memory-mapped array; anything else is a
+    comma-separated text file with `header` as its commented first line. The
+    output is flushed and closed when the context exits.
+
+    Yields:
+        function: `write(rows)`, which appends rows to the output.
+    """
+    if os.path.splitext(output_path)[1] == ".npy":
+        array = np.lib.format.open_memmap(
+            output_path, mode="w+", dtype=np.float64, shape=(nb_frames, columns)
+        )
+        cursor = [0]
+
+        def write(rows):
+            array[cursor[0] : cursor[0] + len(rows)] = rows
+            cursor[0] += len(rows)
+
+        try:
+            yield write
+        finally:
+            array.flush()
+            del array  # release the mapping
+        return
+
+    with open(output_path, "w", buffering=1 << 20) as f:
+        f.write(f"# {header}\n")
+
+        def write(rows):
+            np.savetxt(f, rows, delimiter=",", fmt="%.18e")
+
+        yield write
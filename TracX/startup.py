@@ -0,0 +1,199 @@
+"""Import-time profiling and cold-start benchmark of the TracX entry points.
+
+Heavy backends (pose estimation, OpenSim, plotting, rendering) are imported
+lazily, where they are used. This module checks that it stays that way: it
+reports which modules an entry point imports and how long they take, and it
+tracks the cold-start time of the GUI and CLI entry points across runs.
+
+Usage:
+    python -m TracX.startup report --entry gui
+    python -m TracX.startup benchmark --history startup_history.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from TracX.constants import APP_CACHE
+
+ENTRY_POINTS = {
+    "gui": "TracX.studio",
+    "cli": "TracX.TracX",
+}
+
+# Modules that must not be imported when an entry point is loaded
+HEAVY_MODULES = (
+    "aitviewer",
+    "filterpy",
+    "matplotlib",
+    "onnxruntime",
+    "opensim",
+    "pandas",
+    "Pose2Sim",
+    "rtmlib",
+    "scipy",
+    "Sports2D",
+    "tensorflow",
+    "torch",
+    "TracX_rtmlib",
+)
+
+BENCHMARK_HISTORY = os.path.join(APP_CACHE, "startup_benchmark.json")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_python(code, *args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [ROOT_DIR, env.get("PYTHONPATH")] if p
+    )
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=ROOT_DIR,
+        env=env,
+    )
+
+
+def profile_imports(module):
+    """Profile the imports of a module in a fresh interpreter.
+
+    Args:
+        module: Name of the module to import.
+
+    Returns:
+        dict: The `total` import time in seconds, the `modules` imported as
+            (name, self seconds, cumulative seconds, depth) tuples, and the
+            `heavy` modules that got imported.
+    """
+    code = (
+        f"import {module}, sys, json; "
+        f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"
+    )
+    result = _run_python(code, "-X", "importtime")
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr[-2000:]}")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+
+    return {
+        "total": sum(m[2] for m in modules if m[3] == 0),
+        "modules": modules,
+        "heavy": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def format_report(module, profile, top=25):
+    """Format an import profile as a text report."""
+    lines = [
+        f"Import profile of {module}: {profile['total']:.2f} s",
+        "",
+        f"{'cumulative':>10} {'self':>8}  module",
+    ]
+    slowest = sorted(profile["modules"], key=lambda m: m[2], reverse=True)[:top]
+    for name, self_time, cumulative, depth in slowest:
+        lines.append(f"{cumulative:>9.3f}s {self_time:>7.3f}s  {'  ' * depth}{name}")
+
+    lines.append("")
+    if profile["heavy"]:
+        lines.append("Heavy modules imported eagerly: " + ", ".join(profile["heavy"]))
+    else:
+        lines.append("No heavy module imported eagerly.")
+    return "\n".join(lines)
+
+
+def measure_cold_start(module, repeats=5):
+    """Wall-clock time to start an interpreter and import a module.
+
+    Returns:
+        list: The time of each run in seconds.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = _run_python(f"import {module}")
+        times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to import {module}:\n{result.stderr[-2000:]}")
+    return times
+
+
+def run_benchmark(history_file=BENCHMARK_HISTORY, repeats=5, tolerance=0.2, baseline_runs=5):
+    """Measure the cold start of each entry point and compare with past runs.
+
+    The baseline of an entry point is the best median of its last
+    `baseline_runs` recorded runs. The new run is appended to the history.
+
+    Returns:
+        tuple: The results of the new run, by entry point, and the list of
+            entry points that are more than `tolerance` slower than baseline.
+    """
+    history = []
+    if os.path.exists(history_file):
+        with open(history_file) as f:
+            history = json.load(f)
+
+    results, regressions = {}, []
+    for entry, module in ENTRY_POINTS.items():
+        times = measure_cold_start(module, repeats=repeats)
+        median = statistics.median(times)
+        past = [run["results"][entry]["median"] for run in history if entry in run["results"]]
+        baseline = min(past[-baseline_runs:]) if past else None
+        results[entry] = {
+            "module": module,
+            "median": median,
+            "min": min(times),
+            "baseline": baseline,
+        }
+        if baseline is not None and median > baseline * (1 + tolerance):
+            regressions.append(entry)
+
+    history.append({"date": datetime.now().isoformat(timespec="seconds"), "results": results})
+    os.makedirs(os.path.dirname(os.path.abspath(history_file)), exist_ok=True)
+    with open(history_file, "w") as f:
+        json.dump(history, f, indent=2)
+
+    return results, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = subparsers.add_parser("report", help="Import-time profile of an entry point")
+    report_parser.add_argument("--entry", choices=ENTRY_POINTS, default="gui")
+    report_parser.add_argument("--top", type=int, default=25, help="Number of modules listed")
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="Cold-start regression benchmark")
+    benchmark_parser.add_argument("--history", default=BENCHMARK_HISTORY, help="JSON history file")
+    benchmark_parser.add_argument("--repeats", type=int, default=5)
+    benchmark_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown ratio")
+
+    args = parser.parse_args()
+    if args.command == "report":
+        module = ENTRY_POINTS[args.entry]
+        print(format_report(module, profile_imports(module), top=args.top))
+        return 0
+
+    results, regressions = run_benchmark(args.history, repeats=args.repeats, tolerance=args.tolerance)
+    for entry, r in results.items():
+        baseline = "no baseline" if r["baseline"] is None else f"baseline {r['baseline']:.2f} s"
+        status = "REGRESSION" if entry in regressions else "ok"
+        print(f"{entry:>4} ({r['module']}): median {r['median']:.2f} s, min {r['min']:.2f} s, {baseline} [{status}]")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,22 @@ import numpy as np
 import websockets
 
 
+def _default_serializer(obj):
+    # Handle numpy arrays in the data
+    if isinstance(obj, np.ndarray):
+        obj = np.where(np.isnan(obj), None, obj)
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def encode_frame(data: Any) -> bytes:
+    """
+    Encode a frame of motion data as a JSON message.
+    :param data: A dictionary containing motion data. NaN values of numpy arrays are sent as null.
+    """
+    return json.dumps(data, default=_default_serializer).encode("utf-8")
+
+
 class MotionDataStreamer:
     def __init__(self, host: str = "localhost", port: int = 8765):
         """
@@ -76,12 +92,4 @@ class MotionDataStreamer:
         if not self.is_running:
             raise RuntimeError("The server is not running.")
 
-        # Handle numpy arrays in the data
-        def default_serializer(obj):
-            if isinstance(obj, np.ndarray):
-                obj = np.where(np.isnan(obj), None, obj)
-                return obj.tolist()
-            raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
-
-        message = json.dumps(data, default=default_serializer).encode("utf-8")
-        await self._broadcast(message)
+        await self._broadcast(encode_frame(data))
@@ -0,0 +1,180 @@
+"""The batch runner saves the state of each stage, resumes from it, and never changes the working directory."""
+
+import importlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import toml
+
+from TracX import batch
+from TracX.core import Experiment
+
+STAGES = ["pose2d", "association", "triangulation", "filtering"]
+METHODS = ["estimate_pose2d", "associate_persons", "reconstruct_3d", "filter_poses"]
+
+
+def import_pose2sim(module):
+    try:
+        return importlib.import_module(f"Pose2Sim.{module}")
+    except ModuleNotFoundError as e:
+        pytest.skip(f"{e.name} is not installed")
+
+
+@pytest.fixture
+def projects(tmp_path, monkeypatch):
+    """Directory of multiview experiments, opened by name by the batch runner."""
+    base_dir = tmp_path / "projects"
+    for name in ["walking", "running"]:
+        (base_dir / name).mkdir(parents=True)
+        (base_dir / name / "Config.toml").write_text('[project]\ntype = "multi3d"\n\n[pose]\npose_model = "HALPE_26"\n')
+    monkeypatch.setattr(batch.Experiment, "open", staticmethod(lambda name: Experiment.from_path(str(base_dir / name))))
+    return base_dir
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    """Stub processing stages, recording the stages run, the working directory and the saved state."""
+    calls = []
+    failing = set()
+
+    def make_stage(stage, method):
+        def run(experiment, *args):
+            with open(os.path.join(experiment.path, batch.STATE_FILE_NAME)) as f:
+                status = json.load(f)["stages"][stage]["status"]
+            calls.append({"experiment": experiment.name, "stage": stage, "args": args, "cwd": os.getcwd(), "status": status})
+            if stage in failing:
+                raise RuntimeError(f"{stage} failed")
+            return (1920, 1080) if method == "estimate_pose2d" else None
+
+        return run
+
+    for stage, method in zip(STAGES, METHODS):
+        monkeypatch.setattr(Experiment, method, make_stage(stage, method))
+    return calls, failing
+
+
+def read_state(projects, name):
+    with open(projects / name / batch.STATE_FILE_NAME) as f:
+        return json.load(f)
+
+
+def test_stages_run_in_order_and_state_is_saved(projects, stages, monkeypatch, tmp_path):
+    calls, _ = stages
+    monkeypatch.chdir(tmp_path / "projects")
+
+    summary = batch.process_experiment("walking")
+
+    assert os.getcwd() == str(tmp_path / "projects")
+    assert summary["status"] == batch.DONE
+    assert summary["ran"] == STAGES
+    assert [c["stage"] for c in calls] == STAGES
+    # Each stage is saved as running before it runs, in the working directory of the batch
+    assert {c["status"] for c in calls} == {batch.RUNNING}
+    assert {c["cwd"] for c in calls} == {str(tmp_path / "projects")}
+    assert calls[2]["args"] == (1920, 1080)
+    state = read_state(projects, "walking")
+    assert [state["stages"][s]["status"] for s in STAGES] == [batch.DONE] * 4
+    assert state["context"] == {"frames": 0, "res_w": 1920, "res_h": 1080}
+    assert not os.path.exists(projects / "walking" / (batch.STATE_FILE_NAME + ".tmp"))
+
+
+def test_failed_stage_is_resumed(projects, stages, monkeypatch, tmp_path):
+    calls, failing = stages
+    monkeypatch.chdir(tmp_path / "projects")
+    failing.add("triangulation")
+
+    summary = batch.process_experiment("walking")
+
+    assert os.getcwd() == str(tmp_path / "projects")
+    assert summary["status"] == batch.FAILED
+    assert summary["error"] == "triangulation: triangulation failed"
+    state = read_state(projects, "walking")
+    assert state["stages"]["triangulation"]["status"] == batch.FAILED
+    assert state["stages"]["triangulation"]["error"] == "triangulation failed"
+    assert "filtering" not in state["stages"]
+
+    calls.clear()
+    failing.clear()
+    summary = batch.process_experiment("walking")
+
+    assert summary["status"] == batch.DONE
+    assert summary["ran"] == ["triangulation", "filtering"]
+    # The resolution found by the first run is kept in the saved context
+    assert calls[0]["args"] == (1920, 1080)
+    assert "error" not in read_state(projects, "walking")["stages"]["triangulation"]
+
+    calls.clear()
+    assert batch.process_experiment("walking", force=True)["ran"] == STAGES
+
+
+def test_run_batch_report(projects, stages, monkeypatch, tmp_path):
+    _, failing = stages
+    monkeypatch.chdir(tmp_path)
+    failing.add("filtering")
+
+    report = batch.run_batch(["walking", "missing"], report_file=str(tmp_path / "report.json"))
+
+    assert os.getcwd() == str(tmp_path)
+    assert report["succeeded"] == 0 and report["failed"] == 2
+    assert report["experiments"]["missing"]["error"] == "Experiment missing not found"
+    assert sorted(report["stages"]) == ["association", "pose2d", "triangulation"]
+    with open(tmp_path / "report.json") as f:
+        assert json.load(f)["failed"] == 2
+
+
+def make_session(tmp_path, batch_layout):
+    """Trial directory, with its calibration in the trial or in the session of a batch."""
+    calib = {"cam01": {"name": "cam01", "matrix": [[1000, 0, 960], [0, 1000, 540], [0, 0, 1]], "translation": [0, 0, 4]}}
+    session_dir = tmp_path / "session"
+    trial_dir = session_dir / "trial" if batch_layout else session_dir
+    (trial_dir / "pose-associated").mkdir(parents=True)
+    (session_dir / "calibration").mkdir()
+    (session_dir / "calibration" / "Calib.toml").write_text(toml.dumps(calib))
+    (session_dir / "Config.toml").write_text("")
+    if batch_layout:
+        (trial_dir / "Config.toml").write_text("")
+    return str(trial_dir)
+
+
+@pytest.mark.parametrize("batch_layout", [False, True])
+def test_association_finds_calibration_from_any_working_directory(tmp_path, monkeypatch, caplog, batch_layout):
+    personAssociation = import_pose2sim("personAssociation")
+    project_dir = make_session(tmp_path, batch_layout)
+    (tmp_path / "elsewhere").mkdir()
+    monkeypatch.chdir(tmp_path / "elsewhere")
+    config = {
+        "project": {"project_dir": project_dir, "multi_person": False},
+        "personAssociation": {
+            "likelihood_threshold_association": 0.3,
+            "single_person": {"tracked_keypoint": "Neck", "reproj_error_threshold_association": 20},
+            "multi_person": {"reconstruction_error_threshold": 0.1, "min_affinity": 0.2},
+        },
+    }
+
+    with caplog.at_level("INFO"):
+        personAssociation.recap_tracking(config, error=[4.0, 4.0], nb_cams_excluded=[0, 1])
+
+    # 4 px at 4 m with a focal length of 1000 px
+    assert "roughly corresponds to 16.0 mm" in caplog.text
+
+
+@pytest.mark.parametrize("batch_layout", [False, True])
+def test_triangulation_finds_calibration_from_any_working_directory(tmp_path, monkeypatch, caplog, batch_layout):
+    triangulation = import_pose2sim("triangulation")
+    project_dir = make_session(tmp_path, batch_layout)
+    (tmp_path / "elsewhere").mkdir()
+    monkeypatch.chdir(tmp_path / "elsewhere")
+    config = {
+        "project": {"project_dir": project_dir},
+        "triangulation": {"show_interp_indices": False, "interpolation": "linear", "make_c3d": False},
+    }
+    error = pd.DataFrame(np.full((5, 2), 4.0), columns=["Neck", "mean"])
+    nb_cams_excluded = pd.DataFrame(np.zeros((5, 2)), columns=["Neck", "mean"])
+
+    with caplog.at_level("INFO"):
+        triangulation.recap_triangulate(config, [error], [nb_cams_excluded], ["Neck"], [{0: 0}], [[[]]], [[[]]], ["trial.trc"])
+
+    assert "roughly corresponds to 16.0 mm" in caplog.text
@@ -0,0 +1,31 @@
+"""The benchmark scores triangulated people against the ground truth of everyone in the scene."""
+
+import numpy as np
+import pytest
+
+from TracX import benchmark
+
+try:
+    from Pose2Sim import common, filtering, personAssociation, triangulation  # noqa: F401
+except ModuleNotFoundError as e:
+    pytest.skip(f"{e.name} is not installed", allow_module_level=True)
+
+
+def test_project_session_returns_all_people():
+    rng = np.random.default_rng(0)
+    motion = benchmark.synthetic_motion(10, 2, rng=rng)
+    calib = benchmark.ring_cameras(4)
+
+    coords, truth = benchmark.project_session(motion, calib, extra_people=2, rng=0)
+
+    assert coords.shape == (4, 10, 4, 26, 3)
+    assert truth.shape == (10, 4, 26, 3)
+    np.testing.assert_array_equal(truth[:, :2], motion)
+
+
+@pytest.mark.parametrize("extra_people", [0, 1])
+def test_error_is_near_noise_level_with_extra_people(tmp_path, extra_people):
+    result = benchmark.run_scale(4, 2, 30, extra_people=extra_people, work_dir=str(tmp_path))
+
+    # One pixel of noise is a few millimeters at the distance of the cameras
+    assert result["error"] < 10
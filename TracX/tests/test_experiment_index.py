@@ -0,0 +1,145 @@
+"""The experiment index lists experiments and reads again only those that changed."""
+
+import json
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from TracX.core import experiment_index
+from TracX.core.experiment_index import ExperimentIndex
+
+
+def write_video(path, nb_frames=15):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (32, 32))
+    if not writer.isOpened():
+        pytest.skip("No MJPG video encoder")
+    for _ in range(nb_frames):
+        writer.write(np.zeros((32, 32, 3), dtype=np.uint8))
+    writer.release()
+
+
+def make_experiment(base_dir, name, project_type="multi3d", pose_model="body_with_feet", videos=()):
+    path = base_dir / name
+    (path / "videos").mkdir(parents=True)
+    (path / "Config.toml").write_text(f'[project]\ntype = "{project_type}"\n\n[pose]\npose_model = "{pose_model}"\n')
+    for video in videos:
+        write_video(path / "videos" / video)
+    return path
+
+
+def touch(path):
+    """Advance the modification time of a path, which is coarse on some file systems."""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def projects(tmp_path):
+    base_dir = tmp_path / "projects"
+    make_experiment(base_dir, "walking", videos=["cam1.avi", "cam2.avi"])
+    make_experiment(base_dir, "running", project_type="mono2d", pose_model="whole_body")
+    (base_dir / "not_an_experiment").mkdir()
+    return base_dir
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Paths of the experiments read, and of the videos opened."""
+    reads = {"experiments": [], "videos": []}
+    read_entry = experiment_index.read_entry
+    video_capture = cv2.VideoCapture
+
+    def counting_read_entry(path, signature, previous=None):
+        reads["experiments"].append(os.path.basename(path))
+        return read_entry(path, signature, previous)
+
+    def counting_video_capture(path):
+        reads["videos"].append(os.path.basename(path))
+        return video_capture(path)
+
+    monkeypatch.setattr(experiment_index, "read_entry", counting_read_entry)
+    monkeypatch.setattr(experiment_index.cv2, "VideoCapture", counting_video_capture)
+    return reads
+
+
+def test_list_entries(projects, tmp_path):
+    index = ExperimentIndex(projects, str(tmp_path / "index.json"))
+
+    entries = index.list()
+
+    assert [e["name"] for e in entries] == ["running", "walking"]
+    running, walking = entries
+    assert running["is_2d"] and running["monocular"]
+    assert running["state"] == experiment_index.EMPTY
+    assert walking["path"] == str(projects / "walking")
+    assert walking["pose_model"] == "body_with_feet"
+    assert walking["state"] == experiment_index.READY
+    assert [v["name"] for v in walking["videos"]] == ["cam1.avi", "cam2.avi"]
+    assert walking["videos"][0]["frames"] == 15
+    assert walking["duration"] == pytest.approx(1.0)
+
+
+def test_query(projects, tmp_path):
+    index = ExperimentIndex(projects, str(tmp_path / "index.json"))
+
+    assert [e["name"] for e in index.list(query="WHOLE")] == ["running"]
+    assert [e["name"] for e in index.list(query="cam2")] == ["walking"]
+    assert [e["name"] for e in index.list(query="ready")] == ["walking"]
+    assert index.list(query="jumping") == []
+
+
+def test_only_changed_experiments_are_read_again(projects, tmp_path, reads):
+    index = ExperimentIndex(projects, str(tmp_path / "index.json"))
+    index.list()
+    assert sorted(reads["experiments"]) == ["running", "walking"]
+    assert sorted(reads["videos"]) == ["cam1.avi", "cam2.avi"]
+
+    reads["experiments"].clear()
+    reads["videos"].clear()
+    assert index.refresh() is False
+    assert reads["experiments"] == []
+
+    # A new video is opened, the other videos keep their metadata
+    write_video(projects / "walking" / "videos" / "cam3.avi")
+    touch(projects / "walking" / "videos")
+    assert index.refresh() is True
+    assert reads["experiments"] == ["walking"]
+    assert reads["videos"] == ["cam3.avi"]
+    assert len(index.get("walking", refresh=False)["videos"]) == 3
+
+
+def test_config_and_batch_state_changes_are_detected(projects, tmp_path):
+    index = ExperimentIndex(projects, str(tmp_path / "index.json"))
+    index.list()
+
+    (projects / "walking" / "Config.toml").write_text('[project]\ntype = "multi3d"\n\n[pose]\npose_model = "hand"\n')
+    touch(projects / "walking" / "Config.toml")
+    (projects / "running" / "batch_state.json").write_text(json.dumps({"stages": {"pose": "running"}}))
+    touch(projects / "running")
+
+    assert index.get("walking")["pose_model"] == "hand"
+    assert index.get("running")["state"] == experiment_index.RUNNING
+
+
+def test_catalog_is_reused_by_new_index(projects, tmp_path, reads):
+    ExperimentIndex(projects, str(tmp_path / "index.json")).list()
+    reads["experiments"].clear()
+
+    entries = ExperimentIndex(projects, str(tmp_path / "index.json")).list()
+
+    assert reads["experiments"] == []
+    assert [e["name"] for e in entries] == ["running", "walking"]
+
+
+def test_deleted_and_broken_experiments_are_removed(projects, tmp_path):
+    index = ExperimentIndex(projects, str(tmp_path / "index.json"))
+    index.list()
+
+    shutil.rmtree(projects / "running")
+    (projects / "walking" / "Config.toml").write_text("not toml [")
+    touch(projects / "walking" / "Config.toml")
+
+    assert index.list() == []
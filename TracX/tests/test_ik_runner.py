@@ -0,0 +1,104 @@
+"""IK windows cover the trial, and their outputs are crossfaded back into the input motion."""
+
+import numpy as np
+import pytest
+
+from TracX.ik_runner import crossfade_weights, plan_chunks, stitch_mot_chunks
+from TracX.motion_io import read_mot, write_mot
+
+COLUMNS = ["time", "pelvis_tilt", "hip_flexion_r", "knee_angle_r"]
+PLANS = [(300, 2.0, 1.0), (301, 1.5, 0.5), (95, 1.0, 0.3), (50, 2.0, 1.0), (200, 1.0, 0.0), (200, 0, 1.0)]
+
+
+def motion(nb_frames, rate=30):
+    times = np.arange(nb_frames) / rate
+    angles = np.column_stack([np.sin(times * k) * 30 for k in range(1, len(COLUMNS))])
+    return times, angles
+
+
+@pytest.mark.parametrize(("nb_frames", "chunk_duration", "overlap"), PLANS)
+def test_chunks_cover_the_trial(nb_frames, chunk_duration, overlap):
+    chunks = plan_chunks(np.arange(nb_frames) / 30, chunk_duration, overlap)
+
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == nb_frames
+    for (_, stop), (start, _) in zip(chunks, chunks[1:]):
+        # Consecutive windows overlap by the overlap duration, or at least touch
+        assert start <= stop
+        assert stop - start == pytest.approx(overlap * 30, abs=1)
+
+
+@pytest.mark.parametrize(("nb_frames", "chunk_duration", "overlap"), PLANS)
+def test_crossfade_weights_sum_to_one(nb_frames, chunk_duration, overlap):
+    chunks = plan_chunks(np.arange(nb_frames) / 30, chunk_duration, overlap)
+
+    weights = crossfade_weights(chunks, nb_frames)
+
+    np.testing.assert_allclose(weights.sum(axis=0), 1)
+    for c, (start, stop) in enumerate(chunks):
+        assert np.all(weights[c, :start] == 0) and np.all(weights[c, stop:] == 0)
+        assert np.all(weights[c, start:stop] > 0)
+    # Weights ramp up into a window and down out of it
+    for c in range(len(chunks) - 1):
+        overlap_frames = slice(chunks[c + 1][0], chunks[c][1])
+        assert np.all(np.diff(weights[c, overlap_frames]) < 0)
+        assert np.all(np.diff(weights[c + 1, overlap_frames]) > 0)
+
+
+def write_chunks(tmp_path, times, angles, chunks, offsets=None):
+    """Write the .mot file of each window, with times rounded as OpenSim does."""
+    mot_files = []
+    for c, (start, stop) in enumerate(chunks):
+        offset = 0 if offsets is None else offsets[c]
+        data = np.column_stack([np.round(times[start:stop], 4), angles[start:stop] + offset])
+        mot_files.append(str(tmp_path / f"chunk{c}.mot"))
+        write_mot(mot_files[-1], data, COLUMNS)
+    return mot_files
+
+
+@pytest.mark.parametrize(("nb_frames", "chunk_duration", "overlap"), PLANS)
+def test_stitched_chunks_reproduce_the_input(tmp_path, nb_frames, chunk_duration, overlap):
+    times, angles = motion(nb_frames)
+    chunks = plan_chunks(times, chunk_duration, overlap)
+    mot_files = write_chunks(tmp_path, times, angles, chunks)
+
+    stitch_mot_chunks(mot_files, chunks, times, tmp_path / "trial.mot")
+
+    header, columns, data = read_mot(tmp_path / "trial.mot")
+    assert columns == COLUMNS
+    assert f"nRows={nb_frames}" in header
+    np.testing.assert_array_equal(data[:, 0], times)
+    np.testing.assert_allclose(data[:, 1:], angles, atol=1e-9)
+
+
+def test_overlaps_are_blended_linearly(tmp_path):
+    times, angles = motion(200)
+    chunks = plan_chunks(times, 2.0, 1.0)
+    assert len(chunks) == 3
+    mot_files = write_chunks(tmp_path, times, angles, chunks, offsets=[0, 1, 2])
+
+    stitch_mot_chunks(mot_files, chunks, times, tmp_path / "trial.mot")
+
+    _, _, data = read_mot(tmp_path / "trial.mot")
+    offset = data[:, 1:] - angles
+    np.testing.assert_allclose(offset, offset[:, :1].repeat(offset.shape[1], axis=1), atol=1e-9)
+    weights = crossfade_weights(chunks, len(times))
+    np.testing.assert_allclose(offset[:, 0], weights[1] + 2 * weights[2], atol=1e-9)
+    # Each window alone outside the overlaps
+    np.testing.assert_allclose(offset[: chunks[1][0], 0], 0, atol=1e-9)
+    np.testing.assert_allclose(offset[chunks[1][1] :, 0], 2, atol=1e-9)
+
+
+def test_frames_without_solved_window_are_nan(tmp_path):
+    times, angles = motion(150)
+    chunks = plan_chunks(times, 2.0, 0.0)
+    mot_files = write_chunks(tmp_path, times, angles, chunks)
+
+    # The last window failed to solve its last frames
+    _, _, data = read_mot(mot_files[-1])
+    write_mot(mot_files[-1], data[:-10], COLUMNS)
+    stitch_mot_chunks(mot_files, chunks, times, tmp_path / "trial.mot")
+
+    _, _, stitched = read_mot(tmp_path / "trial.mot")
+    assert np.isnan(stitched[-10:, 1:]).all()
+    np.testing.assert_allclose(stitched[:-10, 1:], angles[:-10], atol=1e-9)
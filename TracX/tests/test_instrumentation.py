@@ -0,0 +1,122 @@
+"""Spans and counters are recorded when instrumentation is enabled, and cost nothing otherwise."""
+
+import json
+
+import pytest
+
+from TracX import instrumentation
+
+
+@pytest.fixture
+def enabled():
+    was_enabled = instrumentation.is_enabled()
+    instrumentation.reset()
+    instrumentation.enable()
+    yield
+    instrumentation.reset()
+    if not was_enabled:
+        instrumentation.disable()
+
+
+@pytest.fixture
+def disabled():
+    was_enabled = instrumentation.is_enabled()
+    instrumentation.reset()
+    instrumentation.disable()
+    yield
+    instrumentation.reset()
+    if was_enabled:
+        instrumentation.enable()
+
+
+def test_spans_are_aggregated_by_name(enabled):
+    for frame in range(3):
+        with instrumentation.span("pose", frame=frame):
+            pass
+    with instrumentation.span("triangulation"):
+        pass
+
+    spans = instrumentation.summary()["spans"]
+
+    assert sorted(spans) == ["pose", "triangulation"]
+    assert spans["pose"]["count"] == 3
+    assert spans["pose"]["mean"] == pytest.approx(spans["pose"]["total"] / 3)
+    assert spans["pose"]["max"] <= spans["pose"]["total"]
+    assert spans["triangulation"]["count"] == 1
+
+
+def test_instrumented_function_is_timed(enabled):
+    @instrumentation.instrumented()
+    def solve(x):
+        return 2 * x
+
+    assert solve(3) == 6
+    assert list(instrumentation.summary()["spans"]) == [solve.__qualname__]
+
+
+def test_counters_keep_totals(enabled):
+    for _ in range(1000):
+        instrumentation.count("svd")
+    instrumentation.count("json_bytes", 512)
+    instrumentation.count("json_bytes", 256)
+
+    assert instrumentation.summary()["counters"] == {"svd": 1000, "json_bytes": 768}
+    assert "svd: 1000" in instrumentation.format_summary()
+
+
+def test_counters_are_sampled_when_spans_end(enabled, tmp_path):
+    for _ in range(2):
+        with instrumentation.span("frame"):
+            for _ in range(100):
+                instrumentation.count("svd")
+    instrumentation.count("frames", 2)
+
+    instrumentation.export_json(tmp_path / "profile.json")
+    with open(tmp_path / "profile.json") as f:
+        samples = json.load(f)["counters"]
+    instrumentation.export_chrome_trace(tmp_path / "trace.json")
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+
+    # One sample per span end, and one for the counts after the last span
+    assert [(s["name"], s["value"]) for s in samples] == [("svd", 100), ("svd", 200), ("frames", 2)]
+    assert [e["args"] for e in events if e["ph"] == "C"] == [{"svd": 100}, {"svd": 200}, {"frames": 2}]
+
+
+def test_disabled_mode_records_nothing(disabled, tmp_path):
+    span = instrumentation.span("pose", frame=0)
+    with span:
+        instrumentation.count("svd")
+
+    @instrumentation.instrumented("solve")
+    def solve():
+        return 1
+
+    assert solve() == 1
+    assert span is instrumentation.span("other")
+    assert instrumentation.summary() == {"spans": {}, "counters": {}}
+    assert instrumentation.format_summary() == []
+    assert instrumentation.export_experiment(str(tmp_path)) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_reset_discards_spans_and_counters(enabled):
+    with instrumentation.span("pose"):
+        instrumentation.count("svd")
+
+    instrumentation.reset()
+
+    assert instrumentation.summary() == {"spans": {}, "counters": {}}
+
+
+def test_export_experiment(enabled, tmp_path):
+    with instrumentation.span("pose"):
+        instrumentation.count("frames")
+
+    profile_dir = instrumentation.export_experiment(str(tmp_path))
+
+    assert profile_dir == str(tmp_path / instrumentation.PROFILE_DIR_NAME)
+    with open(tmp_path / "profile" / "profile.json") as f:
+        assert json.load(f)["summary"]["counters"] == {"frames": 1}
+    with open(tmp_path / "profile" / "trace.json") as f:
+        assert {e["name"] for e in json.load(f)["traceEvents"]} == {"pose", "frames"}
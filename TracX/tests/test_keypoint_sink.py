@@ -0,0 +1,80 @@
+"""KeypointSink writes every queued file, with the last content submitted for it."""
+
+import json
+import os
+
+import pytest
+
+from TracX.keypoint_sink import KeypointSink, extract_container, read_container
+
+
+def frame(i):
+    return {"version": 1.3, "people": [{"pose_keypoints_2d": [i, i + 0.5, 0.9]}]}
+
+
+@pytest.mark.parametrize("fsync", [False, True])
+def test_writes_json_files(tmp_path, fsync):
+    with KeypointSink(fsync=fsync, batch_size=8) as sink:
+        for i in range(50):
+            sink.write(tmp_path / "cam1" / f"frame_{i:06d}.json", frame(i))
+
+    files = sorted(os.listdir(tmp_path / "cam1"))
+    assert len(files) == 50
+    for i, name in enumerate(files):
+        with open(tmp_path / "cam1" / name) as f:
+            assert json.load(f) == frame(i)
+
+
+def test_last_write_of_a_file_wins(tmp_path):
+    path = tmp_path / "frame.json"
+    with KeypointSink(max_pending=4, batch_size=2) as sink:
+        for i in range(20):
+            sink.write(path, frame(i))
+
+    with open(path) as f:
+        assert json.load(f) == frame(19)
+
+
+def test_flush_waits_for_queued_files(tmp_path):
+    with KeypointSink() as sink:
+        sink.write(tmp_path / "frame.json", frame(0))
+        sink.flush()
+        assert (tmp_path / "frame.json").exists()
+
+
+@pytest.mark.parametrize("container", ["ndjson", "zip"])
+def test_containers_round_trip(tmp_path, container):
+    with KeypointSink(container=container) as sink:
+        for i in range(10):
+            sink.write(tmp_path / "cam1" / f"frame_{i:06d}.json", frame(i))
+        sink.write(tmp_path / "cam1" / "frame_000003.json", frame(30))
+
+    files = read_container(str(tmp_path / f"cam1.{container}"))
+    assert list(files) == [f"frame_{i:06d}.json" for i in [0, 1, 2, 4, 5, 6, 7, 8, 9, 3]]
+    assert files["frame_000003.json"] == frame(30)
+
+    directory = extract_container(str(tmp_path / f"cam1.{container}"), str(tmp_path / "extracted"))
+    with open(os.path.join(directory, "frame_000005.json")) as f:
+        assert json.load(f) == frame(5)
+
+
+def test_write_errors_are_raised(tmp_path):
+    (tmp_path / "file").write_text("")
+    sink = KeypointSink()
+    # The parent of the JSON file is a file
+    sink.write(tmp_path / "file" / "frame.json", frame(0))
+    with pytest.raises(RuntimeError, match="Writing keypoint files failed"):
+        sink.flush()
+    sink.close()
+
+
+def test_write_after_close_raises(tmp_path):
+    sink = KeypointSink()
+    sink.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        sink.write(tmp_path / "frame.json", frame(0))
+
+
+def test_unknown_container():
+    with pytest.raises(ValueError, match="Unknown container"):
+        KeypointSink(container="csv")
@@ -0,0 +1,66 @@
+"""TRC and MOT files are written like pandas wrote them and read back exactly."""
+
+import numpy as np
+import pandas as pd
+
+from TracX.motion_io import read_mot, read_trc_data, trc_header, write_mot, write_trc
+
+MARKERS = ["Hip", "RKnee", "LKnee"]
+
+
+def make_coords():
+    rng = np.random.default_rng(0)
+    coords = pd.DataFrame(rng.normal(size=(50, 9)) * ([1e-7, 1, 1e5] * 3), index=np.arange(10, 60))
+    coords.iloc[3, 4] = np.nan
+    coords.iloc[7, :3] = np.nan
+    coords.insert(0, "Time", np.arange(50) / 30)
+    return coords
+
+
+def test_write_trc_matches_pandas(tmp_path):
+    coords = make_coords()
+    header = trc_header("trial.trc", MARKERS, 30, len(coords))
+    with open(tmp_path / "pandas.trc", "w") as f:
+        f.writelines(line + "\n" for line in header)
+        coords.to_csv(f, sep="\t", index=True, header=None, lineterminator="\n")
+
+    write_trc(tmp_path / "trial.trc", np.column_stack([coords.index, coords]), header)
+
+    assert (tmp_path / "trial.trc").read_text() == (tmp_path / "pandas.trc").read_text()
+
+
+def test_trc_round_trip(tmp_path):
+    coords = make_coords()
+    data = np.column_stack([coords.index, coords])
+    write_trc(tmp_path / "trial.trc", data, trc_header("trial.trc", MARKERS, 30, len(coords)))
+
+    header, read_data = read_trc_data(tmp_path / "trial.trc")
+
+    assert header["marker_names"] == MARKERS
+    np.testing.assert_array_equal(read_data, data)
+
+
+def test_trc_cache_is_used_until_the_file_changes(tmp_path):
+    coords = make_coords()
+    header = trc_header("trial.trc", MARKERS, 30, len(coords))
+    write_trc(tmp_path / "trial.trc", np.column_stack([coords.index, coords]), header)
+    _, data = read_trc_data(tmp_path / "trial.trc", cache=True)
+    assert (tmp_path / "trial.trc.npz").exists()
+
+    write_trc(tmp_path / "trial.trc", data[:10], header)
+
+    assert not (tmp_path / "trial.trc.npz").exists()
+    np.testing.assert_array_equal(read_trc_data(tmp_path / "trial.trc")[1], data[:10])
+
+
+def test_write_mot_matches_pandas(tmp_path):
+    angles = make_coords().reset_index(drop=True).rename(columns=lambda c: str(c).lower())
+    write_mot(tmp_path / "angles.mot", angles.to_numpy(), list(angles.columns))
+
+    _, column_names, data = read_mot(tmp_path / "angles.mot")
+    lines = (tmp_path / "angles.mot").read_text().splitlines()
+
+    assert column_names == list(angles.columns)
+    np.testing.assert_array_equal(data, angles.to_numpy())
+    rows = angles.to_csv(sep="\t", index=False, header=None, lineterminator="\n").splitlines()
+    assert lines[-len(rows) :] == rows
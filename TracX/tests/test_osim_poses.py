@@ -0,0 +1,83 @@
+"""Body transforms convert to Euler angles and back, and pose streams read back exactly."""
+
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from TracX.motion_io import write_mot
+
+try:
+    from TracX.osim_poses import H_ZUP, euler_from_transforms, open_stream, read_motion
+except ModuleNotFoundError as e:
+    pytest.skip(f"{e.name} is not installed", allow_module_level=True)
+
+
+def transforms_from_euler(angles, translations):
+    """Homogeneous transforms of XYZ Euler angles, rotating about x first, as Blender does."""
+    transforms = np.zeros((*angles.shape[:-1], 4, 4))
+    transforms[..., :3, :3] = Rotation.from_euler("xyz", angles.reshape(-1, 3)).as_matrix().reshape(*angles.shape, 3)
+    transforms[..., :3, 3] = translations
+    transforms[..., 3, 3] = 1
+    return transforms
+
+
+def test_euler_angles_round_trip():
+    rng = np.random.default_rng(0)
+    angles = rng.uniform(-np.pi, np.pi, (50, 4, 3))
+    angles[..., 1] /= 2.01  # y within (-pi/2, pi/2), where XYZ angles are unique
+    transforms = transforms_from_euler(angles, rng.normal(size=(50, 4, 3)))
+
+    np.testing.assert_allclose(euler_from_transforms(transforms), angles, atol=1e-9)
+
+
+def test_euler_angles_of_singular_rotations_give_the_same_rotation():
+    angles = np.array([[0.3, np.pi / 2, -0.4], [-1.2, -np.pi / 2, 0.5]])
+    transforms = transforms_from_euler(angles, np.zeros((2, 3)))
+
+    euler = euler_from_transforms(transforms)
+
+    np.testing.assert_allclose(euler[:, 2], 0)
+    np.testing.assert_allclose(transforms_from_euler(euler, np.zeros((2, 3))), transforms, atol=1e-9)
+
+
+def test_z_up_conversion_round_trip():
+    rng = np.random.default_rng(1)
+    angles = rng.uniform(-1, 1, (10, 3))
+    transforms = transforms_from_euler(angles, rng.normal(size=(10, 3)))
+
+    z_up = H_ZUP @ transforms
+
+    # y-up points are z-up, and the inverse conversion gives back the OpenSim transforms
+    np.testing.assert_allclose(z_up[:, 2, 3], transforms[:, 1, 3])
+    np.testing.assert_allclose(np.linalg.inv(H_ZUP) @ z_up, transforms, atol=1e-12)
+    np.testing.assert_allclose(np.linalg.det(z_up[:, :3, :3]), 1)
+
+
+@pytest.mark.parametrize("extension", [".npy", ".csv"])
+def test_stream_round_trip(tmp_path, extension):
+    rows = np.random.default_rng(2).normal(size=(25, 7)) * 1e3
+    path = str(tmp_path / f"poses{extension}")
+
+    with open_stream(path, len(rows), rows.shape[1], header="time,a,b") as write:
+        for start in range(0, len(rows), 10):
+            write(rows[start : start + 10])
+
+    if extension == ".npy":
+        np.testing.assert_array_equal(np.load(path), rows)
+    else:
+        with open(path) as f:
+            assert f.readline() == "# time,a,b\n"
+        np.testing.assert_array_equal(np.loadtxt(path, delimiter=","), rows)
+
+
+@pytest.mark.parametrize("in_degrees", [True, False])
+def test_read_motion(tmp_path, in_degrees):
+    data = np.column_stack([np.arange(5) / 30, np.random.default_rng(3).normal(size=(5, 2))])
+    write_mot(tmp_path / "motion.mot", data, ["time", "hip_flexion_r", "pelvis_tx"], in_degrees=in_degrees)
+
+    times, coordinate_names, values, degrees = read_motion(tmp_path / "motion.mot")
+
+    assert degrees == in_degrees
+    assert coordinate_names == ["hip_flexion_r", "pelvis_tx"]
+    np.testing.assert_array_equal(times, data[:, 0])
+    np.testing.assert_array_equal(values, data[:, 1:])
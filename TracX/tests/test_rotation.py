@@ -0,0 +1,156 @@
+"""Videos are rotated clockwise, by changing their display rotation or by encoding rotated frames."""
+
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from TracX.core import rotation
+from TracX.core.rotation import (
+    ROTATE_CODES,
+    rotate_files,
+    rotate_video_monocular,
+    rotate_videos,
+    transcode_rotated,
+)
+
+WIDTH, HEIGHT, NB_FRAMES = 96, 64, 10
+
+
+def write_video(path, fourcc="mp4v"):
+    """Video with a distinct block in each quadrant, so that every rotation reads differently."""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), 30, (WIDTH, HEIGHT))
+    if not writer.isOpened():
+        pytest.skip(f"No {fourcc} video encoder")
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    frame[: HEIGHT // 2, : WIDTH // 2] = (255, 0, 0)
+    frame[: HEIGHT // 2, WIDTH // 2 :] = (0, 255, 0)
+    frame[HEIGHT // 2 :, : WIDTH // 2] = (0, 0, 255)
+    for _ in range(NB_FRAMES):
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+def read_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def assert_rotated(rotated_file, video_file, clockwise):
+    original = read_frames(video_file)
+    rotated = read_frames(rotated_file)
+    assert len(rotated) == len(original) == NB_FRAMES
+    for frame, expected in zip(rotated, original):
+        expected = cv2.rotate(expected, ROTATE_CODES[clockwise])
+        assert frame.shape == expected.shape
+        # Frames encoded again are only close to the rotated original
+        assert np.abs(frame.astype(int) - expected).mean() < 8
+
+
+@pytest.fixture
+def ffmpeg(tmp_path, monkeypatch):
+    """Make an ffmpeg executable available, from the system or from imageio-ffmpeg."""
+    if not shutil.which("ffmpeg"):
+        imageio_ffmpeg = pytest.importorskip("imageio_ffmpeg")
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        os.symlink(imageio_ffmpeg.get_ffmpeg_exe(), bin_dir / "ffmpeg")
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+
+
+@pytest.fixture
+def no_ffmpeg(monkeypatch):
+    monkeypatch.setattr(rotation.shutil, "which", lambda name: None)
+
+
+@pytest.mark.parametrize("clockwise", [90, 180, 270])
+def test_pixels_are_rotated(tmp_path, clockwise):
+    video = write_video(tmp_path / "video.mp4")
+
+    stats = transcode_rotated(video, str(tmp_path / "rotated.mp4"), clockwise)
+
+    assert stats["method"] == "pixels"
+    assert stats["frames"] == NB_FRAMES
+    assert_rotated(stats["output"], video, clockwise)
+
+
+@pytest.mark.parametrize("clockwise", [90, 180, 270])
+def test_metadata_is_rotated(tmp_path, ffmpeg, clockwise):
+    video = write_video(tmp_path / "video.mp4")
+
+    stats = transcode_rotated(video, str(tmp_path / "rotated.mp4"), clockwise, metadata_only=True)
+
+    if stats["method"] != "metadata":
+        pytest.skip("OpenCV does not apply the display rotation of videos")
+    assert stats["frames"] == NB_FRAMES
+    # The streams are copied: frames read exactly as the rotated original frames
+    for frame, original in zip(read_frames(stats["output"]), read_frames(video)):
+        np.testing.assert_array_equal(frame, cv2.rotate(original, ROTATE_CODES[clockwise]))
+
+
+@pytest.mark.parametrize("clockwise", [90, 180, 270])
+def test_pixels_are_rotated_without_ffmpeg(tmp_path, no_ffmpeg, clockwise):
+    video = write_video(tmp_path / "video.mp4")
+
+    stats = transcode_rotated(video, str(tmp_path / "rotated.mp4"), clockwise, metadata_only=True)
+
+    assert stats["method"] == "pixels"
+    assert_rotated(stats["output"], video, clockwise)
+
+
+def test_unsupported_angle(tmp_path):
+    with pytest.raises(ValueError, match="not supported"):
+        transcode_rotated(write_video(tmp_path / "video.mp4"), str(tmp_path / "rotated.mp4"), 45)
+
+
+def test_rotate_files_keeps_job_order(tmp_path, no_ffmpeg):
+    jobs = [
+        (write_video(tmp_path / f"video{i}.mp4"), str(tmp_path / "rotated" / f"video{i}.mp4"), clockwise)
+        for i, clockwise in enumerate([270, 90, 180])
+    ]
+
+    stats = rotate_files(jobs, metadata_only=True, workers=3)
+
+    assert [s["output"] for s in stats] == [job[1] for job in jobs]
+    for video, rotated, clockwise in jobs:
+        assert_rotated(rotated, video, clockwise)
+
+
+def write_camera_parameters(path, rotations):
+    cameras = "".join(f'<camera serial="{serial}" viewrotation="{rot}"/>' for serial, rot in rotations.items())
+    path.write_text(f"<calibration><cameras>{cameras}</cameras></calibration>")
+    return str(path)
+
+
+@pytest.mark.parametrize("metadata_only", [False, True])
+def test_rotate_videos_uses_clockwise_view_rotation(tmp_path, request, metadata_only):
+    if metadata_only:
+        request.getfixturevalue("ffmpeg")
+    rotations = {"28491": 90, "28492": 270, "28493": 180}
+    videos = [write_video(tmp_path / f"cam_{serial}.mp4") for serial in rotations]
+    camera_parameters = write_camera_parameters(tmp_path / "camera_parameters.qca.txt", rotations)
+
+    stats = rotate_videos(videos, str(tmp_path / "rotated"), camera_parameters, metadata_only=metadata_only)
+
+    assert [os.path.basename(s["output"]) for s in stats] == [f"cam_{serial}_rot.mp4" for serial in rotations]
+    for video, s, clockwise in zip(videos, stats, rotations.values()):
+        assert_rotated(s["output"], video, clockwise)
+
+
+def test_monocular_rotation_is_counterclockwise(tmp_path, no_ffmpeg):
+    video = write_video(tmp_path / "video.mp4")
+
+    (stats,) = rotate_video_monocular([video], str(tmp_path / "rotated"), 90)
+
+    assert stats["output"] == str(tmp_path / "rotated" / "video_rot.mp4")
+    assert_rotated(stats["output"], video, 270)
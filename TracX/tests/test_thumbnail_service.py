@@ -0,0 +1,105 @@
+"""Video thumbnails are extracted once, cached on disk, and delivered by the service."""
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+try:
+    from PyQt6.QtCore import QCoreApplication, QEventLoop, QTimer
+
+    from TracX.ui.common import thumbnail_service
+    from TracX.ui.common.thumbnail_service import ThumbnailService, extract_thumbnail
+except ModuleNotFoundError as e:
+    # Qt bindings
+    pytest.skip(f"{e.name} is not installed", allow_module_level=True)
+
+
+def write_video(path, value=100, nb_frames=15):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 30, (80, 40))
+    if not writer.isOpened():
+        pytest.skip("No MJPG video encoder")
+    for _ in range(nb_frames):
+        writer.write(np.full((40, 80, 3), (value, 0, 0), dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+
+def test_extract_thumbnail(tmp_path):
+    video = write_video(tmp_path / "video.avi")
+
+    thumbnail, metadata = extract_thumbnail(video, 32, str(tmp_path / "cache"))
+
+    assert thumbnail.shape == (32, 32, 3)
+    # RGB order
+    assert thumbnail[..., 2].mean() == pytest.approx(100, abs=3)
+    assert metadata == {"width": 80, "height": 40, "fps": 30.0, "duration": 0.5}
+
+
+def test_cached_thumbnail_does_not_open_video(tmp_path, monkeypatch):
+    video = write_video(tmp_path / "video.avi")
+    expected = extract_thumbnail(video, 32, str(tmp_path / "cache"))
+
+    def video_capture(path):
+        raise AssertionError("The video was opened")
+
+    monkeypatch.setattr(thumbnail_service.cv2, "VideoCapture", video_capture)
+    thumbnail, metadata = extract_thumbnail(video, 32, str(tmp_path / "cache"))
+
+    np.testing.assert_array_equal(thumbnail, expected[0])
+    assert metadata == expected[1]
+
+
+def test_modified_video_is_extracted_again(tmp_path):
+    video = write_video(tmp_path / "video.avi", value=100)
+    extract_thumbnail(video, 32, str(tmp_path / "cache"))
+
+    write_video(tmp_path / "video.avi", value=200, nb_frames=30)
+    stat = os.stat(video)
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    thumbnail, metadata = extract_thumbnail(video, 32, str(tmp_path / "cache"))
+
+    assert thumbnail[..., 2].mean() == pytest.approx(200, abs=3)
+    assert metadata["duration"] == 1.0
+    assert len(os.listdir(tmp_path / "cache")) == 4
+
+
+def test_unreadable_video_raises(tmp_path):
+    (tmp_path / "video.avi").write_bytes(b"not a video")
+
+    with pytest.raises(ValueError, match="Failed to open video"):
+        extract_thumbnail(str(tmp_path / "video.avi"), 32, str(tmp_path / "cache"))
+    assert not os.path.exists(tmp_path / "cache")
+
+
+def test_service_delivers_results(tmp_path):
+    app = QCoreApplication.instance() or QCoreApplication([])  # noqa: F841
+    videos = [write_video(tmp_path / f"video{i}.avi", value=50 * i) for i in range(1, 4)]
+    (tmp_path / "broken.avi").write_bytes(b"not a video")
+    service = ThumbnailService(max_workers=2, cache_dir=str(tmp_path / "cache"))
+    ready, failed = {}, []
+    loop = QEventLoop()
+
+    def on_ready(path, thumbnail, metadata):
+        ready[path] = thumbnail
+        if len(ready) == len(videos) and failed:
+            loop.quit()
+
+    def on_failed(path):
+        failed.append(path)
+        if len(ready) == len(videos):
+            loop.quit()
+
+    service.ready.connect(on_ready)
+    service.failed.connect(on_failed)
+    for path in [*videos, str(tmp_path / "broken.avi")]:
+        service.request(path, 16)
+    QTimer.singleShot(10000, loop.quit)
+    loop.exec()
+
+    assert sorted(ready) == videos
+    assert failed == [str(tmp_path / "broken.avi")]
+    for i, path in enumerate(videos, 1):
+        assert ready[path].shape == (16, 16, 3)
+        assert ready[path][..., 2].mean() == pytest.approx(50 * i, abs=3)
@@ -0,0 +1,160 @@
+"""VideoReader yields the same frames as reading the whole video sequentially."""
+
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+
+from TracX import video_reader
+from TracX.video_reader import VideoReader
+
+NB_FRAMES = 60
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("videos") / "video.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("No MJPG video encoder")
+    for i in range(NB_FRAMES):
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[:, : i + 2] = 4 * i
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def read_all(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    assert len(frames) == NB_FRAMES
+    return frames
+
+
+@pytest.fixture(scope="module")
+def all_frames(video):
+    return read_all(video)
+
+
+@pytest.fixture(params=[None, [0, 16, 32, 48]], ids=["no_index", "keyframes"])
+def reader(request, video, monkeypatch):
+    monkeypatch.setattr(video_reader, "keyframe_index", lambda path, fps: request.param)
+    with VideoReader(video, seek_threshold=8) as reader:
+        yield reader
+
+
+@pytest.mark.parametrize(
+    ("start", "stop", "step"),
+    [(0, None, 1), (5, 25, 1), (3, None, 7), (40, 100, 3), (0, NB_FRAMES, 20)],
+)
+def test_frames_match_sequential_read(reader, all_frames, start, stop, step):
+    expected = list(range(NB_FRAMES))[start:stop:step]
+
+    frames = list(reader.frames(start, stop, step))
+
+    assert [index for index, _ in frames] == expected
+    for index, frame in frames:
+        np.testing.assert_array_equal(frame, all_frames[index], err_msg=f"frame {index}")
+
+
+def test_seek_backwards(reader, all_frames):
+    list(reader.frames(30, 35))
+
+    index, frame = next(reader.frames(10))
+
+    assert index == 10
+    np.testing.assert_array_equal(frame, all_frames[10])
+
+
+def test_keyframe_index_is_cached(video, tmp_path, monkeypatch):
+    monkeypatch.setattr(video_reader, "KEYFRAMES_CACHE", str(tmp_path))
+    calls = []
+
+    def keyframes_pyav(path, fps):
+        calls.append(path)
+        return [32, 0, 16, 16]
+
+    monkeypatch.setattr(video_reader, "_keyframes_pyav", keyframes_pyav)
+
+    assert video_reader.keyframe_index(video, 30) == [0, 16, 32]
+    assert video_reader.keyframe_index(video, 30) == [0, 16, 32]
+    assert calls == [video]
+
+
+def ffmpeg_exe():
+    if shutil.which("ffmpeg"):
+        return "ffmpeg"
+    try:
+        import imageio_ffmpeg
+    except ImportError:
+        pytest.skip("No ffmpeg to encode videos with B-frames")
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+
+@pytest.fixture(scope="module", params=["libx264", "mpeg4"], ids=["h264", "mp4v"])
+def gop_video(request, tmp_path_factory):
+    """Video with a keyframe every 12 frames and B-frames, so that packets are not in display order."""
+    path = str(tmp_path_factory.mktemp("videos") / f"{request.param}.mp4")
+    result = subprocess.run(
+        [
+            ffmpeg_exe(), "-y", "-v", "error", "-f", "lavfi", "-i", "testsrc2=size=64x48:rate=30",
+            "-frames:v", str(NB_FRAMES), "-c:v", request.param, "-bf", "2", "-g", "12", "-keyint_min", "12",
+            "-sc_threshold", "0", "-pix_fmt", "yuv420p", path,
+        ],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        pytest.skip(f"ffmpeg cannot encode {request.param}")
+    return path
+
+
+@pytest.fixture
+def gop_reader(gop_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(video_reader, "KEYFRAMES_CACHE", str(tmp_path))
+    if video_reader.keyframe_index(gop_video, 30) is None:
+        pytest.skip("No keyframe index: PyAV or ffprobe is needed")
+    with VideoReader(gop_video, seek_threshold=8) as reader:
+        yield reader
+
+
+def test_keyframe_index_of_video_with_b_frames(gop_reader):
+    keyframes = video_reader.keyframe_index(gop_reader.path, 30)
+
+    # Keyframes in display order, although B-frames are stored after the frames they refer to.
+    # Encoders may also end the video on a keyframe.
+    assert keyframes == sorted(keyframes)
+    assert set(range(0, NB_FRAMES, 12)) <= set(keyframes) <= set(range(0, NB_FRAMES, 12)) | {NB_FRAMES - 1}
+
+
+@pytest.mark.parametrize(
+    ("start", "stop", "step"),
+    [(0, None, 1), (13, 30, 1), (11, 50, 1), (3, None, 7), (25, 60, 12), (47, 100, 5)],
+)
+def test_frames_with_b_frames_match_sequential_read(gop_reader, start, stop, step):
+    all_frames = read_all(gop_reader.path)
+    expected = list(range(NB_FRAMES))[start:stop:step]
+
+    frames = list(gop_reader.frames(start, stop, step))
+
+    assert [index for index, _ in frames] == expected
+    for index, frame in frames:
+        np.testing.assert_array_equal(frame, all_frames[index], err_msg=f"frame {index}")
+
+
+def test_seek_backwards_with_b_frames(gop_reader):
+    all_frames = read_all(gop_reader.path)
+    list(gop_reader.frames(40, 45))
+
+    for start in [26, 12, 1]:
+        index, frame = next(gop_reader.frames(start))
+        assert index == start
+        np.testing.assert_array_equal(frame, all_frames[start])
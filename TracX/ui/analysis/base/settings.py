@@ -132,6 +132,7 @@ class SettingsPanel(QFrame):
 
         self.pose_model.setOption(cfg["pose"]["pose_model"])
         self.perfomance_mode.setOption(cfg["pose"]["mode"])
+        self.precision.setOption(cfg["pose"].get("precision", "fp32"))
         self.det_frequency.widget.setText(str(cfg["pose"]["det_frequency"]))
 
         # Update buttons
@@ -148,6 +149,7 @@ class SettingsPanel(QFrame):
         # Pose settings
         cfg["pose"]["pose_model"] = self.pose_model.selected_option
         cfg["pose"]["mode"] = self.perfomance_mode.selected_option
+        cfg["pose"]["precision"] = self.precision.selected_option
         cfg["pose"]["det_frequency"] = int(self.det_frequency.widget.text())
 
         return cfg
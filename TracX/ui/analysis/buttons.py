@@ -2,13 +2,6 @@ import contextlib
 
 from TracX.tasks import EstimateMotionTask, KinematicsTask
 from TracX.ui.common import BaseTaskButton
-try:
-    from TracX.rendering import render
-except ImportError:
-    def render(*args, **kwargs):
-        raise ImportError(
-            "The rendering module is not available. Please install the `requirements-extra.txt` file."
-        )
 
 
 class EstimateMotionButton(BaseTaskButton):
@@ -35,6 +28,9 @@ class KinematicsButton(BaseTaskButton):
             # Render the OpenSim files
             _, motion_file, model_file = result
             with contextlib.suppress(Exception):
+                # Imported here as aitviewer is slow to import and optional
+                from TracX.rendering import render
+
                 render(
                     osim=model_file,
                     mot=motion_file,
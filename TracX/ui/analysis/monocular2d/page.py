@@ -14,7 +14,6 @@ from PyQt6.QtWidgets import (
 
 from TracX.constants import FEATURE_STREAMING_ENABLED
 from TracX.core import Experiment
-from TracX.core.analyze2d import process_frame, setup_pose_tracker
 from TracX.streaming import MotionDataStreamer
 from TracX.ui.styles import PAD_Y
 
@@ -61,6 +60,7 @@ class Monocular2DAnalysisPage(QWidget):
 
         # Model setup
         self.model = None
+        self.modelIsLive = False
 
         # TODO: Data streaming
         self.streamer = None
@@ -82,9 +82,9 @@ class Monocular2DAnalysisPage(QWidget):
         if self.experiment is None:
             return
 
-        # Model setup
+        # Model setup, deferred to the first processed frame
         # TODO: Refresh model when experiment settings are updated
-        self.model = setup_pose_tracker(self.experiment.cfg)
+        self.model = None
 
         self.all_frames_X = []
         self.all_frames_Y = []
@@ -93,10 +93,30 @@ class Monocular2DAnalysisPage(QWidget):
         self.postprocessing_kwargs = {}
         # frame_count, frame_rate, fps, save_pose, pose_output_path, save_angles, angles_output_path
 
+    def loadModel(self):
+        """Create the pose model session on first use.
+
+        The pose estimation backend is only imported here, so that opening the
+        studio and browsing experiments does not pay for it.
+        """
+        live = self.data.videoPlayer.player.isWebcam
+        if self.model is not None and live != self.modelIsLive:
+            # The source changed between webcam and file, which are tracked differently
+            self.model = None
+
+        if self.model is None and self.experiment is not None:
+            from TracX.core.analyze2d import setup_pose_tracker
+
+            self.model = setup_pose_tracker(self.experiment.cfg, live=live)
+            self.modelIsLive = live
+        return self.model
+
     def processFrame(self, frame):
-        if self.model is None:
+        if self.loadModel() is None:
             return frame
 
+        from TracX.core.analyze2d import process_frame
+
         frame, motion_data = process_frame(self.experiment.cfg, self.model, frame)
 
         if self.streamer is not None:
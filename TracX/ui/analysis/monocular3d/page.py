@@ -2,13 +2,11 @@ import logging
 import os
 
 import numpy as np
-import onnxruntime as ort
 from PyQt6.QtWidgets import (
     QWidget,
 )
 
 from TracX.constants import APP_ASSETS
-from TracX.core.analyze2d import process_frame
 
 from ..monocular2d.page import Monocular2DAnalysisPage
 
@@ -43,6 +41,8 @@ class Monocular3DAnalysisPage(Monocular2DAnalysisPage):
             return self._lifting_model
 
         # Load lifting model
+        import onnxruntime as ort
+
         model_path = os.path.join(APP_ASSETS, "models", "lifting", "baseline.onnx")
         logging.info("Loading the 3D lifting model from %s...", model_path)
         self._lifting_model = ort.InferenceSession(model_path)
@@ -66,9 +66,11 @@ class Monocular3DAnalysisPage(Monocular2DAnalysisPage):
         return self._lifting_model
 
     def processFrame(self, frame):
-        if self.model is None:
+        if self.loadModel() is None:
             return frame
 
+        from TracX.core.analyze2d import process_frame
+
         logging.debug("Estimating 2D pose")
         frame, (x, y, scores, angles, kwargs) = process_frame(
             self.experiment.cfg, self.model, frame
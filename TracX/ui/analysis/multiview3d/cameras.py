@@ -1,7 +1,6 @@
 import contextlib
 import os
 
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QIntValidator
 from PyQt6.QtWidgets import (
@@ -279,6 +278,8 @@ class CamerasTab(Tab):
             self.canvas = None
 
     def showFigure(self, fig):
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
         self.clearFigure()
         self.canvas = FigureCanvas(fig)
         self.canvas.setSizePolicy(
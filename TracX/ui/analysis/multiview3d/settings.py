@@ -101,6 +101,21 @@ class Multiview3DSettingsPanel(SettingsPanel):
         )
         scroll_layout.addWidget(self.perfomance_mode)
 
+        # [pose] precision
+        self.precision = Selection(
+            "Precision",
+            {
+                "FP32": "fp32",
+                "INT8": "int8",
+                "FP16": "fp16",
+            },
+            self,
+        )
+        self.precision.setToolTip(
+            "Model precision for CPU inference: 'int8' is faster and calibrated on the experiment videos, 'fp16' needs a CPU with native FP16 support."
+        )
+        scroll_layout.addWidget(self.precision)
+
         # [pose] det_frequency
         self.det_frequency = LabeledWidget(
             "Detection Frequency",
@@ -12,6 +12,7 @@ from .radio_group import RadioGroup
 from .selection import Selection
 from .tabbed_area import Tab, TabbedArea
 from .task_button import BaseTaskButton
+from .thumbnail_service import ThumbnailService
 from .video_gallery import VideoGallery
 from .video_gallery_item import VideoGalleryItem
 from .video_player_widget import VideoPlayerController, VideoPlayerWidget
@@ -33,6 +34,7 @@ __all__ = [
     "Selection",
     "Tab",
     "TabbedArea",
+    "ThumbnailService",
     "VideoGallery",
     "VideoPlayerController",
     "VideoPlayerWidget",
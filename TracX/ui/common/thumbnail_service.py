@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+
+import cv2
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from TracX.constants import APP_CACHE
+
+THUMBNAILS_CACHE = os.path.join(APP_CACHE, "thumbnails")
+
+
+def thumbnail_cache_key(path: str, size: int) -> str:
+    """Build a cache key from the video path, modification time, and file size.
+
+    Any change to the file on disk produces a new key, so stale thumbnails are
+    never served.
+    """
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{size}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def extract_thumbnail(path: str, size: int, cache_dir: str = THUMBNAILS_CACHE):
+    """Extract a square RGB thumbnail and the metadata of a video.
+
+    Results are cached on disk as a PNG image and a JSON metadata file. Cached
+    entries are returned without opening the video.
+
+    Args:
+        path: Path to the video file.
+        size: Edge length of the square thumbnail in pixels.
+        cache_dir: Directory in which thumbnails are cached.
+
+    Returns:
+        tuple: The RGB thumbnail (or None if no frame could be decoded) and a
+            dictionary with the keys `width`, `height`, `fps`, and `duration`.
+    """
+    key = thumbnail_cache_key(path, size)
+    image_file = os.path.join(cache_dir, f"{key}.png")
+    meta_file = os.path.join(cache_dir, f"{key}.json")
+
+    # Serve from the cache if possible
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            metadata = json.load(f)
+
+        thumbnail = None
+        if os.path.exists(image_file):
+            thumbnail = cv2.imread(image_file)
+            if thumbnail is not None:
+                thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB)
+        return thumbnail, metadata
+
+    # Capture the video
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Failed to open video: {path}")
+
+    # Get video metadata
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    metadata = {
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": fps,
+        "duration": frame_count / fps if fps > 0 else 0.0,
+    }
+
+    # Read the first frame for the thumbnail
+    ret, frame = cap.read()
+    cap.release()
+
+    thumbnail = None
+    os.makedirs(cache_dir, exist_ok=True)
+    if ret:
+        thumbnail = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+        cv2.imwrite(image_file, thumbnail)
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB)
+
+    # Write the metadata last so that it marks a complete cache entry
+    with open(meta_file, "w") as f:
+        json.dump(metadata, f)
+
+    return thumbnail, metadata
+
+
+class _ThumbnailWorker(QRunnable):
+    """Extracts the thumbnail of a single video on a pool thread."""
+
+    def __init__(self, service, path, size):
+        super().__init__()
+        self.service = service
+        self.path = path
+        self.size = size
+
+    def run(self):
+        try:
+            thumbnail, metadata = extract_thumbnail(
+                self.path, self.size, self.service.cache_dir
+            )
+            self.service.ready.emit(self.path, thumbnail, metadata)
+        except Exception as e:
+            logging.error(f"Failed to create thumbnail for {self.path}: {e}")
+            self.service.failed.emit(self.path)
+
+
+class ThumbnailService(QObject):
+    """Extracts video thumbnails and metadata in a background worker pool.
+
+    Results are delivered through the `ready` signal on the thread that owns
+    the service (the GUI thread for the shared instance).
+
+    Signals:
+        ready (str, object, object): The video path, the RGB thumbnail as a
+            NumPy array (or None), and the metadata dictionary.
+        failed (str): The path of a video that could not be opened.
+    """
+
+    ready = pyqtSignal(str, object, object)
+    failed = pyqtSignal(str)
+
+    _instance = None
+
+    def __init__(self, max_workers=None, cache_dir=THUMBNAILS_CACHE):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.pool = QThreadPool(self)
+        if max_workers is None:
+            max_workers = max(1, min(4, (os.cpu_count() or 1) // 2))
+        self.pool.setMaxThreadCount(max_workers)
+
+    @classmethod
+    def instance(cls):
+        """Return the service shared by all gallery items."""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def request(self, path: str, size: int):
+        """Schedule the thumbnail extraction of a video."""
+        self.pool.start(_ThumbnailWorker(self, path, size))
+
+    def clear(self):
+        """Drop all pending requests that have not started yet."""
+        self.pool.clear()
@@ -1,11 +1,11 @@
-import logging
 import os
 
-import cv2
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtCore import Qt, pyqtSignal, pyqtSlot
 from PyQt6.QtGui import QImage, QPixmap
 from PyQt6.QtWidgets import QFrame, QHBoxLayout, QLabel, QVBoxLayout, QWidget
 
+from .thumbnail_service import ThumbnailService
+
 
 class VideoGalleryItem(QFrame):
     clicked = pyqtSignal(str)
@@ -58,29 +58,29 @@ class VideoGalleryItem(QFrame):
         self.clicked.emit(self.path)
 
     def create_thumbnail(self):
-        # Capture the video
-        cap = cv2.VideoCapture(self.path)
-        if not cap.isOpened():
-            logging.error(f"Failed to open video: {self.path}")
+        # Show the file name and a placeholder right away
+        filename = os.path.basename(self.path)
+        self.filename_label.setText(filename)
+        self.filename_label.setStyleSheet(
+            "color: white; font-size: 12px; font-weight: bold;"
+        )
+        self.thumbnail_label.setFixedSize(self.thumbnail_size, self.thumbnail_size)
+        self.thumbnail_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.thumbnail_label.setText("...")
+        self.fileinfo_label.setText("Loading...")
+
+        # Extract the thumbnail and metadata in the background
+        service = ThumbnailService.instance()
+        service.ready.connect(self.on_thumbnail_ready)
+        service.failed.connect(self.on_thumbnail_failed)
+        service.request(self.path, self.thumbnail_size)
+
+    @pyqtSlot(str, object, object)
+    def on_thumbnail_ready(self, path, thumbnail, metadata):
+        if path != self.path:
             return
 
-        # Get video metadata
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        duration = frame_count / fps
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-        # Read the first frame for the thumbnail
-        ret, frame = cap.read()
-        cap.release()
-
-        if ret:
-            # Resize the frame to create a square thumbnail
-            thumbnail_size = self.thumbnail_size
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            thumbnail = cv2.resize(frame, (thumbnail_size, thumbnail_size))
-
+        if thumbnail is not None:
             # Convert the frame to a QImage
             height_, width_, channel = thumbnail.shape
             bytes_per_line = 3 * width_
@@ -95,18 +95,23 @@ class VideoGalleryItem(QFrame):
 
             # Set the thumbnail pixmap
             self.thumbnail_label.setPixmap(pixmap)
-            self.thumbnail_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-
-        # Extract the base name of the video file
-        filename = os.path.basename(self.path)
-        self.filename_label.setText(filename)
-        self.filename_label.setStyleSheet(
-            "color: white; font-size: 12px; font-weight: bold;"
-        )
 
+        width, height = metadata["width"], metadata["height"]
+        duration, fps = metadata["duration"], metadata["fps"]
         self.fileinfo_label.setText(f"{width}x{height}\n{duration:.2f}s\n{fps:.2f} FPS")
 
+    @pyqtSlot(str)
+    def on_thumbnail_failed(self, path):
+        if path != self.path:
+            return
+
+        self.thumbnail_label.setText("")
+        self.fileinfo_label.setText("Unreadable video")
+
     def deleteLater(self):
+        service = ThumbnailService.instance()
+        service.ready.disconnect(self.on_thumbnail_ready)
+        service.failed.disconnect(self.on_thumbnail_failed)
         self.thumbnail_label.deleteLater()
         self.filename_label.deleteLater()
         super().deleteLater()
@@ -1,5 +1,6 @@
 import numpy as np
-import pandas as pd
+
+from TracX.motion_io import read_trc_data
 
 
 def read_trc(file_path):
@@ -19,41 +20,24 @@ def read_trc(file_path):
                         }
                     ]
     """
-    # Read metadata to extract keypoint names
-    header_df = pd.read_csv(file_path, sep="\t", skiprows=3, nrows=0)
-    keypoint_names = header_df.columns[2::3].tolist()
+    header, data = read_trc_data(file_path)
+    keypoint_names = header["marker_names"]
 
     # Assign keypoint IDs
     keypoint_ids = list(range(len(keypoint_names)))
 
-    # Read motion capture data
-    data_df = pd.read_csv(file_path, sep="\t", skiprows=4)
-    frame_col = data_df.iloc[:, 0]
-    time_col = data_df.iloc[:, 1]
-    keypoint_coordinates = data_df.drop(data_df.columns[[0, 1]], axis=1)
-
     # Organize keypoint data into a structured format
-    structured_data = []
-    for idx, keypoint_name in enumerate(keypoint_names):
-        frame = frame_col
-        time = time_col
-        x = keypoint_coordinates.iloc[:, idx * 3].to_numpy()
-        y = keypoint_coordinates.iloc[:, idx * 3 + 1].to_numpy()
-        z = keypoint_coordinates.iloc[:, idx * 3 + 2].to_numpy()
-        keypoints = np.stack((frame, time, x, y, z), axis=1)
-        structured_data.append(keypoints)
-
-    structured_data = np.array(structured_data)  # (K, V, 5)
-    structured_data = np.transpose(structured_data, (1, 0, 2))
+    num_keypoints = len(keypoint_names)
+    keypoints = data[:, 2:].reshape(len(data), num_keypoints, 3)  # (V, K, 3)
 
     # Convert to a list of dictionaries
     return [
         {
-            "frame": keypoints[:, 0],
-            "time": keypoints[:, 1],
+            "frame": np.full(num_keypoints, frame),
+            "time": np.full(num_keypoints, time),
             "keypoint_ids": keypoint_ids,
             "keypoint_names": keypoint_names,
-            "keypoints": keypoints[:, 2:],
+            "keypoints": frame_keypoints,
         }
-        for keypoints in structured_data
+        for frame, time, frame_keypoints in zip(data[:, 0], data[:, 1], keypoints)
     ]
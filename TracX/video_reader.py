@@ -0,0 +1,235 @@
+"""Seek-based video reading.
+
+`VideoReader` wraps `cv2.VideoCapture` so that only the frames that are needed
+get decoded. Reading a frame range seeks to the keyframe before its first
+frame instead of decoding the whole beginning of the video, and strided
+sampling only `grab()`s the frames in between, without `retrieve()`ing them,
+unless a keyframe closer to the next sample allows seeking again.
+
+The keyframe index of a video is read from its container (with PyAV, or
+ffprobe, when available) without decoding, and cached in the application
+cache, keyed by the path, size and modification time of the video.
+
+Usage:
+    with VideoReader(video_path) as reader:
+        for frame_idx, frame in reader.frames(start=300, stop=600):
+            ...
+        for frame_idx, frame in reader.frames(step=int(reader.fps)):
+            ...
+"""
+
+import hashlib
+import itertools as it
+import json
+import logging
+import os
+import shutil
+import subprocess
+
+import cv2
+
+from TracX.constants import APP_CACHE
+
+KEYFRAMES_CACHE = os.path.join(APP_CACHE, "keyframes")
+
+# Without a keyframe index, gaps shorter than this are grabbed rather than seeked
+DEFAULT_SEEK_THRESHOLD = 64
+
+
+def _cache_file(path):
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return os.path.join(KEYFRAMES_CACHE, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+
+def _keyframes_pyav(path, fps):
+    import av
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        start = stream.start_time or 0
+        return [
+            round(float((packet.pts - start) * stream.time_base) * fps)
+            for packet in container.demux(stream)
+            if packet.is_keyframe and packet.pts is not None
+        ]
+
+
+def _keyframes_ffprobe(path, fps):
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if pts_time not in ("", "N/A"):
+            times.append((float(pts_time), "K" in flags))
+    if not times:
+        return []
+    start = min(t for t, _ in times)
+    return [round((t - start) * fps) for t, key in times if key]
+
+
+def keyframe_index(path, fps):
+    """Frame indices of the keyframes of a video, or None if they cannot be read.
+
+    The index is read from the container without decoding and cached.
+    """
+    cache_file = _cache_file(path)
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            return json.load(f)["keyframes"]
+
+    keyframes = None
+    try:
+        keyframes = _keyframes_pyav(path, fps)
+    except ImportError:
+        if shutil.which("ffprobe"):
+            try:
+                keyframes = _keyframes_ffprobe(path, fps)
+            except (subprocess.CalledProcessError, ValueError) as e:
+                logging.debug(f"Could not read the keyframes of {path}: {e}")
+    except Exception as e:
+        logging.debug(f"Could not read the keyframes of {path}: {e}")
+    if not keyframes:
+        return None
+
+    keyframes = sorted(set(keyframes))
+    os.makedirs(KEYFRAMES_CACHE, exist_ok=True)
+    with open(cache_file + ".tmp", "w") as f:
+        json.dump({"path": os.path.abspath(path), "keyframes": keyframes}, f)
+    os.replace(cache_file + ".tmp", cache_file)
+    return keyframes
+
+
+class VideoReader:
+    """Video capture that seeks to keyframes and decodes only the needed frames.
+
+    Args:
+        path: Path of the video.
+        cap: Already opened capture of the video, to reuse instead of opening a new one.
+        seek_threshold: Without a keyframe index, number of frames from which
+            the reader seeks instead of grabbing the frames in between.
+    """
+
+    def __init__(self, path, cap=None, seek_threshold=DEFAULT_SEEK_THRESHOLD):
+        self.path = str(path)
+        self.cap = cap if cap is not None else cv2.VideoCapture(self.path)
+        self.seek_threshold = seek_threshold
+        self.position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        self._keyframes = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    @property
+    def fps(self):
+        return self.cap.get(cv2.CAP_PROP_FPS) or 30
+
+    @property
+    def frame_count(self):
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    @property
+    def width(self):
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+
+    @property
+    def height(self):
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    @property
+    def keyframes(self):
+        """Frame indices of the keyframes, or None if unknown."""
+        if self._keyframes is False:
+            self._keyframes = keyframe_index(self.path, self.fps) if os.path.isfile(self.path) else None
+        return self._keyframes
+
+    def _previous_keyframe(self, index):
+        keyframes = self.keyframes
+        if keyframes is None:
+            return None
+        previous = [k for k in keyframes if k <= index]
+        return previous[-1] if previous else 0
+
+    def seek(self, index):
+        """Position the reader so that the next read returns frame `index`.
+
+        Frames between the current position and `index` are only grabbed if
+        no keyframe closer to `index` can be seeked to.
+        """
+        if index == self.position:
+            return True
+
+        keyframe = self._previous_keyframe(index)
+        if keyframe is None:
+            must_seek = index < self.position or index - self.position > self.seek_threshold
+            target = index
+        else:
+            must_seek = index < self.position or keyframe > self.position
+            target = keyframe
+
+        if must_seek:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            self.position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if self.position != target:
+                # The container does not support seeking: decode from the start
+                self.cap.release()
+                self.cap = cv2.VideoCapture(self.path)
+                self.position = 0
+
+        while self.position < index:
+            if not self.cap.grab():
+                return False
+            self.position += 1
+        return True
+
+    def grab(self):
+        success = self.cap.grab()
+        if success:
+            self.position += 1
+        return success
+
+    def retrieve(self):
+        return self.cap.retrieve()
+
+    def read(self):
+        success, frame = self.cap.read()
+        if success:
+            self.position += 1
+        return success, frame
+
+    def frames(self, start=0, stop=None, step=1):
+        """Yield the (index, frame) of frames `start` to `stop` (excluded) every `step` frames.
+
+        Only the yielded frames are retrieved. Without `stop`, or if `stop` is
+        past the last frame, reading stops at the end of the video.
+        """
+        # The frame count of some containers is an estimate: read until the end
+        indices = it.count(start, max(1, int(step))) if stop is None else range(start, stop, max(1, int(step)))
+        for index in indices:
+            if not self.seek(index):
+                return
+            success, frame = self.read()
+            if not success:
+                return
+            yield index, frame
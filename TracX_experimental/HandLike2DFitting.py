@@ -4,6 +4,7 @@ Create virtual env e.g., using conda, install PyTorch, and other dependencies us
 Note: initial 3D reference pose of hand is provided to the layer as input, see 'HandSkeletonLayer' function.
 """
 
+import functools
 import json
 import os
 import time
@@ -99,75 +100,328 @@ def readTrc(path_to_3d_joints):
     return np.array(joints, dtype=np.float64), joint_to_idx
 
 
+# Joints of the skeleton layer, with the index of their parent joint
+SKELETON_JOINTS = [
+    "Hip",
+    "RHip",
+    "RKnee",
+    "RAnkle",
+    "RBigToe",
+    "RSmallToe",
+    "RHeel",
+    "LHip",
+    "LKnee",
+    "LAnkle",
+    "LBigToe",
+    "LSmallToe",
+    "LHeel",  # 12
+    "Neck",
+    "Head",
+    "Nose",
+    "RShoulder",
+    "RElbow",
+    "RWrist",
+    "LShoulder",
+    "LElbow",
+    "LWrist",
+]
+SKELETON_PARENTS = np.array(
+    [-1, 0, 1, 2, 3, 3, 3, 0, 7, 8, 9, 9, 9, 0, 13, 14, 13, 16, 17, 13, 19, 20],
+)
+
+# HALPE_26 keypoint indices of the 2D pose estimation
+HALPE_26_IDS = {
+    "Nose": 0,
+    "LEye": 1,
+    "REye": 2,
+    "LEar": 3,
+    "REar": 4,
+    "LShoulder": 5,
+    "RShoulder": 6,
+    "LElbow": 7,
+    "RElbow": 8,
+    "LWrist": 9,
+    "RWrist": 10,
+    "LHip": 11,
+    "RHip": 12,
+    "LKnee": 13,
+    "RKnee": 14,
+    "LAnkle": 15,
+    "RAnkle": 16,
+    "Head": 17,
+    "Neck": 18,
+    "Hip": 19,
+    "LBigToe": 20,
+    "RBigToe": 21,
+    "LSmallToe": 22,
+    "RSmallToe": 23,
+    "LHeel": 24,
+    "RHeel": 25,
+}
+SKELETON_ORDERING = [HALPE_26_IDS[name] for name in SKELETON_JOINTS]
+
+# Loss multipliers of the toes (x10), hips and knees (x5)
+JOINT_WEIGHTS = {4: 10, 5: 10, 10: 10, 11: 10, 1: 5, 2: 5, 7: 5, 8: 5}
+
+# Default number of frames optimized together per torch thread
+FRAMES_PER_THREAD = 64
+
+
+@functools.lru_cache
+def _kinematic_levels(parents):
+    """Groups the joints of a kinematic tree by depth, for level by level forward kinematics.
+
+    Parameters
+    ----------
+    - parents: tuple of the parent index of each joint, -1 for the root. Parents come before their children.
+
+    Returns
+    -------
+    - levels: list of index tensors of the joints at each depth
+    - parent_positions: list of index tensors of the parents of each level, in the concatenation of the previous levels
+    - positions: index tensor of each joint in the concatenation of all levels
+
+    """
+    depth = np.zeros(len(parents), dtype=int)
+    for j in range(1, len(parents)):
+        depth[j] = depth[parents[j]] + 1
+    levels = [np.flatnonzero(depth == d) for d in range(depth.max() + 1)]
+    positions = np.empty(len(parents), dtype=int)
+    positions[np.concatenate(levels)] = np.arange(len(parents))
+    parent_positions = [positions[np.asarray(parents)[level]] for level in levels[1:]]
+    return (
+        [torch.as_tensor(level) for level in levels],
+        [torch.as_tensor(p) for p in parent_positions],
+        torch.as_tensor(positions),
+    )
+
+
+def relative_joints(rest_joints, parents=SKELETON_PARENTS):
+    """Offsets of the joints of reference poses from their parent joint.
+
+    Parameters
+    ----------
+    - rest_joints: B x J x 3 tensor of reference 3D poses
+    - parents: parent index of each joint
+
+    Returns
+    -------
+    - rel_joints: B x J x 3 tensor, the root joint is left unchanged
+
+    """
+    parents = torch.as_tensor(parents).long()
+    rel_joints = rest_joints.clone()
+    rel_joints[:, 1:] -= rest_joints[:, parents[1:]]
+    return rel_joints
+
+
+def forward_kinematics(pose, transl, rel_joints, parents=SKELETON_PARENTS):
+    """Batched forward kinematics of a skeleton, one level of the kinematic tree at a time.
+
+    Parameters
+    ----------
+    - pose: B x J x 3 tensor of axis-angle rotations of the joints
+    - transl: B x 3 tensor of global translations
+    - rel_joints: B x J x 3 tensor of joint offsets (see `relative_joints`)
+    - parents: parent index of each joint
+
+    Returns
+    -------
+    - posed_joints: B x J x 3 tensor of joint positions
+
+    """
+    B, J = pose.shape[:2]
+    levels, parent_positions, positions = _kinematic_levels(tuple(int(p) for p in parents))
+    rot_mats = batch_rodrigues(pose.reshape(-1, 3)).view(B, J, 3, 3)
+    transforms_mat = transform_mat(
+        rot_mats.reshape(-1, 3, 3),
+        rel_joints.reshape(-1, 3, 1).to(rot_mats.dtype),
+    ).view(B, J, 4, 4)
+
+    # All joints of a level are chained to their (already posed) parents at once
+    transform_chain = [transforms_mat[:, levels[0]]]
+    for level, parent_position in zip(levels[1:], parent_positions):
+        parent_transforms = torch.cat(transform_chain, dim=1)[:, parent_position]
+        transform_chain.append(torch.matmul(parent_transforms, transforms_mat[:, level]))
+    transforms = torch.cat(transform_chain, dim=1)[:, positions]
+
+    return transforms[:, :, :3, 3] + transl.unsqueeze(dim=1)
+
+
 def BodySkeletionLayer(pose, transl, Projection_mat, img_size, J, j_to_idx):
     """Implements the PyTorch based forward kinematics function of hand skeleton that allows automatic gradient computation.
     The joint order is from https://github.com/otaheri/MANO/blob/master/mano/joints_info.py
     Update this reference pose for a particular user (bonelengths will be automatically calculated from this pose).
     This 3D pose is provided in camera coordinates and in meters.
     """
-    order = [
-        j_to_idx["Hip"],
-        j_to_idx["RHip"],
-        j_to_idx["RKnee"],
-        j_to_idx["RAnkle"],
-        j_to_idx["RBigToe"],
-        j_to_idx["RSmallToe"],
-        j_to_idx["RHeel"],
-        j_to_idx["LHip"],
-        j_to_idx["LKnee"],
-        j_to_idx["LAnkle"],
-        j_to_idx["LBigToe"],
-        j_to_idx["LSmallToe"],
-        j_to_idx["LHeel"],  # 12
-        j_to_idx["Neck"],
-        j_to_idx["Head"],
-        j_to_idx["Nose"],
-        j_to_idx["RShoulder"],
-        j_to_idx["RElbow"],
-        j_to_idx["RWrist"],
-        j_to_idx["LShoulder"],
-        j_to_idx["LElbow"],
-        j_to_idx["LWrist"],
-    ]
-    J = J[order]
-    parents = np.array(
-        [-1, 0, 1, 2, 3, 3, 3, 0, 7, 8, 9, 9, 9, 0, 13, 14, 13, 16, 17, 13, 19, 20],
+    order = [j_to_idx[name] for name in SKELETON_JOINTS]
+    joints = torch.from_numpy(J[order]).float().unsqueeze(dim=0)
+    posed_joints = forward_kinematics(
+        pose.view(1, -1, 3),
+        transl.view(1, 3),
+        relative_joints(joints),
     )
-    J = torch.from_numpy(J)
-    joints = torch.ones(1, J.size(0), J.size(1))
-    joints[0, :, :] = J
-    # print(joints)
-    parents = to_tensor(parents).long()
-    joints = torch.unsqueeze(joints, dim=-1)
-    # print(joints)
-    rel_joints = joints.clone()
-    rel_joints[:, 1:] -= joints[:, parents[1:]]
-    # print(rel_joints)
-    rot_mats = batch_rodrigues(pose.view(-1, 3)).view([1, -1, 3, 3])
-    transforms_mat = transform_mat(
-        rot_mats.reshape(-1, 3, 3),
-        rel_joints.reshape(-1, 3, 1),
-    ).reshape(-1, joints.shape[1], 4, 4)
-    # print(transforms_mat)
-    transform_chain = [transforms_mat[:, 0]]
-    # print(len(transform_chain))
-    # print(transform_chain)
-    # print('parent shape',parents.shape[0])
-    for i in range(1, parents.shape[0]):
-        # print('i',i,parents[i])
-        # print(transforms_mat[:,i])
-        curr_res = torch.matmul(transform_chain[parents[i]], transforms_mat[:, i])
-        transform_chain.append(curr_res)
-        # print('transform_chain',len(transform_chain))
-    transforms = torch.stack(transform_chain, dim=1)
-    posed_joints = transforms[:, :, :3, 3]
-    # print(posed_joints)
-    posed_joints = posed_joints + transl.unsqueeze(dim=1)
     h_keys_proj = multiview_projection_batch(Projection_mat.detach(), posed_joints)
     h_keys_proj = normalize_keys_batch(h_keys_proj, img_size[1], img_size[0])
     return posed_joints, h_keys_proj
 
 
+def project_points(Ps, points):
+    """Ps (projection matrices shared by all frames): n_view x 3 x 4
+    points: B x n_points x 3
+    returns: B x n_view x n_points x 2
+    """
+    points_homo = torch.cat((points, torch.ones_like(points[..., :1])), dim=-1)
+    proj_homo = torch.einsum("vij,bpj->bvpi", Ps, points_homo)
+    return proj_homo[..., :2] / proj_homo[..., 2:]
+
+
+def fit_frames(
+    keypoints_2d,
+    confidences,
+    Ps,
+    rest_joints,
+    img_size=(1920, 1088),
+    iterations=250,
+    lr=0.05,
+    smoothness=0.0,
+    batch_size=None,
+    num_threads=None,
+    warm_start=True,
+    joint_weights=JOINT_WEIGHTS,
+):
+    """Fits the skeleton layer to the 2D keypoints of many frames, optimizing batches of frames together.
+
+    Each frame has its own pose and translation, so frames of a batch are
+    optimized independently (Adam steps are per parameter), except for the
+    optional temporal smoothness term. Each batch starts from the solution of
+    the last frame of the previous batch.
+
+    Parameters
+    ----------
+    - keypoints_2d: F x n_view x J x 2 array of 2D keypoints in pixels, in the order of SKELETON_JOINTS
+    - confidences: F x n_view x J array of keypoint confidences, 0 for missing keypoints
+    - Ps: n_view x 3 x 4 array of projection matrices
+    - rest_joints: F x J x 3 array of reference 3D poses in meters, in the order of SKELETON_JOINTS
+    - img_size: width and height of the images
+    - iterations: number of Adam iterations per batch (the learning rate is divided by 10 every 50 iterations)
+    - lr: initial learning rate
+    - smoothness: weight of the squared joint velocities in the loss (m² per frame), 0 to disable
+    - batch_size: number of frames optimized together (default: FRAMES_PER_THREAD per torch thread)
+    - num_threads: number of torch threads, set with torch.set_num_threads if given
+    - warm_start: whether each batch starts from the previous solution, otherwise from the rest pose
+    - joint_weights: loss multiplier of each joint index
+
+    Returns
+    -------
+    - joints_3d: F x J x 3 array of fitted 3D joints
+    - keypoints_proj: F x n_view x J x 2 array of projected joints, normalized by the image size
+    - pose: F x J x 3 array of axis-angle rotations
+    - transl: F x 3 array of translations
+
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if batch_size is None:
+        batch_size = FRAMES_PER_THREAD * torch.get_num_threads()
+
+    nb_frames, n_view, joint_num = np.shape(confidences)
+    Ps = to_tensor(np.asarray(Ps))
+    scale = to_tensor(img_size)
+    weights = torch.ones(joint_num)
+    for j, w in joint_weights.items():
+        weights[j] = w
+    weights = weights.view(1, 1, -1, 1)
+
+    joints_3d = np.empty((nb_frames, joint_num, 3), dtype=np.float32)
+    keypoints_proj = np.empty((nb_frames, n_view, joint_num, 2), dtype=np.float32)
+    poses = np.empty((nb_frames, joint_num, 3), dtype=np.float32)
+    transls = np.empty((nb_frames, 3), dtype=np.float32)
+
+    init_pose, init_transl = torch.zeros(joint_num, 3), torch.zeros(3)
+    previous_joints = None
+    for start in range(0, nb_frames, batch_size):
+        stop = min(start + batch_size, nb_frames)
+        B = stop - start
+        target = to_tensor(keypoints_2d[start:stop]) / scale
+        conf = to_tensor(confidences[start:stop]).unsqueeze(dim=-1) * weights
+        rel_joints = relative_joints(to_tensor(rest_joints[start:stop]))
+
+        pose = init_pose.expand(B, -1, -1).clone().requires_grad_(True)
+        transl = init_transl.expand(B, -1).clone().requires_grad_(True)
+        optimizer = torch.optim.Adam(
+            params=[{"params": pose, "lr": lr}, {"params": transl, "lr": lr}],
+        )
+        lr_scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=50, gamma=0.1)
+        for _ in range(iterations):
+            joints = forward_kinematics(pose, transl, rel_joints)
+            loss = ((project_points(Ps, joints) / scale - target).pow(2) * conf).mean()
+            if smoothness > 0:
+                # Continuity with the last frame of the previous batch
+                path = joints if previous_joints is None else torch.cat([previous_joints, joints])
+                if len(path) > 1:
+                    loss = loss + smoothness * (path[1:] - path[:-1]).pow(2).mean()
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            lr_scheduler.step()
+
+        with torch.no_grad():
+            joints = forward_kinematics(pose, transl, rel_joints)
+            joints_3d[start:stop] = joints.numpy()
+            keypoints_proj[start:stop] = (project_points(Ps, joints) / scale).numpy()
+        poses[start:stop] = pose.detach().numpy()
+        transls[start:stop] = transl.detach().numpy()
+
+        previous_joints = joints[-1:]
+        if warm_start:
+            init_pose, init_transl = pose.detach()[-1], transl.detach()[-1]
+
+    return joints_3d, keypoints_proj, poses, transls
+
+
+def fit_trial(
+    paths_to_2d_joints,
+    path_to_3d_joints,
+    calib_file="./utils/Calib.toml",
+    which_person=0,
+    frame_range=None,
+    **fit_kwargs,
+):
+    """Loads a trial and fits the skeleton layer to all its frames (see `fit_frames`).
+
+    Parameters
+    ----------
+    - paths_to_2d_joints: list of OpenPose json directories, one per view, in the order of the cameras of calib_file
+    - path_to_3d_joints: trc file of the reference 3D poses
+    - calib_file: calibration .toml file
+    - which_person: index of the person in the json files
+    - frame_range: [start, end] frames to fit, all frames if None
+    - fit_kwargs: parameters of `fit_frames`
+
+    Returns
+    -------
+    - joints_3d, keypoints_proj, pose, transl: see `fit_frames`
+
+    """
+    P = np.asarray(computeP(calib_file))[: len(paths_to_2d_joints)]
+    views = [get_2D_joints(path, which_person) for path in paths_to_2d_joints]
+    joints_3d, joint_names_to_idx = readTrc(path_to_3d_joints)
+    nb_frames = min([len(joints_3d)] + [len(joints) for joints, _ in views])
+    keypoints_2d = np.stack([joints[:nb_frames] for joints, _ in views], axis=1)
+    confidences = np.stack([conf[:nb_frames] for _, conf in views], axis=1)
+    rest_joints = joints_3d[:nb_frames][:, [joint_names_to_idx[name] for name in SKELETON_JOINTS]]
+
+    frames = slice(*frame_range) if frame_range else slice(None)
+    return fit_frames(
+        keypoints_2d[frames][:, :, SKELETON_ORDERING],
+        confidences[frames][:, :, SKELETON_ORDERING],
+        P,
+        rest_joints[frames],
+        **fit_kwargs,
+    )
+
+
 def get_2D_joints(path_to_2d_joints, which_person=0):
     joints_2d = []
     confidences = []
@@ -195,186 +449,31 @@ def main_HPE(
     path_to_2d_joints3,
     path_to_3d_joints,
 ):
-    joint_name_to_idx = {
-        "Nose": 0,
-        "LEye": 1,
-        "REye": 2,
-        "LEar": 3,
-        "REar": 4,
-        "LShoulder": 5,
-        "RShoulder": 6,
-        "LElbow": 7,
-        "RElbow": 8,
-        "LWrist": 9,
-        "RWrist": 10,
-        "LHip": 11,
-        "RHip": 12,
-        "LKnee": 13,
-        "RKnee": 14,
-        "LAnkle": 15,
-        "RAnkle": 16,
-        "Head": 17,
-        "Neck": 18,
-        "Hip": 19,
-        "LBigToe": 20,
-        "RBigToe": 21,
-        "LSmallToe": 22,
-        "RSmallToe": 23,
-        "LHeel": 24,
-        "RHeel": 25,
-    }
-    P_new = computeP("./utils/Calib.toml")
-    joints_gt_2D_all_view1, confidences_all_view1 = get_2D_joints(path_to_2d_joints1, 0)
-    joints_gt_2D_all_view2, confidences_all_view2 = get_2D_joints(path_to_2d_joints2, 0)
-    joints_gt_2D_all_view3, confidences_all_view3 = get_2D_joints(path_to_2d_joints3, 0)
+    paths_to_2d_joints = [path_to_2d_joints1, path_to_2d_joints2, path_to_2d_joints3]
     joint_gt_2d_views = np.array(
-        [joints_gt_2D_all_view1, joints_gt_2D_all_view2, joints_gt_2D_all_view3],
+        [get_2D_joints(path, 0)[0] for path in paths_to_2d_joints],
     )
-    joints_3d, joint_names_to_idx = readTrc(path_to_3d_joints)
-    ordering = [
-        joint_name_to_idx["Hip"],
-        joint_name_to_idx["RHip"],
-        joint_name_to_idx["RKnee"],
-        joint_name_to_idx["RAnkle"],
-        joint_name_to_idx["RBigToe"],
-        joint_name_to_idx["RSmallToe"],
-        joint_name_to_idx["RHeel"],
-        joint_name_to_idx["LHip"],
-        joint_name_to_idx["LKnee"],
-        joint_name_to_idx["LAnkle"],
-        joint_name_to_idx["LBigToe"],
-        joint_name_to_idx["LSmallToe"],
-        joint_name_to_idx["LHeel"],
-        joint_name_to_idx["Neck"],
-        joint_name_to_idx["Head"],
-        joint_name_to_idx["Nose"],
-        joint_name_to_idx["RShoulder"],
-        joint_name_to_idx["RElbow"],
-        joint_name_to_idx["RWrist"],
-        joint_name_to_idx["LShoulder"],
-        joint_name_to_idx["LElbow"],
-        joint_name_to_idx["LWrist"],
-    ]
-    enhanced_3d_joints = []
-    reprojection_error = []
-    for j in range(len(joints_gt_2D_all_view1)):
-        joint_gt_2D_view1 = joints_gt_2D_all_view1[j]
-        confidences_view1 = confidences_all_view1[j]
-        joint_gt_2D_view1 = joint_gt_2D_view1[ordering]
-        confidences_view1 = confidences_view1[ordering]
-
-        joint_gt_2D_view2 = joints_gt_2D_all_view2[j]
-        confidences_view2 = confidences_all_view2[j]
-        joint_gt_2D_view2 = joint_gt_2D_view2[ordering]
-        confidences_view2 = confidences_view2[ordering]
-
-        joint_gt_2D_view3 = joints_gt_2D_all_view3[j]
-        confidences_view3 = confidences_all_view3[j]
-        joint_gt_2D_view3 = joint_gt_2D_view3[ordering]
-        confidences_view3 = confidences_view3[ordering]
-
-        P = np.array(
-            [
-                [P_new[0][0], P_new[0][1], P_new[0][2]],
-                [P_new[1][0], P_new[1][1], P_new[1][2]],
-                [P_new[2][0], P_new[2][1], P_new[2][2]],
-            ],
-        )
-        # P = np.array([[P_new[2][0],P_new[2][1],P_new[2][2]]])
-        Ps_batch = torch.ones(1, 3, 3, 4)
-        Ps_batch[:, :] = torch.tensor(P)
-        joint_num = len(joint_gt_2D_view3)
-        joint_gt = torch.from_numpy(
-            np.array([joint_gt_2D_view1, joint_gt_2D_view2, joint_gt_2D_view3]),
-        )
-        # joint_gt = torch.from_numpy(np.array([joint_gt_2D_view3]))
-        joint_gt = torch.unsqueeze(joint_gt, dim=0).view(1, 3, joint_num, 2)
-        # print(P)
-        confidences_tensor = torch.from_numpy(
-            np.array([confidences_view1, confidences_view2, confidences_view3]),
-        )
-        # confidences_tensor = torch.from_numpy(np.array([confidences_view3]))
-        confidences_tensor = torch.unsqueeze(confidences_tensor, dim=0).view(
-            1,
-            3,
-            joint_num,
-            1,
-        )
-        torch_identity = torch.eye(3)
-        # print(confidences_tensor)
-        img_size = np.array([1920, 1088])  # width, height
-        # h_keys_proj_gt = multiview_projection_batch(Ps_batch.detach(), joint_gt.float())
-        # print(img_size[1],img_size[0])
-        h_keys_proj_gt = normalize_keys_batch(
-            joint_gt.float(),
-            img_size[1],
-            img_size[0],
-        )
-        # h_keys_proj_gt = multiview_projection_batch(Ps_batch.detach(), joint_gt.float())
-        # h_keys_proj_gt = normalize_keys_batch(h_keys_proj_gt, img_size[1], img_size[0])
-        # get the start time
-        print("joint_num", joint_num)
-        st = time.time()
-        vari_dict = {}
-        init_transl = torch.FloatTensor([0, 0, 0])
-        vari_dict["transl"] = (
-            init_transl.view(1, 3).clone().detach().requires_grad_(True)
-        )
-        vari_dict["pose"] = torch.zeros((joint_num * 3), requires_grad=True)
-        params = [
-            {"params": vari_dict["pose"], "lr": 0.05},
-            {"params": vari_dict["transl"], "lr": 0.05},
-        ]
-        optimizer = torch.optim.Adam(params=params)
-        lr_scheduler = torch.optim.lr_scheduler.StepLR(
-            optimizer,
-            step_size=50,
-            gamma=0.1,
-        )
-        itr = 250
-        indices = [4, 5, 10, 11, 1, 2, 7, 8]
-        mult_dict = {4: 10, 5: 10, 10: 10, 11: 10, 1: 5, 2: 5, 7: 5, 8: 5}
-        # change multiple the loss of the joints at index 4 5 10 11 with factor 10
-        for i in range(itr):
-            joints_pos, h_keys_proj = BodySkeletionLayer(
-                vari_dict["pose"],
-                vari_dict["transl"],
-                Ps_batch,
-                img_size,
-                joints_3d[j],
-                joint_names_to_idx,
-            )
-            # loss1 = (torch.mul((h_keys_proj-h_keys_proj_gt).pow(2),confidences_tensor))
-            # loss1[:,:,indices,:] *= 10
-            loss = (
-                torch.mul((h_keys_proj - h_keys_proj_gt).pow(2), confidences_tensor)
-                * torch.tensor(
-                    [
-                        mult_dict[i] if i in indices else 1
-                        for i in range(h_keys_proj.size(2))
-                    ],
-                    dtype=h_keys_proj.dtype,
-                    device=h_keys_proj.device,
-                ).view(1, 1, -1, 1)
-            ).mean()  # +0.000006*vari_dict['pose'].pow(2).mean()  # test with 2d loss
-            # loss = (torch.mul((h_keys_proj-h_keys_proj_gt).pow(2),confidences_tensor)).mean()\
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-            lr_scheduler.step()
-            # print(loss,i)
-        print(j)
-        top_2d = h_keys_proj.detach().numpy()
-        top_data = joints_pos.detach().numpy()
-        enhanced_3d_joints.append(top_data)
-        reprojection_error.append(top_2d)
-        # get the end time
-        et = time.time()
-        # get the execution time
-        elapsed_time = et - st
-        print("Execution time of Body Skeleton Layer:", elapsed_time * 1000, "ms")
-    enhanced_3d_joints = np.array(enhanced_3d_joints)
-    reprojection_error = np.array(reprojection_error)
+    joints_3d, _ = readTrc(path_to_3d_joints)
+    ordering = SKELETON_ORDERING
+    joint_num = len(ordering)
+    img_size = np.array([1920, 1088])  # width, height
+
+    st = time.time()
+    enhanced_3d_joints, reprojection_error, _, _ = fit_trial(
+        paths_to_2d_joints,
+        path_to_3d_joints,
+        "./utils/Calib.toml",
+        img_size=img_size,
+    )
+    elapsed_time = time.time() - st
+    print(
+        "Execution time of Body Skeleton Layer:",
+        elapsed_time * 1000 / len(enhanced_3d_joints),
+        "ms per frame",
+    )
+    # Keep the (frames, 1, ...) layout of the per-frame fitting results
+    enhanced_3d_joints = enhanced_3d_joints[:, None]
+    reprojection_error = reprojection_error[:, None]
     np.save("enhanced_3d_joints_with_weighted_feet_and_hip.npy", enhanced_3d_joints)
     gt_joint = joints_3d
     gt_joint = torch.from_numpy(gt_joint)
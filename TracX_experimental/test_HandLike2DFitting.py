@@ -0,0 +1,121 @@
+"""
+Batched forward kinematics and projection give the same joints as chaining the
+joints one at a time, and fitting frames together gives the same poses as
+fitting them one by one.
+"""
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+from TracX_experimental import HandLike2DFitting as fitting  # noqa: E402
+
+
+def make_rest_joints(nb_frames, seed=0):
+    """Standing skeletons in meters, in the order of SKELETON_JOINTS, with varying bone lengths."""
+    rng = np.random.default_rng(seed)
+    offsets = rng.normal(scale=0.15, size=(len(fitting.SKELETON_JOINTS), 3))
+    offsets[:, 2] -= 0.1
+    offsets[13:, 2] += 0.3  # upper body
+    rest = np.zeros((nb_frames, len(offsets), 3))
+    for j, parent in enumerate(fitting.SKELETON_PARENTS):
+        if parent >= 0:
+            rest[:, j] = rest[:, parent] + offsets[j] * rng.uniform(0.9, 1.1, (nb_frames, 1))
+    return rest + [0, 0, 1]
+
+
+def chained_forward_kinematics(pose, transl, rel_joints, parents):
+    """Forward kinematics chaining the joints one at a time."""
+    B, J = pose.shape[:2]
+    rot_mats = fitting.batch_rodrigues(pose.reshape(-1, 3)).view(B, J, 3, 3)
+    transforms_mat = fitting.transform_mat(rot_mats.reshape(-1, 3, 3), rel_joints.reshape(-1, 3, 1)).view(B, J, 4, 4)
+    transform_chain = [transforms_mat[:, 0]]
+    for i in range(1, J):
+        transform_chain.append(torch.matmul(transform_chain[parents[i]], transforms_mat[:, i]))
+    return torch.stack(transform_chain, dim=1)[:, :, :3, 3] + transl.unsqueeze(dim=1)
+
+
+def camera_matrices():
+    Ps = []
+    for angle in np.linspace(0, 2 * np.pi, 3, endpoint=False):
+        center = np.array([4 * np.cos(angle), 4 * np.sin(angle), 1.0])
+        forward = -center / np.linalg.norm(center)
+        right = np.cross(forward, [0, 0, 1])
+        right /= np.linalg.norm(right)
+        R = np.array([right, np.cross(forward, right), forward])
+        K = np.array([[1000, 0, 960], [0, 1000, 544], [0, 0, 1]])
+        Ps.append(K @ np.column_stack([R, -R @ center]))
+    return np.array(Ps)
+
+
+def test_forward_kinematics_matches_joint_chain():
+    rng = np.random.default_rng(1)
+    B, J = 5, len(fitting.SKELETON_JOINTS)
+    pose = torch.as_tensor(rng.normal(scale=0.5, size=(B, J, 3)), dtype=torch.float32)
+    transl = torch.as_tensor(rng.normal(size=(B, 3)), dtype=torch.float32)
+    rel_joints = fitting.relative_joints(torch.as_tensor(make_rest_joints(B), dtype=torch.float32))
+
+    joints = fitting.forward_kinematics(pose, transl, rel_joints)
+
+    expected = chained_forward_kinematics(pose, transl, rel_joints, fitting.SKELETON_PARENTS)
+    torch.testing.assert_close(joints, expected, rtol=1e-5, atol=1e-6)
+
+
+def test_rest_pose_is_unchanged():
+    rest = torch.as_tensor(make_rest_joints(2), dtype=torch.float32)
+    J = rest.shape[1]
+
+    joints = fitting.forward_kinematics(torch.zeros(2, J, 3), torch.zeros(2, 3), fitting.relative_joints(rest))
+
+    torch.testing.assert_close(joints, rest, rtol=1e-5, atol=1e-6)
+
+
+def test_project_points_matches_multiview_projection():
+    Ps = torch.as_tensor(camera_matrices(), dtype=torch.float32)
+    points = torch.as_tensor(make_rest_joints(4), dtype=torch.float32)
+
+    projected = fitting.project_points(Ps, points)
+
+    expected = fitting.multiview_projection_batch(Ps.expand(4, -1, -1, -1), points)
+    torch.testing.assert_close(projected, expected, rtol=1e-5, atol=1e-4)
+
+
+def synthetic_trial(nb_frames):
+    rng = np.random.default_rng(2)
+    J = len(fitting.SKELETON_JOINTS)
+    rest = make_rest_joints(nb_frames)
+    pose = torch.as_tensor(rng.normal(scale=0.15, size=(nb_frames, J, 3)), dtype=torch.float32)
+    transl = torch.as_tensor(rng.normal(scale=0.1, size=(nb_frames, 3)), dtype=torch.float32)
+    joints = fitting.forward_kinematics(pose, transl, fitting.relative_joints(torch.as_tensor(rest, dtype=torch.float32)))
+    Ps = camera_matrices()
+    keypoints_2d = fitting.project_points(torch.as_tensor(Ps, dtype=torch.float32), joints).numpy()
+    return keypoints_2d, np.ones(keypoints_2d.shape[:3]), Ps, rest
+
+
+def test_frames_of_a_batch_are_fitted_independently():
+    keypoints_2d, confidences, Ps, rest = synthetic_trial(4)
+    kwargs = dict(iterations=60, warm_start=False, img_size=(1920, 1088))
+
+    batched = fitting.fit_frames(keypoints_2d, confidences, Ps, rest, batch_size=4, **kwargs)
+    one_by_one = fitting.fit_frames(keypoints_2d, confidences, Ps, rest, batch_size=1, **kwargs)
+
+    # Within 1 mm: the loss is averaged over the batch, which only changes the weight of Adam's epsilon
+    np.testing.assert_allclose(batched[0], one_by_one[0], atol=1e-3)
+    np.testing.assert_allclose(batched[1], one_by_one[1], atol=1e-4)
+
+
+def test_fit_frames_reduces_reprojection_error():
+    keypoints_2d, confidences, Ps, rest = synthetic_trial(6)
+    img_size = np.array([1920, 1088])
+
+    joints_3d, keypoints_proj, pose, transl = fitting.fit_frames(
+        keypoints_2d, confidences, Ps, rest, img_size=img_size, batch_size=4, smoothness=1e-3
+    )
+
+    assert joints_3d.shape == rest.shape
+    assert pose.shape == rest.shape
+    assert transl.shape == (6, 3)
+    rest_proj = fitting.project_points(torch.as_tensor(Ps, dtype=torch.float32), torch.as_tensor(rest, dtype=torch.float32))
+    rest_error = np.abs(rest_proj.numpy() - keypoints_2d).mean()
+    fit_error = np.abs(keypoints_proj * img_size - keypoints_2d).mean()
+    assert fit_error < rest_error / 2
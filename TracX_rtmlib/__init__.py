@@ -3,17 +3,21 @@
 from .tools import (
     RTMO,
     YOLOX,
+    BatchPoseTracker,
     Body,
     BodyWithFeet,
     BodyWithFeetUE5,
     BodyWithSpine,
     Face,
     Hand,
+    MultiHeadPose,
     PoseTracker,
+    RegionOfInterestTracker,
     RTMDet,
     RTMPose,
     Wholebody,
     WholebodyWithSpine,
+    pooled_solution,
 )
 from .visualization import draw_bbox, draw_skeleton
 
@@ -22,14 +26,19 @@ __all__ = [
     "draw_bbox",
     "Body",
     "BodyWithFeet",
+    "BodyWithFeetUE5",
     "BodyWithSpine",
     "Face",
     "Hand",
+    "MultiHeadPose",
     "PoseTracker",
+    "BatchPoseTracker",
+    "RegionOfInterestTracker",
     "RTMDet",
     "RTMO",
     "RTMPose",
     "Wholebody",
     "WholebodyWithSpine",
     "YOLOX",
+    "pooled_solution",
 ]
@@ -0,0 +1,158 @@
+"""BatchPoseTracker gives the same results as one rtmlib PoseTracker per stream."""
+
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from onnx import TensorProto, helper, numpy_helper  # noqa: E402
+from rtmlib import PoseTracker, RTMPose  # noqa: E402
+
+from TracX_rtmlib import BatchPoseTracker  # noqa: E402
+from TracX_rtmlib.tools.solution.multi_head_pose import MultiHeadPose  # noqa: E402
+
+NB_KEYPOINTS = 17
+INPUT_SIZE = (24, 32)  # (width, height)
+NB_FRAMES = 20
+NB_STREAMS = 3
+
+
+def make_pose_model(path):
+    """RTMPose-like model whose keypoints are fixed positions in the crop."""
+    width, height = INPUT_SIZE
+    rng = np.random.default_rng(0)
+    simcc_x = np.zeros((1, NB_KEYPOINTS, 2 * width), dtype=np.float32)
+    simcc_y = np.zeros((1, NB_KEYPOINTS, 2 * height), dtype=np.float32)
+    simcc_x[0, np.arange(NB_KEYPOINTS), rng.integers(width // 2, 3 * width // 2, NB_KEYPOINTS)] = 1
+    simcc_y[0, np.arange(NB_KEYPOINTS), rng.integers(height // 2, 3 * height // 2, NB_KEYPOINTS)] = 1
+
+    initializers = [
+        numpy_helper.from_array(np.array([1, 2, 3], dtype=np.int64), "axes"),
+        numpy_helper.from_array(np.array([-1, 1, 1], dtype=np.int64), "shape"),
+        numpy_helper.from_array(np.array(0, dtype=np.float32), "zero"),
+        numpy_helper.from_array(simcc_x, "cx"),
+        numpy_helper.from_array(simcc_y, "cy"),
+    ]
+    nodes = [
+        helper.make_node("ReduceSum", ["input", "axes"], ["sum"], keepdims=1),
+        helper.make_node("Reshape", ["sum", "shape"], ["flat"]),
+        helper.make_node("Mul", ["flat", "zero"], ["null"]),
+        helper.make_node("Add", ["null", "cx"], ["simcc_x"]),
+        helper.make_node("Add", ["null", "cy"], ["simcc_y"]),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "pose",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", 3, height, width])],
+        [
+            helper.make_tensor_value_info("simcc_x", TensorProto.FLOAT, ["batch", NB_KEYPOINTS, 2 * width]),
+            helper.make_tensor_value_info("simcc_y", TensorProto.FLOAT, ["batch", NB_KEYPOINTS, 2 * height]),
+        ],
+        initializer=initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+
+# Persons detected in each frame, in detection order. Persons leave and come back, so that
+# track IDs skip indices and PoseTracker returns early without updating its state
+PRESENCE = [
+    [1, 0], [0, 3, 2, 1], [0, 1], [1, 2, 0, 3], [0, 1], [2, 0, 3, 1], [1], [2, 1], [1, 0, 3], [2],
+    [3, 0], [3, 1, 0, 2], [1, 0], [0], [2], [3, 0], [3, 0], [3, 0], [3, 2, 0, 1], [3],
+]
+
+
+def person_bboxes(stream, frame):
+    """Scripted detections of a frame."""
+    bboxes = []
+    for person in PRESENCE[frame]:
+        x = 20 + 80 * person + 3 * frame + 2 * stream
+        y = 40 + 4 * person + 2 * frame
+        bboxes.append(np.array([x, y, x + 60, y + 110], dtype=float))
+    return bboxes
+
+
+class ScriptedDetector:
+    det_mode = "human"
+    model_input_size = (64, 64)
+
+    def __call__(self, image):
+        # The stream and frame indices are encoded in the first pixel
+        return person_bboxes(int(image[0, 0, 0]), int(image[0, 0, 1]))
+
+
+@pytest.fixture(scope="module")
+def solution(tmp_path_factory):
+    pose_path = make_pose_model(tmp_path_factory.mktemp("models") / "pose.onnx")
+
+    class Solution:
+        def __init__(self, to_openpose=False, backend="onnxruntime", device="cpu", mode=None):
+            self.det_model = ScriptedDetector()
+            self.pose_model = RTMPose(pose_path, model_input_size=INPUT_SIZE, backend=backend, device=device)
+
+    return Solution
+
+
+def make_frames():
+    frames = []
+    for t in range(NB_FRAMES):
+        frame_set = []
+        for c in range(NB_STREAMS):
+            image = np.full((240, 400, 3), 128, dtype=np.uint8)
+            image[0, 0, :2] = c, t
+            frame_set.append(image)
+        frames.append(frame_set)
+    return frames
+
+
+@pytest.mark.parametrize("tracking", [True, False])
+@pytest.mark.parametrize("det_frequency", [1, 3])
+def test_matches_pose_tracker(solution, tracking, det_frequency):
+    frames = make_frames()
+    expected = []
+    for c in range(NB_STREAMS):
+        tracker = PoseTracker(solution, det_frequency=det_frequency, tracking=tracking)
+        expected.append([tracker(frames[t][c]) for t in range(NB_FRAMES)])
+
+    tracker = BatchPoseTracker(solution, det_frequency=det_frequency, tracking=tracking, batch_size=4)
+    results = list(tracker.run(frames))
+
+    assert len(results) == NB_FRAMES
+    for t in range(NB_FRAMES):
+        for c in range(NB_STREAMS):
+            keypoints, scores = results[t][c]
+            expected_keypoints, expected_scores = expected[c][t]
+            assert np.shape(keypoints) == np.shape(expected_keypoints), (t, c)
+            np.testing.assert_allclose(keypoints, expected_keypoints, atol=1e-3, err_msg=f"frame {t}, stream {c}")
+            np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+
+
+def test_buffers_at_most_batch_size_frames(solution):
+    pulled = []
+
+    def frame_sets():
+        for frame_set in make_frames():
+            pulled.append(frame_set)
+            yield frame_set
+
+    tracker = BatchPoseTracker(solution, det_frequency=100, batch_size=4)
+    next(tracker.run(frame_sets()))
+    # Two frame sets of three frames reach the batch size
+    assert len(pulled) == 2
+
+
+def test_shared_pose_model_is_not_modified(solution):
+    # Pooled solutions share their pose model between trackers
+    shared = MultiHeadPose([solution().pose_model], batch_size=8)
+
+    class SharedSolution:
+        def __init__(self, **kwargs):
+            self.det_model = ScriptedDetector()
+            self.pose_model = shared
+
+    tracker = BatchPoseTracker(SharedSolution, batch_size=4, pose_batch_size=2)
+    list(tracker.run(make_frames()[:2]))
+    assert tracker.pose_batch_size == 2
+    assert shared.batch_size == 8
@@ -0,0 +1,147 @@
+"""Model registry: lookup order of model URLs, identification of local models and sharing between processes."""
+
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from onnx import TensorProto, helper, numpy_helper  # noqa: E402
+
+from TracX_rtmlib.tools import model_registry  # noqa: E402
+
+URL = "https://example.com/models/rtmpose-t_simcc-body7_pt-body7_420e-256x192-026a1439_20230504.zip"
+MODEL_ID = "rtmpose-t_simcc-body7_pt-body7_420e-256x192-026a1439_20230504"
+
+
+def make_model(path, offset=0.0):
+    """Minimal ONNX model adding a constant to its input."""
+    graph = helper.make_graph(
+        [helper.make_node("Add", ["input", "offset"], ["output"])],
+        "add",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, [1, 3])],
+        initializer=[numpy_helper.from_array(np.full((1, 3), offset, dtype=np.float32), "offset")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    onnx.save(model, str(path))
+    return str(path)
+
+
+@pytest.fixture
+def downloads(tmp_path, monkeypatch):
+    """Registry in a temporary directory, and the URLs it downloads."""
+    cache = tmp_path / "registry"
+    monkeypatch.setattr(model_registry, "MODEL_CACHE", str(cache))
+    monkeypatch.setattr(model_registry, "MANIFEST_FILE", str(cache / "manifest.json"))
+    monkeypatch.setattr(model_registry, "_get_rtmhub_dir", lambda: str(tmp_path / "hub"))
+    monkeypatch.setattr(model_registry, "_verified", set())
+    downloads = []
+
+    def download_checkpoint(url, dst_dir=None):
+        if dst_dir == str(tmp_path / "hub" / "checkpoints"):
+            path = os.path.join(dst_dir, model_registry.model_id(url) + ".onnx")
+            assert os.path.exists(path), "rtmlib would download the model"
+            return path
+        downloads.append(url)
+        return make_model(os.path.join(dst_dir, model_registry.model_id(url) + ".onnx"))
+
+    monkeypatch.setattr(model_registry, "download_checkpoint", download_checkpoint)
+    return downloads
+
+
+def test_resolve_registers_rtmlib_checkpoint_without_download(downloads, tmp_path):
+    make_model(tmp_path / "hub" / "checkpoints" / f"{MODEL_ID}.onnx")
+
+    path = model_registry.resolve(URL, optimize=False)
+
+    assert downloads == []
+    assert path == os.path.join(model_registry.MODEL_CACHE, f"{MODEL_ID}.onnx")
+    assert model_registry.load_manifest()[MODEL_ID]["source"] == URL
+
+
+def test_resolve_downloads_missing_model_once(downloads):
+    first = model_registry.resolve(URL, optimize=False)
+    second = model_registry.resolve(URL, optimize=False)
+
+    assert downloads == [URL]
+    assert first == second
+    assert model_registry.verify(MODEL_ID) == first
+
+
+def test_verify_detects_corrupted_model(downloads):
+    path = model_registry.resolve(URL, optimize=False)
+    model_registry._verified.clear()
+    with open(path, "ab") as f:
+        f.write(b"corrupted")
+
+    with pytest.raises(RuntimeError, match="corrupted"):
+        model_registry.verify(MODEL_ID)
+
+
+def test_local_models_of_same_name_are_optimized_separately(downloads, tmp_path):
+    first = make_model(tmp_path / "a" / "model.onnx", offset=1.0)
+    second = make_model(tmp_path / "b" / "model.onnx", offset=2.0)
+
+    optimized_first = model_registry.resolve(first)
+    optimized_second = model_registry.resolve(second)
+
+    assert optimized_first != optimized_second
+    assert model_registry.resolve(first) == optimized_first
+    assert onnx.load(optimized_first) != onnx.load(optimized_second)
+    assert "model" not in model_registry.load_manifest()
+
+
+def test_seed_and_pack_round_trip(downloads, tmp_path):
+    make_model(tmp_path / "models" / f"{MODEL_ID}.onnx")
+
+    assert model_registry.seed(str(tmp_path / "models")) == [MODEL_ID]
+    archive = model_registry.pack(str(tmp_path / "models.zip"))
+    assert os.path.exists(tmp_path / "hub" / "checkpoints" / f"{MODEL_ID}.onnx")
+
+    # A node without the model seeded from the packed archive
+    os.remove(os.path.join(model_registry.MODEL_CACHE, f"{MODEL_ID}.onnx"))
+    model_registry._verified.clear()
+    assert model_registry.seed(archive) == [MODEL_ID]
+    assert model_registry.resolve(URL, optimize=False) == os.path.join(model_registry.MODEL_CACHE, f"{MODEL_ID}.onnx")
+    assert downloads == []
+
+
+def _register_models(models, barrier):
+    barrier.wait()
+    for path in models:
+        model_registry.register(path)
+
+
+def test_concurrent_processes_keep_all_registrations(downloads, tmp_path):
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        pytest.skip("fork is not available")
+    models = [[make_model(tmp_path / "models" / f"model{p}_{i}.onnx", offset=i) for i in range(10)] for p in range(4)]
+    barrier = context.Barrier(len(models))
+    processes = [context.Process(target=_register_models, args=(paths, barrier)) for paths in models]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+
+    assert [process.exitcode for process in processes] == [0] * len(models)
+    manifest = model_registry.load_manifest()
+    assert sorted(manifest) == sorted(model_registry.model_id(path) for paths in models for path in paths)
+    for mid in manifest:
+        model_registry.verify(mid)
+    assert not [f for f in os.listdir(model_registry.MODEL_CACHE) if ".tmp" in f]
+
+
+def test_failed_optimization_leaves_no_temporary_file(downloads, tmp_path):
+    path = str(tmp_path / "model.onnx")
+    with open(path, "wb") as f:
+        f.write(b"not a model")
+
+    assert model_registry.resolve(path) == path
+    assert not [f for f in os.listdir(model_registry.MODEL_CACHE) if ".tmp" in f]
@@ -0,0 +1,121 @@
+"""MultiHeadPose gives the same keypoints as running each RTMPose head on its own."""
+
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+from onnx import TensorProto, helper, numpy_helper  # noqa: E402
+from rtmlib import RTMPose  # noqa: E402
+
+from TracX_rtmlib.tools.solution.multi_head_pose import MultiHeadPose, merge_onnx_heads  # noqa: E402
+
+INPUT_SIZE = (16, 24)  # (width, height)
+
+
+def make_head(path, nb_keypoints, seed, batch="batch"):
+    """RTMPose-like model whose SimCC outputs are a random linear function of the crop."""
+    width, height = INPUT_SIZE
+    rng = np.random.default_rng(seed)
+    nb_features = 3 * width * height
+    initializers = [
+        numpy_helper.from_array(np.array([-1, nb_features], dtype=np.int64), "flat_shape"),
+        numpy_helper.from_array(rng.normal(size=(nb_features, nb_keypoints * 2 * width)).astype(np.float32), "wx"),
+        numpy_helper.from_array(rng.normal(size=(nb_features, nb_keypoints * 2 * height)).astype(np.float32), "wy"),
+        numpy_helper.from_array(np.array([-1, nb_keypoints, 2 * width], dtype=np.int64), "x_shape"),
+        numpy_helper.from_array(np.array([-1, nb_keypoints, 2 * height], dtype=np.int64), "y_shape"),
+    ]
+    nodes = [
+        helper.make_node("Reshape", ["input", "flat_shape"], ["flat"]),
+        helper.make_node("MatMul", ["flat", "wx"], ["x"]),
+        helper.make_node("MatMul", ["flat", "wy"], ["y"]),
+        helper.make_node("Reshape", ["x", "x_shape"], ["simcc_x"]),
+        helper.make_node("Reshape", ["y", "y_shape"], ["simcc_y"]),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "pose",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [batch, 3, height, width])],
+        [
+            helper.make_tensor_value_info("simcc_x", TensorProto.FLOAT, [batch, nb_keypoints, 2 * width]),
+            helper.make_tensor_value_info("simcc_y", TensorProto.FLOAT, [batch, nb_keypoints, 2 * height]),
+        ],
+        initializer=initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def head_paths(tmp_path_factory):
+    models_dir = tmp_path_factory.mktemp("models")
+    return {
+        "body": make_head(models_dir / "body.onnx", 6, seed=0),
+        "spine": make_head(models_dir / "spine.onnx", 5, seed=1),
+        "static": make_head(models_dir / "static.onnx", 4, seed=2, batch=1),
+    }
+
+
+def load(path):
+    return RTMPose(path, model_input_size=INPUT_SIZE)
+
+
+def make_images():
+    rng = np.random.default_rng(3)
+    images = [rng.integers(0, 256, (120, 160, 3), dtype=np.uint8) for _ in range(3)]
+    bboxes_list = [
+        [[10, 20, 60, 110], [70, 5, 150, 100], [0, 0, 40, 60]],
+        [],
+        [[30, 30, 90, 118]],
+    ]
+    return images, bboxes_list
+
+
+def expected_results(heads, keypoint_slices, images, bboxes_list):
+    results = []
+    for image, bboxes in zip(images, bboxes_list):
+        outputs = [head(image, bboxes) for head in heads]
+        keypoints = np.concatenate([kpts[:, s] for (kpts, _), s in zip(outputs, keypoint_slices)], axis=1)
+        scores = np.concatenate([score[:, s] for (_, score), s in zip(outputs, keypoint_slices)], axis=1)
+        results.append((keypoints, scores))
+    return results
+
+
+def assert_same_results(results, expected):
+    assert len(results) == len(expected)
+    for (keypoints, scores), (expected_keypoints, expected_scores) in zip(results, expected):
+        assert keypoints.shape == expected_keypoints.shape
+        np.testing.assert_allclose(keypoints, expected_keypoints, atol=1e-3)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize("batch_size", [None, 2])
+def test_matches_separate_heads(head_paths, batch_size):
+    heads = [load(head_paths["body"]), load(head_paths["spine"]), load(head_paths["static"])]
+    keypoint_slices = [slice(None), slice(1, 4), slice(None)]
+    images, bboxes_list = make_images()
+
+    pose = MultiHeadPose(heads, keypoint_slices=[None, slice(1, 4), None], batch_size=batch_size)
+
+    assert_same_results(pose.estimate_many(images, bboxes_list), expected_results(heads, keypoint_slices, images, bboxes_list))
+    assert_same_results([pose(images[0], bboxes_list[0])], expected_results(heads, keypoint_slices, images[:1], bboxes_list[:1]))
+
+
+def test_merged_model_matches_separate_heads(head_paths, tmp_path):
+    heads = [load(head_paths["body"]), load(head_paths["spine"])]
+    merged = load(merge_onnx_heads([head_paths["body"], head_paths["spine"]], str(tmp_path / "merged.onnx")))
+    images, bboxes_list = make_images()
+
+    pose = MultiHeadPose(heads, keypoint_slices=[None, slice(2, None)], merged_model=merged)
+
+    expected = expected_results(heads, [slice(None), slice(2, None)], images, bboxes_list)
+    assert_same_results(pose.estimate_many(images, bboxes_list), expected)
+
+
+def test_merged_heads_must_share_preprocessing(head_paths):
+    heads = [load(head_paths["body"]), RTMPose(head_paths["spine"], model_input_size=INPUT_SIZE, mean=None, std=None)]
+
+    with pytest.raises(ValueError, match="share the same input size"):
+        MultiHeadPose(heads, merged_model=heads[0])
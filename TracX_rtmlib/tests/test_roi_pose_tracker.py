@@ -0,0 +1,182 @@
+"""RegionOfInterestTracker detects persons on the full frame, then only around the tracked persons."""
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("rtmlib")
+from TracX_rtmlib.tools.solution.roi_pose_tracker import (  # noqa: E402
+    RegionOfInterestTracker,
+    padded_roi,
+)
+
+WIDTH, HEIGHT = 640, 480
+
+
+class StubDetector:
+    """Detects the bright rectangles of an image, and records the shape of the images it is given."""
+
+    det_mode = "human"
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, image):
+        self.shapes.append(image.shape[:2])
+        nb_labels, _, stats, _ = cv2.connectedComponentsWithStats((image[..., 0] > 0).astype(np.uint8))
+        return np.array([[x, y, x + w, y + h] for x, y, w, h, _ in stats[1:nb_labels]], dtype=float).reshape(-1, 4)
+
+
+class StubPose:
+    """Keypoints at the corners of the bright pixels of each box, with a settable score."""
+
+    def __init__(self):
+        self.score = 0.9
+        self.bboxes = []
+
+    def __call__(self, image, bboxes):
+        self.bboxes.append([np.asarray(bbox, dtype=float) for bbox in bboxes])
+        keypoints, scores = [], []
+        for bbox in bboxes:
+            x0, y0 = np.maximum(np.floor(bbox[:2]).astype(int), 0)
+            x1, y1 = np.ceil(bbox[2:4]).astype(int)
+            ys, xs = np.nonzero(image[y0:y1, x0:x1, 0])
+            if len(xs):
+                xs, ys = xs + x0, ys + y0
+                keypoints.append([[xs.min(), ys.min()], [xs.max(), ys.min()], [xs.min(), ys.max()], [xs.max(), ys.max()]])
+                scores.append([self.score] * 4)
+            else:
+                keypoints.append([bbox[:2], bbox[2:4], bbox[:2], bbox[2:4]])
+                scores.append([0.0] * 4)
+        return np.array(keypoints, dtype=float).reshape(-1, 4, 2), np.array(scores).reshape(-1, 4)
+
+
+class StubSolution:
+    def __init__(self, **kwargs):
+        self.det_model = StubDetector()
+        self.pose_model = StubPose()
+
+
+def frame(*persons):
+    """Black frame with white rectangles (x0, y0, x1, y1) for the persons."""
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    for x0, y0, x1, y1 in persons:
+        image[y0:y1, x0:x1] = 255
+    return image
+
+
+def make_tracker(**kwargs):
+    kwargs = {"redetect_interval": 3, "full_frame_interval": 100, "report_interval": 0, **kwargs}
+    return RegionOfInterestTracker(StubSolution, tracking=True, **kwargs)
+
+
+PERSON = (300, 200, 340, 300)
+
+
+def test_first_frame_is_detected_on_full_frame():
+    tracker = make_tracker()
+
+    keypoints, scores = tracker(frame(PERSON))
+
+    assert tracker.detector.shapes == [(HEIGHT, WIDTH)]
+    assert tracker.full_frame
+    assert len(keypoints) == 1
+    np.testing.assert_array_equal(keypoints[0].min(axis=0), PERSON[:2])
+
+
+def test_crop_is_detected_every_redetect_interval():
+    tracker = make_tracker(redetect_interval=3)
+
+    detected_frames = []
+    for i in range(10):
+        nb_detections = len(tracker.detector.shapes)
+        tracker(frame(PERSON))
+        if len(tracker.detector.shapes) > nb_detections:
+            detected_frames.append(i)
+
+    # Three frames without detection between two detections
+    assert detected_frames == [0, 4, 8]
+    x0, y0, x1, y1 = padded_roi(tracker.tracked_bboxes, (HEIGHT, WIDTH), tracker.padding)
+    assert tracker.detector.shapes[1:] == [(y1 - y0, x1 - x0)] * 2
+    assert y1 - y0 < HEIGHT and x1 - x0 < WIDTH
+
+
+def test_crop_offset_is_applied_to_detected_boxes():
+    tracker = make_tracker(redetect_interval=0)
+    moved = (310, 210, 350, 310)
+
+    tracker(frame(PERSON))
+    tracker(frame(moved))
+
+    # The second frame is detected in a crop, but pose is estimated from boxes of the full frame
+    assert tracker.detector.shapes[1] != (HEIGHT, WIDTH)
+    assert not tracker.full_frame
+    np.testing.assert_array_equal(tracker.pose_model.bboxes[1], [moved])
+
+
+def test_full_frame_is_detected_when_confidence_drops():
+    tracker = make_tracker(redetect_interval=100, confidence_threshold=0.5)
+    tracker(frame(PERSON))
+    tracker(frame(PERSON))
+    assert len(tracker.detector.shapes) == 1
+
+    tracker.pose_model.score = 0.2
+    tracker(frame(PERSON))
+    tracker(frame(PERSON))
+
+    assert tracker.detector.shapes == [(HEIGHT, WIDTH)] * 2
+    assert tracker.full_frame
+
+
+def test_full_frame_is_detected_when_persons_are_lost():
+    other = (100, 100, 140, 200)
+    tracker = make_tracker(redetect_interval=1, confidence_threshold=0)
+    tracker(frame(PERSON, other))
+    tracker(frame(PERSON, other))
+
+    # The other person disappears when the region around both persons is detected
+    tracker(frame(PERSON))
+    assert tracker.detector.shapes[1] != (HEIGHT, WIDTH)
+    tracker(frame(PERSON))
+
+    assert tracker.detector.shapes[2] == (HEIGHT, WIDTH)
+
+
+def test_full_frame_is_detected_while_no_one_is_tracked():
+    tracker = make_tracker()
+
+    for _ in range(3):
+        tracker(frame())
+    tracker(frame(PERSON))
+
+    assert tracker.detector.shapes == [(HEIGHT, WIDTH)] * 4
+
+
+def test_full_frame_is_detected_every_full_frame_interval():
+    tracker = make_tracker(redetect_interval=1, full_frame_interval=4)
+
+    full_frames = []
+    for i in range(11):
+        tracker(frame(PERSON))
+        if tracker.full_frame:
+            full_frames.append(i)
+
+    # Four frames without full-frame detection between two of them
+    assert full_frames == [0, 5, 10]
+
+
+def test_padded_roi_is_clipped_to_image():
+    assert padded_roi([[100, 100, 200, 300]], (480, 640), padding=0.25) == (75, 50, 225, 350)
+    assert padded_roi([[10, 10, 50, 50], [600, 400, 630, 470]], (480, 640), padding=0.25) == (0, 0, 640, 480)
+
+
+def test_report_is_logged_every_report_interval(caplog):
+    tracker = make_tracker(report_interval=4)
+
+    with caplog.at_level("INFO"):
+        for _ in range(8):
+            tracker(frame(PERSON))
+
+    reports = [r.message for r in caplog.records if "Region of interest tracking" in r.message]
+    assert len(reports) == 2
+    assert tracker.fps_gain is not None
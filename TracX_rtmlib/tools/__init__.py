@@ -2,7 +2,17 @@ from rtmlib.tools.object_detection import YOLOX, RTMDet
 from rtmlib.tools.pose_estimation import RTMO, RTMPose
 from rtmlib.tools.solution import Body, BodyWithFeet, Hand, PoseTracker, Wholebody
 
-from .solution import BodyWithFeetUE5, BodyWithSpine, Face, WholebodyWithSpine
+from .model_registry import pooled_solution
+from .solution import (
+    BatchPoseTracker,
+    BodyWithFeetUE5,
+    BodyWithSpine,
+    Face,
+    MultiHeadPose,
+    RegionOfInterestTracker,
+    WholebodyWithSpine,
+    merge_onnx_heads,
+)
 
 __all__ = [
     "RTMDet",
@@ -13,9 +23,14 @@ __all__ = [
     "Face",
     "Hand",
     "PoseTracker",
+    "BatchPoseTracker",
+    "RegionOfInterestTracker",
     "RTMO",
     "BodyWithFeet",
     "BodyWithFeetUE5",
     "BodyWithSpine",
     "WholebodyWithSpine",
+    "MultiHeadPose",
+    "merge_onnx_heads",
+    "pooled_solution",
 ]
@@ -0,0 +1,476 @@
+"""
+Local registry of the pose estimation models, with a process-wide pool of warm sessions.
+
+Models are identified by the name of their ONNX file, or of the zip archive they are
+downloaded from (e.g. "rtmpose-m_simcc-body7_pt-body7-halpe26_700e-256x192-4d3e73dd_20230605").
+The registry resolves a model URL or path to a verified local file in `MODEL_CACHE`:
+files are checked against the SHA-256 recorded in the manifest the first time they are
+used in a process. Models already downloaded by rtmlib are registered from its checkpoints
+directory instead of being downloaded again. With the onnxruntime backend, the graph
+optimizations of each model are applied once and the optimized model is saved next to it.
+Local models outside the registry are identified by their content, so that two files of
+the same name do not share their optimized model.
+
+Several processes can share the registry: files are written under unique temporary names
+and moved into place, and the manifest is updated under a file lock.
+
+Processing nodes without internet access can be seeded from a local archive of models
+(a zip or tar file, or a directory, of ONNX files):
+
+    python -m TracX_rtmlib.tools.model_registry pack models.zip
+    python -m TracX_rtmlib.tools.model_registry seed models.zip
+    python -m TracX_rtmlib.tools.model_registry verify
+
+Seeded models are also made available to the rtmlib solutions (Body, BodyWithFeet, ...),
+which look for them in the rtmlib checkpoints directory.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+
+from rtmlib.tools.file import _get_rtmhub_dir, download_checkpoint
+
+from TracX.constants import APP_CACHE
+
+MODEL_CACHE = os.path.join(APP_CACHE, "models")
+MANIFEST_FILE = os.path.join(MODEL_CACHE, "manifest.json")
+
+_lock = threading.RLock()
+_verified = set()
+_hashes = {}
+_tools = {}
+_solutions = {}
+
+
+def model_id(model):
+    """
+    Identifier of a model URL or path: the name of its file without extension.
+    """
+    return os.path.basename(model.rstrip("/")).split(".")[0]
+
+
+def _sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _content_hash(path):
+    """
+    SHA-256 of a file, computed once per process for each version of the file.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        _hashes[key] = _sha256(path)
+    return _hashes[key]
+
+
+def load_manifest():
+    """
+    Read the manifest of the registry, or an empty manifest.
+    """
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    return {}
+
+
+def _temp_path(path):
+    """
+    Unique temporary file next to `path`, to move into place with `os.replace`.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    root, ext = os.path.splitext(os.path.basename(path))
+    fd, tmp = tempfile.mkstemp(prefix=root + ".", suffix=".tmp" + ext, dir=os.path.dirname(path))
+    os.close(fd)
+    return tmp
+
+
+def _replace(src, dst):
+    try:
+        os.replace(src, dst)
+    except BaseException:
+        os.remove(src)
+        raise
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """
+    Exclusive lock of a file, shared by all processes. Not reentrant.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    # Locks the first byte, retrying for 10 s before raising
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def _updated_manifest():
+    """
+    Manifest to update, saved on exit. Other threads and processes wait for the update.
+    """
+    with _lock, _file_lock(MANIFEST_FILE + ".lock"):
+        manifest = load_manifest()
+        yield manifest
+        _save_manifest(manifest)
+
+
+def _save_manifest(manifest):
+    tmp = _temp_path(MANIFEST_FILE)
+    try:
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    _replace(tmp, MANIFEST_FILE)
+
+
+def register(path, source=None):
+    """
+    Copy an ONNX model into the registry and record its SHA-256.
+
+    Args:
+        path (str): Path of the ONNX model.
+        source (str, optional): URL or path the model comes from. Default is `path`.
+
+    Returns:
+        str: The path of the model in the registry.
+    """
+    mid = model_id(source or path)
+    cached = os.path.join(MODEL_CACHE, mid + ".onnx")
+    if os.path.abspath(path) != os.path.abspath(cached):
+        tmp = _temp_path(cached)
+        try:
+            shutil.copyfile(path, tmp)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        _replace(tmp, cached)
+    with _updated_manifest() as manifest:
+        manifest[mid] = {"file": mid + ".onnx", "sha256": _content_hash(cached), "source": source or path, "optimized": {}}
+        _verified.add(cached)
+    return cached
+
+
+def verify(mid, manifest=None):
+    """
+    Check the SHA-256 of a registered model.
+
+    Raises:
+        FileNotFoundError: If the model is not in the registry.
+        RuntimeError: If the model file does not match its recorded SHA-256.
+    """
+    manifest = load_manifest() if manifest is None else manifest
+    if not manifest.get(mid, {}).get("file"):
+        raise FileNotFoundError(f"Model {mid} is not in the registry {MODEL_CACHE}")
+    path = os.path.join(MODEL_CACHE, manifest[mid]["file"])
+    if path in _verified:
+        return path
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model {mid} is registered but {path} is missing")
+    if _content_hash(path) != manifest[mid]["sha256"]:
+        raise RuntimeError(f"Model {path} is corrupted: its SHA-256 does not match the registry. Seed it again.")
+    _verified.add(path)
+    return path
+
+
+def resolve(model, backend="onnxruntime", device="cpu", optimize=True):
+    """
+    Resolve a model URL or path to a verified local ONNX file.
+
+    Local paths are used as they are. URLs are looked up in the registry, then in the rtmlib
+    checkpoints directory, and downloaded into the registry when missing from both, which
+    requires internet access.
+
+    Args:
+        model (str): URL or path of the model.
+        backend (str): Inference backend. Only onnxruntime models are optimized.
+        device (str): Device the optimized model is made for.
+        optimize (bool): Whether to return the optimized model.
+
+    Returns:
+        str: The path of the model.
+    """
+    with _lock:
+        if os.path.exists(model):
+            path = model
+        else:
+            mid = model_id(model)
+            manifest = load_manifest()
+            checkpoints_dir = os.path.join(_get_rtmhub_dir(), "checkpoints")
+            if manifest.get(mid, {}).get("file"):
+                path = verify(mid, manifest)
+            elif os.path.exists(os.path.join(checkpoints_dir, os.path.basename(model))) or os.path.exists(
+                os.path.join(checkpoints_dir, mid + ".onnx")
+            ):
+                # Downloaded by rtmlib: download_checkpoint returns it, extracting it if needed
+                path = register(download_checkpoint(model, dst_dir=checkpoints_dir), source=model)
+            else:
+                logging.info(f"Model {mid} is not in the registry, downloading it from {model}")
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    path = register(download_checkpoint(model, dst_dir=tmp_dir), source=model)
+
+        if optimize and backend == "onnxruntime":
+            return optimized_model(path, device)
+        return path
+
+
+def optimized_model(path, device="cpu"):
+    """
+    Apply the onnxruntime graph optimizations of a model once and save the optimized model.
+
+    The optimized model is saved in the registry and reused until the content of the
+    original model changes.
+
+    Returns:
+        str: The path of the optimized model, or `path` if it could not be optimized.
+    """
+    import onnxruntime as ort
+
+    signature = _content_hash(path)
+    mid = model_id(path)
+    if os.path.dirname(os.path.abspath(path)) != os.path.abspath(MODEL_CACHE):
+        # Local files outside the registry may share their name with other models
+        mid = f"{mid}-{signature[:16]}"
+    optimized = os.path.join(MODEL_CACHE, f"{mid}.{device.replace(':', '_')}.opt.onnx")
+
+    with _lock:
+        entry = load_manifest().get(mid, {})
+        if entry.get("optimized", {}).get(device) == signature and os.path.exists(optimized):
+            return optimized
+
+        # Saved under a unique name, in case another process optimizes the same model
+        tmp = _temp_path(optimized)
+        options = ort.SessionOptions()
+        # Layout optimizations depend on the hardware and are left to the session.
+        # Extended optimizations fuse nodes into CPU kernels, basic ones run on any provider.
+        options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+            if device == "cpu"
+            else ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+        )
+        options.optimized_model_filepath = tmp
+        try:
+            ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        except Exception as e:
+            os.remove(tmp)
+            logging.warning(f"Could not optimize model {path}: {e}")
+            return path
+        _replace(tmp, optimized)
+
+        with _updated_manifest() as manifest:
+            entry = manifest.setdefault(mid, {"file": None, "sha256": None, "source": path, "optimized": {}})
+            entry["optimized"][device] = signature
+    return optimized
+
+
+def get_tool(tool_class, model, backend="onnxruntime", device="cpu", **kwargs):
+    """
+    Warm instance of an rtmlib tool (YOLOX, RTMPose, ...), shared by the whole process.
+
+    The instance is created on first use, from the resolved model, and reused by every
+    later call with the same arguments.
+
+    Args:
+        tool_class (type): rtmlib tool class.
+        model (str): URL or path of the model.
+        backend (str): Inference backend.
+        device (str): Inference device.
+        **kwargs: Other arguments of the tool (model_input_size, to_openpose, ...).
+    """
+    key = (tool_class, model, backend, device, _freeze(kwargs))
+    with _lock:
+        if key not in _tools:
+            path = resolve(model, backend=backend, device=device)
+            tool = tool_class(path, backend=backend, device=device, **kwargs)
+            # Model before optimization, to convert it to other precisions
+            tool.source_model = resolve(model, backend=backend, device=device, optimize=False)
+            _tools[key] = tool
+        return _tools[key]
+
+
+def get_solution(solution_class, precision="fp32", videos=None, **kwargs):
+    """
+    Warm instance of a pose estimation solution (Body, BodyWithSpine, ...), shared by the whole process.
+
+    Args:
+        solution_class (type): Solution class.
+        precision (str): Precision of the models, "fp32", "int8" or "fp16" (see `quantization`).
+        videos (list, optional): Videos whose frames calibrate INT8 models.
+        **kwargs: Arguments of the solution (mode, backend, device, ...).
+    """
+    videos_key = tuple(sorted(os.path.abspath(v) for v in videos or [])) if precision == "int8" else ()
+    key = (solution_class, precision, videos_key, _freeze(kwargs))
+    with _lock:
+        if key not in _solutions:
+            solution = solution_class(**kwargs)
+            if precision != "fp32":
+                from .quantization import apply_precision
+
+                apply_precision(solution, precision, videos)
+            _solutions[key] = solution
+        return _solutions[key]
+
+
+def pooled_solution(solution_class, precision="fp32", videos=None):
+    """
+    Factory of warm solution instances, to pass to `PoseTracker` instead of the solution class.
+
+    Usage:
+        pose_tracker = PoseTracker(pooled_solution(BodyWithFeet), mode="balanced")
+    """
+
+    def factory(**kwargs):
+        return get_solution(solution_class, precision=precision, videos=videos, **kwargs)
+
+    factory.__name__ = factory.__qualname__ = solution_class.__name__
+    return factory
+
+
+def clear_pool():
+    """
+    Release all warm tools and solutions.
+    """
+    with _lock:
+        _tools.clear()
+        _solutions.clear()
+
+
+def _freeze(kwargs):
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in kwargs.items()))
+
+
+def seed(archive):
+    """
+    Add the ONNX models of a local archive to the registry.
+
+    The models are also linked in the rtmlib checkpoints directory, so the rtmlib
+    solutions find them without downloading them.
+
+    Args:
+        archive (str): Zip or tar archive, or directory, of ONNX models.
+
+    Returns:
+        list: The identifiers of the added models.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if os.path.isdir(archive):
+            root = archive
+        elif zipfile.is_zipfile(archive):
+            with zipfile.ZipFile(archive) as f:
+                f.extractall(tmp_dir)
+            root = tmp_dir
+        elif tarfile.is_tarfile(archive):
+            with tarfile.open(archive) as f:
+                # Reject absolute paths and links out of the archive where supported
+                kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+                f.extractall(tmp_dir, **kwargs)
+            root = tmp_dir
+        else:
+            raise ValueError(f"{archive} is not a directory, a zip or a tar archive")
+
+        added = []
+        checkpoints_dir = os.path.join(_get_rtmhub_dir(), "checkpoints")
+        os.makedirs(checkpoints_dir, exist_ok=True)
+        for dirpath, _, filenames in os.walk(root):
+            for filename in sorted(filenames):
+                if not filename.endswith(".onnx") or filename.endswith(".opt.onnx"):
+                    continue
+                path = register(os.path.join(dirpath, filename))
+                checkpoint = os.path.join(checkpoints_dir, os.path.basename(path))
+                if not os.path.exists(checkpoint):
+                    try:
+                        os.symlink(path, checkpoint)
+                    except OSError:
+                        shutil.copyfile(path, checkpoint)
+                added.append(model_id(path))
+    return added
+
+
+def pack(archive, models=None):
+    """
+    Save registered models in a zip archive, to seed other nodes with `seed`.
+
+    Args:
+        archive (str): Path of the zip archive.
+        models (list, optional): Identifiers of the models. Default is all registered models.
+    """
+    manifest = load_manifest()
+    models = models or [mid for mid, entry in manifest.items() if entry["file"]]
+    with zipfile.ZipFile(archive, "w") as f:
+        for mid in models:
+            f.write(verify(mid, manifest), arcname=manifest[mid]["file"])
+    return archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local registry of pose estimation models.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    seed_parser = subparsers.add_parser("seed", help="Add the models of a local archive to the registry")
+    seed_parser.add_argument("archive", help="Zip or tar archive, or directory, of ONNX models")
+    pack_parser = subparsers.add_parser("pack", help="Save the registered models in a zip archive")
+    pack_parser.add_argument("archive", help="Path of the zip archive")
+    pack_parser.add_argument("models", nargs="*", help="Identifiers of the models (default: all)")
+    subparsers.add_parser("verify", help="Check the SHA-256 of all registered models")
+    subparsers.add_parser("list", help="List the registered models")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        for mid in seed(args.archive):
+            print(f"Added {mid}")
+    elif args.command == "pack":
+        print(f"Saved {pack(args.archive, args.models)}")
+    else:
+        failed = 0
+        for mid, entry in load_manifest().items():
+            if not entry["file"]:
+                continue
+            status = "ok"
+            if args.command == "verify":
+                try:
+                    verify(mid)
+                except (FileNotFoundError, RuntimeError) as e:
+                    status, failed = str(e), failed + 1
+            print(f"{mid}: {status}")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,398 @@
+"""
+Reduced precision profiles of the detection and pose models for CPU inference.
+
+- "fp32": the original models.
+- "int8": static INT8 quantization (QDQ format), calibrated on a sample of frames of the
+  videos to process. The calibration ranges are those of the experiment's own images.
+- "fp16": FP16 weights and activations, only used on CPUs with native FP16 arithmetic.
+
+Converted models are cached in the model registry, keyed by the original model and, for
+INT8, by the calibration frames, so each model is calibrated once per set of videos.
+
+The accuracy and throughput of each profile can be compared with FP32 on the same frames:
+
+    python -m TracX_rtmlib.tools.quantization report path/to/experiment --precisions int8 fp16
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import logging
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+from rtmlib.tools.base import BaseTool
+from rtmlib.tools.object_detection import YOLOX
+
+from .model_registry import MODEL_CACHE, get_solution, model_id
+from .solution.multi_head_pose import MultiHeadPose
+
+PRECISIONS = ("fp32", "int8", "fp16")
+QUANTIZED_CACHE = os.path.join(MODEL_CACHE, "quantized")
+CALIBRATION_FRAMES = 64
+
+# Solution class of each pose model of the configuration files
+POSE_MODEL_SOLUTIONS = {
+    "HALPE_26": "BodyWithFeet",
+    "COCO_133": "Wholebody",
+    "COCO_17": "Body",
+    "BODY_43": "BodyWithSpine",
+    "BODY_53": "BodyWithFeetUE5",
+    "HAND_21": "Hand",
+    "FACE_106": "Face",
+    "WHOLEBODY_150": "WholebodyWithSpine",
+}
+
+
+def cpu_supports(precision):
+    """
+    Whether the CPU runs a precision natively.
+
+    FP16 needs AVX512-FP16 or AMX-FP16 on x86, or half precision arithmetic on ARM.
+    """
+    if precision in ("fp32", "int8"):
+        return True
+    if precision != "fp16":
+        return False
+    if platform.system() == "Darwin":
+        # Every Apple silicon CPU has half precision arithmetic
+        return platform.machine() == "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return False
+    return bool(flags & {"avx512_fp16", "amx_fp16", "asimdhp", "fphp"})
+
+
+def sample_frames(videos, count=CALIBRATION_FRAMES):
+    """
+    Frames evenly spread over a list of videos.
+
+    Returns:
+        tuple: The frames, and the (video, size, modification time, frame indices) of
+               each video, which identify the sample.
+    """
+    per_video = max(1, count // max(1, len(videos)))
+    frames, sources = [], []
+    for video in sorted(videos):
+        cap = cv2.VideoCapture(video)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        indices = np.unique(np.linspace(0, max(0, total - 1), per_video).astype(int)).tolist()
+        for index in indices:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+        stat = os.stat(video)
+        sources.append((os.path.abspath(video), stat.st_size, stat.st_mtime_ns, indices))
+    return frames, sources
+
+
+def _tool_inputs(tool, frames, detector=None):
+    """
+    Model inputs of a tool for a list of frames, preprocessed as in inference.
+    """
+    inputs = []
+    for frame in frames:
+        if isinstance(tool, YOLOX):
+            images = [tool.preprocess(frame)[0]]
+        else:
+            bboxes = detector(frame) if detector is not None else []
+            if len(bboxes) == 0:
+                bboxes = [[0, 0, frame.shape[1], frame.shape[0]]]
+            images = [tool.preprocess(frame, bbox)[0] for bbox in bboxes]
+        for image in images:
+            inputs.append(np.ascontiguousarray(image.transpose(2, 0, 1)[None], dtype=np.float32))
+    return inputs
+
+
+def quantize_int8(onnx_model, inputs, output_path):
+    """
+    Quantize a model to INT8 with static calibration.
+
+    Args:
+        onnx_model (str): Path of the FP32 model.
+        inputs (list): Calibration inputs of shape (1, 3, H, W).
+        output_path (str): Path of the quantized model.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = ort.InferenceSession(onnx_model, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.data = iter([{input_name: x} for x in inputs])
+
+        def get_next(self):
+            return next(self.data, None)
+
+    preprocessed = output_path + ".pre.onnx"
+    try:
+        quant_pre_process(onnx_model, preprocessed, skip_symbolic_shape=True)
+    except Exception as e:
+        logging.warning(f"Could not preprocess {onnx_model} for quantization: {e}")
+        preprocessed = onnx_model
+
+    try:
+        quantize_static(
+            preprocessed,
+            output_path,
+            Reader(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    finally:
+        if preprocessed != onnx_model and os.path.exists(preprocessed):
+            os.remove(preprocessed)
+    return output_path
+
+
+def convert_fp16(onnx_model, output_path):
+    """
+    Convert the weights and operations of a model to FP16, keeping FP32 inputs and outputs.
+    """
+    try:
+        import onnx
+        from onnxconverter_common import float16
+    except ImportError:
+        raise ImportError("FP16 conversion needs onnxconverter-common: pip install onnxconverter-common")
+
+    model = float16.convert_float_to_float16(onnx.load(onnx_model), keep_io_types=True)
+    onnx.save(model, output_path)
+    return output_path
+
+
+def converted_model(tool, precision, frames=None, sources=None, detector=None):
+    """
+    Path of a tool's model converted to a precision, converted on first use and cached.
+
+    Args:
+        tool (BaseTool): rtmlib tool (YOLOX, RTMPose, ...).
+        precision (str): "int8" or "fp16".
+        frames (list): Calibration frames, for INT8.
+        sources (list): Identification of the calibration frames (see `sample_frames`).
+        detector (YOLOX, optional): Detector giving the boxes of the pose calibration crops.
+    """
+    # Models of the registry are converted from their version before graph optimization
+    onnx_model = getattr(tool, "source_model", tool.onnx_model)
+    stat = os.stat(onnx_model)
+    key = [os.path.abspath(onnx_model), stat.st_size, stat.st_mtime_ns, precision]
+    if precision == "int8":
+        key.append(sources)
+    digest = hashlib.sha256(json.dumps(key).encode()).hexdigest()[:16]
+    path = os.path.join(QUANTIZED_CACHE, f"{model_id(onnx_model)}.{precision}.{digest}.onnx")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(QUANTIZED_CACHE, exist_ok=True)
+    tmp_path = path + ".tmp.onnx"
+    logging.info(f"Converting {os.path.basename(onnx_model)} to {precision}...")
+    if precision == "int8":
+        quantize_int8(onnx_model, _tool_inputs(tool, frames, detector), tmp_path)
+    elif precision == "fp16":
+        convert_fp16(onnx_model, tmp_path)
+    else:
+        raise ValueError(f"Unknown precision '{precision}'. Must be one of {PRECISIONS}")
+    os.replace(tmp_path, path)
+    return path
+
+
+def _tool_attributes(solution):
+    """
+    (owner, attribute, tool) of the inference tools of a solution, including MultiHeadPose heads.
+    """
+    for name, value in list(vars(solution).items()):
+        if isinstance(value, BaseTool):
+            yield solution, name, value
+        elif isinstance(value, MultiHeadPose):
+            for i, head in enumerate(value.heads):
+                yield value.heads, i, head
+            if value.merged_model is not None:
+                yield value, "merged_model", value.merged_model
+
+
+def apply_precision(solution, precision, videos=None, calibration_frames=CALIBRATION_FRAMES):
+    """
+    Replace the models of a solution with their converted version.
+
+    Args:
+        solution: Solution instance (Body, BodyWithSpine, ...).
+        precision (str): "fp32", "int8" or "fp16". Unsupported precisions fall back to FP32.
+        videos (list): Videos whose frames calibrate INT8 models.
+        calibration_frames (int): Number of calibration frames.
+
+    Returns:
+        str: The precision actually used.
+    """
+    if precision == "fp32":
+        return precision
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Must be one of {PRECISIONS}")
+    if not cpu_supports(precision):
+        logging.warning(f"This CPU has no native {precision} support, using fp32 models.")
+        return "fp32"
+
+    frames = sources = None
+    if precision == "int8":
+        if not videos:
+            raise ValueError("INT8 calibration needs videos")
+        frames, sources = sample_frames(videos, calibration_frames)
+    detector = getattr(solution, "det_model", None)
+
+    converted = {}
+    for owner, attribute, tool in list(_tool_attributes(solution)):
+        if id(tool) not in converted:
+            path = converted_model(tool, precision, frames, sources, detector)
+            # Same tool settings, new session
+            new_tool = copy.copy(tool)
+            BaseTool.__init__(
+                new_tool, path, tool.model_input_size, tool.mean, tool.std, tool.backend, tool.device
+            )
+            converted[id(tool)] = new_tool
+        if isinstance(owner, list):
+            owner[attribute] = converted[id(tool)]
+        else:
+            setattr(owner, attribute, converted[id(tool)])
+    logging.info(f"Using {precision} models.")
+    return precision
+
+
+def _pose_outputs(solution, frame):
+    bboxes = solution.det_model(frame) if solution.det_model is not None else []
+    keypoints, scores = solution.pose_model(frame, bboxes=bboxes)
+    return np.asarray(bboxes), keypoints, scores
+
+
+def precision_report(solution_class, videos, precisions=("int8", "fp16"), frames=CALIBRATION_FRAMES, **kwargs):
+    """
+    Compare the accuracy and throughput of precision profiles with FP32, on the same frames.
+
+    The accuracy is measured against the FP32 outputs: the mean keypoint distance, in percent
+    of the diagonal of the FP32 person box, the mean absolute score difference and the number
+    of frames with a different number of persons. The frames are different from the
+    calibration frames.
+
+    Args:
+        solution_class (type): Solution class (Body, BodyWithSpine, ...).
+        videos (list): Videos of the experiment.
+        precisions (tuple): Precisions compared with FP32.
+        frames (int): Number of evaluation frames.
+        **kwargs: Arguments of the solution (mode, backend, device).
+
+    Returns:
+        dict: For each precision, the `fps` and the accuracy metrics.
+    """
+    # Evaluation frames are interleaved with the calibration frames
+    evaluation, _ = sample_frames(videos, 2 * frames)
+    evaluation = evaluation[1::2] or evaluation
+
+    def run(precision):
+        solution = get_solution(solution_class, precision=precision, videos=videos, **kwargs)
+        _pose_outputs(solution, evaluation[0])  # warm up
+        start = time.perf_counter()
+        outputs = [_pose_outputs(solution, frame) for frame in evaluation]
+        return outputs, len(evaluation) / (time.perf_counter() - start)
+
+    baseline, baseline_fps = run("fp32")
+    report = {"frames": len(evaluation), "fp32": {"fps": baseline_fps}}
+    for precision in precisions:
+        if not cpu_supports(precision):
+            report[precision] = {"error": f"no native {precision} support on this CPU"}
+            continue
+        try:
+            outputs, fps = run(precision)
+        except ImportError as e:
+            report[precision] = {"error": str(e)}
+            continue
+        errors, score_errors, mismatches = [], [], 0
+        for (ref_boxes, ref_kpts, ref_scores), (_, kpts, scores) in zip(baseline, outputs):
+            if len(ref_kpts) != len(kpts):
+                mismatches += 1
+                continue
+            if len(ref_boxes):
+                diagonal = np.hypot(ref_boxes[:, 2] - ref_boxes[:, 0], ref_boxes[:, 3] - ref_boxes[:, 1])
+            else:
+                diagonal = np.full(len(ref_kpts), np.hypot(*evaluation[0].shape[:2]))
+            distances = np.linalg.norm(kpts - ref_kpts, axis=-1) / diagonal[:, None]
+            errors.append(distances.mean() * 100)
+            score_errors.append(np.abs(scores - ref_scores).mean())
+        report[precision] = {
+            "fps": fps,
+            "speedup": fps / baseline_fps,
+            "keypoint_error_percent": float(np.mean(errors)) if errors else None,
+            "score_error": float(np.mean(score_errors)) if score_errors else None,
+            "person_count_mismatches": mismatches,
+        }
+    return report
+
+
+def format_report(report):
+    lines = [f"{report['frames']} frames, FP32: {report['fp32']['fps']:.1f} frames/s"]
+    for precision, r in report.items():
+        if precision in ("frames", "fp32"):
+            continue
+        if "error" in r:
+            lines.append(f"{precision}: {r['error']}")
+            continue
+        error = "-" if r["keypoint_error_percent"] is None else f"{r['keypoint_error_percent']:.2f}%"
+        lines.append(
+            f"{precision}: {r['fps']:.1f} frames/s (x{r['speedup']:.2f}), keypoint error {error} of the person size, "
+            f"score error {r['score_error'] or 0:.3f}, {r['person_count_mismatches']} frames with other person counts"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    import toml
+
+    import TracX_rtmlib
+
+    parser = argparse.ArgumentParser(description="Compare reduced precision profiles with FP32 on an experiment.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Accuracy and throughput report of the precision profiles")
+    report_parser.add_argument("experiment", help="Experiment directory, with a Config.toml file and videos")
+    report_parser.add_argument("--precisions", nargs="+", default=["int8", "fp16"], choices=PRECISIONS[1:])
+    report_parser.add_argument("--frames", type=int, default=CALIBRATION_FRAMES, help="Number of evaluation frames")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    cfg = toml.load(os.path.join(args.experiment, "Config.toml"))
+    pose_model = cfg["pose"]["pose_model"].upper()
+    solution_class = getattr(TracX_rtmlib, POSE_MODEL_SOLUTIONS[pose_model])
+    videos_dir = os.path.join(args.experiment, "videos")
+    videos = [os.path.join(videos_dir, f) for f in sorted(os.listdir(videos_dir))]
+
+    report = precision_report(
+        solution_class,
+        videos,
+        precisions=args.precisions,
+        frames=args.frames,
+        mode=cfg["pose"].get("mode", "balanced"),
+        backend="onnxruntime",
+        device="cpu",
+    )
+    report_file = os.path.join(args.experiment, "precision_report.json")
+    with open(report_file, "w") as f:
+        json.dump(report, f, indent=2)
+    print(format_report(report))
+    print(f"Report saved to {report_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
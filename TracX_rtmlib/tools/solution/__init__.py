@@ -1,11 +1,18 @@
+from .batch_pose_tracker import BatchPoseTracker
 from .body_with_feet_ue5 import BodyWithFeetUE5
 from .body_with_spine import BodyWithSpine
 from .face import Face
+from .multi_head_pose import MultiHeadPose, merge_onnx_heads
+from .roi_pose_tracker import RegionOfInterestTracker
 from .wholebody_with_spine import WholebodyWithSpine
 
 __all__ = [
+    "BatchPoseTracker",
     "BodyWithFeetUE5",
     "BodyWithSpine",
     "Face",
+    "MultiHeadPose",
+    "merge_onnx_heads",
+    "RegionOfInterestTracker",
     "WholebodyWithSpine",
 ]
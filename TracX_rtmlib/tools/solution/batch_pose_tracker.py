@@ -0,0 +1,368 @@
+import os
+
+import numpy as np
+from rtmlib.tools.object_detection import YOLOX
+from rtmlib.tools.pose_estimation import RTMPose
+from rtmlib.tools.solution.pose_tracker import PoseTracker, compute_iou, pose_to_bbox
+
+from .multi_head_pose import MultiHeadPose, supports_batch
+
+MIN_BATCH_SIZE = 4
+MAX_BATCH_SIZE = 32
+DEFAULT_CACHE_SIZE = 8 * 1024 * 1024
+
+
+def cpu_cache_size():
+    """
+    Size in bytes of the largest CPU cache, or DEFAULT_CACHE_SIZE if it cannot be read.
+    """
+    sizes = []
+    cache_dir = "/sys/devices/system/cpu/cpu0/cache"
+    try:
+        for index in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, index, "size")) as f:
+                size = f.read().strip().upper()
+            unit = {"K": 1024, "M": 1024**2, "G": 1024**3}.get(size[-1:], 1)
+            sizes.append(int(size.rstrip("KMG")) * unit)
+    except (OSError, ValueError):
+        pass
+    return max(sizes, default=DEFAULT_CACHE_SIZE)
+
+
+def auto_batch_size(model_input_size, device="cpu", max_batch_size=MAX_BATCH_SIZE):
+    """
+    Number of inputs per inference call for a model with the given input size.
+
+    On CPU, a batch is as large as fits in the largest CPU cache, but at least
+    MIN_BATCH_SIZE so that large inputs are still batched across cameras, and is rounded
+    down to a multiple of the thread count when larger than it so that all threads get
+    the same share of the batch. On GPU, the batch is `max_batch_size`.
+
+    Args:
+        model_input_size (tuple): (width, height) input size of the model.
+        device (str): Device of the model.
+        max_batch_size (int): Upper bound of the batch size.
+
+    Returns:
+        int: The batch size.
+    """
+    if device != "cpu":
+        return max_batch_size
+    input_bytes = 3 * model_input_size[0] * model_input_size[1] * np.dtype(np.float32).itemsize
+    batch_size = min(max_batch_size, max(MIN_BATCH_SIZE, cpu_cache_size() // input_bytes))
+    threads = os.cpu_count() or 1
+    if batch_size > threads:
+        batch_size -= batch_size % threads
+    return batch_size
+
+
+def detect_batch(det_model, images, batch_size=None):
+    """
+    Run a detector on several images.
+
+    With a YOLOX model run by onnxruntime with a dynamic batch axis, images are detected
+    in inference calls of at most `batch_size` images. Otherwise, images are detected
+    one at a time.
+
+    Args:
+        det_model: Detection model (YOLOX, RTMDet, ...).
+        images (list): Input images.
+        batch_size (int, optional): Maximum number of images per inference call. Default is all images.
+
+    Returns:
+        list: For each image, the output of `det_model(image)`.
+    """
+    if not images or not isinstance(det_model, YOLOX) or not supports_batch(det_model):
+        return [det_model(image) for image in images]
+
+    padded, ratios = zip(*(det_model.preprocess(image) for image in images))
+    batch = np.ascontiguousarray(np.stack(padded).transpose(0, 3, 1, 2), dtype=np.float32)
+    session = det_model.session
+    input_name = session.get_inputs()[0].name
+    output_name = session.get_outputs()[0].name
+    batch_size = batch_size or len(batch)
+    outputs = np.concatenate(
+        [session.run([output_name], {input_name: batch[i : i + batch_size]})[0] for i in range(0, len(batch), batch_size)]
+    )
+    return [det_model.postprocess(outputs[i : i + 1], ratio) for i, ratio in enumerate(ratios)]
+
+
+def propagate_bboxes(bboxes, previous_bboxes, iou_threshold=0.3):
+    """
+    Predict the bounding boxes of the next frame from their motion since the previous frame.
+
+    Each bounding box is matched to the previous bounding box with the highest IoU, and
+    shifted by the displacement of its center. Unmatched bounding boxes are kept in place.
+
+    Args:
+        bboxes (list): xyxy-format bounding boxes of the current frame.
+        previous_bboxes (list): xyxy-format bounding boxes of the previous frame.
+        iou_threshold (float): Minimum IoU for two bounding boxes to be matched.
+
+    Returns:
+        list: The predicted bounding boxes.
+    """
+    propagated = []
+    for bbox in bboxes:
+        ious = [compute_iou(bbox, previous) for previous in previous_bboxes]
+        if ious and max(ious) > iou_threshold:
+            previous = previous_bboxes[int(np.argmax(ious))]
+            shift = (np.asarray(bbox[:2]) + bbox[2:4] - previous[:2] - previous[2:4]) / 2
+            bbox = np.concatenate([bbox[:2] + shift, bbox[2:4] + shift])
+        propagated.append(bbox)
+    return propagated
+
+
+class _Stream:
+    """
+    Tracking state of one video stream, with the same attributes as PoseTracker.
+    """
+
+    MIN_AREA = PoseTracker.MIN_AREA
+    track_by_iou = PoseTracker.track_by_iou
+
+    def __init__(self, tracking_thr):
+        self.tracking_thr = tracking_thr
+        self.frame_cnt = 0
+        self.next_id = 0
+        self.bboxes_last_frame = []
+        self.track_ids_last_frame = []
+        self.next_bboxes = []
+
+
+class BatchPoseTracker:
+    """
+    Pose tracker that runs several frames in each detection and pose inference call.
+
+    Frames are gathered across streams (e.g. the synchronized frames of several cameras)
+    and across time: the detector runs on the frames of several timestamps in one call,
+    and the pose model runs on all crops of one timestamp in one call. At most `batch_size`
+    frames are buffered at a time. Each stream is tracked independently, and gets the same
+    results as with one PoseTracker per stream.
+
+    Between detector runs (`det_frequency` > 1), the bounding boxes of the next frame are
+    the ones of the keypoints of the current frame, as with PoseTracker. With
+    `bbox_propagation`, they are also shifted by their motion since the previous frame.
+
+    Usage:
+        tracker = BatchPoseTracker(Body, det_frequency=5)
+        for results in tracker.run(frame_sets):  # frame_sets: lists of one frame per camera
+            for keypoints, scores in results:
+                ...
+
+    Args:
+        solution (type): Solution class, e.g. Body, BodyWithFeet, BodyWithSpine.
+        det_frequency (int): Frequency of person detection.
+        tracking (bool): Whether to keep consistent person IDs across frames.
+        tracking_thr (float): IoU threshold of the tracking.
+        mode (str, optional): 'performance', 'lightweight', or 'balanced'. Default is the solution default.
+        to_openpose (bool): Whether to use openpose-style skeleton.
+        backend (str): Backend of the models.
+        device (str): Device of the models.
+        batch_size (int, optional): Maximum number of buffered frames, and of frames per
+                                    detection call. Default is `auto_batch_size`.
+        pose_batch_size (int, optional): Maximum number of crops per pose call. Default is `auto_batch_size`.
+        bbox_propagation (bool): Whether to shift the bounding boxes between detector runs.
+                                 Results then differ from PoseTracker's.
+    """
+
+    def __init__(
+        self,
+        solution: type,
+        det_frequency: int = 1,
+        tracking: bool = True,
+        tracking_thr: float = 0.3,
+        mode: str = None,
+        to_openpose: bool = False,
+        backend: str = "onnxruntime",
+        device: str = "cpu",
+        batch_size: int = None,
+        pose_batch_size: int = None,
+        bbox_propagation: bool = False,
+    ):
+        solution_kwargs = dict(to_openpose=to_openpose, backend=backend, device=device)
+        if mode is not None:
+            solution_kwargs["mode"] = mode
+        model = solution(**solution_kwargs)
+
+        self.det_model = getattr(model, "det_model", None)
+        self.det_categories = getattr(model, "det_categories", None) or None
+        self.pose_model = model.pose_model
+        if type(self.pose_model).__name__ == "RTMPose3d":
+            raise NotImplementedError("BatchPoseTracker does not support RTMPose3d models")
+
+        # Pose models whose crops can be gathered across images. Models may be shared
+        # with other trackers, so the batch size is passed at each call
+        if isinstance(self.pose_model, RTMPose):
+            self.pose_model = MultiHeadPose([self.pose_model])
+        self.pose_batch_size = None
+        if isinstance(self.pose_model, MultiHeadPose):
+            head = self.pose_model.heads[0]
+            self.pose_batch_size = pose_batch_size or auto_batch_size(head.model_input_size, device)
+
+        if batch_size is None:
+            batch_size = auto_batch_size(self.det_model.model_input_size, device) if self.det_model else 1
+        self.batch_size = batch_size
+        self.det_frequency = det_frequency
+        self.tracking = tracking
+        self.tracking_thr = tracking_thr
+        self.bbox_propagation = bbox_propagation
+        self.reset()
+
+    def reset(self):
+        """Reset the tracking state of all streams."""
+        self.streams = {}
+
+    def _stream(self, key):
+        if key not in self.streams:
+            self.streams[key] = _Stream(self.tracking_thr)
+        return self.streams[key]
+
+    def __call__(self, image: np.ndarray):
+        """
+        Estimate the poses of one frame of stream 0, like PoseTracker.
+        """
+        return self.estimate([image])[0]
+
+    def estimate(self, images):
+        """
+        Estimate the poses of one frame per stream, e.g. the synchronized frames of several cameras.
+
+        Args:
+            images (list or dict): One frame per stream, as a list (streams 0, 1, 2, ...) or
+                                   as a dict of frames by stream key.
+
+        Returns:
+            list or dict: The (keypoints, scores) tuple of each frame, in the same container.
+        """
+        return next(self.run([images]))
+
+    def run(self, frame_sets):
+        """
+        Estimate the poses of a sequence of frame sets, gathering several of them per detection call.
+
+        Frame sets are buffered until they hold `batch_size` frames, whatever the detection
+        frequency, and the tracking state of each stream is carried from one buffer to the
+        next. Streams can end or start at any frame set.
+
+        Args:
+            frame_sets (iterable): One frame per stream, as lists (streams 0, 1, 2, ...) or
+                                   as dicts of frames by stream key.
+
+        Yields:
+            list or dict: For each frame set, the (keypoints, scores) tuple of each frame,
+                          in the same container as the frame set.
+        """
+        buffer, nb_frames = [], 0
+        for images in frame_sets:
+            buffer.append(images)
+            nb_frames += len(images)
+            if nb_frames >= self.batch_size:
+                yield from self._process(buffer)
+                buffer, nb_frames = [], 0
+        if buffer:
+            yield from self._process(buffer)
+
+    def _process(self, frame_sets):
+        frame_dicts = [images if isinstance(images, dict) else dict(enumerate(images)) for images in frame_sets]
+
+        # Frames predicted to be due for detection are detected in one batch. Frames whose
+        # stream does not advance as predicted (see `_update`) are detected when processed
+        detections = {}
+        if self.det_model is not None:
+            scheduled, frame_counts = [], {}
+            for t, images in enumerate(frame_dicts):
+                for key in images:
+                    frame_cnt = frame_counts.get(key, self._stream(key).frame_cnt)
+                    if frame_cnt % self.det_frequency == 0:
+                        scheduled.append((t, key))
+                    frame_counts[key] = frame_cnt + 1
+            try:
+                outputs = detect_batch(self.det_model, [frame_dicts[t][key] for t, key in scheduled], self.batch_size)
+                detections = {tk: self._person_bboxes(output) for tk, output in zip(scheduled, outputs)}
+            except Exception:
+                # Detected one frame at a time, to fail only the frames PoseTracker fails
+                detections = {}
+
+        for t, (images, frame_dict) in enumerate(zip(frame_sets, frame_dicts)):
+            results = {}
+            keys, frames, bboxes_list = [], [], []
+            for key, image in frame_dict.items():
+                stream = self._stream(key)
+                bboxes = None
+                if self.det_model is not None and stream.frame_cnt % self.det_frequency == 0:
+                    if (t, key) in detections:
+                        bboxes = detections[(t, key)]
+                    else:
+                        try:
+                            bboxes = self._person_bboxes(self.det_model(image))
+                        except Exception:
+                            # As PoseTracker: no person, and the state is left as is
+                            results[key] = ([], [])
+                            continue
+                elif self.det_model is not None:
+                    bboxes = stream.next_bboxes
+                keys.append(key)
+                frames.append(image)
+                bboxes_list.append(bboxes)
+
+            if self.det_model is None:
+                poses = [self.pose_model(image) for image in frames]
+            elif isinstance(self.pose_model, MultiHeadPose):
+                poses = self.pose_model.estimate_many(frames, bboxes_list, self.pose_batch_size) if frames else []
+            else:
+                poses = [self.pose_model(image, bboxes=bboxes) for image, bboxes in zip(frames, bboxes_list)]
+            for key, pose in zip(keys, poses):
+                results[key] = self._update(self._stream(key), *pose)
+            yield results if isinstance(images, dict) else [results[key] for key in frame_dict]
+
+    def _person_bboxes(self, output):
+        if self.det_categories:
+            bboxes, classes = output
+            return [bbox for bbox, cls in zip(bboxes, classes) if cls in self.det_categories]
+        if getattr(self.det_model, "det_mode", "human") == "multiclass":
+            return output[0]
+        return output
+
+    def _update(self, stream, keypoints, scores):
+        """
+        Track the persons of a stream as PoseTracker does, and predict its next bounding boxes.
+
+        As PoseTracker, when a track ID is not the index of a person, the keypoints are returned
+        in their original order and the bounding boxes and frame count of the stream are not
+        updated, so that the next frame reuses them.
+        """
+        previous_bboxes = list(stream.bboxes_last_frame)
+        if not self.tracking and self.det_frequency != 1:
+            bboxes_current_frame = [pose_to_bbox(kpts) for kpts in keypoints]
+        else:
+            if len(stream.track_ids_last_frame) == 0:
+                stream.next_id = len(stream.bboxes_last_frame)
+                stream.track_ids_last_frame = list(range(stream.next_id))
+
+            bboxes_current_frame = []
+            track_ids_current_frame = []
+            for kpts in keypoints:
+                bbox = pose_to_bbox(kpts)
+                track_id, _ = stream.track_by_iou(bbox)
+                if track_id > -1:
+                    track_ids_current_frame.append(track_id)
+                    bboxes_current_frame.append(bbox)
+
+            stream.track_ids_last_frame = track_ids_current_frame
+            # reorder keypoints, scores according to track_id
+            try:
+                keypoints = np.array([keypoints[i] for i in track_ids_current_frame])
+                scores = np.array([scores[i] for i in track_ids_current_frame])
+            except IndexError:
+                stream.next_bboxes = stream.bboxes_last_frame
+                return keypoints, scores
+
+        stream.bboxes_last_frame = bboxes_current_frame
+        stream.next_bboxes = (
+            propagate_bboxes(bboxes_current_frame, previous_bboxes, self.tracking_thr)
+            if self.bbox_propagation
+            else bboxes_current_frame
+        )
+        stream.frame_cnt += 1
+        return keypoints, scores
@@ -6,8 +6,8 @@ from rtmlib import YOLOX, RTMPose
 # FIXME: This import should not be here. Upload model somewhere online and add a link
 from TracX.constants import APP_ASSETS
 
-
-import numpy as np
+from ..model_registry import get_tool
+from .multi_head_pose import MultiHeadPose
 
 
 class BodyWithFeetUE5:
@@ -78,23 +78,22 @@ class BodyWithFeetUE5:
         det = self.MODE[mode]["det"]
         det_input_size = self.MODE[mode]["det_input_size"]
 
-        self.det_model = YOLOX(
-            det, model_input_size=det_input_size, backend=backend, device=device
-        )
-        self.body_model = RTMPose(
-            pose,
-            model_input_size=pose_input_size,
-            to_openpose=to_openpose,
+        self.det_model = get_tool(
+            YOLOX,
+            det,
+            model_input_size=det_input_size,
             backend=backend,
             device=device,
         )
-        self.pose_model = RTMPose(
-            self.MODE[mode]["pose"],
-            model_input_size=self.MODE[mode]["pose_input_size"],
+        self.body_model = get_tool(
+            RTMPose,
+            pose,
+            model_input_size=pose_input_size,
             to_openpose=to_openpose,
             backend=backend,
             device=device,
         )
+        self.pose_model = MultiHeadPose([self.body_model])
 
     def __call__(self, image: np.ndarray):
         """
@@ -1,15 +1,25 @@
 import os
+import time
 
 import numpy as np
 from rtmlib import YOLOX, RTMPose
+from scipy.interpolate import CubicSpline
+from scipy.linalg import block_diag
+from scipy.optimize import minimize
 
 # FIXME: This import should not be here. Upload model somewhere online and add a link
 from TracX.constants import APP_ASSETS
 
+from ..model_registry import get_tool
+from .multi_head_pose import MultiHeadPose
 
-import numpy as np
-from scipy.interpolate import CubicSpline
-from scipy.optimize import minimize
+SPINE_KEYPOINTS = 17
+
+# Weights of the spine refinement loss and expected inter-vertebral distances (px)
+CURVATURE_WEIGHT = 0.1
+DISTANCE_WEIGHT = 0.5
+THORACIC_SPACING = 2.0
+LUMBAR_SPACING = 2.5
 
 
 def refine_spine_keypoints(rough_keypoints, thoracic_count=12, lumbar_count=5):
@@ -96,16 +106,147 @@ def refine_spine_keypoints(rough_keypoints, thoracic_count=12, lumbar_count=5):
     return refined_keypoints[None, :, :]
 
 
-def refine_spine_keypoints_batch(rough_keypoints):
+def _spine_operators(thoracic_count, lumbar_count):
+    """
+    First and second order difference matrices within the thoracic and lumbar regions,
+    and the expected length of each first order difference.
+    """
+    D1 = block_diag(*[np.diff(np.eye(n), axis=0) for n in (thoracic_count, lumbar_count)])
+    D2 = block_diag(*[np.diff(np.eye(n), n=2, axis=0) for n in (thoracic_count, lumbar_count)])
+    expected = np.concatenate([
+        np.full(thoracic_count - 1, THORACIC_SPACING),
+        np.full(lumbar_count - 1, LUMBAR_SPACING),
+    ])
+    return D1, D2, expected
+
+
+def _normalized_confidence(rough_keypoints):
+    confidence = rough_keypoints[..., 2]
+    max_confidence = confidence.max(axis=1, keepdims=True)
+    return confidence / np.where(max_confidence > 0, max_confidence, 1)
+
+
+def spine_loss(params, rough_keypoints, thoracic_count=12, lumbar_count=5):
+    """
+    Loss of `refine_spine_keypoints` and its analytic gradient, for many persons at once.
+
+    Parameters:
+        params (np.ndarray): Shape (B, K, 2), the refined [x, y] coordinates.
+        rough_keypoints (np.ndarray): Shape (B, K, 3), the rough [x, y, confidence] keypoints.
+
+    Returns:
+        loss (np.ndarray): Shape (B,), the loss of each person.
+        grad (np.ndarray): Shape (B, K, 2), the gradient of the loss.
+    """
+    D1, D2, expected = _spine_operators(thoracic_count, lumbar_count)
+    confidence = _normalized_confidence(rough_keypoints)
+
+    residuals = params - rough_keypoints[..., :2]
+    d1 = np.einsum("ik,bkc->bic", D1, params)
+    d2 = np.einsum("ik,bkc->bic", D2, params)
+    lengths = np.linalg.norm(d1, axis=-1)
+    stretch = lengths - expected
+
+    loss = (
+        np.sum(confidence * np.sum(residuals ** 2, axis=-1), axis=1)
+        + CURVATURE_WEIGHT * np.sum(d2 ** 2, axis=(1, 2))
+        + DISTANCE_WEIGHT * np.sum(stretch ** 2, axis=1)
+    )
+    directions = np.divide(d1, lengths[..., None], out=np.zeros_like(d1), where=lengths[..., None] > 0)
+    grad = (
+        2 * confidence[..., None] * residuals
+        + 2 * CURVATURE_WEIGHT * np.einsum("ik,bic->bkc", D2, d2)
+        + 2 * DISTANCE_WEIGHT * np.einsum("ik,bic->bkc", D1, stretch[..., None] * directions)
+    )
+    return loss, grad
+
+
+def refine_spine_keypoints_stacked(
+    rough_keypoints, thoracic_count=12, lumbar_count=5, method="closed_form", max_iter=500, tol=1e-4
+):
+    """
+    Refines the rough spine keypoints of many persons (and frames) as one stacked problem.
+    Minimizes the same loss as `refine_spine_keypoints`, from the same initial guess.
+
+    With the "closed_form" method, the loss is minimized by majorization: each inter-vertebral
+    distance penalty (|d| - e)^2 is replaced by |d - e u|^2, with u the current direction of the
+    segment. The loss then is quadratic, with a matrix that only depends on the confidences,
+    so each iteration is a single batched product with its precomputed inverse.
+    With the "lbfgs" method, L-BFGS-B runs once on the stacked problem with analytic gradients.
+
+    Parameters:
+        rough_keypoints (np.ndarray): Shape (B, K, 3), where B is the number of persons, K is the
+                                      number of keypoints, and each keypoint has [x, y, confidence].
+        thoracic_count (int): Number of thoracic spine keypoints.
+        lumbar_count (int): Number of lumbar spine keypoints.
+        method (str): "closed_form" or "lbfgs".
+        max_iter (int): Maximum number of iterations.
+        tol (float): Largest change of a coordinate (px) at which the "closed_form" iterations stop.
+
+    Returns:
+        refined_keypoints (np.ndarray): Shape (B, K, 2) with refined [x, y] coordinates.
+    """
+    rough_keypoints = np.asarray(rough_keypoints, dtype=float)
+    if len(rough_keypoints) == 0:
+        return np.empty((0, rough_keypoints.shape[1], 2))
+    keypoints = rough_keypoints[..., :2]
+
+    if method == "lbfgs":
+        shape = keypoints.shape
+
+        def fun(x):
+            loss, grad = spine_loss(x.reshape(shape), rough_keypoints, thoracic_count, lumbar_count)
+            return loss.sum(), grad.ravel()
+
+        result = minimize(
+            fun, keypoints.ravel(), jac=True, method="L-BFGS-B",
+            options={"maxiter": max_iter, "disp": False}
+        )
+        return result.x.reshape(shape)
+
+    if method != "closed_form":
+        raise ValueError(f"Unknown spine refinement method '{method}'")
+
+    D1, D2, expected = _spine_operators(thoracic_count, lumbar_count)
+    # A tiny anchoring keeps the system well-posed when all confidences are zero
+    confidence = _normalized_confidence(rough_keypoints) + 1e-6
+    # Quadratic part, shared by x and y: (C + w_c D2'D2 + w_d D1'D1) p = C r + w_d D1'(e u)
+    quadratic = CURVATURE_WEIGHT * D2.T @ D2 + DISTANCE_WEIGHT * D1.T @ D1
+    A = quadratic[None] + confidence[:, :, None] * np.eye(len(quadratic))[None]
+    A_inv = np.linalg.inv(A)
+    data = confidence[..., None] * keypoints
+
+    # The spline initial guess of refine_spine_keypoints interpolates the rough keypoints
+    params = keypoints.copy()
+    for _ in range(max_iter):
+        d1 = np.einsum("ik,bkc->bic", D1, params)
+        lengths = np.linalg.norm(d1, axis=-1, keepdims=True)
+        directions = np.divide(d1, lengths, out=np.zeros_like(d1), where=lengths > 0)
+        b = data + DISTANCE_WEIGHT * np.einsum("ik,bic->bkc", D1, expected[None, :, None] * directions)
+        new_params = A_inv @ b
+        converged = np.max(np.abs(new_params - params)) < tol
+        params = new_params
+        if converged:
+            break
+    return params
+
+
+def refine_spine_keypoints_batch(rough_keypoints, method="closed_form"):
     """
     Refines rough spine keypoints by smoothing, applying cubic splines, and optimizing for smoothness and closeness.
     
     Parameters:
         rough_keypoints (np.ndarray): Shape (B, K, 3), where B is the batch size, K is the number of keypoints, 
                                       and each keypoint has [x, y, confidence].
+        method (str): "closed_form" or "lbfgs" to refine all persons at once (see
+                      `refine_spine_keypoints_stacked`), "legacy" to run `refine_spine_keypoints`
+                      for each person.
     Returns:
         refined_keypoints (np.ndarray): Shape (B, K, 2) with refined [x, y] coordinates.
     """
+    if method != "legacy":
+        return refine_spine_keypoints_stacked(rough_keypoints, method=method)
+
     refined_keypoints = []
     for i in range(rough_keypoints.shape[0]):
         rough_keypoints_i = rough_keypoints[i:i+1, :, :]
@@ -115,6 +256,54 @@ def refine_spine_keypoints_batch(rough_keypoints):
     return np.concatenate(refined_keypoints, axis=0)
 
 
+def compare_spine_refinement(rough_keypoints, methods=("legacy", "closed_form", "lbfgs")):
+    """
+    Benchmarks the spine refinement methods on the same rough keypoints.
+
+    Parameters:
+        rough_keypoints (np.ndarray): Shape (B, K, 3) rough [x, y, confidence] keypoints.
+        methods (tuple): Methods of `refine_spine_keypoints_batch` to compare. The first one is the reference.
+
+    Returns:
+        dict: For each method, the `time` in seconds, the mean `loss`, and the mean and max
+              `deviation` in px of the refined keypoints from those of the reference method.
+    """
+    results, reference = {}, None
+    for method in methods:
+        start = time.perf_counter()
+        refined = refine_spine_keypoints_batch(rough_keypoints, method=method)
+        elapsed = time.perf_counter() - start
+        if reference is None:
+            reference = refined
+        deviation = np.linalg.norm(refined - reference, axis=-1)
+        results[method] = {
+            "time": elapsed,
+            "loss": float(np.mean(spine_loss(refined, rough_keypoints)[0])),
+            "mean_deviation": float(deviation.mean()),
+            "max_deviation": float(deviation.max()),
+        }
+    return results
+
+
+def synthetic_spines(nb_persons, thoracic_count=12, lumbar_count=5, noise=1.5, seed=0):
+    """
+    Random rough spine keypoints: curved spines with noisy keypoints and confidences.
+
+    Returns:
+        rough_keypoints (np.ndarray): Shape (B, K, 3).
+    """
+    rng = np.random.default_rng(seed)
+    K = thoracic_count + lumbar_count
+    t = np.linspace(0, 1, K)
+    spacing = np.concatenate([np.full(thoracic_count, THORACIC_SPACING), np.full(lumbar_count, LUMBAR_SPACING)])
+    y = np.cumsum(spacing)[None] * rng.uniform(0.8, 1.2, (nb_persons, 1))
+    x = rng.uniform(-3, 3, (nb_persons, 1)) * np.sin(np.pi * t)[None]
+    origin = rng.uniform(0, 500, (nb_persons, 1, 2))
+    keypoints = np.stack([x, y], axis=-1) + origin + rng.normal(0, noise, (nb_persons, K, 2))
+    confidence = rng.uniform(0.3, 1.0, (nb_persons, K, 1))
+    return np.concatenate([keypoints, confidence], axis=-1)
+
+
 class BodyWithSpine:
     """
     BodyWithSpine class for human pose estimation using the DFKI_Body43 keypoint format.
@@ -173,6 +362,8 @@ class BodyWithSpine:
         backend="onnxruntime",
         device: str = "cpu",
         postprocess=True,
+        refinement_method="closed_form",
+        merged_pose: str = None,
     ):
         """
         Initialize the DFKI_Body43 pose estimation model.
@@ -182,6 +373,9 @@ class BodyWithSpine:
             to_openpose (bool, optional): Whether to convert output to OpenPose format. Default is False.
             backend (str, optional): Backend for inference ('onnxruntime' or 'opencv'). Default is 'onnxruntime'.
             device (str, optional): Device for inference ('cpu' or 'cuda'). Default is 'cpu'.
+            postprocess (bool, optional): Whether to refine the spine keypoints. Default is True.
+            refinement_method (str, optional): Spine refinement method ('closed_form', 'lbfgs', or 'legacy'). Default is 'closed_form'.
+            merged_pose (str, optional): Merged body and spine ONNX model (see `merge_onnx_heads`), run as a single session. Default is None.
         """
 
         pose = self.MODE[mode]["pose"]
@@ -190,40 +384,64 @@ class BodyWithSpine:
         det = self.MODE[mode]["det"]
         det_input_size = self.MODE[mode]["det_input_size"]
 
-        self.det_model = YOLOX(
-            det, model_input_size=det_input_size, backend=backend, device=device
-        )
-        self.body_model = RTMPose(
-            pose,
-            model_input_size=pose_input_size,
-            to_openpose=to_openpose,
-            backend=backend,
-            device=device,
-        )
-        self.spine_pose = RTMPose(
-            self.MODE[mode]["spine_pose"],
-            model_input_size=self.MODE[mode]["spine_pose_input_size"],
-            to_openpose=to_openpose,
+        self.det_model = get_tool(
+            YOLOX,
+            det,
+            model_input_size=det_input_size,
             backend=backend,
             device=device,
         )
+        if merged_pose is None:
+            self.body_model = get_tool(
+                RTMPose,
+                pose,
+                model_input_size=pose_input_size,
+                to_openpose=to_openpose,
+                backend=backend,
+                device=device,
+            )
+            self.spine_pose = get_tool(
+                RTMPose,
+                self.MODE[mode]["spine_pose"],
+                model_input_size=self.MODE[mode]["spine_pose_input_size"],
+                to_openpose=to_openpose,
+                backend=backend,
+                device=device,
+            )
+            merged_model = None
+        else:
+            merged_model = get_tool(
+                RTMPose,
+                merged_pose,
+                model_input_size=pose_input_size,
+                to_openpose=to_openpose,
+                backend=backend,
+                device=device,
+            )
+            self.body_model = self.spine_pose = merged_model
         self.postprocess = postprocess
+        self.refinement_method = refinement_method
+        # Only the last 17 keypoints of the spine model are kept
+        self.heads = MultiHeadPose(
+            [self.body_model, self.spine_pose],
+            keypoint_slices=[None, slice(-SPINE_KEYPOINTS, None)],
+            merged_model=merged_model,
+            postprocess=self.refine_spine,
+        )
+        self.pose_model = self.heads
 
-        def forward(image, bboxes):
-            keypoints, scores = self.body_model(image, bboxes=bboxes)
-            spine_keypoints, spine_scores = self.spine_pose(image, bboxes=bboxes)
-            spine_keypoints = spine_keypoints[:, -17:] 
-            spine_scores = spine_scores[:, -17:]
-
-            if self.postprocess:
-                guessed_spine = np.concatenate([spine_keypoints, spine_scores[:, :, None]], axis=-1)
-                spine_keypoints = refine_spine_keypoints_batch(guessed_spine)
-
-            keypoints = np.concatenate([keypoints, spine_keypoints], axis=1)
-            scores = np.concatenate([scores, spine_scores], axis=1)
-            return keypoints, scores
-
-        self.pose_model = forward
+    def refine_spine(self, keypoints, scores):
+        """
+        Refine the spine keypoints of all persons, if postprocessing is enabled.
+        """
+        if self.postprocess:
+            guessed_spine = np.concatenate(
+                [keypoints[:, -SPINE_KEYPOINTS:], scores[:, -SPINE_KEYPOINTS:, None]], axis=-1
+            )
+            keypoints[:, -SPINE_KEYPOINTS:] = refine_spine_keypoints_batch(
+                guessed_spine, method=self.refinement_method
+            )
+        return keypoints, scores
 
     def __call__(self, image: np.ndarray):
         """
@@ -240,3 +458,14 @@ class BodyWithSpine:
         bboxes = self.det_model(image)
         keypoints, scores = self.pose_model(image, bboxes=bboxes)
         return keypoints, scores
+
+
+if __name__ == "__main__":
+    # Benchmark of the spine refinement methods on synthetic spines
+    for nb_persons in (1, 10, 100):
+        results = compare_spine_refinement(synthetic_spines(nb_persons))
+        for method, r in results.items():
+            print(
+                f"{nb_persons:>4} persons, {method:>11}: {r['time'] * 1000:8.1f} ms, loss {r['loss']:.4f}, "
+                f"deviation {r['mean_deviation']:.2e} px (max {r['max_deviation']:.2e} px)"
+            )
@@ -0,0 +1,260 @@
+import numpy as np
+from rtmlib.tools.pose_estimation.post_processings import (
+    convert_coco_to_openpose,
+    get_simcc_maximum,
+)
+from rtmlib.tools.pose_estimation.pre_processings import bbox_xyxy2cs, top_down_affine
+
+
+def preprocess_bboxes(image, bboxes, model_input_size, mean=None, std=None):
+    """
+    Crop, affine-warp and normalize all bounding boxes of an image for RTMPose models.
+
+    Args:
+        image (np.ndarray): Input image.
+        bboxes (list): xyxy-format bounding boxes. The whole image is used if empty.
+        model_input_size (tuple): (width, height) input size of the models.
+        mean (tuple, optional): Mean used to normalize the crops.
+        std (tuple, optional): Standard deviation used to normalize the crops.
+
+    Returns:
+        tuple: A tuple containing:
+            - batch (np.ndarray): Shape (N, 3, H, W), the float32 model input.
+            - centers (np.ndarray): Shape (N, 2), the centers of the crops.
+            - scales (np.ndarray): Shape (N, 2), the sizes of the crops.
+    """
+    if len(bboxes) == 0:
+        bboxes = [[0, 0, image.shape[1], image.shape[0]]]
+
+    crops, centers, scales = [], [], []
+    for bbox in bboxes:
+        center, scale = bbox_xyxy2cs(np.asarray(bbox, dtype=float), padding=1.25)
+        crop, scale = top_down_affine(model_input_size, scale, center, image)
+        crops.append(crop)
+        centers.append(center)
+        scales.append(scale)
+
+    batch = np.stack(crops).astype(np.float32)
+    if mean is not None:
+        batch = (batch - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+    return batch, np.stack(centers), np.stack(scales)
+
+
+def decode_simcc(simcc_x, simcc_y, centers, scales, model_input_size, simcc_split_ratio=2.0):
+    """
+    Decode batched SimCC outputs to keypoints in image coordinates.
+
+    Args:
+        simcc_x (np.ndarray): Shape (N, K, Wx), the x classification output.
+        simcc_y (np.ndarray): Shape (N, K, Wy), the y classification output.
+        centers (np.ndarray): Shape (N, 2), the centers of the crops.
+        scales (np.ndarray): Shape (N, 2), the sizes of the crops.
+        model_input_size (tuple): (width, height) input size of the model.
+        simcc_split_ratio (float): Split ratio of SimCC.
+
+    Returns:
+        tuple: A tuple containing:
+            - keypoints (np.ndarray): Shape (N, K, 2), the keypoint coordinates.
+            - scores (np.ndarray): Shape (N, K), the keypoint scores.
+    """
+    locs, scores = get_simcc_maximum(simcc_x, simcc_y)
+    keypoints = locs / simcc_split_ratio
+    keypoints = keypoints / np.asarray(model_input_size) * scales[:, None] + centers[:, None] - scales[:, None] / 2
+    return keypoints, scores
+
+
+def supports_batch(model):
+    """
+    Whether an RTMPose model accepts a batch of crops in one inference call.
+    """
+    if model.backend != "onnxruntime":
+        return False
+    batch_dim = model.session.get_inputs()[0].shape[0]
+    return not isinstance(batch_dim, int) or batch_dim < 0
+
+
+def run_batch(model, batch, batch_size=None):
+    """
+    Run an RTMPose model on a (N, 3, H, W) batch of crops.
+
+    With onnxruntime and a model exported with a dynamic batch axis, crops are processed
+    in inference calls of at most `batch_size` crops (all of them if None). Otherwise,
+    crops are processed one at a time.
+
+    Returns:
+        list: The outputs of the model, each of shape (N, ...).
+    """
+    if supports_batch(model):
+        output_names = [out.name for out in model.session.get_outputs()]
+        input_name = model.session.get_inputs()[0].name
+        batch_size = batch_size or len(batch)
+        outputs = [
+            model.session.run(output_names, {input_name: batch[i : i + batch_size]})
+            for i in range(0, len(batch), batch_size)
+        ]
+    else:
+        # inference expects a single (H, W, 3) image
+        outputs = [model.inference(crop.transpose(1, 2, 0)) for crop in batch]
+    return [np.concatenate(out, axis=0) for out in zip(*outputs)]
+
+
+class MultiHeadPose:
+    """
+    Top-down pose estimation with several RTMPose models (heads) run on the same bounding boxes.
+
+    Heads that share the same input size and normalization share the same preprocessed crops:
+    each bounding box is warped once per input size instead of once per head. All boxes
+    of an image are run in one inference call per head when the backend allows it.
+    The keypoints of the heads are concatenated in the order of the heads.
+
+    With a merged ONNX model (see `merge_onnx_heads`), a single session produces the
+    outputs of all heads at once.
+    """
+
+    def __init__(self, heads, keypoint_slices=None, merged_model=None, postprocess=None, batch_size=None):
+        """
+        Args:
+            heads (list): RTMPose models.
+            keypoint_slices (list, optional): For each head, the slice of its keypoints
+                                              to keep, or None to keep all of them.
+            merged_model (RTMPose, optional): Model loaded from the merged ONNX graph of the heads,
+                                              which must share the same input size and normalization.
+            postprocess (callable, optional): Function applied to the (keypoints, scores) of all
+                                              persons, e.g. to refine some keypoints.
+            batch_size (int, optional): Maximum number of crops per inference call. Default is all crops.
+        """
+        self.heads = list(heads)
+        self.keypoint_slices = keypoint_slices or [None] * len(self.heads)
+        self.merged_model = merged_model
+        self.postprocess = postprocess
+        self.batch_size = batch_size
+
+        # Heads sharing the same preprocessing
+        self.groups = {}
+        for i, head in enumerate(self.heads):
+            key = (tuple(head.model_input_size), _as_key(head.mean), _as_key(head.std))
+            self.groups.setdefault(key, []).append(i)
+        if merged_model is not None and len(self.groups) > 1:
+            raise ValueError("Heads of a merged model must share the same input size and normalization")
+
+    def __call__(self, image: np.ndarray, bboxes: list = []):
+        """
+        Estimate the keypoints of each bounding box with all heads.
+
+        Args:
+            image (np.ndarray): Input image.
+            bboxes (list): xyxy-format bounding boxes. The whole image is used if empty.
+
+        Returns:
+            tuple: A tuple containing:
+                - keypoints (np.ndarray): Shape (N, K, 2), the keypoints of all heads.
+                - scores (np.ndarray): Shape (N, K), the scores of all heads.
+        """
+        return self.estimate_many([image], [bboxes])[0]
+
+    def estimate_many(self, images, bboxes_list, batch_size=None):
+        """
+        Estimate the keypoints of the bounding boxes of several images with all heads.
+
+        The crops of all images are run together, e.g. the synchronized frames of several
+        cameras, so that each head runs in as few inference calls as possible.
+
+        Args:
+            images (list): Input images.
+            bboxes_list (list): For each image, its xyxy-format bounding boxes. The whole image
+                                is used if empty.
+            batch_size (int, optional): Maximum number of crops per inference call. Default is
+                                        the batch size of the model.
+
+        Returns:
+            list: For each image, the (keypoints, scores) tuple returned by `__call__`.
+        """
+        batch_size = batch_size or self.batch_size
+        results = [None] * len(self.heads)
+        for (input_size, mean, std), indices in self.groups.items():
+            crops = [preprocess_bboxes(image, bboxes, input_size, mean, std) for image, bboxes in zip(images, bboxes_list)]
+            counts = [len(batch) for batch, _, _ in crops]
+            batch, centers, scales = (np.concatenate(arrays) for arrays in zip(*crops))
+
+            if self.merged_model is not None:
+                merged_outputs = run_batch(self.merged_model, batch, batch_size)
+                outputs = {i: merged_outputs[2 * j : 2 * j + 2] for j, i in enumerate(indices)}
+            else:
+                outputs = {i: run_batch(self.heads[i], batch, batch_size) for i in indices}
+
+            for i in indices:
+                simcc_x, simcc_y = outputs[i]
+                keypoint_slice = self.keypoint_slices[i]
+                if keypoint_slice is not None:
+                    simcc_x, simcc_y = simcc_x[:, keypoint_slice], simcc_y[:, keypoint_slice]
+                keypoints, scores = decode_simcc(simcc_x, simcc_y, centers, scales, input_size)
+                if self.heads[i].to_openpose:
+                    keypoints, scores = convert_coco_to_openpose(keypoints, scores)
+                results[i] = (keypoints, scores)
+
+        keypoints = np.concatenate([r[0] for r in results], axis=1)
+        scores = np.concatenate([r[1] for r in results], axis=1)
+        if self.postprocess is not None:
+            keypoints, scores = self.postprocess(keypoints, scores)
+
+        splits = np.cumsum(counts)[:-1]
+        return list(zip(np.split(keypoints, splits), np.split(scores, splits)))
+
+
+def _as_key(values):
+    return None if values is None else tuple(np.asarray(values, dtype=float).tolist())
+
+
+def merge_onnx_heads(onnx_models, output_path, prefixes=None):
+    """
+    Merge RTMPose ONNX models with the same input size into one graph with a shared input.
+
+    The merged model outputs the (simcc_x, simcc_y) pair of each model, in order, and
+    can be used as the `merged_model` of `MultiHeadPose`.
+
+    Args:
+        onnx_models (list): Paths of the ONNX models.
+        output_path (str): Path of the merged ONNX model.
+        prefixes (list, optional): Prefix added to the names of each model. Default is "head0_", "head1_", ...
+
+    Returns:
+        str: The path of the merged model.
+    """
+    import onnx
+    from onnx import compose, helper
+
+    prefixes = prefixes or [f"head{i}_" for i in range(len(onnx_models))]
+    models = [compose.add_prefix(onnx.load(path), prefix) for path, prefix in zip(onnx_models, prefixes)]
+
+    shared_input = onnx.ValueInfoProto()
+    shared_input.CopyFrom(models[0].graph.input[0])
+    shared_input.name = "input"
+
+    nodes, initializers, outputs, value_info = [], [], [], []
+    for model in models:
+        input_name = model.graph.input[0].name
+        for node in model.graph.node:
+            for k, name in enumerate(node.input):
+                if name == input_name:
+                    node.input[k] = shared_input.name
+            nodes.append(node)
+        initializers.extend(model.graph.initializer)
+        outputs.extend(model.graph.output)
+        value_info.extend(model.graph.value_info)
+
+    graph = helper.make_graph(
+        nodes, "merged_heads", [shared_input], outputs, initializer=initializers, value_info=value_info
+    )
+    opset_imports = {}
+    for model in models:
+        for opset in model.opset_import:
+            opset_imports[opset.domain] = max(opset_imports.get(opset.domain, 0), opset.version)
+    merged = helper.make_model(
+        graph,
+        opset_imports=[helper.make_opsetid(domain, version) for domain, version in opset_imports.items()],
+        ir_version=models[0].ir_version,
+    )
+    onnx.checker.check_model(merged)
+    onnx.save(merged, output_path)
+    return output_path
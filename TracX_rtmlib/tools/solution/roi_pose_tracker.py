@@ -0,0 +1,181 @@
+import logging
+import time
+
+import numpy as np
+from rtmlib.tools.solution.pose_tracker import PoseTracker, pose_to_bbox
+
+
+def padded_roi(bboxes, image_shape, padding=0.25):
+    """
+    Region of interest around bounding boxes.
+
+    Args:
+        bboxes (list): xyxy-format bounding boxes.
+        image_shape (tuple): Shape of the image.
+        padding (float): Padding added on each side, as a fraction of the size of the region.
+
+    Returns:
+        tuple: (x0, y0, x1, y1) integer coordinates of the region, clipped to the image.
+    """
+    bboxes = np.asarray(bboxes, dtype=float)[:, :4]
+    x0, y0 = bboxes[:, :2].min(axis=0)
+    x1, y1 = bboxes[:, 2:].max(axis=0)
+    pad_x, pad_y = (x1 - x0) * padding, (y1 - y0) * padding
+    height, width = image_shape[:2]
+    return (
+        int(max(0, x0 - pad_x)),
+        int(max(0, y0 - pad_y)),
+        int(min(width, np.ceil(x1 + pad_x))),
+        int(min(height, np.ceil(y1 + pad_y))),
+    )
+
+
+class RegionOfInterestTracker(PoseTracker):
+    """
+    Pose tracker for live streams that follows the persons in a region of interest.
+
+    Persons are tracked from their keypoints in the previous frame, and pose estimation
+    runs on the crops of their bounding boxes, so the detector only runs to find them again:
+    - on the full frame, every `full_frame_interval` frames, when no one is tracked, or when
+      the tracking confidence drops below `confidence_threshold`,
+    - on the padded region around the tracked persons, every `redetect_interval` frames.
+      The region is resized to the detector input, so the detection resolution grows as
+      the subjects get smaller in the frame.
+
+    The speed-up is measured against the frames detected on the full frame, as if the
+    detector ran on the full frame at every frame. It is not logged at every frame, but
+    every `report_interval` frames (300 by default), and is available from `report()`.
+
+    Args:
+        solution (type): rtmlib solutions, e.g. Body, BodyWithFeet, BodyWithSpine.
+        redetect_interval (int): Frames between two detections in the region of interest.
+        full_frame_interval (int): Frames between two detections on the full frame.
+        confidence_threshold (float): Mean keypoint score under which the full frame is detected again.
+        padding (float): Padding of the region of interest, as a fraction of its size.
+        report_interval (int): Frames between two logs of the frame rate and speed-up. 0 to disable them.
+        **kwargs: PoseTracker arguments (tracking, mode, backend, device, ...).
+    """
+
+    def __init__(
+        self,
+        solution: type,
+        redetect_interval: int = 10,
+        full_frame_interval: int = 60,
+        confidence_threshold: float = 0.4,
+        padding: float = 0.25,
+        report_interval: int = 300,
+        **kwargs,
+    ):
+        kwargs["det_frequency"] = 1
+        super().__init__(solution, **kwargs)
+        self.redetect_interval = redetect_interval
+        self.full_frame_interval = full_frame_interval
+        self.confidence_threshold = confidence_threshold
+        self.padding = padding
+        self.report_interval = report_interval
+        self.device = kwargs.get("device", "cpu")
+
+        # PoseTracker calls the detector at every frame: it decides which region to detect, if any
+        self.detector = self.det_model
+        self.detector_categories = self.det_categories
+        self.detector_mode = self.det_mode
+        if self.detector is not None:
+            self.det_model = self._detect
+            self.det_mode = "human"
+            self.det_categories = None
+
+    def reset(self):
+        """Reset pose tracker."""
+        super().reset()
+        self.redetect = True
+        self.tracked_bboxes = []
+        self.frames_since_detection = 0
+        self.frames_since_full_frame = 0
+        self.full_frame = False
+        self.frame_time = [0.0, 0]
+        self.full_frame_time = [0.0, 0]
+
+    def __call__(self, image: np.ndarray):
+        start = time.perf_counter()
+        self.full_frame = False
+        results = super().__call__(image)
+        elapsed = time.perf_counter() - start
+
+        # Bounding boxes of the next frame, and full-frame detection if the persons are lost
+        keypoints, scores = results[:2]
+        self.tracked_bboxes = [pose_to_bbox(kpts) for kpts in keypoints]
+        self.redetect = self.redetect or len(scores) == 0 or np.mean(scores) < self.confidence_threshold
+
+        self.frame_time[0] += elapsed
+        self.frame_time[1] += 1
+        if self.full_frame:
+            self.full_frame_time[0] += elapsed
+            self.full_frame_time[1] += 1
+        if self.report_interval and self.frame_time[1] % self.report_interval == 0:
+            logging.info(self.report())
+        return results
+
+    def _detection_region(self, image_shape):
+        height, width = image_shape[:2]
+        if (
+            self.redetect
+            or len(self.tracked_bboxes) == 0
+            or self.frames_since_full_frame >= self.full_frame_interval
+        ):
+            return (0, 0, width, height)
+        if self.frames_since_detection >= self.redetect_interval:
+            x0, y0, x1, y1 = padded_roi(self.tracked_bboxes, image_shape, self.padding)
+            # Persons tracked out of the frame
+            if x1 - x0 < 2 or y1 - y0 < 2:
+                return (0, 0, width, height)
+            return (x0, y0, x1, y1)
+        return None
+
+    def _detect(self, image: np.ndarray):
+        region = self._detection_region(image.shape)
+        self.frames_since_detection += 1
+        self.frames_since_full_frame += 1
+        if region is None:
+            return list(self.tracked_bboxes)
+
+        x0, y0, x1, y1 = region
+        self.full_frame = region == (0, 0, image.shape[1], image.shape[0])
+        if self.detector_categories:
+            bboxes, classes = self.detector(image[y0:y1, x0:x1])
+            bboxes = [bbox for bbox, cls in zip(bboxes, classes) if cls in self.detector_categories]
+        elif self.detector_mode == "multiclass":
+            bboxes, _ = self.detector(image[y0:y1, x0:x1])
+        else:
+            bboxes = self.detector(image[y0:y1, x0:x1])
+        bboxes = [np.asarray(bbox[:4], dtype=float) + (x0, y0, x0, y0) for bbox in bboxes]
+
+        # Persons lost in the region of interest may have left it
+        self.redetect = not self.full_frame and len(bboxes) < len(self.tracked_bboxes)
+        self.frames_since_detection = 0
+        if self.full_frame:
+            self.frames_since_full_frame = 0
+        return bboxes
+
+    @property
+    def fps(self):
+        """Frames processed per second, or None before the first frame."""
+        total, frames = self.frame_time
+        return frames / total if total else None
+
+    @property
+    def fps_gain(self):
+        """Speed-up over full-frame detection at every frame, or None until it is measured."""
+        if not self.full_frame_time[1] or not self.frame_time[1]:
+            return None
+        full_frame_mean = self.full_frame_time[0] / self.full_frame_time[1]
+        mean = self.frame_time[0] / self.frame_time[1]
+        return full_frame_mean / mean
+
+    def report(self):
+        """Summary of the achieved frame rate and speed-up."""
+        if self.fps_gain is None:
+            return "Region of interest tracking: no frame processed yet."
+        return (
+            f"Region of interest tracking on {self.device}: {self.fps:.1f} fps, "
+            f"{self.fps_gain:.2f}x the frame rate of full-frame detection at every frame."
+        )
@@ -6,6 +6,9 @@ from rtmlib import YOLOX, RTMPose
 # FIXME: This import should not be here. Upload model somewhere online and add a link
 from TracX.constants import APP_ASSETS
 
+from ..model_registry import get_tool
+from .multi_head_pose import MultiHeadPose
+
 
 class WholebodyWithSpine:
     MODE = {
@@ -63,6 +66,7 @@ class WholebodyWithSpine:
         to_openpose: bool = False,
         backend: str = "onnxruntime",
         device: str = "cpu",
+        merged_pose: str = None,
     ):
         if det is None:
             det = self.MODE[mode]["det"]
@@ -72,34 +76,48 @@ class WholebodyWithSpine:
             pose = self.MODE[mode]["pose"]
             pose_input_size = self.MODE[mode]["pose_input_size"]
 
-        self.det_model = YOLOX(
-            det, model_input_size=det_input_size, backend=backend, device=device
-        )
-        self.body_model = RTMPose(
-            pose,
-            model_input_size=pose_input_size,
-            to_openpose=to_openpose,
+        self.det_model = get_tool(
+            YOLOX,
+            det,
+            model_input_size=det_input_size,
             backend=backend,
             device=device,
         )
-        self.spine_pose = RTMPose(
-            self.MODE[mode]["spine_pose"],
-            model_input_size=self.MODE[mode]["spine_pose_input_size"],
-            to_openpose=to_openpose,
-            backend=backend,
-            device=device,
-        )
-
-        def forward(image, bboxes):
-            keypoints, scores = self.body_model(image, bboxes=bboxes)
-            spine_keypoints, spine_scores = self.spine_pose(image, bboxes=bboxes)
-            spine_keypoints = spine_keypoints[:, -17:]
-            spine_scores = spine_scores[:, -17:]
-            keypoints = np.concatenate([keypoints, spine_keypoints], axis=1)
-            scores = np.concatenate([scores, spine_scores], axis=1)
-            return keypoints, scores
+        if merged_pose is None:
+            self.body_model = get_tool(
+                RTMPose,
+                pose,
+                model_input_size=pose_input_size,
+                to_openpose=to_openpose,
+                backend=backend,
+                device=device,
+            )
+            self.spine_pose = get_tool(
+                RTMPose,
+                self.MODE[mode]["spine_pose"],
+                model_input_size=self.MODE[mode]["spine_pose_input_size"],
+                to_openpose=to_openpose,
+                backend=backend,
+                device=device,
+            )
+            merged_model = None
+        else:
+            merged_model = get_tool(
+                RTMPose,
+                merged_pose,
+                model_input_size=pose_input_size,
+                to_openpose=to_openpose,
+                backend=backend,
+                device=device,
+            )
+            self.body_model = self.spine_pose = merged_model
 
-        self.pose_model = forward
+        # Only the last 17 keypoints of the spine model are kept
+        self.pose_model = MultiHeadPose(
+            [self.body_model, self.spine_pose],
+            keypoint_slices=[None, slice(-17, None)],
+            merged_model=merged_model,
+        )
 
     def __call__(self, image: np.ndarray):
         bboxes = self.det_model(image)